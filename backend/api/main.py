@@ -2,6 +2,7 @@ import sys
 import os
 import asyncio
 import json
+import logging
 
 # Add the parent directory (backend) to sys.path for module discovery
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -12,10 +13,12 @@ if parent_dir not in sys.path:
 from typing import Optional, List, Dict, Any
 import asyncio
 import time
+from contextlib import asynccontextmanager, aclosing
 from datetime import datetime
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
 from fastapi.responses import JSONResponse, StreamingResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.errors import RateLimitExceeded
 from backend.services.ai.chat_security_service import security_service
@@ -28,6 +31,9 @@ from backend.api.schemas import (
 )
 
 from backend.models.chat import SessionNotFoundError, ModelNotAvailableError
+from backend.services.utils.stream_compression import COMPRESSION_FORMATS, compress_chunks, get_compressor
+
+logger = logging.getLogger(__name__)
 
 
 def initialize_services():
@@ -70,9 +76,22 @@ def initialize_services():
             from backend.services.ai.session_service import SessionService
             from backend.services.ai.chat_history_service import ChatHistoryService
             from backend.services.ai.chat_service import ChatService
+            from backend.services.ai.message_write_buffer import MessageWriteBuffer
 
             services['session_service'] = SessionService()
-            services['chat_history_service'] = ChatHistoryService()
+            # Chat writes share one write-behind buffer so a turn commits once
+            write_buffer = MessageWriteBuffer(services['session_service'].db_path)
+            services['message_write_buffer'] = write_buffer
+            services['session_service'].write_buffer = write_buffer
+            services['chat_history_service'] = ChatHistoryService(write_buffer=write_buffer)
+
+            # Prefetches the sessions users are likely to open next
+            from backend.services.cache.cache_warmup import AccessTracker, CacheWarmupScheduler
+            services['cache_warmup'] = CacheWarmupScheduler(
+                services['session_service'],
+                services['chat_history_service'],
+                AccessTracker(services['session_service'].db_path),
+            )
 
             if services['llm_service']:
                 services['chat_service'] = ChatService(
@@ -122,8 +141,43 @@ def configure_middleware(app: FastAPI) -> None:
         allow_credentials=True,
         allow_methods=["*"],  # Allows all methods
         allow_headers=["*"],  # Allows all headers
+        expose_headers=["X-Next-Cursor"],  # Keyset pagination cursor
     )
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Application startup and shutdown hooks
+    פעולות בעליית ובכיבוי השרת
+    """
+    if cache_warmup:
+        cache_warmup.start()
+    # Load the local model in the background so the first chat doesn't wait for it
+    from backend.services.ai.providers.local_model_manager import startup_preload_enabled
+    if llm_service and startup_preload_enabled():
+        try:
+            llm_service.preload_active_model()
+        except Exception as e:
+            print(f"⚠️ Local model preload failed to start: {e}")
+    yield
+    if cache_warmup:
+        cache_warmup.stop()
+    # Persist queued chat writes before the worker exits
+    if message_write_buffer:
+        message_write_buffer.close()
+    # Write queued audit events (including those emitted by the flushes above)
+    from backend.services.security.audit_service import audit_service
+    audit_service.close()
+    # Stop the cross-process cache invalidation subscriber
+    from backend.services.cache import chat_cache_service
+    chat_cache_service.cache_service.close()
+    # Close pooled provider connections
+    from backend.services.ai.providers.http_client import aclose_async_client
+    await aclose_async_client()
+    # Stop local inference workers
+    if llm_service:
+        llm_service.close_local_models()
+
 def create_app() -> FastAPI:
     """
     Create and configure FastAPI application
@@ -132,7 +186,8 @@ def create_app() -> FastAPI:
     app = FastAPI(
         title="Audio Chat Studio API",
         description="Backend API for Audio Chat Studio",
-        version="1.0.0"
+        version="1.0.0",
+        lifespan=lifespan
     )
     
     # Configure middleware
@@ -150,6 +205,8 @@ audio_command_processor = services['audio_command_processor']
 session_service = services['session_service']
 chat_history_service = services['chat_history_service']
 chat_service = services['chat_service']
+message_write_buffer = services.get('message_write_buffer')
+cache_warmup = services.get('cache_warmup')
 
 
 # --- FastAPI App Initialization ---
@@ -552,10 +609,79 @@ async def set_active_model(model_id: str = Form(...)):
         if llm_service is None:
             raise HTTPException(status_code=503, detail="LLM service is not available")
         success = llm_service.set_active_model(model_id)
+        if success:
+            # Warm up a newly selected local model before the next chat
+            llm_service.preload_active_model()
         return JSONResponse(content={"success": success})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to set active model: {e}")
 
+@app.get('/api/llm/local-models')
+async def get_local_models_status():
+    """Load state, resident memory and load timing of the local models"""
+    if llm_service is None:
+        raise HTTPException(status_code=503, detail="LLM service is not available")
+    try:
+        status = await run_in_threadpool(llm_service.get_local_model_status)
+        return JSONResponse(content=status)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve local model status: {e}")
+
+@app.post('/api/llm/local-models/{model_id}/backend')
+async def set_local_model_backend(model_id: str, backend: str = Form(...)):
+    """Select the inference backend of a local model ("torch", "int8" or "default")"""
+    if llm_service is None:
+        raise HTTPException(status_code=503, detail="LLM service is not available")
+    try:
+        selected = await run_in_threadpool(
+            llm_service.set_local_model_backend, model_id, None if backend == "default" else backend
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to set local model backend: {e}")
+    return JSONResponse(content={"success": True, "model_id": model_id, "backend": selected})
+
+@app.get('/api/llm/routing')
+async def get_routing_status():
+    """Fallback models, hedging setting and per-provider health of the router"""
+    if llm_service is None:
+        raise HTTPException(status_code=503, detail="LLM service is not available")
+    try:
+        status = await run_in_threadpool(llm_service.get_routing_status)
+        return JSONResponse(content=status)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to retrieve routing status: {e}")
+
+@app.post('/api/llm/routing')
+async def set_routing_settings(request: Request):
+    """Update the fallback models and/or hedging ({"fallback_models": [...], "hedge": bool})"""
+    if llm_service is None:
+        raise HTTPException(status_code=503, detail="LLM service is not available")
+    data = await request.json()
+    try:
+        settings = await run_in_threadpool(
+            llm_service.set_routing_settings, data.get('fallback_models'), data.get('hedge')
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to update routing settings: {e}")
+    return JSONResponse(content={"success": True, "settings": settings})
+
+async def _generate_chat_response(messages: List[Dict[str, str]], cache: Optional[bool] = None):
+    """Run a chat completion without blocking the event loop
+
+    ``cache`` opts in to (True) or bypasses (False) the response cache; by
+    default only temperature 0 calls are cached.
+    """
+    # Only passed when set, so services without a response cache still work
+    kwargs = {} if cache is None else {"cache": cache}
+    agenerate = getattr(llm_service, 'agenerate_chat_response', None)
+    if asyncio.iscoroutinefunction(agenerate):
+        return await agenerate(messages, **kwargs)
+    return await run_in_threadpool(llm_service.generate_chat_response, messages, **kwargs)
+
 @app.post('/api/llm/test-chat')
 async def test_chat(request: Request):
     """Test chat with the active model"""
@@ -573,7 +699,7 @@ async def test_chat(request: Request):
         
         # Generate response
         messages = [{"role": "user", "content": message}]
-        response = llm_service.generate_chat_response(messages)
+        response = await _generate_chat_response(messages, cache=data.get('cache'))
         
         if response and response.success:
             return JSONResponse(content={
@@ -654,7 +780,7 @@ async def chat_endpoint(request: Request):
             raise HTTPException(status_code=400, detail="No messages provided")
         
         # Generate response using the active model
-        response = llm_service.generate_chat_response(messages)
+        response = await _generate_chat_response(messages, cache=data.get('cache'))
         
         if response and response.success:
             return JSONResponse(content={
@@ -709,7 +835,7 @@ async def gemini_chat_endpoint(request: Request):
             llm_service.current_parameters.max_tokens = max_tokens
         
         # Generate response using Gemini
-        response = llm_service.generate_chat_response(messages)
+        response = await _generate_chat_response(messages)
         
         if response and response.success:
             return JSONResponse(content={
@@ -766,14 +892,16 @@ async def gemini_stream_endpoint(request: Request):
         async def stream_generator():
             try:
                 if hasattr(llm_service, 'stream_chat_response'):
-                    async for chunk in llm_service.stream_chat_response(messages, timeout=60):
-                        if await request.is_disconnected():
-                            break
-                        yield f"data: {json.dumps({'content': chunk, 'type': 'content'})}\n\n"
+                    # Closing the stream on disconnect aborts the provider request
+                    async with aclosing(llm_service.stream_chat_response(messages, timeout=60)) as stream:
+                        async for chunk in stream:
+                            if await request.is_disconnected():
+                                return
+                            yield f"data: {json.dumps({'content': chunk, 'type': 'content'})}\n\n"
                     yield f"data: {json.dumps({'type': 'done'})}\n\n"
                 else:
                     # Fallback to regular response
-                    response = llm_service.generate_chat_response(messages)
+                    response = await _generate_chat_response(messages)
                     if response and response.success:
                         yield f"data: {json.dumps({'content': response.content, 'type': 'content'})}\n\n"
                         yield f"data: {json.dumps({'type': 'done', 'metadata': response.metadata})}\n\n"
@@ -795,7 +923,7 @@ async def chat_completion_endpoint(messages: List[Dict[str, str]]):
     try:
         if llm_service is None:
             raise HTTPException(status_code=503, detail="LLM service is not available")
-        response = llm_service.generate_chat_response(messages)
+        response = await _generate_chat_response(messages)
         if response:
             return JSONResponse(content=response.to_dict())
         else:
@@ -824,7 +952,8 @@ async def send_chat_message(payload: SendMessageRequest, request: Request):
             if not security_service.validate_session_access(payload.session_id, payload.user_id):
                 raise HTTPException(status_code=403, detail="Access to this session is forbidden")
 
-        result = chat_service.send_message(payload.session_id, sanitized_message, payload.user_id)
+        _record_session_access(payload.session_id)
+        result = await run_in_threadpool(chat_service.send_message, payload.session_id, sanitized_message, payload.user_id)
         success = True
         
         # Log audit event
@@ -884,6 +1013,8 @@ async def stream_chat_message(payload: SendMessageRequest, request: Request):
         if not security_service.validate_session_access(payload.session_id, payload.user_id):
             raise HTTPException(status_code=403, detail="Access to this session is forbidden")
 
+    _record_session_access(payload.session_id)
+
     async def event_generator():
         try:
             async for chunk in chat_service.stream_message(payload.session_id, sanitized_message, payload.user_id, request=request):
@@ -901,11 +1032,36 @@ async def stream_chat_message(payload: SendMessageRequest, request: Request):
 
 
 
+def _record_session_access(session_id: str) -> None:
+    """Feed the predictive cache warmup with a session open"""
+    if cache_warmup:
+        try:
+            cache_warmup.record_access(session_id)
+        except Exception as e:
+            logger.warning(f"Failed to record session access: {e}")
+
+
+def _parse_keyset_cursor(before: str):
+    """Parse a ``<timestamp>,<id>`` pagination cursor"""
+    key, sep, item_id = before.partition(',')
+    if not sep or not key or not item_id:
+        raise HTTPException(status_code=400, detail="Invalid cursor, expected 'before=<timestamp>,<id>'")
+    return key, item_id
+
+
+def _format_keyset_cursor(key, item_id: str) -> str:
+    return f"{key.isoformat()},{item_id}"
+
+
 @app.get('/api/chat/sessions')
-async def list_chat_sessions(user_id: Optional[str] = None):
+async def list_chat_sessions(response: Response, user_id: Optional[str] = None, limit: int = 50, before: Optional[str] = None):
     if session_service is None:
         raise HTTPException(status_code=503, detail="Session service is not available")
-    sessions = session_service.list_user_sessions(user_id=user_id)
+    cursor = _parse_keyset_cursor(before) if before else None
+    sessions = session_service.list_user_sessions(user_id=user_id, limit=limit, before=cursor)
+    if sessions and len(sessions) >= limit:
+        oldest = sessions[-1]
+        response.headers['X-Next-Cursor'] = _format_keyset_cursor(oldest.updated_at, oldest.id)
     return [s.to_dict() for s in sessions]
 
 
@@ -924,6 +1080,7 @@ async def get_chat_session(session_id: str):
     session = session_service.get_session(session_id)
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
+    _record_session_access(session_id)
     return session.to_dict()
 
 
@@ -945,14 +1102,38 @@ async def delete_chat_session(session_id: str):
     success = session_service.delete_session(session_id)
     if not success:
         raise HTTPException(status_code=404, detail="Session not found")
+    if cache_warmup:
+        cache_warmup.forget(session_id)
     return {"success": True}
 
 
 @app.get('/api/chat/sessions/{session_id}/messages')
-async def get_session_messages(session_id: str, limit: Optional[int] = None, offset: int = 0):
+async def get_session_messages(
+    session_id: str,
+    response: Response,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    before: Optional[str] = None,
+):
+    """
+    Get messages for a session.
+
+    Passing ``before`` switches to keyset pagination: an empty value returns the
+    newest page, ``before=<timestamp>,<id>`` the page older than that message.
+    The cursor for the next page is returned in the ``X-Next-Cursor`` header.
+    """
     if chat_history_service is None:
         raise HTTPException(status_code=503, detail="Chat history service is not available")
-    messages = chat_history_service.get_session_messages(session_id, limit=limit, offset=offset)
+    _record_session_access(session_id)
+    if before is not None:
+        page_size = limit or 50
+        cursor = _parse_keyset_cursor(before) if before else None
+        messages = chat_history_service.get_recent_messages(session_id, limit=page_size, before=cursor, as_str=False)
+        if messages and len(messages) >= page_size:
+            oldest = messages[0]
+            response.headers['X-Next-Cursor'] = _format_keyset_cursor(oldest.timestamp, oldest.id)
+    else:
+        messages = chat_history_service.get_session_messages(session_id, limit=limit, offset=offset)
     return [m.to_dict() for m in messages]
 
 
@@ -988,34 +1169,48 @@ async def search_messages(query: str, user_id: Optional[str] = None, session_id:
     return [m.to_dict() for m in messages]
 
 
+# export format -> (file extension, media type)
+EXPORT_MEDIA_TYPES = {
+    "json": ("json", "application/json"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+    "markdown": ("md", "text/markdown"),
+    "txt": ("txt", "text/plain"),
+}
+
+
+def _streaming_export_response(chunks, media_type: str, filename: str, compression: Optional[str] = None):
+    """Stream export chunks as a download, optionally gzip/zstd compressed on the fly"""
+    if compression:
+        if compression not in COMPRESSION_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported compression: {compression}")
+        try:
+            # Fail before the response starts if the compressor is unavailable
+            get_compressor(compression)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        suffix, media_type = COMPRESSION_FORMATS[compression]
+        filename += suffix
+    return StreamingResponse(
+        compress_chunks(chunks, compression),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename={filename}"}
+    )
+
+
 @app.post('/api/chat/export/{session_id}')
 async def export_session(session_id: str, request: ExportSessionRequest):
     if chat_history_service is None:
         raise HTTPException(status_code=503, detail="Chat history service is not available")
     
     try:
-        exported_data = chat_history_service.export_session(session_id, format=request.format)
-        
-        # Set appropriate content type based on format
-        if request.format == "json":
-            media_type = "application/json"
-            filename = f"session_{session_id}.json"
-        elif request.format == "markdown":
-            media_type = "text/markdown"
-            filename = f"session_{session_id}.md"
-        else:  # txt
-            media_type = "text/plain"
-            filename = f"session_{session_id}.txt"
-        
-        return Response(
-            content=exported_data,
-            media_type=media_type,
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
+        chunks = chat_history_service.stream_export_session(session_id, format=request.format)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    
+    extension, media_type = EXPORT_MEDIA_TYPES[request.format]
+    return _streaming_export_response(
+        chunks, media_type, f"session_{session_id}.{extension}", request.compression
+    )
 
 
 # --- Security and Encryption Endpoints ---
@@ -1203,7 +1398,8 @@ async def get_audit_statistics(
         
         return JSONResponse(content={
             "success": True,
-            "statistics": statistics
+            "statistics": statistics,
+            "writer": audit_service.get_writer_stats()
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get audit statistics: {str(e)}")
@@ -1212,9 +1408,12 @@ async def get_audit_statistics(
 @app.get('/api/security/audit/search')
 async def search_audit_events(
     q: str,
-    fields: Optional[str] = None
+    fields: Optional[str] = None,
+    start_date: Optional[str] = None,
+    end_date: Optional[str] = None,
+    limit: int = 100
 ):
-    """Search audit events"""
+    """Search audit events (only monthly partitions in the date range are searched)"""
     try:
         from backend.services.security.audit_service import audit_service
         
@@ -1227,7 +1426,10 @@ async def search_audit_events(
         
         events = audit_service.search_events(
             search_term=q.strip(),
-            search_fields=search_fields
+            search_fields=search_fields,
+            start_date=datetime.fromisoformat(start_date) if start_date else None,
+            end_date=datetime.fromisoformat(end_date) if end_date else None,
+            limit=min(max(limit, 1), 1000)
         )
         
         return JSONResponse(content={
@@ -1243,12 +1445,12 @@ async def search_audit_events(
 
 
 @app.post('/api/security/audit/verify')
-async def verify_audit_integrity():
-    """Verify audit log integrity"""
+async def verify_audit_integrity(full: bool = False):
+    """Verify audit log integrity (events added since the last checkpoint unless ``full``)"""
     try:
         from backend.services.security.audit_service import audit_service
         
-        integrity = audit_service.verify_integrity()
+        integrity = await run_in_threadpool(audit_service.verify_integrity, full=full)
         
         return JSONResponse(content={
             "success": True,
@@ -1281,46 +1483,50 @@ async def cleanup_audit_logs(retention_days: int = 365):
         raise HTTPException(status_code=500, detail=f"Failed to cleanup audit logs: {str(e)}")
 
 
+# audit export format -> (file extension, media type)
+AUDIT_EXPORT_MEDIA_TYPES = {
+    "json": ("json", "application/json"),
+    "ndjson": ("ndjson", "application/x-ndjson"),
+    "csv": ("csv", "text/csv"),
+}
+
+
 @app.get('/api/security/audit/export')
 async def export_audit_logs(
     start_date: Optional[str] = None,
     end_date: Optional[str] = None,
-    format: str = "json"
+    format: str = "json",
+    event_types: Optional[str] = None,
+    user_id: Optional[str] = None,
+    severity: Optional[str] = None,
+    compression: Optional[str] = None
 ):
-    """Export audit logs"""
+    """Stream audit logs as JSON, NDJSON or CSV, optionally gzip/zstd compressed"""
+    from backend.services.security.audit_service import audit_service, AuditEventType, AuditSeverity
+    
+    if format not in AUDIT_EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Format must be 'json', 'ndjson' or 'csv'")
+    
     try:
-        from backend.services.security.audit_service import audit_service
-        
-        if format not in ["json", "csv"]:
-            raise HTTPException(status_code=400, detail="Format must be 'json' or 'csv'")
-        
-        # Parse parameters
         start_dt = datetime.fromisoformat(start_date) if start_date else None
         end_dt = datetime.fromisoformat(end_date) if end_date else None
-        
-        exported_data = audit_service.export_logs(
-            start_date=start_dt,
-            end_date=end_dt,
-            format=format
-        )
-        
-        # Set appropriate content type and filename
-        if format == "json":
-            media_type = "application/json"
-            filename = f"audit-logs-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"
-        else:  # csv
-            media_type = "text/csv"
-            filename = f"audit-logs-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.csv"
-        
-        return Response(
-            content=exported_data,
-            media_type=media_type,
-            headers={"Content-Disposition": f"attachment; filename={filename}"}
-        )
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to export audit logs: {str(e)}")
+        types = [AuditEventType(value.strip()) for value in event_types.split(',')] if event_types else None
+        severity_filter = AuditSeverity(severity) if severity else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid export filter: {str(e)}")
+    
+    chunks = audit_service.stream_export(
+        start_date=start_dt,
+        end_date=end_dt,
+        event_types=types,
+        user_id=user_id,
+        severity=severity_filter,
+        format=format
+    )
+    
+    extension, media_type = AUDIT_EXPORT_MEDIA_TYPES[format]
+    filename = f"audit-logs-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{extension}"
+    return _streaming_export_response(chunks, media_type, filename, compression)
 
 
 @app.post('/api/security/audit/log')
@@ -1377,49 +1583,34 @@ async def log_audit_event(request: Request):
 # --- Data Management and Privacy Endpoints ---
 
 @app.get('/api/data/statistics')
-async def get_data_statistics():
+async def get_data_statistics(exact: bool = False):
     """Get data usage statistics for privacy dashboard"""
     try:
         if chat_history_service is None or session_service is None:
             raise HTTPException(status_code=503, detail="Required services are not available")
         
-        # Get session statistics
-        sessions = session_service.list_user_sessions()
-        total_sessions = len(sessions)
-        
-        # Get message statistics
-        total_messages = 0
-        encrypted_messages = 0
-        oldest_data = None
-        storage_used = 0
-        
-        for session in sessions:
-            session_stats = chat_history_service.get_session_statistics(session.id)
-            total_messages += session_stats["message_counts"]["total"]
-            
-            # Estimate storage (rough calculation)
-            storage_used += session_stats["message_counts"]["total"] * 500  # ~500 bytes per message
-            
-            # Check oldest data
-            if session_stats["date_range"]["first_message"]:
-                if not oldest_data or session_stats["date_range"]["first_message"] < oldest_data:
-                    oldest_data = session_stats["date_range"]["first_message"]
+        # Totals come from the summary row maintained by database triggers
+        stats = chat_history_service.get_data_statistics(exact_storage=exact)
         
         # Try to get encryption statistics
+        encrypted_messages = 0
         try:
             encryption_status = chat_history_service.get_encryption_status()
             if encryption_status.get("encryption_enabled", False):
-                encrypted_messages = total_messages  # Assume all are encrypted if encryption is enabled
+                encrypted_messages = stats["total_messages"]  # Assume all are encrypted if encryption is enabled
         except:
             pass
         
         return JSONResponse(content={
-            "totalMessages": total_messages,
-            "totalSessions": total_sessions,
-            "storageUsed": storage_used,
-            "oldestData": oldest_data,
+            "totalMessages": stats["total_messages"],
+            "totalSessions": stats["total_sessions"],
+            "storageUsed": stats["storage_bytes"],
+            "oldestData": stats["oldest_message"],
+            "newestData": stats["newest_message"],
             "encryptedMessages": encrypted_messages
         })
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get data statistics: {str(e)}")
 
@@ -1470,71 +1661,97 @@ async def clear_all_data():
         raise HTTPException(status_code=500, detail=f"Failed to clear data: {str(e)}")
 
 
-@app.get('/api/data/export')
-async def export_all_data():
-    """Export all chat data for backup"""
+def _stream_data_export(format: str):
+    """Yield the full chat backup one session at a time.
+
+    The export is audited when the generator finishes, is closed by a client
+    disconnect or fails, recording how much was sent and whether it completed.
+    """
+    from backend.services.security.audit_service import log_security_event, AuditSeverity
+    
+    encryption_status = None
     try:
-        if chat_history_service is None or session_service is None:
-            raise HTTPException(status_code=503, detail="Required services are not available")
-        
-        # Get all sessions
-        sessions = session_service.list_user_sessions()
-        
-        export_data = {
-            "export_timestamp": datetime.utcnow().isoformat(),
-            "sessions": [],
-            "encryption_status": None
-        }
-        
-        # Add encryption status
-        try:
-            export_data["encryption_status"] = chat_history_service.get_encryption_status()
-        except:
-            pass
+        encryption_status = chat_history_service.get_encryption_status()
+    except Exception:
+        pass
+    
+    header = {"export_timestamp": datetime.utcnow().isoformat(), "encryption_status": encryption_status}
+    exported_sessions = 0
+    exported_messages = 0
+    data_size = 0
+    completed = False
+    
+    def emit(chunk: str) -> str:
+        nonlocal data_size
+        data_size += len(chunk.encode('utf-8'))
+        return chunk
+    
+    try:
+        if format == "ndjson":
+            yield emit(json.dumps({"type": "export", "data": header}, ensure_ascii=False) + "\n")
+        else:
+            yield emit(json.dumps(header, ensure_ascii=False)[:-1] + ', "sessions": [')
         
-        # Export each session
-        for session in sessions:
+        for session in session_service.iter_sessions():
             session_data = session.to_dict()
-            
-            # Get messages for this session
-            messages = chat_history_service.get_session_messages(session.id)
-            session_data["messages"] = [m.to_dict() for m in messages]
-            
-            # Get session statistics
             try:
                 session_data["statistics"] = chat_history_service.get_session_statistics(session.id)
-            except:
+            except Exception:
                 pass
+            messages = chat_history_service.iter_session_messages(session.id)
             
-            export_data["sessions"].append(session_data)
-        
-        # Convert to JSON
-        import json
-        json_data = json.dumps(export_data, ensure_ascii=False, indent=2)
-        
-        # Log security event
+            if format == "ndjson":
+                yield emit(json.dumps({"type": "session", "data": session_data}, ensure_ascii=False) + "\n")
+                for message in messages:
+                    exported_messages += 1
+                    yield emit(json.dumps({"type": "message", "data": message.to_dict()}, ensure_ascii=False) + "\n")
+            else:
+                separator = ", " if exported_sessions else ""
+                yield emit(separator + json.dumps(session_data, ensure_ascii=False)[:-1] + ', "messages": [')
+                for index, message in enumerate(messages):
+                    exported_messages += 1
+                    yield emit((", " if index else "") + json.dumps(message.to_dict(), ensure_ascii=False))
+                yield emit("]}")
+            exported_sessions += 1
+        
+        if format != "ndjson":
+            yield emit("]}")
+        completed = True
+    finally:
+        # Also runs on disconnect (GeneratorExit) so partial exports are audited
         try:
-            from backend.services.security.audit_service import log_security_event, AuditSeverity
             log_security_event(
                 action="data_exported",
                 severity=AuditSeverity.HIGH,
                 details={
-                    "exported_sessions": len(export_data["sessions"]),
-                    "export_format": "json",
-                    "data_size_bytes": len(json_data),
-                    "includes_encryption_status": export_data["encryption_status"] is not None
+                    "completed": completed,
+                    "exported_sessions": exported_sessions,
+                    "exported_messages": exported_messages,
+                    "export_format": format,
+                    "data_size_bytes": data_size,
+                    "includes_encryption_status": encryption_status is not None
                 }
             )
         except Exception as audit_error:
             logger.warning(f"Failed to log audit event: {audit_error}")
-        
-        return Response(
-            content=json_data,
-            media_type="application/json",
-            headers={"Content-Disposition": f"attachment; filename=chat-data-export-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json"}
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Failed to export data: {str(e)}")
+
+
+@app.get('/api/data/export')
+async def export_all_data(format: str = "json", compression: Optional[str] = None):
+    """
+    Export all chat data for backup.
+    
+    The backup is streamed session by session; ``format=ndjson`` emits one
+    ``{"type": ..., "data": ...}`` record per export header, session and message.
+    """
+    if chat_history_service is None or session_service is None:
+        raise HTTPException(status_code=503, detail="Required services are not available")
+    if format not in ("json", "ndjson"):
+        raise HTTPException(status_code=400, detail="Invalid format. Must be 'json' or 'ndjson'")
+    
+    extension, media_type = EXPORT_MEDIA_TYPES[format]
+    filename = f"chat-data-export-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.{extension}"
+    return _streaming_export_response(_stream_data_export(format), media_type, filename, compression)
 
 
 # --- Settings Endpoints ---
@@ -1617,27 +1834,26 @@ async def get_cache_info():
 async def clear_cache(cache_type: Optional[str] = None):
     """Clear cache (all or specific type)"""
     try:
-        from backend.services.cache.chat_cache_service import clear_all_cache, cache_service
+        from backend.services.cache.chat_cache_service import clear_all_cache, chat_cache, llm_response_cache
         
         if cache_type == "all" or cache_type is None:
             result = clear_all_cache()
             message = "All cache cleared successfully"
-        elif cache_type == "sessions":
-            # Clear session-related cache
-            invalidated = cache_service.invalidate_pattern("session:*")
-            invalidated += cache_service.invalidate_pattern("user_sessions:*")
-            result = invalidated > 0
-            message = f"Session cache cleared: {invalidated} entries"
-        elif cache_type == "messages":
-            # Clear message-related cache
-            invalidated = cache_service.invalidate_pattern("messages:*")
-            result = invalidated > 0
-            message = f"Message cache cleared: {invalidated} entries"
-        elif cache_type == "search":
-            # Clear search cache
-            invalidated = cache_service.invalidate_pattern("search:*")
-            result = invalidated > 0
-            message = f"Search cache cleared: {invalidated} entries"
+        elif cache_type == "llm":
+            llm_response_cache.invalidate()
+            result = True
+            message = "LLM response cache invalidated"
+        elif cache_type in ("sessions", "messages", "search"):
+            # Bump the family generations; stale entries age out through LRU/TTL
+            families = {
+                "sessions": ("session", "user_sessions"),
+                "messages": ("messages",),
+                "search": ("search",),
+            }[cache_type]
+            for family in families:
+                chat_cache.invalidate_family(family)
+            result = True
+            message = f"{cache_type.capitalize()} cache invalidated"
         else:
             raise HTTPException(status_code=400, detail=f"Invalid cache type: {cache_type}")
         
@@ -1655,6 +1871,7 @@ async def clear_cache(cache_type: Optional[str] = None):
 async def get_cache_stats():
     """Get detailed cache statistics"""
     try:
+        from dataclasses import asdict
         from backend.services.cache.chat_cache_service import cache_service
         
         stats = cache_service.get_stats()
@@ -1673,17 +1890,38 @@ async def get_cache_stats():
         
         return JSONResponse(content={
             "success": True,
-            "stats": formatted_stats
+            "stats": formatted_stats,
+            "single_flight": asdict(cache_service.single_flight.get_stats())
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get cache stats: {str(e)}")
 
 
 @app.post('/api/cache/invalidate')
-async def invalidate_cache_pattern(pattern: str):
-    """Invalidate cache entries matching a pattern"""
+async def invalidate_cache_pattern(pattern: Optional[str] = None, namespace: Optional[str] = None):
+    """
+    Invalidate cache entries by namespace or pattern.
+
+    Namespaces (``messages``, ``messages:<session_id>``, ``user_sessions:<user_id>`` ...)
+    and patterns that map onto one (``messages:<session_id>:*``) are invalidated in O(1)
+    by bumping their generation counter. Other patterns fall back to a key scan.
+    """
     try:
-        from backend.services.cache.chat_cache_service import cache_service
+        from backend.services.cache.chat_cache_service import cache_service, chat_cache
+        
+        if namespace is None and pattern is not None:
+            namespace = chat_cache.namespace_for_pattern(pattern.strip())
+        
+        if namespace is not None:
+            if not namespace.strip():
+                raise HTTPException(status_code=400, detail="Namespace must not be empty")
+            generation = cache_service.invalidate_namespace(namespace.strip())
+            return JSONResponse(content={
+                "success": True,
+                "message": f"Cache invalidated for namespace: {namespace}",
+                "strategy": "generation",
+                "generation": generation
+            })
         
         if not pattern or len(pattern.strip()) < 2:
             raise HTTPException(status_code=400, detail="Pattern must be at least 2 characters")
@@ -1693,6 +1931,7 @@ async def invalidate_cache_pattern(pattern: str):
         return JSONResponse(content={
             "success": True,
             "message": f"Cache invalidated for pattern: {pattern}",
+            "strategy": "scan",
             "invalidated_count": invalidated
         })
     except HTTPException:
@@ -1703,39 +1942,17 @@ async def invalidate_cache_pattern(pattern: str):
 
 @app.post('/api/cache/warmup')
 async def warmup_cache():
-    """Warm up cache with frequently accessed data"""
+    """Warm up the cache with the sessions users are most likely to open next"""
+    if cache_warmup is None:
+        raise HTTPException(status_code=503, detail="Chat services are not available")
     try:
-        from backend.services.cache.chat_cache_service import chat_cache
-        
-        warmed_up = 0
-        
-        # Warm up recent sessions
-        if session_service:
-            try:
-                recent_sessions = session_service.list_user_sessions(limit=20)
-                for session in recent_sessions:
-                    chat_cache.set_session(session.id, session.to_dict())
-                    warmed_up += 1
-            except Exception as e:
-                logger.warning(f"Failed to warm up sessions: {e}")
-        
-        # Warm up recent messages for active sessions
-        if chat_history_service and session_service:
-            try:
-                recent_sessions = session_service.list_user_sessions(limit=10)
-                for session in recent_sessions:
-                    messages = chat_history_service.get_session_messages(session.id, limit=50)
-                    if messages:
-                        cached_data = [msg.to_dict() for msg in messages]
-                        chat_cache.set_session_messages(session.id, cached_data, 50)
-                        warmed_up += 1
-            except Exception as e:
-                logger.warning(f"Failed to warm up messages: {e}")
+        warmed_up = await run_in_threadpool(cache_warmup.run_once)
         
         return JSONResponse(content={
             "success": True,
             "message": "Cache warmed up successfully",
-            "warmed_entries": warmed_up
+            "warmed_entries": warmed_up,
+            "details": cache_warmup.last_run
         })
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to warm up cache: {str(e)}")
@@ -1748,17 +1965,28 @@ async def delete_chat_session(session_id: str):
     success = session_service.delete_session(session_id)
     if not success:
         raise HTTPException(status_code=404, detail="Session not found")
+    if cache_warmup:
+        cache_warmup.forget(session_id)
     return {"success": True}
 
 if __name__ == "__main__":
     import uvicorn
+    from backend.services.ai.providers.local_model_manager import PRELOAD_ENV
+    # Single worker: it preloads the local model
+    os.environ.setdefault(PRELOAD_ENV, "1")
     uvicorn.run(app, host="0.0.0.0", port=8000)
 
 
 # Message Management Endpoints
 
 @app.get('/api/chat/sessions/{session_id}/messages')
-async def get_session_messages(session_id: str, limit: Optional[int] = None, offset: int = 0):
+async def get_session_messages(
+    session_id: str,
+    response: Response,
+    limit: Optional[int] = None,
+    offset: int = 0,
+    before: Optional[str] = None,
+):
     """Get messages for a specific session"""
     if chat_history_service is None:
         raise HTTPException(status_code=503, detail="Chat history service is not available")
@@ -1768,9 +1996,18 @@ async def get_session_messages(session_id: str, limit: Optional[int] = None, off
         session = session_service.get_session(session_id)
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
+    _record_session_access(session_id)
     
+    cursor = _parse_keyset_cursor(before) if before else None
     try:
-        messages = chat_history_service.get_session_messages(session_id, limit=limit, offset=offset)
+        if before is not None:
+            page_size = limit or 50
+            messages = chat_history_service.get_recent_messages(session_id, limit=page_size, before=cursor, as_str=False)
+            if messages and len(messages) >= page_size:
+                oldest = messages[0]
+                response.headers['X-Next-Cursor'] = _format_keyset_cursor(oldest.timestamp, oldest.id)
+        else:
+            messages = chat_history_service.get_session_messages(session_id, limit=limit, offset=offset)
         return [msg.to_dict() for msg in messages]
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get messages: {str(e)}")
@@ -1851,31 +2088,19 @@ async def export_session(session_id: str, request: ExportSessionRequest):
         if not session:
             raise HTTPException(status_code=404, detail="Session not found")
     
+    format_type = request.format.lower()
+    
+    if format_type not in EXPORT_MEDIA_TYPES:
+        raise HTTPException(status_code=400, detail="Invalid format. Must be 'json', 'ndjson', 'markdown', or 'txt'")
+    
     try:
-        format_type = request.format.lower()
-        
-        if format_type not in ['json', 'markdown', 'txt']:
-            raise HTTPException(status_code=400, detail="Invalid format. Must be 'json', 'markdown', or 'txt'")
-        
-        exported_data = chat_history_service.export_session(session_id, format=format_type)
-        
-        # Set appropriate content type
-        content_types = {
-            'json': 'application/json',
-            'markdown': 'text/markdown',
-            'txt': 'text/plain'
-        }
-        
-        return Response(
-            content=exported_data,
-            media_type=content_types[format_type],
-            headers={
-                "Content-Disposition": f"attachment; filename=session_{session_id}.{format_type}"
-            }
-        )
-        
+        chunks = chat_history_service.stream_export_session(session_id, format=format_type)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to export session: {str(e)}")
+    
+    return _streaming_export_response(
+        chunks, EXPORT_MEDIA_TYPES[format_type][1], f"session_{session_id}.{format_type}", request.compression
+    )
 
 @app.post('/api/audio/command/interpret')
 async def interpret_audio_command(request: Request):
@@ -32,3 +32,4 @@ class MessageCreateRequest(BaseModel):
 
 class ExportSessionRequest(BaseModel):
     format: str = "json"
+    compression: Optional[str] = None
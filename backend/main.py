@@ -109,6 +109,10 @@ def start_server(host: str = "127.0.0.1", port: int = 5000, reload: bool = False
         
         # Import the FastAPI app from api module
         from backend.api.main import app
+        from backend.services.ai.providers.local_model_manager import PRELOAD_ENV
+        
+        # A single worker serves every chat, so it preloads the local model
+        os.environ.setdefault(PRELOAD_ENV, "1")
         
         # Start the server
         uvicorn.run(
@@ -0,0 +1,138 @@
+"""
+Migration script to add keyset pagination indexes to chat tables
+"""
+import os
+import sqlite3
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_NAME = 'add_chat_keyset_indexes'
+
+# Composite indexes matching the (filter, sort key, tie-breaker) of each
+# paginated query, so a page is a single index seek instead of an OFFSET scan
+KEYSET_INDEXES = {
+    'idx_chat_messages_session_keyset': 'chat_messages(session_id, timestamp, id)',
+    'idx_chat_sessions_user_keyset': 'chat_sessions(user_id, updated_at, id)',
+    'idx_chat_sessions_updated_keyset': 'chat_sessions(updated_at, id)',
+}
+
+# Single-column indexes that are left-prefixes of the keyset indexes above
+SUPERSEDED_INDEXES = {
+    'idx_chat_messages_session_id': 'chat_messages(session_id)',
+    'idx_chat_messages_session_timestamp': 'chat_messages(session_id, timestamp)',
+    'idx_chat_sessions_user_id': 'chat_sessions(user_id)',
+    'idx_chat_sessions_updated_at': 'chat_sessions(updated_at)',
+}
+
+
+def migrate_chat_keyset_indexes(db_path: str = None) -> bool:
+    """
+    Add composite indexes for keyset pagination of chat sessions and messages
+
+    Args:
+        db_path (str, optional): Path to database file
+
+    Returns:
+        bool: True if migration successful
+    """
+    if db_path is None:
+        app_data_dir = os.path.join(os.path.expanduser("~"), ".audio_chat_qt")
+        os.makedirs(app_data_dir, exist_ok=True)
+        db_path = os.path.join(app_data_dir, "llm_data.db")
+
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS migrations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        ''')
+
+        # Check if migration was already applied
+        cursor.execute('SELECT 1 FROM migrations WHERE name = ?', (MIGRATION_NAME,))
+        if cursor.fetchone():
+            logger.info("Chat keyset indexes already exist, skipping migration")
+            conn.close()
+            return True
+
+        logger.info("Creating chat keyset indexes...")
+
+        for name, definition in KEYSET_INDEXES.items():
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+        for name in SUPERSEDED_INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+        cursor.execute('ANALYZE chat_messages')
+        cursor.execute('ANALYZE chat_sessions')
+
+        cursor.execute(
+            'INSERT INTO migrations (name, applied_at) VALUES (?, ?)',
+            (MIGRATION_NAME, datetime.utcnow().isoformat())
+        )
+
+        conn.commit()
+        conn.close()
+
+        logger.info("Chat keyset indexes migration completed successfully")
+        return True
+
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        return False
+
+
+def rollback_chat_keyset_indexes(db_path: str = None) -> bool:
+    """
+    Rollback chat keyset indexes migration
+
+    Args:
+        db_path (str, optional): Path to database file
+
+    Returns:
+        bool: True if rollback successful
+    """
+    if db_path is None:
+        app_data_dir = os.path.join(os.path.expanduser("~"), ".audio_chat_qt")
+        db_path = os.path.join(app_data_dir, "llm_data.db")
+
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        logger.info("Rolling back chat keyset indexes...")
+
+        for name in KEYSET_INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+        # Restore the original single-column indexes
+        for name, definition in SUPERSEDED_INDEXES.items():
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {definition}')
+
+        # Remove migration record
+        cursor.execute('DELETE FROM migrations WHERE name = ?', (MIGRATION_NAME,))
+
+        conn.commit()
+        conn.close()
+
+        logger.info("Chat keyset indexes rollback completed successfully")
+        return True
+
+    except Exception as e:
+        logger.error(f"Rollback failed: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    # Run migration
+    success = migrate_chat_keyset_indexes()
+    if success:
+        print("✅ Chat keyset indexes migration completed")
+    else:
+        print("❌ Chat keyset indexes migration failed")
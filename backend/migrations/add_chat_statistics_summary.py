@@ -0,0 +1,196 @@
+"""
+Migration script to add an incrementally maintained chat statistics summary
+"""
+import os
+import sqlite3
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_NAME = 'add_chat_statistics_summary'
+
+# Bytes stored for a message row (UTF-8 payload of its text columns)
+_ROW_BYTES = (
+    "length(CAST({t}.id AS BLOB)) + length(CAST({t}.session_id AS BLOB)) + length(CAST({t}.role AS BLOB)) "
+    "+ length(CAST({t}.content AS BLOB)) + length(CAST({t}.timestamp AS BLOB)) "
+    "+ COALESCE(length(CAST({t}.model_id AS BLOB)), 0) + COALESCE(length(CAST({t}.metadata AS BLOB)), 0)"
+)
+
+TRIGGERS = {
+    'trg_chat_summary_message_insert': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_summary_message_insert AFTER INSERT ON chat_messages
+        BEGIN
+            UPDATE chat_data_summary SET
+                message_count = message_count + 1,
+                storage_bytes = storage_bytes + {_ROW_BYTES.format(t='NEW')},
+                oldest_message = CASE WHEN oldest_message IS NULL OR NEW.timestamp < oldest_message
+                                      THEN NEW.timestamp ELSE oldest_message END,
+                newest_message = CASE WHEN newest_message IS NULL OR NEW.timestamp > newest_message
+                                      THEN NEW.timestamp ELSE newest_message END
+            WHERE id = 1;
+        END
+    ''',
+    # Removing the oldest/newest message re-reads the bound from idx_chat_messages_timestamp
+    'trg_chat_summary_message_delete': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_summary_message_delete AFTER DELETE ON chat_messages
+        BEGIN
+            UPDATE chat_data_summary SET
+                message_count = message_count - 1,
+                storage_bytes = storage_bytes - ({_ROW_BYTES.format(t='OLD')}),
+                oldest_message = CASE WHEN OLD.timestamp = oldest_message
+                                      THEN (SELECT MIN(timestamp) FROM chat_messages) ELSE oldest_message END,
+                newest_message = CASE WHEN OLD.timestamp = newest_message
+                                      THEN (SELECT MAX(timestamp) FROM chat_messages) ELSE newest_message END
+            WHERE id = 1;
+        END
+    ''',
+    'trg_chat_summary_message_update': f'''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_summary_message_update
+        AFTER UPDATE OF content, metadata, model_id ON chat_messages
+        BEGIN
+            UPDATE chat_data_summary SET
+                storage_bytes = storage_bytes + ({_ROW_BYTES.format(t='NEW')}) - ({_ROW_BYTES.format(t='OLD')})
+            WHERE id = 1;
+        END
+    ''',
+    'trg_chat_summary_session_insert': '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_summary_session_insert AFTER INSERT ON chat_sessions
+        BEGIN
+            UPDATE chat_data_summary SET session_count = session_count + 1 WHERE id = 1;
+        END
+    ''',
+    'trg_chat_summary_session_delete': '''
+        CREATE TRIGGER IF NOT EXISTS trg_chat_summary_session_delete AFTER DELETE ON chat_sessions
+        BEGIN
+            UPDATE chat_data_summary SET session_count = session_count - 1 WHERE id = 1;
+        END
+    ''',
+}
+
+
+def migrate_chat_statistics_summary(db_path: str = None) -> bool:
+    """
+    Add the chat_data_summary table and the triggers that keep it current
+
+    Args:
+        db_path (str, optional): Path to database file
+
+    Returns:
+        bool: True if migration successful
+    """
+    if db_path is None:
+        app_data_dir = os.path.join(os.path.expanduser("~"), ".audio_chat_qt")
+        os.makedirs(app_data_dir, exist_ok=True)
+        db_path = os.path.join(app_data_dir, "llm_data.db")
+
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS migrations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            applied_at TEXT NOT NULL
+        )
+        ''')
+
+        # Check if migration was already applied
+        cursor.execute('SELECT 1 FROM migrations WHERE name = ?', (MIGRATION_NAME,))
+        if cursor.fetchone():
+            logger.info("Chat statistics summary already exists, skipping migration")
+            conn.close()
+            return True
+
+        logger.info("Creating chat statistics summary...")
+
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_data_summary (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            session_count INTEGER NOT NULL DEFAULT 0,
+            message_count INTEGER NOT NULL DEFAULT 0,
+            storage_bytes INTEGER NOT NULL DEFAULT 0,
+            oldest_message TEXT,
+            newest_message TEXT
+        )
+        ''')
+
+        # Backfill from existing data with one grouped query per table
+        cursor.execute('DELETE FROM chat_data_summary')
+        cursor.execute(f'''
+        INSERT INTO chat_data_summary
+            (id, session_count, message_count, storage_bytes, oldest_message, newest_message)
+        SELECT 1,
+               (SELECT COUNT(*) FROM chat_sessions),
+               COUNT(*),
+               COALESCE(SUM({_ROW_BYTES.format(t='chat_messages')}), 0),
+               MIN(timestamp),
+               MAX(timestamp)
+        FROM chat_messages
+        ''')
+
+        for sql in TRIGGERS.values():
+            cursor.execute(sql)
+
+        cursor.execute(
+            'INSERT INTO migrations (name, applied_at) VALUES (?, ?)',
+            (MIGRATION_NAME, datetime.utcnow().isoformat())
+        )
+
+        conn.commit()
+        conn.close()
+
+        logger.info("Chat statistics summary migration completed successfully")
+        return True
+
+    except Exception as e:
+        logger.error(f"Migration failed: {e}")
+        return False
+
+
+def rollback_chat_statistics_summary(db_path: str = None) -> bool:
+    """
+    Rollback chat statistics summary migration
+
+    Args:
+        db_path (str, optional): Path to database file
+
+    Returns:
+        bool: True if rollback successful
+    """
+    if db_path is None:
+        app_data_dir = os.path.join(os.path.expanduser("~"), ".audio_chat_qt")
+        db_path = os.path.join(app_data_dir, "llm_data.db")
+
+    try:
+        conn = sqlite3.connect(db_path)
+        cursor = conn.cursor()
+
+        logger.info("Rolling back chat statistics summary...")
+
+        for name in TRIGGERS:
+            cursor.execute(f'DROP TRIGGER IF EXISTS {name}')
+        cursor.execute('DROP TABLE IF EXISTS chat_data_summary')
+
+        # Remove migration record
+        cursor.execute('DELETE FROM migrations WHERE name = ?', (MIGRATION_NAME,))
+
+        conn.commit()
+        conn.close()
+
+        logger.info("Chat statistics summary rollback completed successfully")
+        return True
+
+    except Exception as e:
+        logger.error(f"Rollback failed: {e}")
+        return False
+
+
+if __name__ == "__main__":
+    # Run migration
+    success = migrate_chat_statistics_summary()
+    if success:
+        print("✅ Chat statistics summary migration completed")
+    else:
+        print("❌ Chat statistics summary migration failed")
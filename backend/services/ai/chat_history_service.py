@@ -4,12 +4,16 @@ import sqlite3
 import logging
 import uuid
 from datetime import datetime
-from typing import List, Optional
+from typing import Iterable, Iterator, List, Optional, Tuple, TYPE_CHECKING
 
 from backend.models.chat import Message
 from backend.services.security.encryption_service import encryption_service
 from backend.services.security.audit_service import log_user_action, log_security_event, AuditSeverity
 from backend.services.cache.chat_cache_service import chat_cache, cached
+from .context_window import SessionContextWindow
+
+if TYPE_CHECKING:
+    from .message_write_buffer import MessageWriteBuffer
 
 logger = logging.getLogger(__name__)
 
@@ -17,14 +21,28 @@ logger = logging.getLogger(__name__)
 class ChatHistoryService:
     """Store and retrieve chat messages"""
 
-    def __init__(self, db_path: str = None):
+    def __init__(
+        self,
+        db_path: str = None,
+        write_buffer: Optional["MessageWriteBuffer"] = None,
+        context_window: Optional[SessionContextWindow] = None,
+    ):
         if db_path is None:
             app_dir = os.path.join(os.path.expanduser("~"), ".audio_chat_qt")
             os.makedirs(app_dir, exist_ok=True)
             db_path = os.path.join(app_dir, "llm_data.db")  # Use same DB as LLM service
         self.db_path = db_path
+        # When set, saves are queued and committed in batches by the buffer
+        self.write_buffer = write_buffer
+        # Latest decrypted turns per session, used to build prompt context
+        self.context_window = context_window or SessionContextWindow()
         # No need to init DB here - it's handled by LLM service
 
+    def _flush_pending(self) -> None:
+        """Make queued writes visible before reading from the database"""
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
+
     def _init_db(self) -> None:
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
@@ -58,7 +76,14 @@ class ChatHistoryService:
         except Exception as e:
             logger.warning(f"Failed to encrypt message {message.id}: {e}. Saving unencrypted.")
             encrypted_content = message.content
-        
+
+        self.context_window.append(session_id, message.role, message.content)
+
+        if self.write_buffer is not None:
+            # Insert, cache invalidation and audit happen in the buffer's flush
+            self.write_buffer.enqueue_message(session_id, message, encrypted_content)
+            return message.id
+
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute(
@@ -82,10 +107,7 @@ class ChatHistoryService:
         logger.info(f"Saved message {message.id} to session {session_id}")
         
         # Invalidate cache for this session
-        try:
-            chat_cache.invalidate_session_messages(session_id)
-        except Exception as e:
-            logger.warning(f"Failed to invalidate message cache: {e}")
+        self._invalidate_message_cache(session_id)
         
         # Log audit event
         try:
@@ -105,31 +127,48 @@ class ChatHistoryService:
         return message.id
 
     def get_session_messages(self, session_id: str, limit: int = None, offset: int = 0, as_str: bool = True) -> List[Message]:
-        # Try to get from cache first
-        cache_key = f"session_messages:{session_id}:{limit}:{offset}"
-        cached_messages = chat_cache.get_session_messages(session_id, limit or 50)
-        
-        if cached_messages is not None and offset == 0:
-            # Convert cached data back to Message objects
-            messages = []
-            for msg_data in cached_messages:
-                try:
-                    message = Message.from_dict(msg_data)
-                    messages.append(message)
-                except Exception as e:
-                    logger.warning(f"Failed to deserialize cached message: {e}")
-                    break
-            else:
-                # All messages deserialized successfully
-                if as_str:
-                    for m in messages:
-                        if hasattr(m.role, "value"):
-                            m.role = m.role.value
-                        if hasattr(m.type, "value"):
-                            m.type = m.type.value
-                return messages[:limit] if limit else messages
-        
-        # Cache miss - fetch from database
+        if offset == 0:
+            # Queued writes invalidate the cached list when they commit, so
+            # commit them before the lookup computes its cache key
+            self._flush_pending()
+            # Concurrent misses for the same session share a single load; the
+            # full history gets its own key so a capped read never stands in for it
+            cached_messages = chat_cache.load_session_messages(
+                session_id,
+                limit if limit is not None else chat_cache.FULL_HISTORY,
+                lambda: [msg.to_dict() for msg in self._fetch_session_messages(session_id, limit, 0)],
+            )
+            if cached_messages is not None:
+                messages = []
+                for msg_data in cached_messages:
+                    try:
+                        messages.append(Message.from_dict(msg_data))
+                    except Exception as e:
+                        logger.warning(f"Failed to deserialize cached message: {e}")
+                        break
+                else:
+                    # All messages deserialized successfully
+                    if as_str:
+                        for m in messages:
+                            if hasattr(m.role, "value"):
+                                m.role = m.role.value
+                            if hasattr(m.type, "value"):
+                                m.type = m.type.value
+                    return messages[:limit] if limit else messages
+        
+        messages = self._fetch_session_messages(session_id, limit, offset)
+        
+        if as_str:
+            for m in messages:
+                if hasattr(m.role, "value"):
+                    m.role = m.role.value
+                if hasattr(m.type, "value"):
+                    m.type = m.type.value
+        return messages
+
+    def _fetch_session_messages(self, session_id: str, limit: Optional[int], offset: int) -> List[Message]:
+        """Read and decrypt a session's messages in chronological order"""
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         query = "SELECT * FROM chat_messages WHERE session_id = ? ORDER BY timestamp ASC"
@@ -155,29 +194,81 @@ class ChatHistoryService:
                 # Content remains as stored (might be unencrypted)
             
             messages.append(message)
-        
-        # Cache the results (only for recent messages without offset)
-        if offset == 0 and messages:
+        return messages
+
+    def get_recent_messages(
+        self,
+        session_id: str,
+        limit: int = 50,
+        as_str: bool = True,
+        before: Optional[Tuple[str, str]] = None,
+    ) -> List[Message]:
+        """
+        Get the latest ``limit`` messages of a session, returned oldest first.
+
+        ``before`` is a ``(timestamp, id)`` keyset cursor; only messages strictly
+        older than it are returned, so paging back through history costs one
+        index seek per page regardless of depth.
+        """
+        self._flush_pending()
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        # Served by idx_chat_messages_session_keyset, newest rows first
+        if before is not None:
+            cursor.execute(
+                "SELECT * FROM chat_messages WHERE session_id = ? AND (timestamp, id) < (?, ?) "
+                "ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (session_id, before[0], before[1], limit),
+            )
+        else:
+            cursor.execute(
+                "SELECT * FROM chat_messages WHERE session_id = ? ORDER BY timestamp DESC, id DESC LIMIT ?",
+                (session_id, limit),
+            )
+        rows = cursor.fetchall()
+        conn.close()
+
+        messages = []
+        for row in reversed(rows):
+            message = Message.from_row(row)
             try:
-                cached_data = [msg.to_dict() for msg in messages]
-                chat_cache.set_session_messages(session_id, cached_data, limit or 50)
+                message.content = encryption_service.decrypt_message(message.content, message.id)
             except Exception as e:
-                logger.warning(f"Failed to cache session messages: {e}")
-        
-        if as_str:
-            for m in messages:
-                if hasattr(m.role, "value"):
-                    m.role = m.role.value
-                if hasattr(m.type, "value"):
-                    m.type = m.type.value
+                logger.warning(f"Failed to decrypt message {message.id}: {e}. Using content as-is.")
+            if as_str:
+                message.role = message.role.value
+                message.type = message.type.value
+            messages.append(message)
         return messages
 
+    def get_recent_context(self, session_id: str) -> List[dict]:
+        """
+        Get the latest turns of a session as chat messages for the LLM.
+
+        Served from the in-memory context window, which local saves keep
+        current. It is reloaded from the newest messages in the database on
+        first use, or when the message cache generations show that another
+        worker changed the session.
+        """
+        try:
+            mark = chat_cache.session_messages_remote_mark(session_id)
+        except Exception as e:
+            logger.warning(f"Failed to read message cache generation: {e}")
+            mark = None
+        context = self.context_window.get(session_id, mark)
+        if context is None:
+            messages = self.get_recent_messages(session_id, limit=self.context_window.max_messages)
+            self.context_window.load(session_id, messages, mark)
+            context = self.context_window.get(session_id) or []
+        return context
+
     def search_messages(self, query: str, user_id: str = None, session_id: str = None) -> List[Message]:
         """
         Search messages by content. Note: This searches encrypted content,
         so results may be limited when encryption is enabled.
         For better search functionality, consider implementing a search index.
         """
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
@@ -223,57 +314,106 @@ class ChatHistoryService:
         
         return matching_messages
 
+    EXPORT_FORMATS = ("json", "ndjson", "markdown", "txt")
+
     def export_session(self, session_id: str, format: str = "json") -> str:
         """Export session messages in specified format"""
-        messages = self.get_session_messages(session_id, as_str=False)
-        
-        if format == "json":
-            data = [m.to_dict() for m in messages]
-            return json.dumps(data, ensure_ascii=False, indent=2)
+        return "".join(self.stream_export_session(session_id, format=format))
+
+    def stream_export_session(self, session_id: str, format: str = "json") -> Iterator[str]:
+        """
+        Export session messages as an iterator of text chunks.
+
+        Messages are read and decrypted in keyset batches, so memory use does
+        not grow with the size of the session.
+        """
+        if format not in self.EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {format}")
+        return self._stream_export(self.iter_session_messages(session_id), format)
+
+    def iter_session_messages(self, session_id: str, batch_size: int = 500) -> Iterator[Message]:
+        """Iterate over all messages of a session, oldest first, decrypting per batch"""
+        self._flush_pending()
+        after = None
+        while True:
+            conn = sqlite3.connect(self.db_path)
+            cursor = conn.cursor()
+            if after is None:
+                cursor.execute(
+                    "SELECT * FROM chat_messages WHERE session_id = ? ORDER BY timestamp, id LIMIT ?",
+                    (session_id, batch_size),
+                )
+            else:
+                cursor.execute(
+                    "SELECT * FROM chat_messages WHERE session_id = ? AND (timestamp, id) > (?, ?) "
+                    "ORDER BY timestamp, id LIMIT ?",
+                    (session_id, after[0], after[1], batch_size),
+                )
+            rows = cursor.fetchall()
+            # The connection is not held open while the consumer processes the batch
+            conn.close()
+            if not rows:
+                return
+
+            decrypted = encryption_service.decrypt_messages([(row[3], row[0]) for row in rows])
+            for row in rows:
+                message = Message.from_row(row)
+                if message.id in decrypted:
+                    message.content = decrypted[message.id]
+                else:
+                    logger.warning(f"Failed to decrypt message {message.id}. Using content as-is.")
+                yield message
+
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1][4], rows[-1][0])
+
+    def _stream_export(self, messages: Iterable[Message], format: str) -> Iterator[str]:
+        if format == "ndjson":
+            for message in messages:
+                yield json.dumps(message.to_dict(), ensure_ascii=False) + "\n"
+        elif format == "json":
+            # Same document as json.dumps(list, indent=2), emitted one element at a time
+            first = True
+            for message in messages:
+                item = json.dumps(message.to_dict(), ensure_ascii=False, indent=2).replace("\n", "\n  ")
+                yield ("[\n  " if first else ",\n  ") + item
+                first = False
+            yield "[]" if first else "\n]"
         elif format == "markdown":
-            return self._export_as_markdown(messages)
+            yield "# Chat Session Export\n"
+            for message in messages:
+                yield "\n" + self._format_markdown_message(message)
         elif format == "txt":
-            return self._export_as_text(messages)
-        else:
-            raise ValueError(f"Unsupported export format: {format}")
+            yield "\n".join(["Chat Session Export", "=" * 50, ""])
+            for message in messages:
+                yield "\n" + self._format_text_message(message)
 
-    def _export_as_markdown(self, messages: List[Message]) -> str:
-        """Export messages as markdown format"""
-        lines = ["# Chat Session Export\n"]
-        
-        for message in messages:
-            timestamp = message.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            role = message.role.value if hasattr(message.role, "value") else message.role
-            role_emoji = "👤" if role == "user" else "🤖" if role == "assistant" else "⚙️"
+    def _format_markdown_message(self, message: Message) -> str:
+        """Format a single message as a markdown section"""
+        timestamp = message.timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        role = message.role.value if hasattr(message.role, "value") else message.role
+        role_emoji = "👤" if role == "user" else "🤖" if role == "assistant" else "⚙️"
 
-            lines.append(f"## {role_emoji} {role.title()} - {timestamp}\n")
-            lines.append(f"{message.content}\n")
-            
-            if message.model_id:
-                lines.append(f"*Model: {message.model_id}*")
-            if message.tokens_used:
-                lines.append(f"*Tokens: {message.tokens_used}*")
-            if message.response_time:
-                lines.append(f"*Response time: {message.response_time:.2f}s*")
-            
-            lines.append("\n---\n")
-        
+        lines = [f"## {role_emoji} {role.title()} - {timestamp}\n", f"{message.content}\n"]
+        if message.model_id:
+            lines.append(f"*Model: {message.model_id}*")
+        if message.tokens_used:
+            lines.append(f"*Tokens: {message.tokens_used}*")
+        if message.response_time:
+            lines.append(f"*Response time: {message.response_time:.2f}s*")
+        lines.append("\n---\n")
         return "\n".join(lines)
 
-    def _export_as_text(self, messages: List[Message]) -> str:
-        """Export messages as plain text format"""
-        lines = ["Chat Session Export", "=" * 50, ""]
-        
-        for message in messages:
-            timestamp = message.timestamp.strftime("%Y-%m-%d %H:%M:%S")
-            role = message.role.value if hasattr(message.role, "value") else message.role
-            lines.append(f"[{timestamp}] {role.upper()}: {message.content}")
-            lines.append("")
-        
-        return "\n".join(lines)
+    def _format_text_message(self, message: Message) -> str:
+        """Format a single message as a plain text line"""
+        timestamp = message.timestamp.strftime("%Y-%m-%d %H:%M:%S")
+        role = message.role.value if hasattr(message.role, "value") else message.role
+        return f"[{timestamp}] {role.upper()}: {message.content}\n"
 
     def get_message_count(self, session_id: str) -> int:
         """Get total message count for a session"""
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute("SELECT COUNT(*) FROM chat_messages WHERE session_id = ?", (session_id,))
@@ -283,28 +423,38 @@ class ChatHistoryService:
 
     def delete_message(self, message_id: str) -> bool:
         """Delete a specific message"""
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
+        cursor.execute("SELECT session_id FROM chat_messages WHERE id = ?", (message_id,))
+        row = cursor.fetchone()
         cursor.execute("DELETE FROM chat_messages WHERE id = ?", (message_id,))
         success = cursor.rowcount > 0
         conn.commit()
         conn.close()
+        if row:
+            self.context_window.invalidate(row[0])
+            self._invalidate_message_cache(row[0])
         logger.info(f"Deleted message {message_id}")
         return success
 
     def delete_session_messages(self, session_id: str) -> int:
         """Delete all messages for a session"""
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,))
         count = cursor.rowcount
         conn.commit()
         conn.close()
+        self.context_window.invalidate(session_id)
+        self._invalidate_message_cache(session_id)
         logger.info(f"Deleted {count} messages from session {session_id}")
         return count
 
     def get_message_by_id(self, message_id: str, as_str: bool = True) -> Optional[Message]:
         """Get a specific message by ID"""
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM chat_messages WHERE id = ?", (message_id,))
@@ -346,6 +496,7 @@ class ChatHistoryService:
         
         values.append(message_id)
         
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute(
@@ -353,49 +504,53 @@ class ChatHistoryService:
             values
         )
         success = cursor.rowcount > 0
+        cursor.execute("SELECT session_id FROM chat_messages WHERE id = ?", (message_id,))
+        row = cursor.fetchone()
         conn.commit()
         conn.close()
+        if row:
+            self.context_window.invalidate(row[0])
+            self._invalidate_message_cache(row[0])
         return success
 
+    def _invalidate_message_cache(self, session_id: str) -> None:
+        """Bump the session's message cache generation (O(1), no key scan)"""
+        try:
+            chat_cache.invalidate_session_messages(session_id)
+        except Exception as e:
+            logger.warning(f"Failed to invalidate message cache: {e}")
+
     def get_session_statistics(self, session_id: str) -> dict:
         """Get detailed statistics for a session"""
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
-        # Basic counts
-        cursor.execute(
-            "SELECT role, COUNT(*) FROM chat_messages WHERE session_id = ? GROUP BY role",
-            (session_id,)
-        )
-        role_counts = dict(cursor.fetchall())
-        
-        # Token usage
-        cursor.execute(
-            "SELECT SUM(tokens_used), AVG(tokens_used), MAX(tokens_used) FROM chat_messages WHERE session_id = ? AND tokens_used IS NOT NULL",
-            (session_id,)
-        )
-        token_stats = cursor.fetchone()
-        
-        # Response times
-        cursor.execute(
-            "SELECT AVG(response_time), MIN(response_time), MAX(response_time) FROM chat_messages WHERE session_id = ? AND response_time IS NOT NULL",
-            (session_id,)
-        )
-        time_stats = cursor.fetchone()
-        
-        # Date range
+        # One pass over the session's rows; AVG/MIN/MAX ignore NULLs like the old filtered queries
         cursor.execute(
-            "SELECT MIN(timestamp), MAX(timestamp) FROM chat_messages WHERE session_id = ?",
+            """
+            SELECT
+                COUNT(*),
+                SUM(role = 'user'), SUM(role = 'assistant'), SUM(role = 'system'),
+                SUM(tokens_used), AVG(tokens_used), MAX(tokens_used),
+                AVG(response_time), MIN(response_time), MAX(response_time),
+                MIN(timestamp), MAX(timestamp)
+            FROM chat_messages WHERE session_id = ?
+            """,
             (session_id,)
         )
-        date_range = cursor.fetchone()
-        
+        row = cursor.fetchone()
         conn.close()
         
+        role_counts = {"user": row[1] or 0, "assistant": row[2] or 0, "system": row[3] or 0}
+        token_stats = row[4:7]
+        time_stats = row[7:10]
+        date_range = row[10:12]
+        
         return {
             "session_id": session_id,
             "message_counts": {
-                "total": sum(role_counts.values()),
+                "total": row[0],
                 "user": role_counts.get("user", 0),
                 "assistant": role_counts.get("assistant", 0),
                 "system": role_counts.get("system", 0)
@@ -416,6 +571,55 @@ class ChatHistoryService:
             }
         }
 
+    def get_data_statistics(self, exact_storage: bool = False) -> dict:
+        """
+        Get totals for all chat data from the trigger-maintained summary row.
+
+        ``storage_bytes`` is the UTF-8 payload of the stored rows. With
+        ``exact_storage`` the on-disk size of the chat tables and their indexes
+        is read from ``dbstat`` instead, which scans every page.
+        """
+        self._flush_pending()
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute(
+                "SELECT session_count, message_count, storage_bytes, oldest_message, newest_message "
+                "FROM chat_data_summary WHERE id = 1"
+            )
+            row = cursor.fetchone()
+        except sqlite3.OperationalError:
+            # Summary migration not applied yet
+            row = None
+        if row is None:
+            cursor.execute("SELECT COUNT(*) FROM chat_sessions")
+            session_count = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT COUNT(*), COALESCE(SUM(length(CAST(content AS BLOB))), 0), MIN(timestamp), MAX(timestamp) "
+                "FROM chat_messages"
+            )
+            row = (session_count, *cursor.fetchone())
+
+        stats = {
+            "total_sessions": row[0],
+            "total_messages": row[1],
+            "storage_bytes": row[2],
+            "oldest_message": row[3],
+            "newest_message": row[4],
+        }
+
+        if exact_storage:
+            try:
+                cursor.execute(
+                    "SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name IN "
+                    "(SELECT name FROM sqlite_master WHERE tbl_name IN ('chat_messages', 'chat_sessions'))"
+                )
+                stats["storage_bytes"] = cursor.fetchone()[0]
+            except sqlite3.OperationalError:
+                logger.warning("dbstat is not available in this SQLite build, using payload size")
+        conn.close()
+        return stats
+
     def get_encryption_status(self) -> dict:
         """Get encryption status and statistics"""
         try:
@@ -433,6 +637,7 @@ class ChatHistoryService:
         Migrate existing unencrypted messages to encrypted format.
         This should be run once when enabling encryption on existing data.
         """
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
@@ -497,6 +702,7 @@ class ChatHistoryService:
         Verify that messages can be properly decrypted.
         Useful for checking encryption integrity.
         """
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
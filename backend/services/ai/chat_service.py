@@ -1,12 +1,15 @@
 import logging
 import time
 import uuid
+import inspect
+from contextlib import aclosing
 from typing import List, AsyncGenerator, Optional
 import asyncio
 from fastapi import Request
 from datetime import datetime
 
 from backend.models.chat import Message, ChatResponse, ModelNotAvailableError, SessionNotFoundError
+from backend.services.ai.providers.base_provider import StreamUsage
 from typing import TYPE_CHECKING
 
 from .session_service import SessionService
@@ -18,6 +21,14 @@ if TYPE_CHECKING:
 logger = logging.getLogger(__name__)
 
 
+def _accepts_usage(stream_fn) -> bool:
+    """Whether a stream_chat_response implementation takes a ``usage`` accumulator"""
+    try:
+        return 'usage' in inspect.signature(stream_fn).parameters
+    except (TypeError, ValueError):
+        return False
+
+
 class ChatService:
     """High level chat orchestration"""
 
@@ -26,9 +37,16 @@ class ChatService:
         self.session_service = session_service
         self.history_service = history_service
 
-    def _build_context(self, session_id: str, limit: int = 10) -> List[dict]:
-        messages = self.history_service.get_session_messages(session_id, limit=limit)
-        return [{"role": m.role, "content": m.content} for m in messages]
+    def _build_context(self, session_id: str) -> List[dict]:
+        # Latest turns from the history service's rolling window (token-budgeted)
+        return self.history_service.get_recent_context(session_id)
+
+    async def _generate(self, context: List[dict]):
+        """Run a full chat completion without blocking the event loop"""
+        agenerate = getattr(self.llm_service, 'agenerate_chat_response', None)
+        if asyncio.iscoroutinefunction(agenerate):
+            return await agenerate(context)
+        return await asyncio.to_thread(self.llm_service.generate_chat_response, context)
 
     def send_message(self, session_id: str, message: str, user_id: str = None) -> ChatResponse:
         session = self.session_service.get_session(session_id)
@@ -126,17 +144,29 @@ class ChatService:
         full_response = ""
         tokens_used = 0
         
+        usage = None
+        
         try:
             if hasattr(self.llm_service, 'stream_chat_response'):
-                async for chunk in self.llm_service.stream_chat_response(context, timeout=timeout):
-                    full_response += chunk
-                    tokens_used += 1  # Approximate token count
-                    if request and await request.is_disconnected():
-                        raise asyncio.CancelledError()
-                    yield chunk
+                stream_fn = self.llm_service.stream_chat_response
+                if _accepts_usage(stream_fn):
+                    usage = StreamUsage()
+                    stream = stream_fn(context, timeout=timeout, usage=usage)
+                else:
+                    stream = stream_fn(context, timeout=timeout)
+                # Leaving the loop early closes the stream and the provider request
+                async with aclosing(stream):
+                    async for chunk in stream:
+                        full_response += chunk
+                        tokens_used += 1  # Approximate token count
+                        if request and await request.is_disconnected():
+                            raise asyncio.CancelledError()
+                        yield chunk
+                if usage is not None:
+                    tokens_used = usage.total_tokens
             else:
                 # Fallback to regular response
-                provider_resp = self.llm_service.generate_chat_response(context)
+                provider_resp = await self._generate(context)
                 if not provider_resp or not provider_resp.success:
                     error_msg = provider_resp.error_message if provider_resp else "no response"
                     logger.error(f"LLM generation failed: {error_msg}")
@@ -159,6 +189,7 @@ class ChatService:
                 model_id=session.model_id,
                 tokens_used=tokens_used,
                 response_time=response_time,
+                metadata={"usage": usage.to_dict()} if usage is not None else {},
             )
             self.history_service.save_message(session_id, ai_msg)
             # Increment count for both the user message and the AI response
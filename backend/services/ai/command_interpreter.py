@@ -378,19 +378,21 @@ class AudioCommandInterpreter:
             user_prompt = self._create_llm_user_prompt(command_text, context)
             
             # שליחת בקשה ל-LLM
-            response = await self.llm_service.generate_response(
-                messages=[
+            # פקודות נפוצות חוזרות על עצמן - הפרשנות נשמרת ב-cache התשובות
+            response = await self.llm_service.agenerate_chat_response(
+                [
                     {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_prompt}
                 ],
-                temperature=0.1  # טמפרטורה נמוכה לדיוק
+                temperature=0.1,  # טמפרטורה נמוכה לדיוק
+                cache=True
             )
-            
-            if not response or not response.get('content'):
+
+            if not response or not response.success or not response.content:
                 return None
-            
+
             # פרשנות תגובת ה-LLM
-            return self._parse_llm_response(response['content'], command_text)
+            return self._parse_llm_response(response.content, command_text)
             
         except Exception as e:
             self.logger.error(f"Error parsing with LLM: {e}")
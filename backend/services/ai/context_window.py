@@ -0,0 +1,122 @@
+"""
+Rolling per-session context window.
+
+Keeps the latest decrypted turns of recently active sessions in memory,
+bounded by an estimated token budget, so building the prompt context for a
+new turn does not re-read and re-decrypt history from the database.
+
+Local saves append to the window directly. Each window also remembers a mark
+of the changes other workers had made to the session when it was loaded;
+readers pass the current mark, and a window whose mark moved (a turn stored,
+edited or deleted by another worker) is dropped and reloaded, so several
+workers can serve the same session without a database read per turn.
+"""
+
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+from backend.models.chat import Message
+
+# get() without a mark to check against
+_UNCHECKED: Any = object()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token)"""
+    return max(1, len(text) // 4)
+
+
+@dataclass
+class ContextTurn:
+    """A single message held in the context window"""
+    role: str
+    content: str
+    tokens: int
+
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+
+class SessionContextWindow:
+    """Latest turns per session under a token budget, LRU across sessions"""
+
+    def __init__(self, max_tokens: int = 2048, max_messages: int = 50, max_sessions: int = 256):
+        self.max_tokens = max_tokens
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self._windows: "OrderedDict[str, Deque[ContextTurn]]" = OrderedDict()
+        self._token_totals: Dict[str, int] = {}
+        # Mark of other workers' changes each window is current with
+        self._marks: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str, mark: Any = _UNCHECKED) -> Optional[List[Dict[str, str]]]:
+        """
+        Return the window as chat messages, or None if the session is not loaded.
+
+        When ``mark`` is given and differs from the one the window was loaded
+        with (or is None, i.e. unknown), the window is dropped and None is
+        returned, so the caller reloads it.
+        """
+        with self._lock:
+            window = self._windows.get(session_id)
+            if window is None:
+                return None
+            if mark is not _UNCHECKED and (mark is None or self._marks.get(session_id) != mark):
+                self._drop(session_id)
+                return None
+            self._windows.move_to_end(session_id)
+            return [turn.to_dict() for turn in window]
+
+    def load(self, session_id: str, messages: Iterable[Message], mark: Any = None) -> None:
+        """Seed a session's window from messages ordered oldest first"""
+        with self._lock:
+            self._windows[session_id] = deque()
+            self._token_totals[session_id] = 0
+            self._marks[session_id] = mark
+            self._windows.move_to_end(session_id)
+            for message in messages:
+                self._push(session_id, message.role, message.content)
+            self._evict_sessions()
+
+    def append(self, session_id: str, role, content: str) -> None:
+        """Add a new turn if the session is loaded; unloaded sessions load lazily"""
+        with self._lock:
+            if session_id in self._windows:
+                self._push(session_id, role, content)
+
+    def invalidate(self, session_id: str) -> None:
+        with self._lock:
+            self._drop(session_id)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._windows.clear()
+            self._token_totals.clear()
+            self._marks.clear()
+
+    def _drop(self, session_id: str) -> None:
+        self._windows.pop(session_id, None)
+        self._token_totals.pop(session_id, None)
+        self._marks.pop(session_id, None)
+
+    def _push(self, session_id: str, role, content: str) -> None:
+        role = role.value if hasattr(role, "value") else role
+        turn = ContextTurn(role=role, content=content, tokens=estimate_tokens(content))
+        window = self._windows[session_id]
+        window.append(turn)
+        self._token_totals[session_id] += turn.tokens
+
+        # Drop the oldest turns once over budget, always keeping the latest one
+        while len(window) > 1 and (
+            self._token_totals[session_id] > self.max_tokens or len(window) > self.max_messages
+        ):
+            self._token_totals[session_id] -= window.popleft().tokens
+
+    def _evict_sessions(self) -> None:
+        while len(self._windows) > self.max_sessions:
+            session_id, _ = self._windows.popitem(last=False)
+            self._token_totals.pop(session_id, None)
+            self._marks.pop(session_id, None)
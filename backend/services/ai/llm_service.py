@@ -1,8 +1,14 @@
 import os
 import json
+import time
 import sqlite3
 import logging
 import asyncio
+import inspect
+import threading
+from contextlib import aclosing
+from copy import deepcopy
+from dataclasses import dataclass, field, replace
 from datetime import datetime
 from typing import List, Dict, Any, Optional, Tuple
 
@@ -22,10 +28,37 @@ except ImportError:
     ModelCapability = None
 from backend.services.utils.api_key_manager import APIKeyManager
 from backend.services.ai.providers.provider_factory import ProviderFactory
-from backend.services.ai.providers.base_provider import BaseProvider, ProviderResponse
+from backend.services.ai.providers.base_provider import BaseProvider, ProviderError, ProviderResponse, StreamUsage
+from backend.services.ai.provider_router import (
+    ProviderRouter, ProviderLimits, RouteTarget, DEFAULT_MAX_CONCURRENCY
+)
+from starlette.concurrency import iterate_in_threadpool
+from backend.migrations.add_chat_keyset_indexes import migrate_chat_keyset_indexes
+from backend.migrations.add_chat_statistics_summary import migrate_chat_statistics_summary
 
 logger = logging.getLogger(__name__)
 
+# llm_settings key counting the writes to providers, models and settings
+REGISTRY_VERSION_KEY = "registry_version"
+# How often the registry checks whether another worker changed the database
+REGISTRY_CHECK_SECONDS = 1.0
+
+
+@dataclass
+class _Registry:
+    """In-memory copy of the providers, models and settings tables"""
+    version: int
+    providers: Dict[str, LLMProvider] = field(default_factory=dict)
+    models: Dict[str, LLMModel] = field(default_factory=dict)
+    active_model_id: Optional[str] = None
+    parameters: Optional[LLMParameters] = None
+    routing: Dict[str, Any] = field(default_factory=dict)
+    checked_at: float = 0.0
+
+
+def _is_missing_table(error: sqlite3.OperationalError) -> bool:
+    return str(error).startswith("no such table")
+
 
 class LLMService:
     """שירות לניהול מודלי LLM"""
@@ -46,6 +79,10 @@ class LLMService:
             db_path = os.path.join(app_data_dir, "llm_data.db")
         
         self.db_path = db_path
+
+        # Providers, models and settings are read from memory; see _get_registry
+        self._registry: Optional[_Registry] = None
+        self._registry_lock = threading.RLock()
         
         # יצירת מסד נתונים אם לא קיים ומעבר סכמת ספקים
         self._init_db()
@@ -68,6 +105,12 @@ class LLMService:
         # Provider instance cache
         self._provider_instances: Dict[str, BaseProvider] = {}
 
+        # Response cache for deterministic calls (None uses the shared one)
+        self.response_cache = None
+
+        # Concurrency limits, retries, failover and hedging across providers
+        self.router = ProviderRouter(hedge=self.get_routing_settings()["hedge"])
+
         # טעינת ספקים ברירת מחדל
         self._init_default_providers()
         
@@ -237,13 +280,15 @@ class LLMService:
         ''')
         
         # אינדקסים לביצועים
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_id ON chat_sessions(user_id)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_sessions_updated_at ON chat_sessions(updated_at)')
-        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_session_id ON chat_messages(session_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_chat_messages_timestamp ON chat_messages(timestamp)')
         
         conn.commit()
         conn.close()
+        
+        # אינדקסים מורכבים לדפדוף keyset (sessions ו-messages)
+        migrate_chat_keyset_indexes(self.db_path)
+        # טבלת סיכום סטטיסטיקות המתוחזקת ע"י triggers
+        migrate_chat_statistics_summary(self.db_path)
     
     def _init_default_providers(self) -> None:
         """יצירת ספקים ברירת מחדל"""
@@ -427,6 +472,153 @@ class LLMService:
         except Exception as e:
             logger.warning(f"Could not add downloaded model: {e}")
     
+    # Registry
+    @staticmethod
+    def _provider_from_row(row) -> LLMProvider:
+        return LLMProvider(
+            name=row[0],
+            api_base_url=row[1],
+            supported_models=json.loads(row[2]),
+            api_key=None,
+            is_connected=bool(row[3]),
+            connection_status=ProviderStatus(row[4]),
+            last_test_date=datetime.fromisoformat(row[5]) if row[5] else None,
+            error_message=row[6],
+            rate_limit=row[7],
+            cost_per_1k_tokens=row[8],
+            metadata=json.loads(row[9]) if row[9] else {}
+        )
+
+    @staticmethod
+    def _model_from_row(row) -> LLMModel:
+        return LLMModel(
+            id=row[0],
+            name=row[1],
+            provider=row[2],
+            description=row[3],
+            max_tokens=row[4],
+            cost_per_token=row[5],
+            capabilities=[ModelCapability(cap) for cap in json.loads(row[6])],
+            is_active=bool(row[7]),
+            is_available=bool(row[8]),
+            context_window=row[9],
+            training_data_cutoff=row[10],
+            version=row[11],
+            parameters=json.loads(row[12]) if row[12] else {},
+            metadata=json.loads(row[13]) if row[13] else {}
+        )
+
+    @staticmethod
+    def _read_registry_version(cursor) -> int:
+        cursor.execute('SELECT value FROM llm_settings WHERE key = ?', (REGISTRY_VERSION_KEY,))
+        row = cursor.fetchone()
+        return int(row[0]) if row else 0
+
+    def _load_registry(self) -> _Registry:
+        """Read providers, models and settings in one snapshot"""
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        try:
+            cursor.execute('BEGIN')
+            registry = _Registry(version=self._read_registry_version(cursor))
+            cursor.execute('SELECT * FROM llm_providers ORDER BY name')
+            for row in cursor.fetchall():
+                registry.providers[row[0]] = self._provider_from_row(row)
+            cursor.execute('SELECT * FROM llm_models')
+            for row in cursor.fetchall():
+                model = self._model_from_row(row)
+                registry.models[model.id] = model
+                if model.is_active and registry.active_model_id is None:
+                    registry.active_model_id = model.id
+            cursor.execute('SELECT key, value FROM llm_settings WHERE key IN (?, ?)', ("current_parameters", "routing"))
+            settings = dict(cursor.fetchall())
+        except sqlite3.OperationalError as e:
+            if not _is_missing_table(e):
+                raise
+            # ":memory:" databases start empty on every connection
+            return _Registry(version=0, checked_at=time.monotonic())
+        finally:
+            conn.close()
+
+        if "current_parameters" in settings:
+            try:
+                registry.parameters = LLMParameters.from_dict(json.loads(settings["current_parameters"]))
+            except (ValueError, TypeError, AttributeError):
+                logger.warning("Ignoring malformed LLM parameters")
+        if "routing" in settings:
+            try:
+                registry.routing = json.loads(settings["routing"])
+            except ValueError:
+                logger.warning("Ignoring malformed routing settings")
+        registry.checked_at = time.monotonic()
+        return registry
+
+    def _get_registry(self) -> _Registry:
+        """The in-memory registry, reloaded when another worker has written to the database.
+
+        Writes through this service update it in place; changes made by other
+        processes are picked up within REGISTRY_CHECK_SECONDS. When the
+        database can't be read (e.g. it is locked) the registry already in
+        memory keeps being served and the read is retried on the next call.
+        """
+        with self._registry_lock:
+            registry = self._registry
+            now = time.monotonic()
+            if registry is not None and now - registry.checked_at >= REGISTRY_CHECK_SECONDS:
+                conn = sqlite3.connect(self.db_path)
+                try:
+                    version = self._read_registry_version(conn.cursor())
+                except sqlite3.OperationalError as e:
+                    if not _is_missing_table(e):
+                        logger.warning(f"Could not check the LLM registry version: {e}")
+                        return registry
+                    version = registry.version
+                finally:
+                    conn.close()
+                if version == registry.version:
+                    registry.checked_at = now
+                    return registry
+            elif registry is not None:
+                return registry
+
+            try:
+                loaded = self._load_registry()
+            except sqlite3.Error as e:
+                if registry is None:
+                    raise
+                logger.warning(f"Could not reload the LLM registry, keeping the loaded one: {e}")
+                return registry
+            self._registry = loaded
+            return loaded
+
+    def _commit_registry_write(self, conn: sqlite3.Connection) -> int:
+        """Bump the registry version in the open transaction, commit and return the new version"""
+        cursor = conn.cursor()
+        cursor.execute('''
+        INSERT INTO llm_settings (key, value, updated_at) VALUES (?, '1', ?)
+        ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1, updated_at = excluded.updated_at
+        ''', (REGISTRY_VERSION_KEY, datetime.now().isoformat()))
+        version = self._read_registry_version(cursor)
+        conn.commit()
+        return version
+
+    def _registry_after_write(self, version: int) -> Optional[_Registry]:
+        """The registry to apply a committed write to, or None when there is nothing to apply.
+
+        Call with _registry_lock held. A write that skipped a version means
+        another worker wrote in between, so the registry is dropped and
+        reloaded on the next read.
+        """
+        registry = self._registry
+        if registry is None or version <= registry.version:
+            # Not loaded yet, or loaded after the write
+            return None
+        if version != registry.version + 1:
+            self._registry = None
+            return None
+        registry.version = version
+        return registry
+
     # Provider Management
     def save_provider(self, provider: LLMProvider) -> None:
         """שמירת ספק במסד הנתונים"""
@@ -451,34 +643,19 @@ class LLMService:
             json.dumps(provider.metadata)
         ))
         
-        conn.commit()
+        version = self._commit_registry_write(conn)
         conn.close()
+
+        with self._registry_lock:
+            registry = self._registry_after_write(version)
+            if registry is not None:
+                # API keys are never kept in the registry
+                registry.providers[provider.name] = replace(deepcopy(provider), api_key=None)
     
     def get_provider(self, name: str) -> Optional[LLMProvider]:
         """קבלת ספק לפי שם"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM llm_providers WHERE name = ?', (name,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if not row:
-            return None
-        
-        return LLMProvider(
-            name=row[0],
-            api_base_url=row[1],
-            supported_models=json.loads(row[2]),
-            api_key=None,
-            is_connected=bool(row[3]),
-            connection_status=ProviderStatus(row[4]),
-            last_test_date=datetime.fromisoformat(row[5]) if row[5] else None,
-            error_message=row[6],
-            rate_limit=row[7],
-            cost_per_1k_tokens=row[8],
-            metadata=json.loads(row[9]) if row[9] else {}
-        )
+        provider = self._get_registry().providers.get(name)
+        return deepcopy(provider) if provider else None
 
     def _get_provider_instance(self, provider_name: str) -> Optional[BaseProvider]:
         """Return or create a provider instance"""
@@ -493,6 +670,14 @@ class LLMService:
         if provider_name == "Local Gemma":
             from backend.services.ai.providers.local_gemma_provider import LocalGemmaProvider
             instance = LocalGemmaProvider()
+            # Backends chosen per model are kept in the model parameters
+            for model in self.get_models_by_provider(provider_name):
+                backend = model.parameters.get("backend")
+                if backend:
+                    try:
+                        instance.set_model_backend(model.id, backend)
+                    except ValueError as e:
+                        logger.warning(f"Ignoring backend of model {model.id}: {e}")
             self._provider_instances[provider_name] = instance
             return instance
 
@@ -505,33 +690,56 @@ class LLMService:
             self._provider_instances[provider_name] = instance
         return instance
     
+    def preload_active_model(self) -> bool:
+        """Start loading the active model in the background if it runs locally"""
+        active = self.get_active_model()
+        if not active or active.provider != "Local Gemma":
+            return False
+        provider = self._get_provider_instance(active.provider)
+        if not provider or not hasattr(provider, "preload"):
+            return False
+        provider.preload(active.id)
+        return True
+
+    def get_local_model_status(self) -> Dict[str, Any]:
+        """Load state, memory and timing of the local models"""
+        provider = self._get_provider_instance("Local Gemma")
+        if not provider or not hasattr(provider, "model_status"):
+            return {"active_model": None, "models": []}
+        return provider.model_status()
+
+    def set_local_model_backend(self, model_id: str, backend: Optional[str]) -> str:
+        """Select and persist the inference backend of a local model (None for the default).
+
+        Returns the backend the model now uses. Raises ValueError for unknown backends,
+        models that don't run locally or when the local provider is unavailable.
+        """
+        model = self.get_model(model_id)
+        if not model or model.provider != "Local Gemma":
+            raise ValueError(f"{model_id} is not a local model")
+        provider = self._get_provider_instance(model.provider)
+        if provider is None:
+            raise ValueError(f"The {model.provider} provider is not available")
+        if provider.set_model_backend(model_id, backend):
+            # Cached replies came from the other weights
+            self._get_response_cache().invalidate()
+        if backend is None:
+            model.parameters.pop("backend", None)
+        else:
+            model.parameters["backend"] = provider.backend_for(model_id)
+        self.save_model(model)
+        return provider.backend_for(model_id)
+
+    def close_local_models(self) -> None:
+        """Unload local models and stop their worker threads"""
+        provider = self._provider_instances.get("Local Gemma")
+        if provider is not None and hasattr(provider, "models"):
+            provider.models.stop()
+
     def get_all_providers(self) -> List[LLMProvider]:
         """קבלת כל הספקים"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM llm_providers ORDER BY name')
-        rows = cursor.fetchall()
-        conn.close()
-        
-        providers = []
-        for row in rows:
-            provider = LLMProvider(
-                name=row[0],
-                api_base_url=row[1],
-                supported_models=json.loads(row[2]),
-                api_key=None,
-                is_connected=bool(row[3]),
-                connection_status=ProviderStatus(row[4]),
-                last_test_date=datetime.fromisoformat(row[5]) if row[5] else None,
-                error_message=row[6],
-                rate_limit=row[7],
-                cost_per_1k_tokens=row[8],
-                metadata=json.loads(row[9]) if row[9] else {}
-            )
-            providers.append(provider)
-        
-        return providers
+        providers = self._get_registry().providers.values()
+        return [deepcopy(provider) for provider in sorted(providers, key=lambda p: p.name)]
     
     def test_provider_connection(self, provider_name: str) -> bool:
         """בדיקת חיבור לספק"""
@@ -593,108 +801,38 @@ class LLMService:
             json.dumps(model.metadata)
         ))
         
-        conn.commit()
+        version = self._commit_registry_write(conn)
         conn.close()
+
+        with self._registry_lock:
+            registry = self._registry_after_write(version)
+            if registry is not None:
+                registry.models[model.id] = deepcopy(model)
+                if model.is_active and registry.active_model_id is None:
+                    registry.active_model_id = model.id
+                elif not model.is_active and registry.active_model_id == model.id:
+                    registry.active_model_id = next((m.id for m in registry.models.values() if m.is_active), None)
     
     def get_model(self, model_id: str) -> Optional[LLMModel]:
         """קבלת מודל לפי ID"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM llm_models WHERE id = ?', (model_id,))
-        row = cursor.fetchone()
-        conn.close()
-        
-        if not row:
-            return None
-        
-        capabilities = [ModelCapability(cap) for cap in json.loads(row[6])]
-        
-        return LLMModel(
-            id=row[0],
-            name=row[1],
-            provider=row[2],
-            description=row[3],
-            max_tokens=row[4],
-            cost_per_token=row[5],
-            capabilities=capabilities,
-            is_active=bool(row[7]),
-            is_available=bool(row[8]),
-            context_window=row[9],
-            training_data_cutoff=row[10],
-            version=row[11],
-            parameters=json.loads(row[12]) if row[12] else {},
-            metadata=json.loads(row[13]) if row[13] else {}
-        )
+        model = self._get_registry().models.get(model_id)
+        return deepcopy(model) if model else None
     
     def get_models_by_provider(self, provider_name: str) -> List[LLMModel]:
         """קבלת מודלים לפי ספק"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM llm_models WHERE provider = ? ORDER BY name', (provider_name,))
-        rows = cursor.fetchall()
-        conn.close()
-        
-        models = []
-        for row in rows:
-            capabilities = [ModelCapability(cap) for cap in json.loads(row[6])]
-            
-            model = LLMModel(
-                id=row[0],
-                name=row[1],
-                provider=row[2],
-                description=row[3],
-                max_tokens=row[4],
-                cost_per_token=row[5],
-                capabilities=capabilities,
-                is_active=bool(row[7]),
-                is_available=bool(row[8]),
-                context_window=row[9],
-                training_data_cutoff=row[10],
-                version=row[11],
-                parameters=json.loads(row[12]) if row[12] else {},
-                metadata=json.loads(row[13]) if row[13] else {}
-            )
-            models.append(model)
-        
-        return models
+        models = [m for m in self._get_registry().models.values() if m.provider == provider_name]
+        return [deepcopy(model) for model in sorted(models, key=lambda m: m.name)]
     
     def get_all_models(self) -> List[LLMModel]:
         """קבלת כל המודלים"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM llm_models ORDER BY provider, name')
-        rows = cursor.fetchall()
-        conn.close()
-        
-        models = []
-        for row in rows:
-            capabilities = [ModelCapability(cap) for cap in json.loads(row[6])]
-            
-            model = LLMModel(
-                id=row[0],
-                name=row[1],
-                provider=row[2],
-                description=row[3],
-                max_tokens=row[4],
-                cost_per_token=row[5],
-                capabilities=capabilities,
-                is_active=bool(row[7]),
-                is_available=bool(row[8]),
-                context_window=row[9],
-                training_data_cutoff=row[10],
-                version=row[11],
-                parameters=json.loads(row[12]) if row[12] else {},
-                metadata=json.loads(row[13]) if row[13] else {}
-            )
-            models.append(model)
-        
-        return models
+        models = self._get_registry().models.values()
+        return [deepcopy(model) for model in sorted(models, key=lambda m: (m.provider, m.name))]
     
     def set_active_model(self, model_id: str) -> bool:
         """הגדרת מודל פעיל"""
+        if model_id not in self._get_registry().models:
+            return False
+
         # איפוס כל המודלים
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
@@ -705,49 +843,24 @@ class LLMService:
         cursor.execute('UPDATE llm_models SET is_active = TRUE WHERE id = ?', (model_id,))
         
         success = cursor.rowcount > 0
-        conn.commit()
+        version = self._commit_registry_write(conn)
         conn.close()
-        
-        if success:
-            self.active_model = self.get_model(model_id)
-            
-        
+
+        with self._registry_lock:
+            registry = self._registry_after_write(version)
+            if registry is not None:
+                for model in registry.models.values():
+                    model.is_active = model.id == model_id
+                registry.active_model_id = model_id if success else None
+        
+        self.active_model = self.get_model(model_id) if success else None
         return success
     
     def get_active_model(self) -> Optional[LLMModel]:
         """קבלת המודל הפעיל"""
-        if self.active_model:
-            return self.active_model
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM llm_models WHERE is_active = TRUE LIMIT 1')
-        row = cursor.fetchone()
-        conn.close()
-        
-        if not row:
-            return None
-        
-        capabilities = [ModelCapability(cap) for cap in json.loads(row[6])]
-        
-        self.active_model = LLMModel(
-            id=row[0],
-            name=row[1],
-            provider=row[2],
-            description=row[3],
-            max_tokens=row[4],
-            cost_per_token=row[5],
-            capabilities=capabilities,
-            is_active=bool(row[7]),
-            is_available=bool(row[8]),
-            context_window=row[9],
-            training_data_cutoff=row[10],
-            version=row[11],
-            parameters=json.loads(row[12]) if row[12] else {},
-            metadata=json.loads(row[13]) if row[13] else {}
-        )
-        
+        registry = self._get_registry()
+        model = registry.models.get(registry.active_model_id) if registry.active_model_id else None
+        self.active_model = deepcopy(model) if model else None
         return self.active_model
     
     # Parameters Management
@@ -767,29 +880,90 @@ class LLMService:
         VALUES (?, ?, ?)
         ''', ("current_parameters", json.dumps(parameters.to_dict()), datetime.now().isoformat()))
         
-        conn.commit()
+        version = self._commit_registry_write(conn)
         conn.close()
+
+        with self._registry_lock:
+            registry = self._registry_after_write(version)
+            if registry is not None:
+                registry.parameters = deepcopy(parameters)
         
         return True
     
     def get_parameters(self) -> LLMParameters:
         """קבלת פרמטרים נוכחיים"""
+        parameters = self._get_registry().parameters
+        if parameters is not None:
+            self.current_parameters = deepcopy(parameters)
+        
+        return self.current_parameters
+
+    # Routing Settings
+    def get_routing_settings(self) -> Dict[str, Any]:
+        """Fallback models (tried in order when the active model fails) and whether to hedge slow requests"""
+        settings = {"fallback_models": [], "hedge": False}
+        settings.update(deepcopy(self._get_registry().routing))
+        return settings
+
+    def set_routing_settings(self, fallback_models: Optional[List[str]] = None,
+                             hedge: Optional[bool] = None) -> Dict[str, Any]:
+        """Update the routing settings; arguments left as None keep their value.
+
+        Raises ValueError for unknown model ids.
+        """
+        settings = self.get_routing_settings()
+        if fallback_models is not None:
+            unknown = [model_id for model_id in fallback_models if not self.get_model(model_id)]
+            if unknown:
+                raise ValueError(f"Unknown models: {', '.join(unknown)}")
+            settings["fallback_models"] = list(dict.fromkeys(fallback_models))
+        if hedge is not None:
+            settings["hedge"] = bool(hedge)
+
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        
-        cursor.execute('SELECT value FROM llm_settings WHERE key = ?', ("current_parameters",))
-        row = cursor.fetchone()
+        cursor.execute('''
+        INSERT OR REPLACE INTO llm_settings (key, value, updated_at)
+        VALUES (?, ?, ?)
+        ''', ("routing", json.dumps(settings), datetime.now().isoformat()))
+        version = self._commit_registry_write(conn)
         conn.close()
-        
-        if row:
-            try:
-                params_data = json.loads(row[0])
-                self.current_parameters = LLMParameters.from_dict(params_data)
-            except:
-                pass
-        
-        return self.current_parameters
-    
+
+        with self._registry_lock:
+            registry = self._registry_after_write(version)
+            if registry is not None:
+                registry.routing = deepcopy(settings)
+
+        self.router.hedge = settings["hedge"]
+        return settings
+
+    def get_routing_status(self) -> Dict[str, Any]:
+        """Routing settings with the router's per-provider load and health"""
+        return {"settings": self.get_routing_settings(), "router": self.router.stats()}
+
+    def _route_targets(self, active: LLMModel) -> List[RouteTarget]:
+        """The active model followed by the configured fallbacks that have a usable provider"""
+        models = [active]
+        for model_id in self.get_routing_settings()["fallback_models"]:
+            if model_id != active.id:
+                model = self.get_model(model_id)
+                if model:
+                    models.append(model)
+
+        targets = []
+        for model in models:
+            provider = self._get_provider_instance(model.provider)
+            if not provider:
+                continue
+            config = self.get_provider(model.provider)
+            if config:
+                self.router.configure(model.provider, ProviderLimits(
+                    max_concurrency=int(config.metadata.get("max_concurrency", DEFAULT_MAX_CONCURRENCY)),
+                    requests_per_minute=config.rate_limit,
+                ))
+            targets.append(RouteTarget(model.provider, model.id, provider))
+        return targets
+
     # API Key Management Integration
     def set_provider_api_key(self, provider_name: str, api_key: str) -> bool:
         """
@@ -934,57 +1108,179 @@ class LLMService:
             del self._old_api_keys
 
     # --- Integration Helpers ---
-    def generate_chat_response(self, messages: List[Dict[str, str]]) -> Optional[ProviderResponse]:
-        """Generate a chat completion using the active model"""
+    def _get_response_cache(self):
+        """The LLM response cache: the injected one, else the shared one in ChatCacheService"""
+        if self.response_cache is not None:
+            return self.response_cache
+        from backend.services.cache import chat_cache_service
+        return chat_cache_service.llm_response_cache
+
+    def _request_parameters(self, temperature: Optional[float] = None) -> LLMParameters:
+        """Current parameters, with the temperature overridden for this request only"""
+        params = self.get_parameters()
+        if temperature is not None:
+            params = replace(params, temperature=temperature)
+        return params
+
+    def _cached_response(self, model_id: str, messages: List[Dict[str, str]], params: LLMParameters,
+                         cache: Optional[bool]) -> Tuple[Optional[str], Optional[ProviderResponse]]:
+        """Look up a cached response.
+
+        Returns the cache key to store a fresh response under (None when the
+        request isn't cacheable) and the cached response, if there is one.
+        """
+        response_cache = self._get_response_cache()
+        parameters = params.to_dict()
+        if not response_cache.should_cache(parameters, cache):
+            return None, None
+        start = time.perf_counter()
+        key = response_cache.key_for(model_id, messages, parameters)
+        cached = response_cache.get(key)
+        if cached is None:
+            return key, None
+        return key, ProviderResponse(
+            content=cached["content"],
+            tokens_used=cached["tokens_used"],
+            # Nothing was billed for this one
+            cost=0.0,
+            response_time=time.perf_counter() - start,
+            model_used=cached["model_used"],
+            success=True,
+            metadata={
+                **(cached.get("metadata") or {}),
+                "cached": True,
+                "cached_at": datetime.fromtimestamp(cached["cached_at"]).isoformat(),
+                "cost_saved": cached["cost"],
+            },
+        )
+
+    def _cache_response(self, key: Optional[str], response: Optional[ProviderResponse]) -> None:
+        """Store a successful response under the key from _cached_response"""
+        if key is None or response is None or not response.success:
+            return
+        # The key names the active model; a fallback's reply isn't its answer
+        if (response.metadata or {}).get("route", {}).get("failover"):
+            return
+        self._get_response_cache().store(key, {
+            "content": response.content,
+            "tokens_used": response.tokens_used,
+            "cost": response.cost,
+            "model_used": response.model_used,
+            "metadata": response.metadata,
+        })
+
+    def generate_chat_response(self, messages: List[Dict[str, str]], temperature: Optional[float] = None,
+                               cache: Optional[bool] = None) -> Optional[ProviderResponse]:
+        """Generate a chat completion using the active model
+
+        Args:
+            messages: Chat messages.
+            temperature: Overrides the current temperature for this request.
+            cache: None caches only deterministic (temperature 0) calls, True
+                opts in regardless of temperature, False bypasses the cache.
+        """
         active = self.get_active_model()
         if not active:
             return None
 
-        provider = self._get_provider_instance(active.provider)
-        if not provider:
+        targets = self._route_targets(active)
+        if not targets:
             return None
 
         # Use the model ID directly for local models
-        model_id = active.id
-        params = self.get_parameters()
-        response = provider.chat_completion(messages, model_id, params)
+        params = self._request_parameters(temperature)
+        key, cached = self._cached_response(active.id, messages, params, cache)
+        if cached is not None:
+            return cached
+        response = self.router.complete(targets, messages, params)
+        self._cache_response(key, response)
+        return response
+
+    async def agenerate_chat_response(self, messages: List[Dict[str, str]], temperature: Optional[float] = None,
+                                      cache: Optional[bool] = None) -> Optional[ProviderResponse]:
+        """Generate a chat completion without blocking the event loop (arguments as in generate_chat_response)"""
+        active = self.get_active_model()
+        if not active:
+            return None
+
+        # Creating a provider instance reads its API key from the database
+        targets = await asyncio.to_thread(self._route_targets, active)
+        if not targets:
+            return None
+
+        params = self._request_parameters(temperature)
+        key, cached = self._cached_response(active.id, messages, params, cache)
+        if cached is not None:
+            return cached
+        response = await self.router.acomplete(targets, messages, params)
+        self._cache_response(key, response)
         return response
 
     async def stream_chat_response(
-        self, messages: List[Dict[str, str]], timeout: int = 60
+        self, messages: List[Dict[str, str]], timeout: int = 60, usage: Optional[StreamUsage] = None
     ):
         """Yield chat completion chunks if the provider supports streaming.
 
+        The stream goes through the router: it takes a concurrency slot and a
+        rate-limit token, and fails over to the fallback models when a
+        provider errors before its first chunk.
+
         Args:
             messages: Chat messages.
             timeout: Timeout in seconds for provider requests.
+            usage: Updated with token counts as chunks arrive.
         """
         active = self.get_active_model()
         if not active:
             return
 
-        provider = self._get_provider_instance(active.provider)
-        if not provider:
+        # Creating a provider instance reads its API key from the database
+        targets = await asyncio.to_thread(self._route_targets, active)
+        if not targets:
             return
 
-        model_id = active.id
         params = self.get_parameters()
 
+        def open_stream(target: RouteTarget):
+            if usage is not None:
+                # Drop what a provider that failed before its first chunk counted
+                usage.reset()
+            return self._provider_stream(target, messages, params, timeout, usage)
+
+        # Closing the stream aborts the upstream request on disconnect
+        async with aclosing(self.router.astream(targets, open_stream)) as stream:
+            async for chunk in stream:
+                yield chunk
+
+    async def _provider_stream(self, target: RouteTarget, messages: List[Dict[str, str]], params,
+                               timeout: int, usage: Optional[StreamUsage]):
+        """Chunks of one provider, through the best streaming method it offers"""
+        provider, model_id = target.provider, target.model_id
+
+        # Native async streaming on the shared HTTP client
+        if hasattr(provider, "astream_chat_completion"):
+            async with aclosing(
+                provider.astream_chat_completion(messages, model_id, params, timeout=timeout, usage=usage)
+            ) as stream:
+                async for chunk in stream:
+                    yield chunk
         # Provider-specific streaming method
-        if hasattr(provider, "stream_chat_completion"):
+        elif hasattr(provider, "stream_chat_completion"):
             stream_fn = provider.stream_chat_completion
             # Detect if coroutine
-            if asyncio.iscoroutinefunction(stream_fn):
+            if inspect.isasyncgenfunction(stream_fn) or asyncio.iscoroutinefunction(stream_fn):
                 async for chunk in stream_fn(messages, model_id, params, timeout=timeout):
                     yield chunk
             else:
-                for chunk in stream_fn(messages, model_id, params, timeout=timeout):
+                # Blocking generator: read it in a worker thread
+                async for chunk in iterate_in_threadpool(stream_fn(messages, model_id, params, timeout=timeout)):
                     yield chunk
         else:
             # Fallback to single response
-            resp = provider.chat_completion(messages, model_id, params)
-            if resp and resp.success:
-                yield resp.content
+            resp = await asyncio.to_thread(provider.chat_completion, messages, model_id, params)
+            if not resp or not resp.success:
+                raise ProviderError(resp.error_message if resp else "Chat completion failed")
+            yield resp.content
 
     def suggest_models_for_task(self, task: str) -> List[LLMModel]:
         """Return models suitable for the given task"""
@@ -0,0 +1,425 @@
+"""
+Write-behind persistence for chat messages.
+
+Message inserts, session counter updates and cache invalidations are queued
+and committed together in a single SQLite transaction by a background flusher,
+so the chat request path no longer pays for one commit per write.
+
+Every queued operation is appended to a journal file before it is
+acknowledged. By default the journal is only flushed to the operating system,
+which survives a crash of the process but not of the machine; the ``durable``
+flag fsyncs every write as well, at the cost of a disk sync per write on the
+request thread. Each buffer (one per worker process) owns its own journal, named
+after a journal id made of the process id, the process start time and a random
+suffix, and numbers its entries in its own sequence. The flusher rotates the
+journal before each batch and records the journal's last applied sequence
+number in ``chat_write_journals`` inside the same transaction as the batch,
+which makes replay after a crash exact: entries already committed are skipped,
+the rest are applied once.
+
+On startup a buffer replays the journals of processes that are no longer
+running; journals of live workers are left to their owners. A batch that keeps
+failing is moved to a ``.dead`` file next to the journal instead of being
+retried forever; a failed flush is retried with a growing delay even when no
+new writes arrive.
+"""
+
+import atexit
+import glob
+import json
+import os
+import sqlite3
+import logging
+import threading
+import uuid
+from collections import defaultdict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+
+from backend.models.chat import Message
+
+logger = logging.getLogger(__name__)
+
+
+def _process_stamp(pid: int) -> Optional[str]:
+    """Start time of a process in ms, which tells its journals from those of a recycled pid.
+
+    Returns None when the process doesn't exist and "" when it can't be inspected.
+    """
+    try:
+        return str(int(psutil.Process(pid).create_time() * 1000))
+    except psutil.NoSuchProcess:
+        return None
+    except psutil.Error:
+        return ""
+
+
+def _owner_alive(journal_id: str) -> bool:
+    """Whether the process that owns a journal id is still running"""
+    try:
+        pid, stamp, _ = journal_id.split("-", 2)
+        pid = int(pid)
+    except ValueError:
+        # Not written by this buffer; leave it alone
+        return True
+    current = _process_stamp(pid)
+    if current is None:
+        return False
+    # A pid we can't inspect is assumed to be the owner
+    return current in ("", stamp)
+
+
+class MessageWriteBuffer:
+    """Batch chat writes into periodic single-transaction flushes"""
+
+    def __init__(
+        self,
+        db_path: str,
+        journal_path: str = None,
+        flush_interval: float = 0.005,
+        max_batch: int = 200,
+        max_attempts: int = 5,
+        retry_interval: float = 0.5,
+        durable: bool = False,
+    ):
+        self.db_path = db_path
+        # Journal files are named "<journal_path>.<journal id>.*"
+        self.journal_base = journal_path or f"{db_path}.journal"
+        self.journal_id = f"{os.getpid()}-{_process_stamp(os.getpid())}-{uuid.uuid4().hex[:8]}"
+        self.journal_path = f"{self.journal_base}.{self.journal_id}.log"
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        # Failed flushes of the same batch before it is dead-lettered
+        self.max_attempts = max_attempts
+        # Delay before retrying a failed flush, doubled on each further failure
+        self.retry_interval = retry_interval
+        # fsync every journal write before acknowledging it
+        self.durable = durable
+
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._pending: List[dict] = []
+        self._rotated: List[str] = []
+        self._rotation = 0
+        self._seq = 0
+        self._failed_attempts = 0
+        self.dead_lettered = 0
+
+        self._init_db()
+        self._recover()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+
+        self._thread = threading.Thread(target=self._run, name="chat-write-buffer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def _init_db(self) -> None:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chat_write_journals (
+                journal_id TEXT PRIMARY KEY,
+                last_seq INTEGER NOT NULL
+            )
+            """
+        )
+        conn.commit()
+        conn.close()
+
+    # --- Producers ---
+    def enqueue_message(self, session_id: str, message: Message, stored_content: str) -> None:
+        """Queue a message insert. ``stored_content`` is the (encrypted) column value."""
+        role = message.role.value if hasattr(message.role, "value") else message.role
+        self._append(
+            {
+                "op": "message",
+                "row": [
+                    message.id,
+                    session_id,
+                    role,
+                    stored_content,
+                    message.timestamp.isoformat(),
+                    message.model_id,
+                    message.tokens_used,
+                    message.response_time,
+                    json.dumps(message.metadata),
+                ],
+                "content_length": len(message.content),
+            }
+        )
+
+    def enqueue_increment(self, session_id: str, count: int = 1) -> None:
+        """Queue a ``message_count`` increment for a session."""
+        self._append(
+            {
+                "op": "increment",
+                "session_id": session_id,
+                "count": count,
+                "updated_at": datetime.utcnow().isoformat(),
+            }
+        )
+
+    def _append(self, entry: dict) -> None:
+        with self._lock:
+            self._seq += 1
+            entry["seq"] = self._seq
+            self._journal.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._journal.flush()
+            if self.durable:
+                os.fsync(self._journal.fileno())
+            self._pending.append(entry)
+        self._wakeup.set()
+
+    @property
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    # --- Flushing ---
+    def flush(self) -> int:
+        """Commit everything queued so far. Returns the number of applied entries."""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return 0
+                batch = self._pending
+                self._pending = []
+                self._rotated.append(self._rotate_journal())
+
+            try:
+                applied, touched = self._apply(self.journal_id, batch)
+            except Exception as e:
+                self._failed_attempts += 1
+                if self._failed_attempts < self.max_attempts:
+                    logger.error(
+                        f"Write buffer flush failed ({self._failed_attempts}/{self.max_attempts}), "
+                        f"{len(batch)} writes will be retried: {e}"
+                    )
+                    with self._lock:
+                        self._pending = batch + self._pending
+                    return 0
+                applied, touched = self._apply_one_by_one(batch)
+
+            # Journal segments are only dropped once their entries are committed or dead-lettered
+            self._failed_attempts = 0
+            with self._lock:
+                rotated, self._rotated = self._rotated, []
+            for path in rotated:
+                os.remove(path)
+            self._after_commit(applied, touched)
+            return len(applied)
+
+    def _apply_one_by_one(self, batch: List[dict]) -> Tuple[List[dict], Dict[str, int]]:
+        """Apply the entries of a batch that keeps failing separately and dead-letter the ones that fail.
+
+        Returns the applied entries and the inserted counts per session.
+        """
+        applied, dead = [], []
+        inserted: Dict[str, int] = defaultdict(int)
+        for entry in batch:
+            try:
+                done, counts = self._apply(self.journal_id, [entry])
+                for session_id, count in counts.items():
+                    inserted[session_id] += count
+                applied.extend(done)
+            except Exception as e:
+                logger.error(f"Write buffer entry {entry['seq']} failed: {e}")
+                dead.append(entry)
+        if dead:
+            self._dead_letter(dead)
+        return applied, inserted
+
+    def _dead_letter(self, entries: List[dict]) -> None:
+        """Keep writes that could not be applied in a file for manual recovery"""
+        path = f"{self.journal_base}.{self.journal_id}.dead"
+        with open(path, "a", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.dead_lettered += len(entries)
+        logger.error(f"Moved {len(entries)} chat writes that keep failing to {path}")
+
+    def _rotate_journal(self) -> str:
+        """Move the live journal aside so new writes land in a fresh file (lock held)."""
+        self._journal.close()
+        self._rotation += 1
+        rotated = f"{self.journal_base}.{self.journal_id}.{self._rotation}.flushing"
+        os.replace(self.journal_path, rotated)
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        return rotated
+
+    def _apply(self, journal_id: str, batch: List[dict]) -> Tuple[List[dict], Dict[str, int]]:
+        """Apply a journal's batch in one transaction.
+
+        Entries at or below the journal's recorded sequence number are skipped.
+        Returns the applied entries and the inserted counts per session.
+        """
+        applied: List[dict] = []
+        inserted: Dict[str, int] = defaultdict(int)
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            # Taken before reading last_seq, so two workers replaying one journal apply it once
+            cursor.execute("BEGIN IMMEDIATE")
+            cursor.execute("SELECT last_seq FROM chat_write_journals WHERE journal_id = ?", (journal_id,))
+            row = cursor.fetchone()
+            skip_through = row[0] if row else 0
+
+            rows = []
+            increments: Dict[str, int] = defaultdict(int)
+            updated_at: Dict[str, str] = {}
+            last_seq = skip_through
+            for entry in batch:
+                if entry["seq"] <= skip_through:
+                    continue
+                applied.append(entry)
+                last_seq = max(last_seq, entry["seq"])
+                if entry["op"] == "message":
+                    rows.append(tuple(entry["row"]))
+                elif entry["op"] == "increment":
+                    increments[entry["session_id"]] += entry["count"]
+                    updated_at[entry["session_id"]] = entry["updated_at"]
+
+            for row in rows:
+                cursor.execute("INSERT OR IGNORE INTO chat_messages VALUES (?,?,?,?,?,?,?,?,?)", row)
+                if cursor.rowcount > 0:
+                    inserted[row[1]] += 1
+            if increments:
+                cursor.executemany(
+                    "UPDATE chat_sessions SET message_count = message_count + ?, updated_at = ? WHERE id = ?",
+                    [(count, updated_at[sid], sid) for sid, count in increments.items()],
+                )
+            cursor.execute(
+                "INSERT OR REPLACE INTO chat_write_journals (journal_id, last_seq) VALUES (?, ?)",
+                (journal_id, last_seq),
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return applied, inserted
+
+    def _after_commit(self, batch: List[dict], inserted: Dict[str, int]) -> None:
+        """Invalidate caches once per touched session and emit audit rows."""
+        from backend.services.cache.chat_cache_service import chat_cache
+        from backend.services.security.audit_service import log_user_action
+
+        for session_id in inserted:
+            try:
+                chat_cache.invalidate_session_messages(session_id)
+            except Exception as e:
+                logger.warning(f"Failed to invalidate message cache: {e}")
+
+        for entry in batch:
+            if entry["op"] != "message":
+                continue
+            row = entry["row"]
+            try:
+                log_user_action(
+                    action="message_saved",
+                    session_id=row[1],
+                    details={
+                        "message_id": row[0],
+                        "role": row[2],
+                        "encrypted": True,
+                        "content_length": entry.get("content_length", 0),
+                    },
+                )
+            except Exception as e:
+                logger.warning(f"Failed to log audit event for message save: {e}")
+
+    def _recover(self) -> None:
+        """Replay the journals of buffers whose process is no longer running."""
+        prefix = f"{self.journal_base}."
+        journals: Dict[str, List[str]] = defaultdict(list)
+        for path in glob.glob(f"{glob.escape(self.journal_base)}.*"):
+            if path.endswith(".log") or path.endswith(".flushing"):
+                journals[path[len(prefix):].split(".", 1)[0]].append(path)
+
+        for journal_id, paths in journals.items():
+            if journal_id == self.journal_id or _owner_alive(journal_id):
+                continue
+            self._replay(journal_id, paths)
+
+    def _replay(self, journal_id: str, paths: List[str]) -> None:
+        entries = []
+        for path in paths:
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                # Replayed by another worker meanwhile
+                continue
+            for line in lines:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entries.append(json.loads(line))
+                except json.JSONDecodeError:
+                    # A torn final line from a crash mid-write was never acknowledged
+                    logger.warning(f"Skipping truncated journal line in {path}")
+
+        if entries:
+            entries.sort(key=lambda e: e["seq"])
+            replayed, inserted = self._apply(journal_id, entries)
+            if replayed:
+                logger.info(f"Recovered {len(replayed)} journaled chat writes of {journal_id}")
+                self._after_commit(replayed, inserted)
+
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._forget_journal(journal_id)
+
+    def _forget_journal(self, journal_id: str) -> None:
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("DELETE FROM chat_write_journals WHERE journal_id = ?", (journal_id,))
+        conn.commit()
+        conn.close()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wakeup.wait()
+            # Give concurrent writers a moment to join the batch
+            if self.pending_count < self.max_batch:
+                self._stopped.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Write buffer worker error: {e}")
+            if self._failed_attempts and self.pending_count:
+                # The failed batch is queued again; retry it without waiting for another write
+                self._stopped.wait(self.retry_interval * 2 ** min(self._failed_attempts - 1, 5))
+                self._wakeup.set()
+
+    def close(self) -> None:
+        """Stop the flusher and persist anything still queued."""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join(timeout=5)
+        self.flush()
+        with self._lock:
+            self._journal.close()
+            clean = not self._pending and not self._rotated
+            if clean and os.path.exists(self.journal_path):
+                os.remove(self.journal_path)
+        if clean:
+            self._forget_journal(self.journal_id)
+        try:
+            atexit.unregister(self.close)
+        except Exception:
+            pass
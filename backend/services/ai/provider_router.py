@@ -0,0 +1,551 @@
+"""
+Routing of chat completions across providers
+
+ProviderRouter sends a request to the active model and, when its provider
+fails, to the configured fallback models in order. Per provider it keeps a
+concurrency limit, a token bucket for requests per minute and health
+statistics (latency and error-rate EWMAs, a latency window for p95, and a
+cooldown after repeated failures).
+
+Transient failures (rate limits, timeouts, connection errors, 5xx) are
+retried on the same provider with full-jitter exponential backoff; a rate
+limited provider is failed over at once when another target is left. Other
+failures (authentication, unknown model, invalid parameters) fail over
+without retrying. Async requests can be hedged: when an attempt runs past
+its provider's p95 latency, the next target is started too and the first
+successful response wins.
+
+Streams hold a concurrency slot and a token while they run and fail over
+to the next target when a provider errors before its first chunk; once a
+chunk was sent the error reaches the caller, since the reply can't be
+replayed. Their latency is the time to the first chunk.
+
+Fallback targets are tried healthiest first (``ProviderHealth.score``);
+the active model keeps going first unless it is cooling down.
+"""
+
+import time
+import random
+import asyncio
+import inspect
+import logging
+import threading
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from backend.services.ai.providers.base_provider import ProviderError, ProviderResponse
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_CONCURRENCY = 8
+# Failures that don't get better by trying the same provider again
+PERMANENT_ERRORS = ("AuthenticationError", "ModelNotFoundError", "InvalidParametersError")
+RATE_LIMIT_ERROR = "RateLimitError"
+# Untyped failures (API error bodies) that are worth a retry
+_TRANSIENT_MARKERS = ("rate limit", "timeout", "timed out", "connection error", "overloaded",
+                      "temporarily unavailable", "502", "503", "504", "529")
+# How often a request waiting for a concurrency slot checks again
+_ADMIT_POLL_SECONDS = 0.02
+
+
+@dataclass
+class RouteTarget:
+    """A model and the provider instance that serves it"""
+    provider_name: str
+    model_id: str
+    provider: Any
+
+
+@dataclass
+class ProviderLimits:
+    """Admission limits of one provider"""
+    max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    requests_per_minute: Optional[float] = None
+
+
+class TokenBucket:
+    """Requests-per-minute limiter; a burst of up to a minute's worth is allowed"""
+
+    def __init__(self, requests_per_minute: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = requests_per_minute / 60.0
+        self.capacity = max(1.0, float(requests_per_minute))
+        self.tokens = self.capacity
+        self._clock = clock
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def reserve(self) -> float:
+        """Take a token; returns 0 on success, else the seconds until one is available (nothing taken)"""
+        now = self._clock()
+        if now < self._paused_until:
+            return self._paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        return (1.0 - self.tokens) / self.rate
+
+    def pause(self, seconds: float) -> None:
+        """Hand out no tokens for a while, e.g. after the provider answered 429"""
+        self._paused_until = max(self._paused_until, self._clock() + seconds)
+
+
+@dataclass
+class ProviderHealth:
+    """Observed latency and failures of one provider"""
+    alpha: float = 0.2
+    window: int = 100
+    latency_ewma: Optional[float] = None
+    error_rate: float = 0.0
+    requests: int = 0
+    failures: int = 0
+    rate_limited: int = 0
+    consecutive_failures: int = 0
+    cooldown_until: float = 0.0
+    latencies: Deque[float] = field(default_factory=deque)
+
+    def record(self, latency: float, ok: bool) -> None:
+        self.requests += 1
+        self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.consecutive_failures = 0
+            # Only successes: fast failures would drag the hedging threshold down
+            self.latency_ewma = latency if self.latency_ewma is None else (
+                self.latency_ewma + self.alpha * (latency - self.latency_ewma))
+            self.latencies.append(latency)
+            if len(self.latencies) > self.window:
+                self.latencies.popleft()
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+    def p95(self, min_samples: int = 1) -> Optional[float]:
+        if len(self.latencies) < max(1, min_samples):
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+    def score(self) -> float:
+        """1.0 for a fast provider that never fails, towards 0 as errors and latency grow"""
+        latency_penalty = 1.0 + (self.latency_ewma or 0.0) / 10.0
+        return round((1.0 - self.error_rate) / latency_penalty, 4)
+
+
+class _ProviderState:
+    def __init__(self, limits: ProviderLimits):
+        self.limits = limits
+        self.bucket = TokenBucket(limits.requests_per_minute) if limits.requests_per_minute else None
+        self.health = ProviderHealth()
+        self.in_flight = 0
+
+
+class ProviderRouter:
+    """Admission control, retries, failover and hedging for chat completions"""
+
+    def __init__(self, max_attempts: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 queue_timeout: float = 10.0, hedge: bool = False, hedge_min_samples: int = 20,
+                 failure_threshold: int = 5, cooldown_seconds: float = 30.0):
+        """
+        Args:
+            max_attempts: Tries per target for transient failures.
+            backoff_base: First retry waits up to this long; doubles per attempt up to ``backoff_max``.
+            queue_timeout: Longest wait for a concurrency slot or rate-limit token before failing over.
+            hedge: Start the next target when an async attempt runs past its provider's p95 latency.
+            hedge_min_samples: Successful requests needed before a provider's p95 is trusted.
+            failure_threshold: Consecutive failures that put a provider in cooldown.
+            cooldown_seconds: How long a provider in cooldown is tried only after the other targets.
+        """
+        self.max_attempts = max(1, max_attempts)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.queue_timeout = queue_timeout
+        self.hedge = hedge
+        self.hedge_min_samples = hedge_min_samples
+        self.failure_threshold = failure_threshold
+        self.cooldown_seconds = cooldown_seconds
+
+        self._states: Dict[str, _ProviderState] = {}
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "failovers": 0, "hedges": 0, "hedge_wins": 0,
+                       "rejected": 0}
+
+    # Configuration
+
+    def configure(self, provider_name: str, limits: ProviderLimits) -> None:
+        """Set the limits of a provider; its health history is kept"""
+        with self._lock:
+            state = self._states.get(provider_name)
+            if state is None:
+                self._states[provider_name] = _ProviderState(limits)
+            elif state.limits != limits:
+                # In place: requests in flight release their slot on this state
+                state.limits = limits
+                state.bucket = TokenBucket(limits.requests_per_minute) if limits.requests_per_minute else None
+
+    def _state(self, provider_name: str) -> _ProviderState:
+        with self._lock:
+            state = self._states.get(provider_name)
+            if state is None:
+                state = self._states[provider_name] = _ProviderState(ProviderLimits())
+            return state
+
+    # Admission
+
+    def _try_admit(self, state: _ProviderState) -> float:
+        """Take a concurrency slot and a token; returns 0 if admitted, else how long to wait"""
+        with self._lock:
+            if state.in_flight >= state.limits.max_concurrency:
+                return _ADMIT_POLL_SECONDS
+            if state.bucket is not None:
+                wait = state.bucket.reserve()
+                if wait > 0:
+                    return wait
+            state.in_flight += 1
+            return 0.0
+
+    def _release(self, state: _ProviderState) -> None:
+        with self._lock:
+            state.in_flight -= 1
+
+    def _admit(self, state: _ProviderState) -> bool:
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            wait = self._try_admit(state)
+            if wait == 0:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(wait, remaining))
+
+    async def _aadmit(self, state: _ProviderState) -> bool:
+        deadline = time.monotonic() + self.queue_timeout
+        while True:
+            wait = self._try_admit(state)
+            if wait == 0:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            await asyncio.sleep(min(wait, remaining))
+
+    # Outcomes
+
+    def _classify(self, response: ProviderResponse) -> str:
+        """ok | rate_limited | transient | permanent"""
+        if response.success:
+            return "ok"
+        error_type = (response.metadata or {}).get("error_type")
+        if error_type == RATE_LIMIT_ERROR:
+            return "rate_limited"
+        if error_type in PERMANENT_ERRORS:
+            return "permanent"
+        message = (response.error_message or "").lower()
+        if "rate limit" in message:
+            return "rate_limited"
+        if any(marker in message for marker in _TRANSIENT_MARKERS):
+            return "transient"
+        return "permanent"
+
+    def _record(self, state: _ProviderState, provider_name: str, response: ProviderResponse,
+                latency: float, attempt: int) -> str:
+        outcome = self._classify(response)
+        with self._lock:
+            health = state.health
+            health.record(latency, outcome == "ok")
+            if outcome == "rate_limited":
+                health.rate_limited += 1
+                if state.bucket is not None:
+                    state.bucket.pause(self._backoff_cap(attempt))
+            if health.consecutive_failures >= self.failure_threshold:
+                health.cooldown_until = time.monotonic() + self.cooldown_seconds
+                logger.warning(f"{provider_name}: {health.consecutive_failures} failures in a row, "
+                               f"cooling down for {self.cooldown_seconds:.0f}s")
+        return outcome
+
+    def _backoff_cap(self, attempt: int) -> float:
+        return min(self.backoff_max, self.backoff_base * (2 ** attempt))
+
+    def _backoff(self, attempt: int) -> float:
+        """Full jitter: uniform in [0, base * 2^attempt], capped"""
+        return random.uniform(0, self._backoff_cap(attempt))
+
+    def _order(self, targets: List[RouteTarget]) -> List[RouteTarget]:
+        """Primary first and fallbacks by health score, with providers in cooldown after the healthy ones"""
+        now = time.monotonic()
+        primary = targets[0]
+
+        def key(target: RouteTarget):
+            health = self._state(target.provider_name).health
+            # Stable sort: fallbacks with equal scores keep their configured order
+            return (health.cooldown_until > now, target is not primary, -health.score())
+
+        return sorted(targets, key=key)
+
+    def _rejected(self, target: RouteTarget) -> ProviderResponse:
+        with self._lock:
+            self._stats["rejected"] += 1
+        return ProviderResponse(
+            content="", tokens_used=0, cost=0.0, response_time=self.queue_timeout,
+            model_used=target.model_id, success=False,
+            error_message=f"{target.provider_name} is at capacity",
+            metadata={"error_type": "ProviderOverloaded"},
+        )
+
+    @staticmethod
+    def _failed(target: RouteTarget, error: Exception) -> ProviderResponse:
+        return ProviderResponse(
+            content="", tokens_used=0, cost=0.0, response_time=0.0, model_used=target.model_id,
+            success=False, error_message=str(error), metadata={"error_type": type(error).__name__},
+        )
+
+    def _should_retry(self, outcome: str, attempt: int, has_next: bool) -> bool:
+        if outcome in ("ok", "permanent") or attempt + 1 >= self.max_attempts:
+            return False
+        # Another provider answers sooner than a rate limit lifts
+        return not (outcome == "rate_limited" and has_next)
+
+    def _annotate(self, response: ProviderResponse, target: RouteTarget, primary: RouteTarget,
+                  attempts: int, hedged: bool = False) -> ProviderResponse:
+        if response.metadata is None:
+            response.metadata = {}
+        response.metadata["route"] = {
+            "provider": target.provider_name,
+            "model_id": target.model_id,
+            "attempts": attempts,
+            "failover": target is not primary,
+            "hedged": hedged,
+        }
+        return response
+
+    # Sync path
+
+    def _attempt(self, target: RouteTarget, messages, params, has_next: bool) -> Tuple[ProviderResponse, int]:
+        state = self._state(target.provider_name)
+        for attempt in range(self.max_attempts):
+            if not self._admit(state):
+                return self._rejected(target), attempt
+            start = time.monotonic()
+            try:
+                response = target.provider.chat_completion(messages, target.model_id, params)
+            except Exception as e:
+                response = self._failed(target, e)
+            finally:
+                self._release(state)
+            outcome = self._record(state, target.provider_name, response, time.monotonic() - start, attempt)
+            if not self._should_retry(outcome, attempt, has_next):
+                return response, attempt + 1
+            with self._lock:
+                self._stats["retries"] += 1
+            time.sleep(self._backoff(attempt))
+        return response, self.max_attempts
+
+    def complete(self, targets: List[RouteTarget], messages: List[Dict[str, str]], params) -> Optional[ProviderResponse]:
+        """Run a chat completion on the first target that succeeds; hedging only applies to ``acomplete``"""
+        if not targets:
+            return None
+        with self._lock:
+            self._stats["requests"] += 1
+        primary = targets[0]
+        ordered = self._order(targets)
+        response = None
+        for index, target in enumerate(ordered):
+            if index:
+                self._count_failover(ordered[index - 1], target, response)
+            response, attempts = self._attempt(target, messages, params, has_next=index + 1 < len(ordered))
+            if response.success or index + 1 == len(ordered):
+                return self._annotate(response, target, primary, attempts)
+        return response
+
+    def _count_failover(self, previous: RouteTarget, target: RouteTarget, response: Optional[ProviderResponse]):
+        with self._lock:
+            self._stats["failovers"] += 1
+        reason = response.error_message if response is not None else "cooldown"
+        logger.warning(f"{previous.provider_name}/{previous.model_id} failed ({reason}), "
+                       f"failing over to {target.provider_name}/{target.model_id}")
+
+    # Async path
+
+    async def _acall(self, target: RouteTarget, messages, params) -> ProviderResponse:
+        achat = getattr(target.provider, "achat_completion", None)
+        if achat is not None and inspect.iscoroutinefunction(achat):
+            return await achat(messages, target.model_id, params)
+        return await asyncio.to_thread(target.provider.chat_completion, messages, target.model_id, params)
+
+    async def _aattempt(self, target: RouteTarget, messages, params, has_next: bool) -> Tuple[ProviderResponse, int]:
+        state = self._state(target.provider_name)
+        for attempt in range(self.max_attempts):
+            if not await self._aadmit(state):
+                return self._rejected(target), attempt
+            start = time.monotonic()
+            try:
+                response = await self._acall(target, messages, params)
+            except asyncio.CancelledError:
+                # Lost a hedge race or the client went away; not the provider's fault
+                raise
+            except Exception as e:
+                response = self._failed(target, e)
+            finally:
+                self._release(state)
+            outcome = self._record(state, target.provider_name, response, time.monotonic() - start, attempt)
+            if not self._should_retry(outcome, attempt, has_next):
+                return response, attempt + 1
+            with self._lock:
+                self._stats["retries"] += 1
+            await asyncio.sleep(self._backoff(attempt))
+        return response, self.max_attempts
+
+    def _hedge_delay(self, target: RouteTarget) -> Optional[float]:
+        if not self.hedge:
+            return None
+        return self._state(target.provider_name).health.p95(self.hedge_min_samples)
+
+    async def _ahedged(self, first: RouteTarget, second: RouteTarget, delay: float, messages, params,
+                       has_more: bool) -> Tuple[Optional[ProviderResponse], Optional[RouteTarget], int, bool]:
+        """
+        Run ``first``; if it is still running after ``delay``, start ``second`` as well.
+
+        Returns the winning response, its target, its attempts and whether
+        ``second`` was started. On failure of both the last response is
+        returned with a None target.
+        """
+        tasks = {asyncio.create_task(self._aattempt(first, messages, params, has_next=True)): first}
+        done, _ = await asyncio.wait(tasks, timeout=delay)
+        if done:
+            (task,) = done
+            response, attempts = task.result()
+            return response, (first if response.success else None), attempts, False
+
+        with self._lock:
+            self._stats["hedges"] += 1
+        logger.info(f"{first.provider_name}/{first.model_id} slower than its p95 ({delay:.2f}s), "
+                    f"hedging on {second.provider_name}/{second.model_id}")
+        tasks[asyncio.create_task(self._aattempt(second, messages, params, has_next=has_more))] = second
+        response, attempts = None, 0
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    response, attempts = task.result()
+                    if response.success:
+                        if tasks[task] is second:
+                            with self._lock:
+                                self._stats["hedge_wins"] += 1
+                        return response, tasks[task], attempts, True
+            return response, None, attempts, True
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def acomplete(self, targets: List[RouteTarget], messages: List[Dict[str, str]], params) -> Optional[ProviderResponse]:
+        """Async ``complete``; with ``hedge`` a slow attempt races the next target"""
+        if not targets:
+            return None
+        with self._lock:
+            self._stats["requests"] += 1
+        primary = targets[0]
+        ordered = self._order(targets)
+        response = None
+        index = 0
+        while index < len(ordered):
+            target = ordered[index]
+            if index:
+                self._count_failover(ordered[index - 1], target, response)
+            has_next = index + 1 < len(ordered)
+            delay = self._hedge_delay(target) if has_next else None
+            if delay is None:
+                response, attempts = await self._aattempt(target, messages, params, has_next)
+                if response.success or not has_next:
+                    return self._annotate(response, target, primary, attempts)
+                index += 1
+                continue
+
+            second = ordered[index + 1]
+            response, winner, attempts, hedged = await self._ahedged(
+                target, second, delay, messages, params, has_more=index + 2 < len(ordered))
+            if winner is not None:
+                return self._annotate(response, winner, primary, attempts, hedged=hedged)
+            # Both raced and failed: go on after the second
+            index += 2 if hedged else 1
+            if index >= len(ordered):
+                return self._annotate(response, second if hedged else target, primary, attempts, hedged=hedged)
+        return response
+
+    # Streaming
+
+    async def astream(self, targets: List[RouteTarget],
+                      open_stream: Callable[[RouteTarget], AsyncIterator[str]]) -> AsyncIterator[str]:
+        """
+        Yield the chunks of the first target whose stream starts.
+
+        ``open_stream`` returns a target's stream as an async generator. Failing over is only possible
+        until the first chunk; later errors are recorded and raised.
+        """
+        if not targets:
+            return
+        with self._lock:
+            self._stats["requests"] += 1
+        ordered = self._order(targets)
+        response, error = None, None
+        for index, target in enumerate(ordered):
+            if index:
+                self._count_failover(ordered[index - 1], target, response)
+            state = self._state(target.provider_name)
+            if not await self._aadmit(state):
+                response = self._rejected(target)
+                error = ProviderError(response.error_message)
+                continue
+            start = time.monotonic()
+            latency = None
+            try:
+                async with aclosing(open_stream(target)) as stream:
+                    async for chunk in stream:
+                        if latency is None:
+                            latency = time.monotonic() - start
+                        yield chunk
+            except Exception as e:
+                response, error = self._failed(target, e), e
+                self._record(state, target.provider_name, response,
+                             latency if latency is not None else time.monotonic() - start, 0)
+                if latency is not None:
+                    raise
+                continue
+            finally:
+                # Also on a client disconnect, which is not recorded against the provider
+                self._release(state)
+            ok = ProviderResponse(content="", tokens_used=0, cost=0.0, response_time=0.0, model_used=target.model_id)
+            self._record(state, target.provider_name, ok,
+                         latency if latency is not None else time.monotonic() - start, 0)
+            return
+        if error is not None:
+            raise error
+
+    # Introspection
+
+    def stats(self) -> Dict[str, Any]:
+        """Router counters and, per provider, limits, load and health"""
+        now = time.monotonic()
+        with self._lock:
+            providers = {}
+            for name, state in self._states.items():
+                health = state.health
+                providers[name] = {
+                    "max_concurrency": state.limits.max_concurrency,
+                    "requests_per_minute": state.limits.requests_per_minute,
+                    "in_flight": state.in_flight,
+                    "requests": health.requests,
+                    "failures": health.failures,
+                    "rate_limited": health.rate_limited,
+                    "error_rate": round(health.error_rate, 4),
+                    "latency_ewma": health.latency_ewma,
+                    "latency_p95": health.p95(),
+                    "score": health.score(),
+                    "cooldown_remaining": max(0.0, health.cooldown_until - now),
+                }
+            return {**self._stats, "hedge": self.hedge, "providers": providers}
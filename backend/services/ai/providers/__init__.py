@@ -2,7 +2,7 @@
 Provider integrations for LLM services
 """
 
-from .base_provider import BaseProvider, ProviderError
+from .base_provider import BaseProvider, ProviderError, StreamUsage
 from .openai_provider import OpenAIProvider
 from .anthropic_provider import AnthropicProvider
 from .google_provider import GoogleProvider
@@ -13,6 +13,7 @@ from .local_gemma_provider import LocalGemmaProvider
 __all__ = [
     'BaseProvider',
     'ProviderError',
+    'StreamUsage',
     'OpenAIProvider',
     'AnthropicProvider',
     'GoogleProvider',
@@ -7,7 +7,7 @@ import re
 from typing import Dict, Any, List, Optional, Tuple
 
 from .base_provider import (
-    BaseProvider, ProviderResponse, ProviderError, 
+    BaseProvider, ProviderResponse, ProviderError, StreamUsage,
     AuthenticationError, RateLimitError, ModelNotFoundError
 )
 
@@ -212,6 +212,19 @@ class AnthropicProvider(BaseProvider):
         Returns:
             ProviderResponse: Response from Anthropic
         """
+        endpoint, request_data = self._chat_request(messages, model_id, parameters)
+        
+        try:
+            success, response_data, response_time = self._make_request('POST', endpoint, request_data)
+            return self._chat_result(success, response_data, response_time, model_id, messages)
+        except Exception as e:
+            return self._failed_response(model_id, str(e), error=e)
+    
+    def _chat_request(self, 
+                     messages: List[Dict[str, str]], 
+                     model_id: str, 
+                     parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Validate parameters and build the messages API request"""
         # Validate model
         if model_id not in self.MODEL_CONFIGS:
             raise ModelNotFoundError(f"Model {model_id} not supported")
@@ -240,75 +253,95 @@ class AnthropicProvider(BaseProvider):
         if parameters.stop_sequences:
             request_data["stop_sequences"] = parameters.stop_sequences
         
-        try:
-            success, response_data, response_time = self._make_request('POST', 'messages', request_data)
-            
-            if not success:
-                error_msg = response_data.get('error', {}).get('message', 'Unknown error')
-                return ProviderResponse(
-                    content="",
-                    tokens_used=0,
-                    cost=0.0,
-                    response_time=response_time,
-                    model_used=model_id,
-                    success=False,
-                    error_message=error_msg
-                )
-            
-            # Extract response content
-            content_blocks = response_data.get('content', [])
-            if not content_blocks:
-                return ProviderResponse(
-                    content="",
-                    tokens_used=0,
-                    cost=0.0,
-                    response_time=response_time,
-                    model_used=model_id,
-                    success=False,
-                    error_message="No content blocks returned"
-                )
-            
-            # Combine text from all content blocks
-            content = ""
-            for block in content_blocks:
-                if block.get('type') == 'text':
-                    content += block.get('text', '')
-            
-            # Calculate usage and cost
-            usage = response_data.get('usage', {})
-            input_tokens = usage.get('input_tokens', 0)
-            output_tokens = usage.get('output_tokens', 0)
-            tokens_used = input_tokens + output_tokens
-            
-            if tokens_used == 0:
-                tokens_used = self._estimate_tokens(str(messages) + content)
-            
-            cost = self._calculate_cost(tokens_used, model_id)
-            
-            return ProviderResponse(
-                content=content,
-                tokens_used=tokens_used,
-                cost=cost,
-                response_time=response_time,
-                model_used=model_id,
-                success=True,
-                metadata={
-                    'stop_reason': response_data.get('stop_reason'),
-                    'usage': usage,
-                    'role': response_data.get('role', 'assistant')
-                }
-            )
-            
-        except Exception as e:
-            return ProviderResponse(
-                content="",
-                tokens_used=0,
-                cost=0.0,
-                response_time=0.0,
-                model_used=model_id,
-                success=False,
-                error_message=str(e)
-            )
+        return 'messages', request_data
+    
+    def _chat_result(self, 
+                    success: bool, 
+                    response_data: Dict[str, Any], 
+                    response_time: float,
+                    model_id: str,
+                    messages: List[Dict[str, str]]) -> ProviderResponse:
+        """Convert a messages API response to a ProviderResponse"""
+        if not success:
+            error_msg = response_data.get('error', {}).get('message', 'Unknown error')
+            return self._failed_response(model_id, error_msg, response_time)
+        
+        # Extract response content
+        content_blocks = response_data.get('content', [])
+        if not content_blocks:
+            return self._failed_response(model_id, "No content blocks returned", response_time)
+        
+        # Combine text from all content blocks
+        content = ""
+        for block in content_blocks:
+            if block.get('type') == 'text':
+                content += block.get('text', '')
+        
+        # Calculate usage and cost
+        usage = response_data.get('usage', {})
+        input_tokens = usage.get('input_tokens', 0)
+        output_tokens = usage.get('output_tokens', 0)
+        tokens_used = input_tokens + output_tokens
+        
+        if tokens_used == 0:
+            tokens_used = self._estimate_tokens(str(messages) + content)
+            input_tokens = tokens_used
+        
+        cost = self._calculate_cost(input_tokens, output_tokens, model_id)
+        
+        return ProviderResponse(
+            content=content,
+            tokens_used=tokens_used,
+            cost=cost,
+            response_time=response_time,
+            model_used=model_id,
+            success=True,
+            metadata={
+                'stop_reason': response_data.get('stop_reason'),
+                'usage': usage,
+                'role': response_data.get('role', 'assistant')
+            }
+        )
+    
+    def _stream_request(self, 
+                       messages: List[Dict[str, str]], 
+                       model_id: str, 
+                       parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Build the streaming messages API request (server-sent events)"""
+        endpoint, request_data = self._chat_request(messages, model_id, parameters)
+        request_data["stream"] = True
+        return endpoint, request_data
+    
+    def _parse_stream_line(self, line: str, usage: StreamUsage) -> List[str]:
+        """
+        Parse one ``data:`` event of a messages stream
+        
+        message_start carries the input tokens, content_block_delta the text
+        and message_delta the running output token count and stop reason.
+        """
+        data = self._sse_data(line)
+        if data is None:
+            return []
+        
+        event_type = data.get('type')
+        if event_type == 'content_block_delta':
+            delta = data.get('delta', {})
+            if delta.get('type') == 'text_delta' and delta.get('text'):
+                return [delta['text']]
+        elif event_type == 'message_start':
+            message_usage = data.get('message', {}).get('usage', {})
+            usage.report(prompt_tokens=message_usage.get('input_tokens'))
+        elif event_type == 'message_delta':
+            usage.report(completion_tokens=data.get('usage', {}).get('output_tokens'))
+            if data.get('delta', {}).get('stop_reason'):
+                usage.finish_reason = data['delta']['stop_reason']
+        elif event_type == 'error':
+            raise ProviderError(data.get('error', {}).get('message', 'Stream error'))
+        return []
+    
+    def _usage_cost(self, usage: StreamUsage, model_id: str) -> float:
+        """Cost of a streamed completion"""
+        return self._calculate_cost(usage.prompt_tokens, usage.completion_tokens, model_id)
     
     def _calculate_cost(self, input_tokens: int, output_tokens: int, model_id: str) -> float:
         """
@@ -4,9 +4,11 @@ Base provider class for LLM integrations
 
 import json
 import time
+import asyncio
 from abc import ABC, abstractmethod
-from typing import Dict, Any, List, Optional, Tuple
-from dataclasses import dataclass
+from typing import Dict, Any, List, Optional, Tuple, AsyncIterator, Iterator
+from dataclasses import dataclass, field
+import httpx
 import requests
 from datetime import datetime
 
@@ -15,6 +17,7 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
 
 from backend.models.commands import LLMModel, LLMParameters, UsageRecord
+from .http_client import get_async_client
 
 
 class ProviderError(Exception):
@@ -59,6 +62,70 @@ class ProviderResponse:
             self.metadata = {}
 
 
+@dataclass
+class StreamUsage:
+    """Token accounting for a streamed completion, updated as chunks arrive
+    
+    Completion tokens are estimated from the streamed text until the provider
+    reports exact counts (per token event or in its final usage event).
+    """
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    chunks: int = 0
+    finish_reason: Optional[str] = None
+    cost: float = 0.0
+    prompt_reported: bool = False
+    completion_reported: bool = False
+    _chars: int = field(default=0, repr=False)
+    
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+    
+    @property
+    def estimated(self) -> bool:
+        return not (self.prompt_reported and self.completion_reported)
+    
+    def reset(self) -> None:
+        """Forget everything counted so far, e.g. before another provider streams the reply"""
+        for name, value in StreamUsage().__dict__.items():
+            setattr(self, name, value)
+    
+    def add_text(self, text: str) -> None:
+        """Account for a streamed text chunk"""
+        self.chunks += 1
+        self._chars += len(text)
+        if not self.completion_reported:
+            self.completion_tokens = max(1, self._chars // 4)
+    
+    def add_tokens(self, count: int = 1) -> None:
+        """Account for generated tokens the provider streams one by one"""
+        if not self.completion_reported:
+            self.completion_tokens = 0
+            self.completion_reported = True
+        self.completion_tokens += count
+    
+    def report(self, prompt_tokens: Optional[int] = None, completion_tokens: Optional[int] = None) -> None:
+        """Replace estimates with counts reported by the provider"""
+        if prompt_tokens is not None:
+            self.prompt_tokens = prompt_tokens
+            self.prompt_reported = True
+        if completion_tokens is not None:
+            self.completion_tokens = completion_tokens
+            self.completion_reported = True
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "chunks": self.chunks,
+            "estimated": self.estimated,
+            "finish_reason": self.finish_reason,
+            "cost": self.cost
+        }
+
+
 class BaseProvider(ABC):
     """Base class for all LLM providers"""
     
@@ -195,20 +262,14 @@ class BaseProvider(ABC):
             # Handle different response status codes
             if response.status_code == 200:
                 return True, response.json(), response_time
-            elif response.status_code == 401:
-                raise AuthenticationError("Invalid API key or authentication failed")
-            elif response.status_code == 429:
-                raise RateLimitError("Rate limit exceeded")
-            elif response.status_code == 404:
-                raise ModelNotFoundError("Model not found or endpoint not available")
-            else:
-                error_data = {}
-                try:
-                    error_data = response.json()
-                except:
-                    error_data = {"error": response.text}
-                
-                return False, error_data, response_time
+            self._raise_for_status(response.status_code)
+            error_data = {}
+            try:
+                error_data = response.json()
+            except:
+                error_data = {"error": response.text}
+            
+            return False, error_data, response_time
                 
         except requests.exceptions.Timeout:
             response_time = time.time() - start_time
@@ -220,6 +281,287 @@ class BaseProvider(ABC):
             response_time = time.time() - start_time
             raise ProviderError(f"Request failed: {str(e)}")
     
+    def _raise_for_status(self, status_code: int) -> None:
+        """Raise the matching provider error for auth, rate limit and not-found statuses"""
+        if status_code == 401:
+            raise AuthenticationError("Invalid API key or authentication failed")
+        elif status_code == 429:
+            raise RateLimitError("Rate limit exceeded")
+        elif status_code == 404:
+            raise ModelNotFoundError("Model not found or endpoint not available")
+    
+    def _async_headers(self) -> Dict[str, str]:
+        """Session headers for the shared async client (hop-by-hop headers dropped)"""
+        return {
+            key: value for key, value in self.session.headers.items()
+            if key.lower() not in ('connection', 'keep-alive')
+        }
+    
+    async def _amake_request(self, 
+                            method: str, 
+                            endpoint: str, 
+                            data: Dict[str, Any] = None,
+                            timeout: int = 30) -> Tuple[bool, Dict[str, Any], float]:
+        """
+        Async counterpart of ``_make_request`` on the shared connection pool
+        
+        Returns:
+            Tuple[bool, Dict[str, Any], float]: (success, response_data, response_time)
+        """
+        url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
+        
+        start_time = time.time()
+        
+        try:
+            response = await get_async_client().request(
+                method.upper(), url,
+                json=data if method.upper() in ('POST', 'PUT') else None,
+                headers=self._async_headers(),
+                timeout=timeout
+            )
+        except httpx.TimeoutException:
+            raise ProviderError(f"Request timeout after {timeout} seconds")
+        except httpx.ConnectError:
+            raise ProviderError("Connection error - check internet connection")
+        except httpx.HTTPError as e:
+            raise ProviderError(f"Request failed: {str(e)}")
+        
+        response_time = time.time() - start_time
+        
+        if response.status_code == 200:
+            return True, response.json(), response_time
+        self._raise_for_status(response.status_code)
+        try:
+            error_data = response.json()
+        except ValueError:
+            error_data = {"error": response.text}
+        return False, error_data, response_time
+    
+    async def _astream_lines(self, 
+                            endpoint: str, 
+                            data: Dict[str, Any],
+                            timeout: int = 60) -> AsyncIterator[str]:
+        """
+        POST ``data`` and yield the response body line by line as it arrives
+        
+        Closing the iterator (e.g. when the client disconnects) closes the
+        response and returns the connection to the pool.
+        """
+        url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
+        
+        try:
+            async with get_async_client().stream(
+                'POST', url, json=data, headers=self._async_headers(), timeout=timeout
+            ) as response:
+                if response.status_code != 200:
+                    self._raise_for_status(response.status_code)
+                    body = (await response.aread()).decode('utf-8', errors='replace')
+                    raise ProviderError(f"Streaming request failed ({response.status_code}): {body[:500]}")
+                async for line in response.aiter_lines():
+                    if line:
+                        yield line
+        except httpx.TimeoutException:
+            raise ProviderError(f"Request timeout after {timeout} seconds")
+        except httpx.ConnectError:
+            raise ProviderError("Connection error - check internet connection")
+        except httpx.HTTPError as e:
+            raise ProviderError(f"Request failed: {str(e)}")
+    
+    def _chat_request(self, 
+                     messages: List[Dict[str, str]], 
+                     model_id: str, 
+                     parameters: LLMParameters) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Build the chat completion request
+        
+        Returns:
+            Optional[Tuple[str, Dict[str, Any]]]: (endpoint, request_data), or None
+            for providers that don't talk HTTP (``achat_completion`` then runs
+            ``chat_completion`` in a worker thread)
+        """
+        return None
+    
+    def _chat_result(self, 
+                    success: bool, 
+                    response_data: Dict[str, Any], 
+                    response_time: float,
+                    model_id: str,
+                    messages: List[Dict[str, str]]) -> ProviderResponse:
+        """Convert a chat completion API response to a ProviderResponse"""
+        raise NotImplementedError
+    
+    def _failed_response(self, model_id: str, error_message: str, response_time: float = 0.0,
+                         error: Optional[Exception] = None) -> ProviderResponse:
+        """ProviderResponse for a failed request; ``error`` is recorded so callers can tell rate limits from other failures"""
+        return ProviderResponse(
+            content="",
+            tokens_used=0,
+            cost=0.0,
+            response_time=response_time,
+            model_used=model_id,
+            success=False,
+            error_message=error_message,
+            metadata={"error_type": type(error).__name__} if error is not None else None
+        )
+    
+    async def achat_completion(self, 
+                              messages: List[Dict[str, str]], 
+                              model_id: str, 
+                              parameters: LLMParameters,
+                              timeout: int = 30) -> ProviderResponse:
+        """
+        Chat completion without blocking the event loop
+        
+        Args:
+            messages (List[Dict[str, str]]): Chat messages
+            model_id (str): Model identifier
+            parameters (LLMParameters): Generation parameters
+            timeout (int): Request timeout in seconds
+            
+        Returns:
+            ProviderResponse: Response from the provider
+        """
+        request = self._chat_request(messages, model_id, parameters)
+        if request is None:
+            return await asyncio.to_thread(self.chat_completion, messages, model_id, parameters)
+        
+        endpoint, request_data = request
+        try:
+            success, response_data, response_time = await self._amake_request('POST', endpoint, request_data, timeout)
+            return self._chat_result(success, response_data, response_time, model_id, messages)
+        except Exception as e:
+            return self._failed_response(model_id, str(e), error=e)
+    
+    def _stream_request(self, 
+                       messages: List[Dict[str, str]], 
+                       model_id: str, 
+                       parameters: LLMParameters) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Build the streaming chat request
+        
+        Returns:
+            Optional[Tuple[str, Dict[str, Any]]]: (endpoint, request_data), or None
+            if the provider has no streaming protocol
+        """
+        return None
+    
+    def _parse_stream_line(self, line: str, usage: StreamUsage) -> List[str]:
+        """
+        Parse one line of the provider's stream
+        
+        Returns the text chunks it carries and records token counts and the
+        finish reason in ``usage``.
+        """
+        raise NotImplementedError
+    
+    def _sse_data(self, line: str) -> Optional[Dict[str, Any]]:
+        """JSON payload of a server-sent events ``data:`` line, None for other lines"""
+        if not line.startswith('data:'):
+            return None
+        payload = line[5:].strip()
+        if not payload or payload == '[DONE]':
+            return None
+        try:
+            return json.loads(payload)
+        except json.JSONDecodeError:
+            return None
+    
+    def _prompt_text(self, messages: List[Dict[str, str]], model_id: str) -> str:
+        """Text the prompt token estimate is based on"""
+        return str(messages)
+    
+    def _usage_cost(self, usage: StreamUsage, model_id: str) -> float:
+        """Cost of a streamed completion"""
+        return self._calculate_cost(usage.total_tokens, model_id)
+    
+    def _start_stream(self, 
+                     messages: List[Dict[str, str]], 
+                     model_id: str, 
+                     usage: Optional[StreamUsage]) -> StreamUsage:
+        usage = usage if usage is not None else StreamUsage()
+        usage.prompt_tokens = self._estimate_tokens(self._prompt_text(messages, model_id))
+        return usage
+    
+    def _finish_stream(self, usage: StreamUsage, model_id: str) -> None:
+        try:
+            usage.cost = self._usage_cost(usage, model_id)
+        except Exception:
+            usage.cost = 0.0
+    
+    async def astream_chat_completion(self, 
+                                     messages: List[Dict[str, str]], 
+                                     model_id: str, 
+                                     parameters: LLMParameters,
+                                     timeout: int = 60,
+                                     usage: Optional[StreamUsage] = None) -> AsyncIterator[str]:
+        """
+        Yield chat completion chunks without blocking the event loop
+        
+        Args:
+            messages (List[Dict[str, str]]): Chat messages
+            model_id (str): Model identifier
+            parameters (LLMParameters): Generation parameters
+            timeout (int): Request timeout in seconds
+            usage (StreamUsage, optional): Updated with token counts as chunks arrive
+        
+        Providers without a streaming protocol yield the whole reply as one chunk.
+        Closing the generator early aborts the upstream request.
+        """
+        request = self._stream_request(messages, model_id, parameters)
+        if request is None:
+            response = await self.achat_completion(messages, model_id, parameters, timeout=timeout)
+            if not response.success:
+                raise ProviderError(response.error_message or "Chat completion failed")
+            if usage is not None:
+                usage.add_text(response.content)
+                usage.cost = response.cost
+            if response.content:
+                yield response.content
+            return
+        
+        usage = self._start_stream(messages, model_id, usage)
+        endpoint, request_data = request
+        async for line in self._astream_lines(endpoint, request_data, timeout=timeout):
+            for text in self._parse_stream_line(line, usage):
+                usage.add_text(text)
+                yield text
+        self._finish_stream(usage, model_id)
+    
+    def stream_chat_completion(self, 
+                              messages: List[Dict[str, str]], 
+                              model_id: str, 
+                              parameters: LLMParameters,
+                              timeout: int = 60,
+                              usage: Optional[StreamUsage] = None) -> Iterator[str]:
+        """Blocking counterpart of ``astream_chat_completion``"""
+        request = self._stream_request(messages, model_id, parameters)
+        if request is None:
+            response = self.chat_completion(messages, model_id, parameters)
+            if not response.success:
+                raise ProviderError(response.error_message or "Chat completion failed")
+            if usage is not None:
+                usage.add_text(response.content)
+                usage.cost = response.cost
+            if response.content:
+                yield response.content
+            return
+        
+        usage = self._start_stream(messages, model_id, usage)
+        endpoint, request_data = request
+        url = f"{self.base_url.rstrip('/')}/{endpoint.lstrip('/')}"
+        
+        with self.session.post(url, json=request_data, stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                self._raise_for_status(response.status_code)
+                raise ProviderError(f"Streaming request failed ({response.status_code}): {response.text[:500]}")
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                for text in self._parse_stream_line(line.decode('utf-8'), usage):
+                    usage.add_text(text)
+                    yield text
+        self._finish_stream(usage, model_id)
+    
     def _calculate_cost(self, tokens_used: int, model_id: str) -> float:
         """
         Calculate cost based on tokens used
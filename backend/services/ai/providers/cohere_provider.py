@@ -7,7 +7,7 @@ import re
 from typing import Dict, Any, List, Optional, Tuple
 
 from .base_provider import (
-    BaseProvider, ProviderResponse, ProviderError, 
+    BaseProvider, ProviderResponse, ProviderError, StreamUsage,
     AuthenticationError, RateLimitError, ModelNotFoundError
 )
 
@@ -282,6 +282,19 @@ class CohereProvider(BaseProvider):
         Returns:
             ProviderResponse: Response from Cohere
         """
+        endpoint, request_data = self._chat_request(messages, model_id, parameters)
+        
+        try:
+            success, response_data, response_time = self._make_request('POST', endpoint, request_data)
+            return self._chat_result(success, response_data, response_time, model_id, messages)
+        except Exception as e:
+            return self._failed_response(model_id, str(e), error=e)
+    
+    def _chat_request(self, 
+                     messages: List[Dict[str, str]], 
+                     model_id: str, 
+                     parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Validate parameters and build the chat API request"""
         # Validate model
         if model_id not in self.MODEL_CONFIGS:
             raise ModelNotFoundError(f"Model {model_id} not supported")
@@ -327,61 +340,83 @@ class CohereProvider(BaseProvider):
         if parameters.stop_sequences:
             request_data["stop_sequences"] = parameters.stop_sequences
         
+        return 'chat', request_data
+    
+    def _chat_result(self, 
+                    success: bool, 
+                    response_data: Dict[str, Any], 
+                    response_time: float,
+                    model_id: str,
+                    messages: List[Dict[str, str]]) -> ProviderResponse:
+        """Convert a chat API response to a ProviderResponse"""
+        if not success:
+            error_msg = response_data.get('message', 'Unknown error')
+            return self._failed_response(model_id, error_msg, response_time)
+        
+        # Extract response content
+        content = response_data.get('text', '')
+        
+        # Calculate usage and cost
+        meta = response_data.get('meta', {})
+        billed_units = meta.get('billed_units', {})
+        input_tokens = billed_units.get('input_tokens', 0)
+        output_tokens = billed_units.get('output_tokens', 0)
+        tokens_used = input_tokens + output_tokens
+        
+        if tokens_used == 0:
+            tokens_used = self._estimate_tokens(str(messages) + content)
+            input_tokens = tokens_used
+        
+        cost = self._calculate_cost(input_tokens, output_tokens, model_id)
+        
+        return ProviderResponse(
+            content=content,
+            tokens_used=tokens_used,
+            cost=cost,
+            response_time=response_time,
+            model_used=model_id,
+            success=True,
+            metadata={
+                'finish_reason': response_data.get('finish_reason'),
+                'billed_units': billed_units,
+                'warnings': meta.get('warnings', []),
+                'role': 'assistant'
+            }
+        )
+    
+    def _stream_request(self, 
+                       messages: List[Dict[str, str]], 
+                       model_id: str, 
+                       parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Build the streaming chat API request (newline-delimited JSON events)"""
+        endpoint, request_data = self._chat_request(messages, model_id, parameters)
+        request_data["stream"] = True
+        return endpoint, request_data
+    
+    def _parse_stream_line(self, line: str, usage: StreamUsage) -> List[str]:
+        """Parse one JSON event of a chat stream; stream-end carries billed units"""
         try:
-            success, response_data, response_time = self._make_request('POST', 'chat', request_data)
-            
-            if not success:
-                error_msg = response_data.get('message', 'Unknown error')
-                return ProviderResponse(
-                    content="",
-                    tokens_used=0,
-                    cost=0.0,
-                    response_time=response_time,
-                    model_used=model_id,
-                    success=False,
-                    error_message=error_msg
-                )
-            
-            # Extract response content
-            content = response_data.get('text', '')
-            
-            # Calculate usage and cost
-            meta = response_data.get('meta', {})
-            billed_units = meta.get('billed_units', {})
-            input_tokens = billed_units.get('input_tokens', 0)
-            output_tokens = billed_units.get('output_tokens', 0)
-            tokens_used = input_tokens + output_tokens
-            
-            if tokens_used == 0:
-                tokens_used = self._estimate_tokens(str(messages) + content)
-            
-            cost = self._calculate_cost(tokens_used, model_id)
-            
-            return ProviderResponse(
-                content=content,
-                tokens_used=tokens_used,
-                cost=cost,
-                response_time=response_time,
-                model_used=model_id,
-                success=True,
-                metadata={
-                    'finish_reason': response_data.get('finish_reason'),
-                    'billed_units': billed_units,
-                    'warnings': meta.get('warnings', []),
-                    'role': 'assistant'
-                }
-            )
-            
-        except Exception as e:
-            return ProviderResponse(
-                content="",
-                tokens_used=0,
-                cost=0.0,
-                response_time=0.0,
-                model_used=model_id,
-                success=False,
-                error_message=str(e)
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            return []
+        
+        event_type = data.get('event_type')
+        if event_type == 'text-generation' and data.get('text'):
+            return [data['text']]
+        if event_type == 'stream-end':
+            usage.finish_reason = data.get('finish_reason')
+            billed_units = data.get('response', {}).get('meta', {}).get('billed_units', {})
+            usage.report(
+                prompt_tokens=billed_units.get('input_tokens'),
+                completion_tokens=billed_units.get('output_tokens')
             )
+            if usage.finish_reason == 'ERROR':
+                raise ProviderError(data.get('response', {}).get('text') or 'Stream error')
+        return []
+    
+    def _usage_cost(self, usage: StreamUsage, model_id: str) -> float:
+        """Cost of a streamed completion"""
+        return self._calculate_cost(usage.prompt_tokens, usage.completion_tokens, model_id)
     
     def _calculate_cost(self, input_tokens: int, output_tokens: int, model_id: str) -> float:
         """
@@ -397,6 +432,9 @@ class CohereProvider(BaseProvider):
         """
         if model_id in self.MODEL_CONFIGS:
             cost_config = self.MODEL_CONFIGS[model_id]["cost_per_1k_tokens"]
+            if not isinstance(cost_config, dict):
+                # Flat rate for input and output
+                return ((input_tokens + output_tokens) / 1000) * cost_config
             input_cost = (input_tokens / 1000) * cost_config["input"]
             output_cost = (output_tokens / 1000) * cost_config["output"]
             return input_cost + output_cost
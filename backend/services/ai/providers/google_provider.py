@@ -7,7 +7,7 @@ import re
 from typing import Dict, Any, List, Optional, Tuple
 
 from .base_provider import (
-    BaseProvider, ProviderResponse, ProviderError, 
+    BaseProvider, ProviderResponse, ProviderError, StreamUsage,
     AuthenticationError, RateLimitError, ModelNotFoundError
 )
 
@@ -293,6 +293,19 @@ class GoogleProvider(BaseProvider):
         Returns:
             ProviderResponse: Response from Google AI
         """
+        endpoint, request_data = self._chat_request(messages, model_id, parameters)
+        
+        try:
+            success, response_data, response_time = self._make_request('POST', endpoint, request_data)
+            return self._chat_result(success, response_data, response_time, model_id, messages)
+        except Exception as e:
+            return self._failed_response(model_id, str(e), error=e)
+    
+    def _chat_request(self, 
+                     messages: List[Dict[str, str]], 
+                     model_id: str, 
+                     parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Validate parameters and build the generateContent request"""
         # Convert messages to Google AI format
         contents = []
         for message in messages:
@@ -331,79 +344,58 @@ class GoogleProvider(BaseProvider):
         if parameters.stop_sequences:
             request_data["generationConfig"]["stopSequences"] = parameters.stop_sequences
         
-        try:
-            endpoint = f"models/{model_id}:generateContent"
-            success, response_data, response_time = self._make_request('POST', endpoint, request_data)
-            
-            if not success:
-                error_msg = response_data.get('error', {}).get('message', 'Unknown error')
-                return ProviderResponse(
-                    content="",
-                    tokens_used=0,
-                    cost=0.0,
-                    response_time=response_time,
-                    model_used=model_id,
-                    success=False,
-                    error_message=error_msg
-                )
-            
-            # Extract response content
-            candidates = response_data.get('candidates', [])
-            if not candidates:
-                return ProviderResponse(
-                    content="",
-                    tokens_used=0,
-                    cost=0.0,
-                    response_time=response_time,
-                    model_used=model_id,
-                    success=False,
-                    error_message="No candidates returned"
-                )
-            
-            candidate = candidates[0]
-            content_parts = candidate.get('content', {}).get('parts', [])
-            
-            content = ""
-            for part in content_parts:
-                if 'text' in part:
-                    content += part['text']
-            
-            # Calculate usage and cost
-            usage_metadata = response_data.get('usageMetadata', {})
-            prompt_tokens = usage_metadata.get('promptTokenCount', 0)
-            completion_tokens = usage_metadata.get('candidatesTokenCount', 0)
-            tokens_used = prompt_tokens + completion_tokens
-            
-            if tokens_used == 0:
-                tokens_used = self._estimate_tokens(str(messages) + content)
-            
-            cost = self._calculate_cost(tokens_used, model_id)
-            
-            return ProviderResponse(
-                content=content,
-                tokens_used=tokens_used,
-                cost=cost,
-                response_time=response_time,
-                model_used=model_id,
-                success=True,
-                metadata={
-                    'finish_reason': candidate.get('finishReason'),
-                    'usage': usage_metadata,
-                    'safety_ratings': candidate.get('safetyRatings', []),
-                    'role': 'assistant'
-                }
-            )
-            
-        except Exception as e:
-            return ProviderResponse(
-                content="",
-                tokens_used=0,
-                cost=0.0,
-                response_time=0.0,
-                model_used=model_id,
-                success=False,
-                error_message=str(e)
-            )
+        return f"models/{model_id}:generateContent", request_data
+    
+    def _chat_result(self, 
+                    success: bool, 
+                    response_data: Dict[str, Any], 
+                    response_time: float,
+                    model_id: str,
+                    messages: List[Dict[str, str]]) -> ProviderResponse:
+        """Convert a generateContent response to a ProviderResponse"""
+        if not success:
+            error_msg = response_data.get('error', {}).get('message', 'Unknown error')
+            return self._failed_response(model_id, error_msg, response_time)
+        
+        # Extract response content
+        candidates = response_data.get('candidates', [])
+        if not candidates:
+            return self._failed_response(model_id, "No candidates returned", response_time)
+        
+        candidate = candidates[0]
+        content_parts = candidate.get('content', {}).get('parts', [])
+        
+        content = ""
+        for part in content_parts:
+            if 'text' in part:
+                content += part['text']
+        
+        # Calculate usage and cost
+        usage_metadata = response_data.get('usageMetadata', {})
+        prompt_tokens = usage_metadata.get('promptTokenCount', 0)
+        completion_tokens = usage_metadata.get('candidatesTokenCount', 0)
+        tokens_used = prompt_tokens + completion_tokens
+        
+        if tokens_used == 0:
+            tokens_used = self._estimate_tokens(str(messages) + content)
+            prompt_tokens = tokens_used
+        
+        cost = self._calculate_cost(prompt_tokens, completion_tokens, model_id)
+        
+        return ProviderResponse(
+            content=content,
+            tokens_used=tokens_used,
+            cost=cost,
+            response_time=response_time,
+            model_used=model_id,
+            success=True,
+            metadata={
+                'finish_reason': candidate.get('finishReason'),
+                'usage': usage_metadata,
+                'safety_ratings': candidate.get('safetyRatings', []),
+                'role': 'assistant'
+            }
+        )
     
     def _calculate_cost(self, prompt_tokens: int, completion_tokens: int, model_id: str) -> float:
         """
@@ -501,52 +493,41 @@ class GoogleProvider(BaseProvider):
                 models.append(model_info)
         return models
 
-    def stream_chat_completion(
-        self,
-        messages: List[Dict[str, str]],
-        model_id: str,
-        parameters: LLMParameters,
-        timeout: int = 60,
-    ):
-        """Yield chat completion chunks using Google AI's streaming API."""
-
-        contents = []
-        for message in messages:
-            role = message.get("role", "user")
-            if role == "assistant":
-                role = "model"
-            contents.append({"role": role, "parts": [{"text": message.get("content", "")}]})
-
-        request_data = {
-            "contents": contents,
-            "generationConfig": {
-                "temperature": parameters.temperature,
-                "topP": parameters.top_p,
-                "maxOutputTokens": min(
-                    parameters.max_tokens,
-                    self.MODEL_CONFIGS.get(model_id, {}).get("max_tokens", parameters.max_tokens),
-                ),
-            },
-        }
-
-        if parameters.stop_sequences:
-            request_data["generationConfig"]["stopSequences"] = parameters.stop_sequences
-
-        endpoint = f"models/{model_id}:streamGenerateContent"
-        url = f"{self.base_url.rstrip('/')}/{endpoint}"
-
-        with self.session.post(url, json=request_data, stream=True, timeout=timeout) as resp:
-            resp.raise_for_status()
-            for line in resp.iter_lines():
-                if not line:
-                    continue
-                try:
-                    data = json.loads(line.decode("utf-8"))
-                except json.JSONDecodeError:
-                    continue
-
-                for candidate in data.get("candidates", []):
-                    parts = candidate.get("content", {}).get("parts", [])
-                    for part in parts:
-                        if "text" in part:
-                            yield part["text"]
+    def _stream_request(self, 
+                       messages: List[Dict[str, str]], 
+                       model_id: str, 
+                       parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Build the streamGenerateContent request (server-sent events)"""
+        endpoint, request_data = self._chat_request(messages, model_id, parameters)
+        endpoint = endpoint.replace(':generateContent', ':streamGenerateContent') + '?alt=sse'
+        return endpoint, request_data
+    
+    def _parse_stream_line(self, line: str, usage: StreamUsage) -> List[str]:
+        """Text parts and usage metadata carried by one streamed response"""
+        if line.startswith('data:'):
+            line = line[5:]
+        try:
+            data = json.loads(line)
+        except json.JSONDecodeError:
+            return []
+        
+        # Every chunk carries the running usage
+        usage_metadata = data.get("usageMetadata")
+        if usage_metadata:
+            usage.report(
+                prompt_tokens=usage_metadata.get("promptTokenCount"),
+                completion_tokens=usage_metadata.get("candidatesTokenCount")
+            )
+        
+        texts = []
+        for candidate in data.get("candidates", []):
+            if candidate.get("finishReason"):
+                usage.finish_reason = candidate["finishReason"]
+            for part in candidate.get("content", {}).get("parts", []):
+                if "text" in part:
+                    texts.append(part["text"])
+        return texts
+    
+    def _usage_cost(self, usage: StreamUsage, model_id: str) -> float:
+        """Cost of a streamed completion"""
+        return self._calculate_cost(usage.prompt_tokens, usage.completion_tokens, model_id)
@@ -0,0 +1,61 @@
+"""
+Shared async HTTP client for provider integrations
+
+All providers share one ``httpx.AsyncClient`` per event loop, so concurrent
+chats reuse the same keep-alive connection pool instead of opening a socket
+per request. HTTP/2 is enabled when the optional ``h2`` package is installed.
+"""
+
+import asyncio
+import logging
+import weakref
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Hundreds of concurrent streams over HTTP/1.1 need a connection each
+MAX_CONNECTIONS = 512
+MAX_KEEPALIVE_CONNECTIONS = 64
+KEEPALIVE_EXPIRY = 30.0
+DEFAULT_TIMEOUT = httpx.Timeout(30.0, connect=10.0)
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# An AsyncClient's connections belong to the loop that opened them
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+
+def create_async_client() -> httpx.AsyncClient:
+    """Create a pooled client with the provider defaults"""
+    return httpx.AsyncClient(
+        http2=HTTP2_AVAILABLE,
+        timeout=DEFAULT_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=MAX_CONNECTIONS,
+            max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=KEEPALIVE_EXPIRY,
+        ),
+    )
+
+
+def get_async_client() -> httpx.AsyncClient:
+    """Return the shared client for the running event loop"""
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = create_async_client()
+        _clients[loop] = client
+        logger.debug(f"Created provider HTTP client (http2={HTTP2_AVAILABLE})")
+    return client
+
+
+async def aclose_async_client() -> None:
+    """Close the shared client of the running event loop (e.g. on shutdown)"""
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
@@ -7,7 +7,7 @@ import re
 from typing import Dict, Any, List, Optional, Tuple
 
 from .base_provider import (
-    BaseProvider, ProviderResponse, ProviderError, 
+    BaseProvider, ProviderResponse, ProviderError, StreamUsage,
     AuthenticationError, RateLimitError, ModelNotFoundError
 )
 
@@ -214,6 +214,19 @@ class HuggingFaceProvider(BaseProvider):
         Returns:
             ProviderResponse: Response from Hugging Face
         """
+        endpoint, request_data = self._generate_request(prompt, model_id, parameters)
+        
+        try:
+            success, response_data, response_time = self._make_request('POST', endpoint, request_data)
+            return self._generate_result(success, response_data, response_time, model_id, prompt)
+        except Exception as e:
+            return self._failed_response(model_id, str(e), error=e)
+    
+    def _generate_request(self, 
+                         prompt: str, 
+                         model_id: str, 
+                         parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Validate parameters and build the inference API request"""
         # Validate model
         if model_id not in self.MODEL_CONFIGS:
             raise ModelNotFoundError(f"Model {model_id} not supported")
@@ -239,67 +252,45 @@ class HuggingFaceProvider(BaseProvider):
         if parameters.stop_sequences:
             request_data["parameters"]["stop"] = parameters.stop_sequences
         
-        try:
-            endpoint = f"models/{model_id}"
-            success, response_data, response_time = self._make_request('POST', endpoint, request_data)
-            
-            if not success:
-                error_msg = response_data.get('error', 'Unknown error')
-                return ProviderResponse(
-                    content="",
-                    tokens_used=0,
-                    cost=0.0,
-                    response_time=response_time,
-                    model_used=model_id,
-                    success=False,
-                    error_message=error_msg
-                )
-            
-            # Extract response content
-            content = ""
-            if isinstance(response_data, list) and len(response_data) > 0:
-                content = response_data[0].get('generated_text', '')
-            elif isinstance(response_data, dict):
-                content = response_data.get('generated_text', '')
-            
-            if not content:
-                return ProviderResponse(
-                    content="",
-                    tokens_used=0,
-                    cost=0.0,
-                    response_time=response_time,
-                    model_used=model_id,
-                    success=False,
-                    error_message="No generated text returned"
-                )
-            
-            # Calculate usage and cost (Hugging Face doesn't provide token counts)
-            tokens_used = self._estimate_tokens(prompt + content)
-            cost = self._calculate_cost(tokens_used, model_id)
-            
-            return ProviderResponse(
-                content=content,
-                tokens_used=tokens_used,
-                cost=cost,
-                response_time=response_time,
-                model_used=model_id,
-                success=True,
-                metadata={
-                    'estimated_tokens': True,
-                    'model_type': 'huggingface_inference'
-                }
-            )
-            
-        except Exception as e:
-            return ProviderResponse(
-                content="",
-                tokens_used=0,
-                cost=0.0,
-                response_time=0.0,
-                model_used=model_id,
-                success=False,
-                error_message=str(e)
-            )
+        return f"models/{model_id}", request_data
+    
+    def _generate_result(self, 
+                        success: bool, 
+                        response_data: Any, 
+                        response_time: float,
+                        model_id: str,
+                        prompt: str) -> ProviderResponse:
+        """Convert an inference API response to a ProviderResponse"""
+        if not success:
+            error_msg = response_data.get('error', 'Unknown error')
+            return self._failed_response(model_id, error_msg, response_time)
+        
+        # Extract response content
+        content = ""
+        if isinstance(response_data, list) and len(response_data) > 0:
+            content = response_data[0].get('generated_text', '')
+        elif isinstance(response_data, dict):
+            content = response_data.get('generated_text', '')
+        
+        if not content:
+            return self._failed_response(model_id, "No generated text returned", response_time)
+        
+        # Calculate usage and cost (Hugging Face doesn't provide token counts)
+        tokens_used = self._estimate_tokens(prompt + content)
+        cost = self._calculate_cost(tokens_used, 0, model_id)
+        
+        return ProviderResponse(
+            content=content,
+            tokens_used=tokens_used,
+            cost=cost,
+            response_time=response_time,
+            model_used=model_id,
+            success=True,
+            metadata={
+                'estimated_tokens': True,
+                'model_type': 'huggingface_inference'
+            }
+        )
     
     def chat_completion(self, 
                        messages: List[Dict[str, str]], 
@@ -321,14 +312,77 @@ class HuggingFaceProvider(BaseProvider):
         
         # Use generate_text for chat completion
         response = self.generate_text(prompt, model_id, parameters)
-        
-        # Update metadata to indicate this was a chat completion
+        return self._as_chat_response(response)
+    
+    def _chat_request(self, 
+                     messages: List[Dict[str, str]], 
+                     model_id: str, 
+                     parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Build the inference API request for a chat prompt"""
+        prompt = self._format_messages_for_model(messages, model_id)
+        return self._generate_request(prompt, model_id, parameters)
+    
+    def _chat_result(self, 
+                    success: bool, 
+                    response_data: Any, 
+                    response_time: float,
+                    model_id: str,
+                    messages: List[Dict[str, str]]) -> ProviderResponse:
+        """Convert an inference API response for a chat prompt"""
+        prompt = self._format_messages_for_model(messages, model_id)
+        response = self._generate_result(success, response_data, response_time, model_id, prompt)
+        return self._as_chat_response(response)
+    
+    def _as_chat_response(self, response: ProviderResponse) -> ProviderResponse:
+        """Update metadata to indicate this was a chat completion"""
         if response.metadata:
             response.metadata['request_type'] = 'chat'
             response.metadata['role'] = 'assistant'
         
         return response
     
+    def _stream_request(self, 
+                       messages: List[Dict[str, str]], 
+                       model_id: str, 
+                       parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Build the streaming text-generation request (server-sent token events)"""
+        endpoint, request_data = self._chat_request(messages, model_id, parameters)
+        request_data["stream"] = True
+        return endpoint, request_data
+    
+    def _parse_stream_line(self, line: str, usage: StreamUsage) -> List[str]:
+        """
+        Parse one ``data:`` token event
+        
+        Every event is one generated token, so completion tokens are counted
+        exactly; the final event's details carry the total.
+        """
+        data = self._sse_data(line)
+        if data is None:
+            return []
+        if 'error' in data:
+            raise ProviderError(str(data['error']))
+        
+        token = data.get('token') or {}
+        if token:
+            usage.add_tokens(1)
+        details = data.get('details') or {}
+        if details:
+            usage.finish_reason = details.get('finish_reason')
+            usage.report(completion_tokens=details.get('generated_tokens'))
+        
+        if token.get('text') and not token.get('special'):
+            return [token['text']]
+        return []
+    
+    def _prompt_text(self, messages: List[Dict[str, str]], model_id: str) -> str:
+        """Token estimate is based on the formatted prompt"""
+        return self._format_messages_for_model(messages, model_id)
+    
+    def _usage_cost(self, usage: StreamUsage, model_id: str) -> float:
+        """Cost of a streamed completion"""
+        return self._calculate_cost(usage.prompt_tokens, usage.completion_tokens, model_id)
+    
     def _format_messages_for_model(self, messages: List[Dict[str, str]], model_id: str) -> str:
         """
         Format messages for specific Hugging Face models
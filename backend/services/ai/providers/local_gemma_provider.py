@@ -3,16 +3,50 @@ Provider for running local Gemma models using Hugging Face Transformers
 """
 
 import os
+import time
+import asyncio
+import threading
 import torch, gc
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
-from typing import List, Dict, Optional
+from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM, TextIteratorStreamer
+from typing import List, Dict, Optional, Iterator, AsyncIterator
 
-from .base_provider import BaseProvider, ProviderResponse
+from .base_provider import BaseProvider, ProviderResponse, ProviderError, StreamUsage
+from .local_scheduler import LocalInferenceScheduler, MAX_BATCH_SIZE, MAX_CONCURRENT_TOKENS
+from .local_prefix_cache import PrefixKVCache, PREFIX_CACHE_BYTES
+from .local_model_manager import LocalModelManager, default_memory_budget, IDLE_UNLOAD_SECONDS
+from .local_backends import LOCAL_BACKENDS, apply_backend, default_backend, resolve_backend
 from backend.models.commands import LLMParameters
 
+_END = object()
+
+
+class _CountingStreamer(TextIteratorStreamer):
+    """TextIteratorStreamer that counts the prompt and generated tokens it receives"""
+
+    def __init__(self, tokenizer, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.prompt_tokens = 0
+        self.generated_tokens = 0
+
+    def put(self, value):
+        if self.skip_prompt and self.next_tokens_are_prompt:
+            self.prompt_tokens = value.shape[-1]
+        else:
+            self.generated_tokens += value.shape[-1] if value.dim() > 1 else value.numel()
+        super().put(value)
+
+
 class LocalGemmaProvider(BaseProvider):
     """Provider for local Gemma models"""
 
+    # Limits of the per-model batching scheduler
+    max_batch_size = MAX_BATCH_SIZE
+    max_concurrent_tokens = MAX_CONCURRENT_TOKENS
+    # Per-model budget for KV prefixes reused across turns (0 disables)
+    prefix_cache_bytes = PREFIX_CACHE_BYTES
+    # Unused models are unloaded after this long (None keeps them)
+    idle_unload_seconds = IDLE_UNLOAD_SECONDS
+
     def __init__(self, api_key: str = None, base_url: str = None):
         """
         Initializes the LocalGemmaProvider.
@@ -23,72 +57,236 @@ class LocalGemmaProvider(BaseProvider):
         """
         super().__init__(api_key, base_url)
         self.active_model_name: Optional[str] = None
-        self._loaded_models: Dict[str, pipeline] = {}
+        self._schedulers: Dict[str, LocalInferenceScheduler] = {}
+        self._schedulers_lock = threading.Lock()
+        self._local_model_path: Optional[str] = None
+        self._local_model_path_resolved = False
+        # Inference backend per model id; others use default_backend()
+        self.model_backends: Dict[str, str] = {}
+        self._loaded_backends: Dict[str, str] = {}
+        self.models = LocalModelManager(
+            lambda model_id: self._create_pipeline(model_id),
+            memory_budget_bytes=default_memory_budget(),
+            idle_unload_seconds=self.idle_unload_seconds,
+            on_unload=self._on_model_unloaded,
+        )
 
     def _load_model(self, model_id: str):
-        """Initializes the model and tokenizer pipeline.
+        """Load the model (once; later calls reuse it) and make it the active one."""
+        if self.models.get(model_id) is None:
+            return False
+        self.active_model_name = model_id
+        return True
+
+    def _create_pipeline(self, model_id: str):
+        """Build the text-generation pipeline of a model; called by the model manager.
 
         The ``model_id`` argument can be either a Hugging Face model ID or a
-        path to a previously downloaded snapshot.  The loaded pipeline is
-        cached so subsequent calls are fast.
+        path to a previously downloaded snapshot.
         """
-        if model_id in self._loaded_models:
-            self.active_model_name = model_id
-            print(f"Switched to already loaded model '{model_id}'.")
-            return True
-
         print("\n" + "=" * 50)
         print(f"INFO: Loading local model '{model_id}'.")
         print("=" * 50 + "\n")
 
-        try:
-            # Check for downloaded model first
-            local_path = self._get_local_model_path()
-            if local_path:
-                path_to_use = local_path
-                print(f"Using downloaded model: {local_path}")
-            else:
-                # For any model, try to use the downloaded DialoGPT as fallback
-                print(f"No local model found, using DialoGPT-small as fallback")
-                path_to_use = "microsoft/DialoGPT-small"
-            
-            print(f"Using model path: {path_to_use}")
+        # Check for downloaded model first
+        local_path = self._get_local_model_path()
+        if local_path:
+            path_to_use = local_path
+            print(f"Using downloaded model: {local_path}")
+        else:
+            # For any model, try to use the downloaded DialoGPT as fallback
+            print(f"No local model found, using DialoGPT-small as fallback")
+            path_to_use = "microsoft/DialoGPT-small"
 
-            # Determine the device
-            device = "cuda" if torch.cuda.is_available() else "cpu"
-            print(f"Using device: {device}")
+        print(f"Using model path: {path_to_use}")
 
-            # Set torch_dtype based on device
-            torch_dtype = (
-                torch.bfloat16 if torch.cuda.is_available() and torch.cuda.is_bf16_supported() else torch.float32
-            )
+        # Determine the device
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+        print(f"Using device: {device}")
 
-            # Choose appropriate task based on model
-            task = "conversational" if "dialogpt" in actual_model_name.lower() else "text-generation"
-            
-            model_pipeline = pipeline(
-                task,
-                model=path_to_use,
-                device=device,
-                torch_dtype=torch_dtype,
-            )
-            self._loaded_models[model_id] = model_pipeline
-            self.active_model_name = model_id
-            print(f"Successfully loaded model '{model_id}' on {device}.")
-            return True
-        except Exception as e:
-            print(f"Error initializing local model: {e}")
-            return False
+        # Set torch_dtype based on device
+        torch_dtype = (
+            torch.bfloat16 if torch.cuda.is_available() and torch.cuda.is_bf16_supported() else torch.float32
+        )
+
+        # DialoGPT is a causal LM as well; all models run on the batching scheduler
+        model_pipeline = pipeline(
+            "text-generation",
+            model=path_to_use,
+            device=device,
+            torch_dtype=torch_dtype,
+        )
+        backend = self.backend_for(model_id)
+        model_pipeline.model = apply_backend(model_pipeline.model, backend)
+        self._loaded_backends[model_id] = backend
+        print(f"Successfully loaded model '{model_id}' on {device} ({backend} backend).")
+        return model_pipeline
+
+    def backend_for(self, model_id: str) -> str:
+        """Inference backend a model is loaded with"""
+        return self.model_backends.get(model_id) or default_backend()
+
+    def set_model_backend(self, model_id: str, backend: Optional[str]) -> bool:
+        """Select the backend of a model (None for the default); a loaded model is reloaded with it.
+
+        Raises ValueError for unknown backends. Returns True if the backend changed.
+        """
+        backend = resolve_backend(backend)
+        changed = backend != self.backend_for(model_id)
+        self.model_backends[model_id] = backend
+        self._unload_if_stale(model_id)
+        return changed
+
+    def _unload_if_stale(self, model_id: str) -> None:
+        """Unload a model loaded with another backend than the selected one, unless it is generating"""
+        loaded = self._loaded_backends.get(model_id)
+        if loaded is None or loaded == self.backend_for(model_id):
+            return
+        # A model in use keeps its weights; the next generation after it finishes reloads it
+        if self.models.unload(model_id):
+            print(f"Model '{model_id}' unloaded to switch to the {self.backend_for(model_id)} backend.")
+
+    def preload(self, model_id: str) -> threading.Thread:
+        """Load a model in the background so the first chat doesn't wait for it; it stays warm while active."""
+        self.active_model_name = model_id
+        return self.models.preload(model_id, pin=True)
+
+    def model_status(self) -> Dict:
+        """Load state, memory and timing of the local models, with their scheduler counters"""
+        status = self.models.status()
+        with self._schedulers_lock:
+            schedulers = dict(self._schedulers)
+        for model in status["models"]:
+            scheduler = schedulers.get(model["model_id"])
+            model["scheduler"] = scheduler.stats() if scheduler is not None else None
+            model["backend"] = self.backend_for(model["model_id"])
+        status["active_model"] = self.active_model_name
+        status["backends"] = list(LOCAL_BACKENDS)
+        return status
 
     def unload_model(self, model_id: Optional[str] = None):
         """Unloads a specific model or all models to free up memory."""
         model_to_unload = model_id or self.active_model_name
-        if model_to_unload and model_to_unload in self._loaded_models:
-            del self._loaded_models[model_to_unload]
-            gc.collect()
-            torch.cuda.empty_cache()
+        if model_to_unload and self.models.unload(model_to_unload, force=True):
             print(f"Model '{model_to_unload}' unloaded.")
 
+    def _on_model_unloaded(self, model_id: str, model_pipeline):
+        """Stop the model's scheduler (dropping its prefix cache) and release the memory"""
+        self._loaded_backends.pop(model_id, None)
+        with self._schedulers_lock:
+            scheduler = self._schedulers.pop(model_id, None)
+        if scheduler is not None:
+            scheduler.stop()
+        del model_pipeline, scheduler
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def _build_prompt(self, messages: List[Dict[str, str]], tokenizer) -> str:
+        """Render the conversation with the model's chat template, or a plain User/Assistant transcript"""
+        if getattr(tokenizer, "chat_template", None):
+            return tokenizer.apply_chat_template(messages, tokenize=False, add_generation_prompt=True)
+
+        prompt = ""
+        for msg in messages:
+            if msg['role'] == 'user':
+                prompt += f"User: {msg['content']}\n"
+            elif msg['role'] == 'assistant':
+                prompt += f"Assistant: {msg['content']}\n"
+
+        # No trailing space: the reply's first token carries it, so the reply
+        # tokenizes the same way when it comes back in the next turn's history
+        prompt += "Assistant:"
+        return prompt
+
+    def _get_scheduler(self, model_id: str, active_pipe) -> LocalInferenceScheduler:
+        """The single worker that runs every generation of a loaded model"""
+        with self._schedulers_lock:
+            scheduler = self._schedulers.get(model_id)
+            if scheduler is None:
+                scheduler = LocalInferenceScheduler(
+                    active_pipe.model,
+                    active_pipe.tokenizer,
+                    max_batch_size=self.max_batch_size,
+                    max_concurrent_tokens=self.max_concurrent_tokens,
+                    name=model_id,
+                    prefix_cache=PrefixKVCache(self.prefix_cache_bytes) if self.prefix_cache_bytes else None,
+                )
+                self._schedulers[model_id] = scheduler
+            return scheduler
+
+    def _generate_stream(self, messages: List[Dict[str, str]], model_id: str, params: LLMParameters,
+                         timeout: int, usage: StreamUsage, stop: threading.Event) -> Iterator[str]:
+        """
+        Queue the generation on the model's batching scheduler and yield text as tokens are decoded.
+
+        Token counts come from the streamer (prompt length and every generated
+        token), so nothing is re-encoded. Setting ``stop`` drops the request
+        from the batch at the next step.
+        """
+        self._unload_if_stale(model_id)
+        # Held for the whole generation so the model can't be evicted meanwhile
+        with self.models.use(model_id) as active_pipe:
+            if active_pipe is None:
+                raise ProviderError(f"Could not initialize model: {model_id}")
+
+            self.active_model_name = model_id
+            tokenizer = active_pipe.tokenizer
+            scheduler = self._get_scheduler(model_id, active_pipe)
+
+            prompt_ids = tokenizer(self._build_prompt(messages, tokenizer))["input_ids"]
+            streamer = _CountingStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=timeout)
+            request = scheduler.submit(
+                prompt_ids,
+                max_new_tokens=params.max_tokens,
+                temperature=params.temperature,
+                top_p=params.top_p,
+                streamer=streamer,
+                stop_event=stop,
+            )
+            try:
+                for text in streamer:
+                    usage.report(prompt_tokens=streamer.prompt_tokens, completion_tokens=streamer.generated_tokens)
+                    if text:
+                        usage.chunks += 1
+                        yield text
+            finally:
+                scheduler.cancel(request)
+                request.done.wait()
+
+        if request.error:
+            raise ProviderError(f"Generation failed: {request.error}")
+        usage.finish_reason = request.finish_reason
+        usage.report(prompt_tokens=streamer.prompt_tokens, completion_tokens=streamer.generated_tokens)
+
+    def stream_chat_completion(self, messages: List[Dict[str, str]], model_id: str, params: LLMParameters,
+                               timeout: int = 60, usage: Optional[StreamUsage] = None) -> Iterator[str]:
+        """Yield the reply of the local model as tokens are decoded."""
+        usage = usage if usage is not None else StreamUsage()
+        yield from self._generate_stream(messages, model_id, params, timeout, usage, threading.Event())
+
+    async def astream_chat_completion(self, messages: List[Dict[str, str]], model_id: str, params: LLMParameters,
+                                      timeout: int = 60, usage: Optional[StreamUsage] = None) -> AsyncIterator[str]:
+        """Stream without blocking the event loop; closing the stream stops generation."""
+        usage = usage if usage is not None else StreamUsage()
+        stop = threading.Event()
+        # Model loading and each decoded chunk are waited for in a worker thread
+        stream = self._generate_stream(messages, model_id, params, timeout, usage, stop)
+        try:
+            while True:
+                text = await asyncio.to_thread(next, stream, _END)
+                if text is _END:
+                    break
+                yield text
+        finally:
+            stop.set()
+            try:
+                # Waits until the scheduler has dropped the request from its batch
+                await asyncio.to_thread(stream.close)
+            except ValueError:
+                # Cancelled while a chunk was still being waited for; the scheduler drops it on its own
+                pass
+
     def chat_completion(self, messages: List[Dict[str, str]], model_id: str, params: LLMParameters) -> Optional[ProviderResponse]:
         """
         Generate a chat completion using the local Gemma model.
@@ -101,95 +299,37 @@ class LocalGemmaProvider(BaseProvider):
         Returns:
             Optional[ProviderResponse]: The response from the provider or None on failure.
         """
-        # Load or switch model if necessary
-        if model_id not in self._loaded_models:
-            if not self._load_model(model_id):
-                return ProviderResponse(
-                    content=f"Failed to load local model: {model_id}",
-                    tokens_used=0,
-                    cost=0.0,
-                    response_time=0.0,
-                    model_used=model_id,
-                    success=False,
-                    error_message=f"Could not initialize model: {model_id}"
-                )
-        
-        self.active_model_name = model_id
-        active_pipe = self._loaded_models[self.active_model_name]
-
+        usage = StreamUsage()
+        start = time.time()
         try:
-            # Handle different model types
-            if hasattr(active_pipe, 'task') and active_pipe.task == 'conversational':
-                # DialoGPT conversational model
-                from transformers import Conversation
-                
-                # Convert messages to conversation format
-                conversation_text = ""
-                for msg in messages:
-                    if msg['role'] == 'user':
-                        conversation_text += msg['content'] + " "
-                
-                conversation = Conversation(conversation_text.strip())
-                result = active_pipe(conversation)
-                generated_text = result.generated_responses[-1] if result.generated_responses else "I'm sorry, I couldn't generate a response."
-                
-                prompt_tokens = len(conversation_text.split())
-                completion_tokens = len(generated_text.split())
-                
-            else:
-                # Standard text generation model
-                # Convert messages to simple prompt
-                prompt = ""
-                for msg in messages:
-                    if msg['role'] == 'user':
-                        prompt += f"User: {msg['content']}\n"
-                    elif msg['role'] == 'assistant':
-                        prompt += f"Assistant: {msg['content']}\n"
-                
-                prompt += "Assistant: "
-                
-                # Generate the response
-                outputs = active_pipe(
-                    prompt,
-                    max_new_tokens=params.max_tokens,
-                    do_sample=True,
-                    temperature=params.temperature,
-                    top_p=params.top_p,
-                    top_k=params.top_k,
-                    pad_token_id=active_pipe.tokenizer.eos_token_id
-                )
-                
-                # Extract only the generated text
-                generated_text = outputs[0]["generated_text"][len(prompt):].strip()
-                
-                prompt_tokens = len(active_pipe.tokenizer.encode(prompt))
-                completion_tokens = len(active_pipe.tokenizer.encode(generated_text))
-
-            return ProviderResponse(
-                content=generated_text.strip(),
-                tokens_used=prompt_tokens + completion_tokens,
-                cost=0.0,
-                response_time=0.0,
-                model_used=self.active_model_name,
-                success=True,
-                error_message=None,
-                metadata={
-                    "prompt_tokens": prompt_tokens,
-                    "completion_tokens": completion_tokens,
-                    "total_tokens": prompt_tokens + completion_tokens
-                }
-            )
+            generated_text = "".join(self.stream_chat_completion(messages, model_id, params, usage=usage))
         except Exception as e:
             return ProviderResponse(
                 content="Error occurred during generation",
                 tokens_used=0,
                 cost=0.0,
-                response_time=0.0,
-                model_used=self.active_model_name or "unknown",
+                response_time=time.time() - start,
+                model_used=self.active_model_name or model_id,
                 success=False,
                 error_message=str(e)
             )
 
+        return ProviderResponse(
+            content=generated_text.strip(),
+            tokens_used=usage.total_tokens,
+            cost=0.0,
+            response_time=time.time() - start,
+            model_used=self.active_model_name,
+            success=True,
+            error_message=None,
+            metadata={
+                "prompt_tokens": usage.prompt_tokens,
+                "completion_tokens": usage.completion_tokens,
+                "total_tokens": usage.total_tokens,
+                "finish_reason": usage.finish_reason
+            }
+        )
+
     def test_connection(self) -> tuple[bool, str, float]:
         """
         Test the connection to the local model.
@@ -213,7 +353,14 @@ class LocalGemmaProvider(BaseProvider):
         else:
             return False, "Model failed to initialize.", 0.0
     def _get_local_model_path(self):
-        """Get the local path for a downloaded model"""
+        """Get the local path for a downloaded model (resolved once per provider)"""
+        if not self._local_model_path_resolved:
+            self._local_model_path = self._find_local_model_path()
+            self._local_model_path_resolved = True
+        return self._local_model_path
+
+    def _find_local_model_path(self):
+        """Scan models/gemma for a downloaded model"""
         try:
             from pathlib import Path
             config_file = Path("models/gemma/model_config.txt")
@@ -252,22 +399,14 @@ class LocalGemmaProvider(BaseProvider):
     def generate_text(self, prompt: str, max_tokens: int = 100) -> str:
         """Generate text using the local model"""
         try:
-            if not self.active_model_name or self.active_model_name not in self._loaded_models:
+            if not self.active_model_name or self.active_model_name not in self.models.loaded():
                 # Try to load a default model
                 if not self._load_model("google-gemma-2-2b-it"):
                     return "Sorry, I couldn't load the model."
             
-            active_pipe = self._loaded_models[self.active_model_name]
-            
-            if hasattr(active_pipe, 'task') and active_pipe.task == 'conversational':
-                from transformers import Conversation
-                conversation = Conversation()
-                conversation.add_user_input(prompt)
-                result = active_pipe(conversation, max_length=max_tokens)
-                return result.generated_responses[-1] if result.generated_responses else "No response generated."
-            else:
-                outputs = active_pipe(prompt, max_new_tokens=max_tokens, do_sample=True, temperature=0.7)
-                return outputs[0]["generated_text"][len(prompt):].strip()
+            params = LLMParameters(temperature=0.7, max_tokens=max_tokens)
+            messages = [{"role": "user", "content": prompt}]
+            return "".join(self.stream_chat_completion(messages, self.active_model_name, params)).strip()
         except Exception as e:
             return f"Error generating text: {str(e)}"
     
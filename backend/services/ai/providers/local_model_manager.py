@@ -0,0 +1,355 @@
+"""
+Lifecycle manager for local models
+
+Loads local models once (concurrent callers wait for the same load), can
+preload a model in a background thread so the first chat doesn't pay for
+a cold start, and keeps the resident weights under a RAM budget by
+unloading the least recently used idle models. Models that stay idle for
+``idle_unload_seconds`` are unloaded by a background reaper.
+"""
+
+import os
+import time
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+try:
+    import psutil
+    PSUTIL_AVAILABLE = True
+except ImportError:
+    PSUTIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Overrides the default budget of half the physical memory
+MEMORY_BUDGET_ENV = "LOCAL_MODEL_MEMORY_BUDGET_MB"
+# Set to 1 in the process that should load the active model at startup
+PRELOAD_ENV = "LOCAL_MODEL_PRELOAD"
+IDLE_UNLOAD_SECONDS = 30 * 60
+
+
+def default_memory_budget() -> Optional[int]:
+    """Budget in bytes from the environment, else half of physical RAM (None if unknown)"""
+    configured = os.getenv(MEMORY_BUDGET_ENV)
+    if configured:
+        return int(float(configured) * 1024 * 1024)
+    if PSUTIL_AVAILABLE:
+        return psutil.virtual_memory().total // 2
+    return None
+
+
+def startup_preload_enabled() -> bool:
+    """Whether this process preloads the active model at startup.
+
+    Off unless opted in, so only one of several server workers holds the
+    weights before its first chat.
+    """
+    return os.getenv(PRELOAD_ENV, "").strip().lower() in ("1", "true", "yes")
+
+
+def model_memory_bytes(pipeline: Any) -> int:
+    """Bytes held by the weights and buffers of a pipeline's (or a bare) model"""
+    model = getattr(pipeline, "model", pipeline)
+    total = 0
+    for tensors in (getattr(model, "parameters", None), getattr(model, "buffers", None)):
+        if tensors is not None:
+            total += sum(t.numel() * t.element_size() for t in tensors())
+    # Quantized layers keep their weights in packed params rather than parameters
+    for module in (model.modules() if hasattr(model, "modules") else ()):
+        if hasattr(module, "_packed_params") and callable(getattr(module, "weight", None)):
+            for tensor in (module.weight(), module.bias()):
+                if tensor is not None:
+                    total += tensor.numel() * tensor.element_size()
+    return total
+
+
+def _process_rss() -> Optional[int]:
+    return psutil.Process().memory_info().rss if PSUTIL_AVAILABLE else None
+
+
+def _iso(timestamp: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+@dataclass
+class ManagedModel:
+    """Load state and accounting of one local model"""
+    model_id: str
+    state: str = "unloaded"  # unloaded | loading | loaded | failed
+    pipeline: Any = None
+    resident_bytes: int = 0
+    rss_delta_bytes: Optional[int] = None
+    load_seconds: Optional[float] = None
+    loaded_at: Optional[float] = None
+    last_used: Optional[float] = None
+    in_use: int = 0
+    pinned: bool = False
+    load_count: int = 0
+    error: Optional[str] = None
+    ready: threading.Event = field(default_factory=threading.Event)
+
+    def to_dict(self, now: Optional[float] = None) -> Dict[str, Any]:
+        now = time.time() if now is None else now
+        return {
+            "model_id": self.model_id,
+            "state": self.state,
+            "resident_bytes": self.resident_bytes,
+            "rss_delta_bytes": self.rss_delta_bytes,
+            "load_seconds": self.load_seconds,
+            "loaded_at": _iso(self.loaded_at),
+            "last_used": _iso(self.last_used),
+            "idle_seconds": (now - self.last_used) if self.last_used and not self.in_use else 0.0,
+            "in_use": self.in_use,
+            "pinned": self.pinned,
+            "load_count": self.load_count,
+            "error": self.error,
+        }
+
+
+class LocalModelManager:
+    """Loads, tracks and evicts local model pipelines"""
+
+    def __init__(self, loader: Callable[[str], Any], memory_budget_bytes: Optional[int] = None,
+                 idle_unload_seconds: Optional[float] = IDLE_UNLOAD_SECONDS,
+                 on_unload: Optional[Callable[[str, Any], None]] = None):
+        """
+        Args:
+            loader: Builds the pipeline of a model id; exceptions mark the load as failed.
+            memory_budget_bytes: Limit for the weights of all loaded models (None for no limit).
+            idle_unload_seconds: Unload models unused for this long (None keeps them).
+            on_unload: Called with the model id and pipeline after a model is dropped.
+        """
+        self.loader = loader
+        self.memory_budget_bytes = memory_budget_bytes
+        self.idle_unload_seconds = idle_unload_seconds
+        self.on_unload = on_unload
+
+        self._models: Dict[str, ManagedModel] = {}
+        self._lock = threading.Lock()
+        self._reaper: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._stats = {"loads": 0, "failed_loads": 0, "evictions": 0, "idle_unloads": 0}
+        # (model_id, pipeline) dropped under the lock, handed to on_unload outside it
+        self._unload_queue: List[tuple] = []
+
+    # Loading
+
+    def get(self, model_id: str) -> Optional[Any]:
+        """Return the loaded pipeline, loading it first if needed; None if loading fails"""
+        with self._lock:
+            record = self._models.setdefault(model_id, ManagedModel(model_id))
+            if record.state == "loaded":
+                record.last_used = time.time()
+                return record.pipeline
+            if record.state == "loading":
+                ready = record.ready
+                load_here = False
+            else:
+                self._begin_load(record)
+                load_here = True
+
+        if load_here:
+            self._load(record)
+        else:
+            ready.wait()
+        return record.pipeline if record.state == "loaded" else None
+
+    @contextmanager
+    def use(self, model_id: str) -> Iterator[Optional[Any]]:
+        """Hold a model for the duration of a generation so it can't be evicted meanwhile"""
+        with self._lock:
+            record = self._models.setdefault(model_id, ManagedModel(model_id))
+            record.in_use += 1
+        try:
+            yield self.get(model_id)
+        finally:
+            with self._lock:
+                record.in_use -= 1
+                record.last_used = time.time()
+
+    def preload(self, model_id: str, pin: bool = True) -> threading.Thread:
+        """
+        Load a model in a background thread.
+
+        The pinned model (the active one; pinning moves it from the previous
+        one) is never unloaded for being idle and is the last candidate for
+        eviction under memory pressure.
+        """
+        with self._lock:
+            record = self._models.setdefault(model_id, ManagedModel(model_id))
+            if pin:
+                for other in self._models.values():
+                    other.pinned = other is record
+        thread = threading.Thread(target=self.get, args=(model_id,), name=f"preload-{model_id}", daemon=True)
+        thread.start()
+        return thread
+
+    def register(self, model_id: str, pipeline: Any) -> None:
+        """Adopt a pipeline that was built elsewhere"""
+        with self._lock:
+            record = self._models.setdefault(model_id, ManagedModel(model_id))
+            self._begin_load(record)
+        self._load(record, pipeline=pipeline)
+
+    def _begin_load(self, record: ManagedModel) -> None:
+        record.state = "loading"
+        record.error = None
+        record.ready = threading.Event()
+        # Make room with what the model took last time, if it was loaded before
+        self._evict_for(record.resident_bytes, exclude=record.model_id)
+
+    def _load(self, record: ManagedModel, pipeline: Any = None) -> None:
+        rss_before = _process_rss()
+        start = time.perf_counter()
+        try:
+            if pipeline is None:
+                logger.info(f"Loading local model '{record.model_id}'")
+                pipeline = self.loader(record.model_id)
+        except Exception as e:
+            logger.error(f"Loading local model '{record.model_id}' failed: {e}")
+            with self._lock:
+                record.state = "failed"
+                record.error = str(e)
+                self._stats["failed_loads"] += 1
+                record.ready.set()
+            self._run_unloads()
+            return
+
+        elapsed = time.perf_counter() - start
+        rss_after = _process_rss()
+        with self._lock:
+            record.pipeline = pipeline
+            record.state = "loaded"
+            record.resident_bytes = model_memory_bytes(pipeline)
+            record.rss_delta_bytes = rss_after - rss_before if rss_before is not None else None
+            record.load_seconds = elapsed
+            record.loaded_at = record.last_used = time.time()
+            record.load_count += 1
+            self._stats["loads"] += 1
+            self._evict_for(0, exclude=record.model_id)
+            record.ready.set()
+        logger.info(f"Loaded local model '{record.model_id}' in {elapsed:.1f}s "
+                    f"({record.resident_bytes / 1024 ** 2:.0f} MiB)")
+        self._run_unloads()
+        self._ensure_reaper()
+
+    # Unloading
+
+    def unload(self, model_id: str, force: bool = False) -> bool:
+        """Unload a model; one that is generating is only unloaded with ``force``"""
+        with self._lock:
+            record = self._models.get(model_id)
+            if record is None or record.state != "loaded" or (record.in_use and not force):
+                return False
+            self._drop(record)
+        self._run_unloads()
+        return True
+
+    def unload_all(self) -> None:
+        with self._lock:
+            for record in self._models.values():
+                if record.state == "loaded":
+                    self._drop(record)
+        self._run_unloads()
+
+    def unload_idle(self, now: Optional[float] = None) -> List[str]:
+        """Unload unpinned models that have been idle longer than ``idle_unload_seconds``"""
+        if self.idle_unload_seconds is None:
+            return []
+        now = time.time() if now is None else now
+        unloaded = []
+        with self._lock:
+            for record in self._models.values():
+                if (record.state == "loaded" and not record.pinned and not record.in_use
+                        and now - (record.last_used or 0) >= self.idle_unload_seconds):
+                    self._drop(record)
+                    self._stats["idle_unloads"] += 1
+                    unloaded.append(record.model_id)
+        self._run_unloads()
+        return unloaded
+
+    def _evict_for(self, needed: int, exclude: str) -> None:
+        """Unload LRU idle models until ``needed`` more bytes fit. Called with the lock held."""
+        if self.memory_budget_bytes is None:
+            return
+        candidates = sorted(
+            (r for r in self._models.values()
+             if r.state == "loaded" and not r.in_use and r.model_id != exclude),
+            key=lambda r: (r.pinned, r.last_used or 0),
+        )
+        for record in candidates:
+            if self._resident_bytes() + needed <= self.memory_budget_bytes:
+                return
+            logger.info(f"Evicting local model '{record.model_id}' to stay within the memory budget")
+            self._drop(record)
+            self._stats["evictions"] += 1
+        if self._resident_bytes() + needed > self.memory_budget_bytes:
+            logger.warning("Local models exceed the memory budget; the remaining ones are in use")
+
+    def _drop(self, record: ManagedModel) -> None:
+        """Mark a model unloaded; the callback runs after the lock is released"""
+        self._unload_queue.append((record.model_id, record.pipeline))
+        record.pipeline = None
+        record.state = "unloaded"
+
+    def _run_unloads(self) -> None:
+        with self._lock:
+            pending, self._unload_queue = self._unload_queue, []
+        for model_id, pipeline in pending:
+            if self.on_unload is not None:
+                try:
+                    self.on_unload(model_id, pipeline)
+                except Exception as e:
+                    logger.error(f"Unloading local model '{model_id}' failed: {e}")
+            logger.info(f"Unloaded local model '{model_id}'")
+
+    def _resident_bytes(self) -> int:
+        return sum(r.resident_bytes for r in self._models.values() if r.state == "loaded")
+
+    # Idle reaper
+
+    def _ensure_reaper(self) -> None:
+        if self.idle_unload_seconds is None:
+            return
+        with self._lock:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._stop_event.clear()
+            self._reaper = threading.Thread(target=self._reap, name="local-model-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self) -> None:
+        interval = min(60.0, max(1.0, self.idle_unload_seconds / 4))
+        while not self._stop_event.wait(interval):
+            self.unload_idle()
+
+    def stop(self) -> None:
+        """Stop the reaper and unload every model"""
+        self._stop_event.set()
+        if self._reaper is not None:
+            self._reaper.join()
+            self._reaper = None
+        self.unload_all()
+
+    # Introspection
+
+    def loaded(self) -> Dict[str, Any]:
+        """Pipelines of the loaded models by id"""
+        with self._lock:
+            return {r.model_id: r.pipeline for r in self._models.values() if r.state == "loaded"}
+
+    def status(self) -> Dict[str, Any]:
+        """Load state, memory and timing of every known model"""
+        now = time.time()
+        with self._lock:
+            return {
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "resident_bytes": self._resident_bytes(),
+                "idle_unload_seconds": self.idle_unload_seconds,
+                "stats": dict(self._stats),
+                "models": [r.to_dict(now) for r in self._models.values()],
+            }
@@ -0,0 +1,142 @@
+"""
+Prefix KV cache for local chat sessions
+
+Each turn of a local chat re-sends the whole conversation, so without
+reuse the prefill cost grows with the length of the history. This cache
+keeps the ``past_key_values`` of the last processed token sequence of a
+conversation. Entries are bucketed by a hash of their first token block
+(in practice the conversation's opening, so one bucket per session), and
+a new prompt reuses the longest common token prefix it finds there. Only
+the newly appended tokens are then prefilled. Memory is bounded by a
+byte budget with LRU eviction.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import torch
+
+PREFIX_CACHE_BYTES = 256 * 1024 * 1024
+# Tokens hashed to find a session's entries; shorter prompts aren't cached
+PREFIX_BLOCK_TOKENS = 16
+
+KVLayers = List[Tuple[torch.Tensor, torch.Tensor]]
+
+
+@dataclass
+class PrefixEntry:
+    tokens: Tuple[int, ...]
+    layers: KVLayers
+    nbytes: int
+
+
+def _block_key(tokens: Sequence[int]) -> str:
+    return hashlib.blake2b(repr(tuple(tokens[:PREFIX_BLOCK_TOKENS])).encode(), digest_size=16).hexdigest()
+
+
+def _common_prefix(a: Sequence[int], b: Sequence[int]) -> int:
+    n = min(len(a), len(b))
+    i = 0
+    while i < n and a[i] == b[i]:
+        i += 1
+    return i
+
+
+class PrefixKVCache:
+    """LRU, byte-budgeted store of per-session KV prefixes"""
+
+    def __init__(self, max_bytes: int = PREFIX_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[int, PrefixEntry]" = OrderedDict()
+        self._buckets: Dict[str, List[int]] = {}
+        self._next_id = 0
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "tokens_reused": 0, "evictions": 0}
+
+    def lookup(self, tokens: Sequence[int]) -> Tuple[int, Optional[KVLayers]]:
+        """
+        Return ``(length, layers)`` for the longest cached prefix of ``tokens``.
+
+        At least one token is always left to prefill, so the model still
+        produces logits for the next token. ``(0, None)`` on a miss.
+        """
+        if len(tokens) <= PREFIX_BLOCK_TOKENS:
+            return 0, None
+
+        with self._lock:
+            best_id, best_len = None, 0
+            for entry_id in self._buckets.get(_block_key(tokens), ()):
+                length = _common_prefix(self._entries[entry_id].tokens, tokens)
+                if length > best_len:
+                    best_id, best_len = entry_id, length
+
+            best_len = min(best_len, len(tokens) - 1)
+            if best_id is None or best_len < PREFIX_BLOCK_TOKENS:
+                self._stats["misses"] += 1
+                return 0, None
+
+            self._entries.move_to_end(best_id)
+            entry = self._entries[best_id]
+            self._stats["hits"] += 1
+            self._stats["tokens_reused"] += best_len
+
+        # Slices are views; the stored tensors are never written to
+        return best_len, [(k[:, :, :best_len], v[:, :, :best_len]) for k, v in entry.layers]
+
+    def store(self, tokens: Sequence[int], layers: KVLayers) -> bool:
+        """
+        Keep ``layers`` (batch of one, one position per token) for ``tokens``.
+
+        The entry of the previous turn of the same session is replaced, so a
+        session holds only its latest prefix.
+        """
+        if len(tokens) <= PREFIX_BLOCK_TOKENS:
+            return False
+        nbytes = sum(k.numel() * k.element_size() + v.numel() * v.element_size() for k, v in layers)
+        if nbytes > self.max_bytes:
+            return False
+
+        tokens = tuple(tokens)
+        key = _block_key(tokens)
+        with self._lock:
+            for entry_id in list(self._buckets.get(key, ())):
+                old = self._entries[entry_id]
+                # The next turn of the same session repeats the old sequence, except
+                # for a few retokenized tokens at its end; another session sharing
+                # the opening (e.g. a system prompt) diverges much earlier
+                if _common_prefix(old.tokens, tokens) >= len(old.tokens) - PREFIX_BLOCK_TOKENS:
+                    self._remove(entry_id, key)
+
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = PrefixEntry(tokens, layers, nbytes)
+            self._buckets.setdefault(key, []).append(entry_id)
+            self._bytes += nbytes
+
+            while self._bytes > self.max_bytes:
+                oldest_id, oldest = next(iter(self._entries.items()))
+                self._remove(oldest_id, _block_key(oldest.tokens))
+                self._stats["evictions"] += 1
+        return True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._buckets.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries), bytes=self._bytes, max_bytes=self.max_bytes)
+
+    def _remove(self, entry_id: int, key: str):
+        entry = self._entries.pop(entry_id)
+        self._bytes -= entry.nbytes
+        bucket = self._buckets[key]
+        bucket.remove(entry_id)
+        if not bucket:
+            del self._buckets[key]
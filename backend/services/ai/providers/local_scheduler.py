@@ -0,0 +1,448 @@
+"""
+Continuous batching scheduler for local model inference
+
+One worker thread owns the model. Concurrent requests are queued and
+decoded together, one token per step for the whole batch, instead of each
+caller running its own ``generate()`` at batch size 1. New requests join
+the running batch between steps (their prompts are prefilled as a group
+of similar lengths), finished ones leave it, and the sum of reserved
+tokens (prompt + max_new_tokens) of the batch stays under a budget.
+
+With a ``PrefixKVCache``, a finished request leaves the KV of its prompt
+and reply behind, and the next turn of the same conversation prefills only
+the tokens it appends.
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, List, Optional, Tuple
+
+import torch
+import torch.nn.functional as F
+from transformers import DynamicCache
+
+from .local_prefix_cache import PrefixKVCache
+
+logger = logging.getLogger(__name__)
+
+MAX_BATCH_SIZE = 8
+MAX_CONCURRENT_TOKENS = 8192
+# Prompts within this many tokens (or a quarter of the longest) share a prefill batch
+PREFILL_PAD_TOLERANCE = 16
+
+
+class SchedulerStopped(RuntimeError):
+    """Raised for requests that were pending when the scheduler stopped"""
+
+
+@dataclass
+class GenerationRequest:
+    """A single generation, consumed through ``streamer`` like ``generate(streamer=...)``"""
+    prompt_ids: List[int]
+    max_new_tokens: int
+    temperature: float = 0.0
+    top_p: float = 1.0
+    streamer: Optional[object] = None
+    stop_event: threading.Event = field(default_factory=threading.Event)
+    done: threading.Event = field(default_factory=threading.Event)
+    output_ids: List[int] = field(default_factory=list)
+    finish_reason: Optional[str] = None
+    error: Optional[Exception] = None
+    submitted_at: float = field(default_factory=time.perf_counter)
+
+    @property
+    def reserved_tokens(self) -> int:
+        return len(self.prompt_ids) + self.max_new_tokens
+
+
+class _Batch:
+    """Running batch: left-padded KV cache, attention mask and the next input token per row"""
+
+    def __init__(self, requests: List[GenerationRequest], cache: DynamicCache,
+                 mask: torch.Tensor, next_tokens: torch.Tensor):
+        self.requests = requests
+        self.cache = cache
+        self.mask = mask
+        self.next_tokens = next_tokens
+
+    def __len__(self):
+        return len(self.requests)
+
+
+def _cache_tensors(cache: DynamicCache) -> List[Tuple[torch.Tensor, torch.Tensor]]:
+    return [(layer.keys, layer.values) for layer in cache.layers]
+
+
+def _left_pad(tensor: torch.Tensor, length: int, dim: int) -> torch.Tensor:
+    missing = length - tensor.shape[dim]
+    if missing <= 0:
+        return tensor
+    # F.pad pads the last dimensions first: (last_left, last_right, prev_left, prev_right, ...)
+    pad = [0, 0] * (tensor.dim() - 1 - dim % tensor.dim()) + [missing, 0]
+    return F.pad(tensor, pad)
+
+
+class LocalInferenceScheduler:
+    """Single model worker that batches concurrent generations"""
+
+    def __init__(self, model, tokenizer=None, max_batch_size: int = MAX_BATCH_SIZE,
+                 max_concurrent_tokens: int = MAX_CONCURRENT_TOKENS, name: str = "local",
+                 prefix_cache: Optional[PrefixKVCache] = None):
+        if max_batch_size < 1 or max_concurrent_tokens < 1:
+            raise ValueError("max_batch_size and max_concurrent_tokens must be positive")
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_concurrent_tokens = max_concurrent_tokens
+        self.name = name
+        self.prefix_cache = prefix_cache
+        self.eos_token_ids = self._eos_token_ids(model, tokenizer)
+
+        self._waiting: Deque[GenerationRequest] = deque()
+        self._condition = threading.Condition()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self._batch: Optional[_Batch] = None
+        self._stats = {
+            "requests_completed": 0,
+            "tokens_generated": 0,
+            "prefill_batches": 0,
+            "prefill_tokens": 0,
+            "decode_steps": 0,
+            "decode_rows": 0,
+            "max_batch_size_seen": 0,
+        }
+
+    @staticmethod
+    def _eos_token_ids(model, tokenizer) -> set:
+        eos = getattr(getattr(model, "generation_config", None), "eos_token_id", None)
+        if eos is None and tokenizer is not None:
+            eos = tokenizer.eos_token_id
+        if eos is None:
+            return set()
+        return set(eos) if isinstance(eos, (list, tuple)) else {eos}
+
+    # Public API
+
+    def submit(self, prompt_ids: List[int], max_new_tokens: int, temperature: float = 0.0,
+               top_p: float = 1.0, streamer=None, stop_event: Optional[threading.Event] = None) -> GenerationRequest:
+        """Queue a generation and return its request; tokens go to ``streamer`` as they are sampled"""
+        if not prompt_ids:
+            raise ValueError("prompt_ids must not be empty")
+        request = GenerationRequest(
+            prompt_ids=list(prompt_ids),
+            max_new_tokens=max(1, max_new_tokens),
+            temperature=temperature,
+            top_p=top_p,
+            streamer=streamer,
+        )
+        if stop_event is not None:
+            request.stop_event = stop_event
+
+        with self._condition:
+            self._ensure_started()
+            self._waiting.append(request)
+            self._condition.notify()
+        return request
+
+    def cancel(self, request: GenerationRequest) -> None:
+        """Stop a request; it leaves the batch before the next step"""
+        request.stop_event.set()
+        with self._condition:
+            self._condition.notify()
+
+    def generate(self, prompt_ids: List[int], max_new_tokens: int, **kwargs) -> List[int]:
+        """Blocking helper that returns the generated token ids"""
+        request = self.submit(prompt_ids, max_new_tokens, **kwargs)
+        request.done.wait()
+        if request.error:
+            raise request.error
+        return request.output_ids
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the worker; requests still queued or running fail with SchedulerStopped"""
+        with self._condition:
+            self._running = False
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def stats(self) -> Dict[str, float]:
+        """Throughput counters of the worker"""
+        with self._condition:
+            stats = dict(self._stats)
+            stats["waiting"] = len(self._waiting)
+            stats["running"] = len(self._batch) if self._batch else 0
+        steps = stats["decode_steps"]
+        stats["avg_batch_size"] = stats["decode_rows"] / steps if steps else 0.0
+        if self.prefix_cache is not None:
+            stats["prefix_cache"] = self.prefix_cache.stats()
+        return stats
+
+    # Worker
+
+    def _ensure_started(self):
+        if self._running:
+            return
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name=f"local-inference-{self.name}", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        with torch.inference_mode():
+            while True:
+                with self._condition:
+                    while self._running and not self._waiting and self._batch is None:
+                        self._condition.wait()
+                    if not self._running:
+                        break
+                    group = self._next_prefill_group()
+
+                try:
+                    if group:
+                        self._prefill(group)
+                    if self._batch is not None:
+                        self._decode_step()
+                except Exception as e:
+                    logger.error(f"Local inference step failed: {e}")
+                    failed = list(group) + (self._batch.requests if self._batch else [])
+                    self._batch = None
+                    for request in failed:
+                        if not request.done.is_set():
+                            self._finish(request, "error", error=e)
+
+        self._fail_pending()
+
+    def _fail_pending(self):
+        with self._condition:
+            pending = list(self._waiting) + (self._batch.requests if self._batch else [])
+            self._waiting.clear()
+            self._batch = None
+        for request in pending:
+            self._finish(request, "error", error=SchedulerStopped("Local inference scheduler stopped"))
+
+    def _next_prefill_group(self) -> List[GenerationRequest]:
+        """
+        Take queued requests that fit next to the running batch.
+
+        The oldest request anchors the group, so nothing starves; other
+        requests join only if their prompt length is close to it, which keeps
+        prefill padding small. Called with the condition held.
+        """
+        for request in [r for r in self._waiting if r.stop_event.is_set()]:
+            self._waiting.remove(request)
+            self._finish(request, "cancelled")
+        if not self._waiting:
+            return []
+
+        running = self._batch.requests if self._batch else []
+        slots = self.max_batch_size - len(running)
+        budget = self.max_concurrent_tokens - sum(r.reserved_tokens for r in running)
+        anchor = self._waiting[0]
+        if slots <= 0:
+            return []
+        if anchor.reserved_tokens > budget:
+            # An oversized request runs alone rather than never
+            if running:
+                return []
+            budget = anchor.reserved_tokens
+
+        anchor_len = len(anchor.prompt_ids)
+        tolerance = max(PREFILL_PAD_TOLERANCE, anchor_len // 4)
+        group = []
+        for request in self._waiting:
+            if len(group) >= slots:
+                break
+            if request is not anchor and abs(len(request.prompt_ids) - anchor_len) > tolerance:
+                continue
+            if request.reserved_tokens > budget:
+                continue
+            budget -= request.reserved_tokens
+            group.append(request)
+
+        for request in group:
+            self._waiting.remove(request)
+        return group
+
+    def _prefill(self, group: List[GenerationRequest]):
+        """Prefill the group and add it to the running batch"""
+        misses, hits = [], []
+        for request in group:
+            if request.streamer is not None:
+                # Same contract as generate(): the prompt first, then each new token
+                request.streamer.put(torch.tensor([request.prompt_ids]))
+            cached_len, layers = self.prefix_cache.lookup(request.prompt_ids) if self.prefix_cache else (0, None)
+            if layers is None:
+                misses.append(request)
+            else:
+                hits.append((request, cached_len, layers))
+
+        parts = []
+        if misses:
+            parts.append(self._prefill_batch(misses))
+        # A cached prefix is specific to its row, so hits are prefilled one by one
+        parts.extend(self._prefill_cached(request, cached_len, layers) for request, cached_len, layers in hits)
+
+        for part in parts:
+            first_row = len(self._batch) if self._batch else 0
+            self._batch = self._merge(self._batch, part) if self._batch else part
+            self._stats["max_batch_size_seen"] = max(self._stats["max_batch_size_seen"], len(self._batch))
+            self._emit(first_row)
+
+    def _prefill_batch(self, group: List[GenerationRequest]) -> _Batch:
+        device = self.model.device
+        length = max(len(r.prompt_ids) for r in group)
+        input_ids = torch.zeros(len(group), length, dtype=torch.long, device=device)
+        mask = torch.zeros(len(group), length, dtype=torch.long, device=device)
+        for row, request in enumerate(group):
+            input_ids[row, length - len(request.prompt_ids):] = torch.tensor(request.prompt_ids, device=device)
+            mask[row, length - len(request.prompt_ids):] = 1
+
+        position_ids = (mask.cumsum(-1) - 1).clamp(min=0)
+        # Full-length layers even for sliding-window models, so rows can be sliced by the mask
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=mask,
+            position_ids=position_ids,
+            past_key_values=DynamicCache(),
+            use_cache=True,
+        )
+        self._stats["prefill_batches"] += 1
+        self._stats["prefill_tokens"] += sum(len(r.prompt_ids) for r in group)
+        return _Batch(group, outputs.past_key_values, mask, self._sample(outputs.logits[:, -1, :], group))
+
+    def _prefill_cached(self, request: GenerationRequest, cached_len: int, layers) -> _Batch:
+        """Prefill only the tokens after a cached prefix"""
+        device = self.model.device
+        total = len(request.prompt_ids)
+        mask = torch.ones(1, total, dtype=torch.long, device=device)
+        outputs = self.model(
+            input_ids=torch.tensor([request.prompt_ids[cached_len:]], device=device),
+            attention_mask=mask,
+            position_ids=torch.arange(cached_len, total, device=device)[None],
+            # Updating the cache concatenates into new tensors; the cached ones stay intact
+            past_key_values=DynamicCache(ddp_cache_data=layers),
+            use_cache=True,
+        )
+        self._stats["prefill_batches"] += 1
+        self._stats["prefill_tokens"] += total - cached_len
+        return _Batch([request], outputs.past_key_values, mask, self._sample(outputs.logits[:, -1, :], [request]))
+
+    def _decode_step(self):
+        batch = self._batch
+        batch.mask = torch.cat([batch.mask, batch.mask.new_ones(len(batch), 1)], dim=1)
+        position_ids = batch.mask.sum(-1, keepdim=True) - 1
+        outputs = self.model(
+            input_ids=batch.next_tokens[:, None],
+            attention_mask=batch.mask,
+            position_ids=position_ids,
+            past_key_values=batch.cache,
+            use_cache=True,
+        )
+        batch.cache = outputs.past_key_values
+        batch.next_tokens = self._sample(outputs.logits[:, -1, :], batch.requests)
+        self._stats["decode_steps"] += 1
+        self._stats["decode_rows"] += len(batch)
+        self._emit(0)
+
+    def _emit(self, first_row: int):
+        """Hand the newest token of rows from ``first_row`` on to their requests and drop finished rows"""
+        batch = self._batch
+        keep = list(range(first_row))
+        tokens = batch.next_tokens[first_row:].tolist()
+        for row, (request, token) in enumerate(zip(batch.requests[first_row:], tokens), start=first_row):
+            if request.stop_event.is_set():
+                self._finish(request, "cancelled")
+                continue
+            request.output_ids.append(token)
+            self._stats["tokens_generated"] += 1
+            if request.streamer is not None:
+                request.streamer.put(torch.tensor([token]))
+            if token in self.eos_token_ids:
+                self._remember(batch, row)
+                self._finish(request, "stop")
+            elif len(request.output_ids) >= request.max_new_tokens:
+                self._remember(batch, row)
+                self._finish(request, "length")
+            else:
+                keep.append(row)
+
+        if len(keep) == len(batch):
+            return
+        if not keep:
+            self._batch = None
+            return
+        self._batch = self._select(batch, keep)
+
+    def _remember(self, batch: _Batch, row: int):
+        """Store the KV of everything the row has processed (prompt and fed reply tokens)"""
+        if self.prefix_cache is None:
+            return
+        request = batch.requests[row]
+        length = int(batch.mask[row].sum())
+        # Rows are left-padded, so the row's positions are the last ``length`` columns
+        start = batch.mask.shape[1] - length
+        layers = [(k[row:row + 1, :, start:].clone(), v[row:row + 1, :, start:].clone())
+                  for k, v in _cache_tensors(batch.cache)]
+        self.prefix_cache.store((request.prompt_ids + request.output_ids)[:length], layers)
+
+    def _finish(self, request: GenerationRequest, reason: str, error: Optional[Exception] = None):
+        request.finish_reason = reason
+        request.error = error
+        if request.streamer is not None:
+            request.streamer.end()
+        if reason != "error":
+            self._stats["requests_completed"] += 1
+        request.done.set()
+
+    # Batch reshaping
+
+    def _sample(self, logits: torch.Tensor, requests: List[GenerationRequest]) -> torch.Tensor:
+        """Greedy rows take the argmax; sampled rows use their own temperature and top-p"""
+        tokens = logits.argmax(dim=-1)
+        sampled = [row for row, r in enumerate(requests) if r.temperature > 0]
+        if not sampled:
+            return tokens
+
+        rows = torch.tensor(sampled, device=logits.device)
+        temperature = torch.tensor([requests[i].temperature for i in sampled], device=logits.device)
+        top_p = torch.tensor([requests[i].top_p for i in sampled], device=logits.device)
+        probs = torch.softmax(logits[rows].float() / temperature[:, None], dim=-1)
+        sorted_probs, order = probs.sort(dim=-1, descending=True)
+        # Keep the smallest prefix whose mass reaches top_p (always at least one token)
+        sorted_probs[(sorted_probs.cumsum(-1) - sorted_probs) > top_p[:, None]] = 0
+        choice = torch.multinomial(sorted_probs, 1)
+        tokens[rows] = order.gather(-1, choice).squeeze(-1)
+        return tokens
+
+    def _merge(self, running: _Batch, incoming: _Batch) -> _Batch:
+        """Concatenate two batches, left-padding the shorter cache to the same length"""
+        length = max(running.mask.shape[1], incoming.mask.shape[1])
+        layers = []
+        for (k1, v1), (k2, v2) in zip(_cache_tensors(running.cache), _cache_tensors(incoming.cache)):
+            layers.append((
+                torch.cat([_left_pad(k1, length, -2), _left_pad(k2, length, -2)]),
+                torch.cat([_left_pad(v1, length, -2), _left_pad(v2, length, -2)]),
+            ))
+        return _Batch(
+            running.requests + incoming.requests,
+            DynamicCache(ddp_cache_data=layers),
+            torch.cat([_left_pad(running.mask, length, 1), _left_pad(incoming.mask, length, 1)]),
+            torch.cat([running.next_tokens, incoming.next_tokens]),
+        )
+
+    def _select(self, batch: _Batch, rows: List[int]) -> _Batch:
+        """Keep ``rows`` and trim the padding columns no remaining row uses"""
+        index = torch.tensor(rows, device=batch.mask.device)
+        mask = batch.mask[index]
+        start = int((mask.sum(0) > 0).nonzero()[0])
+        layers = [(k[index, :, start:], v[index, :, start:]) for k, v in _cache_tensors(batch.cache)]
+        return _Batch(
+            [batch.requests[i] for i in rows],
+            DynamicCache(ddp_cache_data=layers),
+            mask[:, start:],
+            batch.next_tokens[index],
+        )
@@ -7,7 +7,7 @@ import re
 from typing import Dict, Any, List, Optional, Tuple
 
 from .base_provider import (
-    BaseProvider, ProviderResponse, ProviderError, 
+    BaseProvider, ProviderResponse, ProviderError, StreamUsage,
     AuthenticationError, RateLimitError, ModelNotFoundError
 )
 
@@ -270,6 +270,19 @@ class OpenAIProvider(BaseProvider):
         Returns:
             ProviderResponse: Response from OpenAI
         """
+        endpoint, request_data = self._chat_request(messages, model_id, parameters)
+        
+        try:
+            success, response_data, response_time = self._make_request('POST', endpoint, request_data)
+            return self._chat_result(success, response_data, response_time, model_id, messages)
+        except Exception as e:
+            return self._failed_response(model_id, str(e), error=e)
+    
+    def _chat_request(self, 
+                     messages: List[Dict[str, str]], 
+                     model_id: str, 
+                     parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Validate parameters and build the chat/completions request"""
         # Validate model
         if model_id not in self.MODEL_CONFIGS:
             raise ModelNotFoundError(f"Model {model_id} not supported")
@@ -294,66 +307,79 @@ class OpenAIProvider(BaseProvider):
         if parameters.stop_sequences:
             request_data["stop"] = parameters.stop_sequences
         
-        try:
-            success, response_data, response_time = self._make_request('POST', 'chat/completions', request_data)
-            
-            if not success:
-                error_msg = response_data.get('error', {}).get('message', 'Unknown error')
-                return ProviderResponse(
-                    content="",
-                    tokens_used=0,
-                    cost=0.0,
-                    response_time=response_time,
-                    model_used=model_id,
-                    success=False,
-                    error_message=error_msg
-                )
-            
-            # Extract response content
-            choices = response_data.get('choices', [])
-            if not choices:
-                return ProviderResponse(
-                    content="",
-                    tokens_used=0,
-                    cost=0.0,
-                    response_time=response_time,
-                    model_used=model_id,
-                    success=False,
-                    error_message="No response choices returned"
-                )
-            
-            message = choices[0].get('message', {})
-            content = message.get('content', '')
-            
-            # Calculate usage and cost
-            usage = response_data.get('usage', {})
-            tokens_used = usage.get('total_tokens', self._estimate_tokens(str(messages) + content))
-            cost = self._calculate_cost(tokens_used, model_id)
-            
-            return ProviderResponse(
-                content=content,
-                tokens_used=tokens_used,
-                cost=cost,
-                response_time=response_time,
-                model_used=model_id,
-                success=True,
-                metadata={
-                    'finish_reason': choices[0].get('finish_reason'),
-                    'usage': usage,
-                    'role': message.get('role', 'assistant')
-                }
-            )
-            
-        except Exception as e:
-            return ProviderResponse(
-                content="",
-                tokens_used=0,
-                cost=0.0,
-                response_time=0.0,
-                model_used=model_id,
-                success=False,
-                error_message=str(e)
+        return 'chat/completions', request_data
+    
+    def _chat_result(self, 
+                    success: bool, 
+                    response_data: Dict[str, Any], 
+                    response_time: float,
+                    model_id: str,
+                    messages: List[Dict[str, str]]) -> ProviderResponse:
+        """Convert a chat/completions response to a ProviderResponse"""
+        if not success:
+            error_msg = response_data.get('error', {}).get('message', 'Unknown error')
+            return self._failed_response(model_id, error_msg, response_time)
+        
+        # Extract response content
+        choices = response_data.get('choices', [])
+        if not choices:
+            return self._failed_response(model_id, "No response choices returned", response_time)
+        
+        message = choices[0].get('message', {})
+        content = message.get('content', '')
+        
+        # Calculate usage and cost
+        usage = response_data.get('usage', {})
+        tokens_used = usage.get('total_tokens', self._estimate_tokens(str(messages) + content))
+        cost = self._calculate_cost(tokens_used, model_id)
+        
+        return ProviderResponse(
+            content=content,
+            tokens_used=tokens_used,
+            cost=cost,
+            response_time=response_time,
+            model_used=model_id,
+            success=True,
+            metadata={
+                'finish_reason': choices[0].get('finish_reason'),
+                'usage': usage,
+                'role': message.get('role', 'assistant')
+            }
+        )
+    
+    def _stream_request(self, 
+                       messages: List[Dict[str, str]], 
+                       model_id: str, 
+                       parameters: LLMParameters) -> Tuple[str, Dict[str, Any]]:
+        """Build the streaming chat/completions request (server-sent events)"""
+        endpoint, request_data = self._chat_request(messages, model_id, parameters)
+        request_data["stream"] = True
+        # Final chunk carries the exact token usage
+        request_data["stream_options"] = {"include_usage": True}
+        return endpoint, request_data
+    
+    def _parse_stream_line(self, line: str, usage: StreamUsage) -> List[str]:
+        """Parse one ``data:`` event of a chat.completion.chunk stream"""
+        data = self._sse_data(line)
+        if data is None:
+            return []
+        if 'error' in data:
+            raise ProviderError(data['error'].get('message', 'Stream error'))
+        
+        if data.get('usage'):
+            usage.report(
+                prompt_tokens=data['usage'].get('prompt_tokens'),
+                completion_tokens=data['usage'].get('completion_tokens')
             )
+        
+        texts = []
+        for choice in data.get('choices', []):
+            if choice.get('finish_reason'):
+                usage.finish_reason = choice['finish_reason']
+            content = choice.get('delta', {}).get('content')
+            if content:
+                texts.append(content)
+        return texts
     
     def _calculate_cost(self, tokens_used: int, model_id: str) -> float:
         """
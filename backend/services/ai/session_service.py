@@ -4,27 +4,35 @@ import sqlite3
 import logging
 import uuid
 from datetime import datetime
-from typing import Optional, List
+from typing import Iterator, Optional, List, Tuple, TYPE_CHECKING
 
 from backend.models.chat import ChatSession, SessionNotFoundError
 from backend.services.security.audit_service import log_user_action, AuditSeverity
 from backend.services.cache.chat_cache_service import chat_cache, cached
 
+if TYPE_CHECKING:
+    from .message_write_buffer import MessageWriteBuffer
+
 logger = logging.getLogger(__name__)
 
 
 class SessionService:
     """Manage chat sessions"""
 
-    def __init__(self, db_path: str = None):
+    def __init__(self, db_path: str = None, write_buffer: Optional["MessageWriteBuffer"] = None):
         if db_path is None:
             app_dir = os.path.join(os.path.expanduser("~"), ".audio_chat_qt")
             os.makedirs(app_dir, exist_ok=True)
             db_path = os.path.join(app_dir, "llm_data.db")  # Use same DB as LLM service
         self.db_path = db_path
+        # When set, message count updates are batched with message inserts
+        self.write_buffer = write_buffer
         # No need to init DB here - it's handled by LLM service
 
-
+    def _flush_pending(self) -> None:
+        """Make queued writes visible before reading from the database"""
+        if self.write_buffer is not None:
+            self.write_buffer.flush()
 
     def create_session(self, title: str = None, model_id: str = None, user_id: str = None) -> ChatSession:
         session_id = str(uuid.uuid4())
@@ -93,6 +101,7 @@ class SessionService:
                 logger.warning(f"Failed to deserialize cached session: {e}")
         
         # Cache miss - fetch from database
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute("SELECT * FROM chat_sessions WHERE id = ?", (session_id,))
@@ -112,43 +121,73 @@ class SessionService:
         
         return session
 
-    def list_user_sessions(self, user_id: str = None, limit: int = 50) -> List[ChatSession]:
-        # Try cache first for user sessions
+    def list_user_sessions(
+        self,
+        user_id: str = None,
+        limit: int = 50,
+        before: Optional[Tuple[str, str]] = None,
+    ) -> List[ChatSession]:
+        """
+        List sessions, most recently updated first.
+
+        ``before`` is an ``(updated_at, id)`` keyset cursor taken from the last
+        session of the previous page.
+        """
+        if before is not None:
+            # Deeper pages are not cached
+            return self._query_sessions(user_id, limit, before)
+
         if user_id:
-            cached_sessions = chat_cache.get_user_sessions(user_id, limit)
-            if cached_sessions:
+            # Concurrent misses for the same user share a single query
+            cached_sessions = chat_cache.load_user_sessions(
+                user_id,
+                limit,
+                lambda: [session.to_dict() for session in self._query_sessions(user_id, limit)],
+            )
+            if cached_sessions is not None:
                 try:
                     return [ChatSession.from_dict(session_data) for session_data in cached_sessions]
                 except Exception as e:
                     logger.warning(f"Failed to deserialize cached user sessions: {e}")
         
-        # Cache miss - fetch from database
+        sessions = self._query_sessions(user_id, limit)
+        
+        return sessions
+
+    def iter_sessions(self, user_id: str = None, batch_size: int = 200) -> Iterator[ChatSession]:
+        """Iterate over all sessions, most recently updated first, one keyset page at a time"""
+        before = None
+        while True:
+            page = self._query_sessions(user_id, batch_size, before)
+            yield from page
+            if len(page) < batch_size:
+                return
+            before = (page[-1].updated_at.isoformat(), page[-1].id)
+
+    def _query_sessions(
+        self, user_id: Optional[str], limit: int, before: Optional[Tuple[str, str]] = None
+    ) -> List[ChatSession]:
+        # Served by the *_keyset indexes on (user_id,) updated_at, id
+        conditions = []
+        params: list = []
+        if user_id:
+            conditions.append("user_id = ?")
+            params.append(user_id)
+        if before is not None:
+            conditions.append("(updated_at, id) < (?, ?)")
+            params.extend(before)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        if user_id:
-            cursor.execute(
-                "SELECT * FROM chat_sessions WHERE user_id = ? ORDER BY updated_at DESC LIMIT ?",
-                (user_id, limit),
-            )
-        else:
-            cursor.execute(
-                "SELECT * FROM chat_sessions ORDER BY updated_at DESC LIMIT ?",
-                (limit,),
-            )
+        cursor.execute(
+            f"SELECT * FROM chat_sessions {where}ORDER BY updated_at DESC, id DESC LIMIT ?",
+            (*params, limit),
+        )
         rows = cursor.fetchall()
         conn.close()
-        
-        sessions = [ChatSession.from_row(r) for r in rows]
-        
-        # Cache user sessions
-        if user_id and sessions:
-            try:
-                cached_data = [session.to_dict() for session in sessions]
-                chat_cache.set_user_sessions(user_id, cached_data, limit)
-            except Exception as e:
-                logger.warning(f"Failed to cache user sessions: {e}")
-        
-        return sessions
+        return [ChatSession.from_row(r) for r in rows]
 
     def update_session(self, session_id: str, **updates) -> bool:
         if not updates:
@@ -161,6 +200,7 @@ class SessionService:
             fields.append(f"{key} = ?")
             values.append(value)
         values.append(session_id)
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute(
@@ -173,6 +213,7 @@ class SessionService:
         return success
 
     def delete_session(self, session_id: str) -> bool:
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute("DELETE FROM chat_sessions WHERE id = ?", (session_id,))
@@ -204,6 +245,9 @@ class SessionService:
 
     def increment_message_count(self, session_id: str, count: int = 1) -> None:
         """Increment message count for a session"""
+        if self.write_buffer is not None:
+            self.write_buffer.enqueue_increment(session_id, count)
+            return
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         cursor.execute(
@@ -227,6 +271,7 @@ class SessionService:
         if not session:
             return None
         
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
@@ -262,6 +307,7 @@ class SessionService:
 
     def search_sessions(self, query: str, user_id: str = None, limit: int = 50) -> List[ChatSession]:
         """Search sessions by title"""
+        self._flush_pending()
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
         
@@ -0,0 +1,155 @@
+"""
+Cache Codecs
+סריאליזציה בינארית לערכי cache ב-Redis
+
+כל ערך מקודד מתחיל בבית header אחד: סוג ה-codec ודגל דחיסה. ערכים שנשמרו
+לפני כן כטקסט JSON (ללא header) עדיין נקראים.
+"""
+
+import json
+import zlib
+import logging
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# בית ה-header - ערכים מתחת ל-0x20 כדי שלא יתנגשו בתחילת טקסט JSON ישן
+_CODEC_JSON = 0x01
+_CODEC_MSGPACK = 0x02
+_FLAG_ZSTD = 0x08
+_FLAG_ZLIB = 0x10
+_CODEC_MASK = 0x07
+
+
+class CacheCodec:
+    """
+    Codec בסיסי: encode/decode לבתים עם דחיסה מעל סף גודל
+
+    Args:
+        compress_threshold: ערכים גדולים מזה (בבתים) נדחסים; None מבטל דחיסה
+        compression: "zstd" (אם zstandard מותקן, אחרת zlib) או "zlib"
+    """
+
+    codec_id = _CODEC_JSON
+    name = "json"
+
+    def __init__(self, compress_threshold: Optional[int] = 4096, compression: str = "zstd"):
+        self.compress_threshold = compress_threshold
+        self._compress: Optional[Callable[[bytes], bytes]] = None
+        self._compress_flag = 0
+        self._zstd_decompressor = None
+
+        if compress_threshold is not None:
+            if compression == "zstd":
+                try:
+                    import zstandard
+                    compressor = zstandard.ZstdCompressor(level=3)
+                    self._compress = compressor.compress
+                    self._compress_flag = _FLAG_ZSTD
+                except ImportError:
+                    logger.info("zstandard not installed, using zlib for cache compression")
+                    compression = "zlib"
+            if compression == "zlib":
+                self._compress = lambda data: zlib.compress(data, 3)
+                self._compress_flag = _FLAG_ZLIB
+            elif self._compress is None:
+                raise ValueError(f"Unsupported cache compression: {compression}")
+
+    def _dumps(self, value: Any) -> bytes:
+        return json.dumps(value, ensure_ascii=False, default=str).encode("utf-8")
+
+    def _loads(self, data: bytes) -> Any:
+        return json.loads(data)
+
+    def encode(self, value: Any) -> bytes:
+        """קידוד ערך לבתים עם header"""
+        payload = self._dumps(value)
+        flags = 0
+        if self._compress is not None and len(payload) > self.compress_threshold:
+            compressed = self._compress(payload)
+            # דחיסה שלא חוסכת לא שווה את עלות הפריסה בקריאה
+            if len(compressed) < len(payload):
+                payload = compressed
+                flags = self._compress_flag
+        return bytes((self.codec_id | flags,)) + payload
+
+    def decode(self, data: bytes) -> Any:
+        """פענוח בתים שנוצרו ב-encode (או טקסט JSON ישן ללא header)"""
+        if not data:
+            return None
+        header = data[0]
+        if header >= 0x20:
+            # ערך ישן שנשמר כטקסט JSON
+            return json.loads(data)
+
+        payload = data[1:]
+        if header & _FLAG_ZSTD:
+            payload = self._zstd_decompress(payload)
+        elif header & _FLAG_ZLIB:
+            payload = zlib.decompress(payload)
+
+        codec_id = header & _CODEC_MASK
+        if codec_id == self.codec_id:
+            return self._loads(payload)
+        return _decoder_for(codec_id)(payload)
+
+    def _zstd_decompress(self, payload: bytes) -> bytes:
+        if self._zstd_decompressor is None:
+            try:
+                import zstandard
+            except ImportError:
+                raise ValueError("Cached value is zstd-compressed but zstandard is not installed")
+            self._zstd_decompressor = zstandard.ZstdDecompressor()
+        # זרם מלא בפריים אחד - גודל הפלט לא תמיד ידוע מראש
+        return self._zstd_decompressor.decompressobj().decompress(payload)
+
+
+class JsonCodec(CacheCodec):
+    """JSON (UTF-8) - תואם לפורמט הקודם"""
+
+
+class MsgpackCodec(CacheCodec):
+    """msgpack - קומפקטי ומהיר יותר מ-JSON לרשימות הודעות"""
+
+    codec_id = _CODEC_MSGPACK
+    name = "msgpack"
+
+    def __init__(self, compress_threshold: Optional[int] = 4096, compression: str = "zstd"):
+        import msgpack  # ImportError מטופל ב-get_codec
+        self._msgpack = msgpack
+        super().__init__(compress_threshold, compression)
+
+    def _dumps(self, value: Any) -> bytes:
+        return self._msgpack.packb(value, default=str, use_bin_type=True)
+
+    def _loads(self, data: bytes) -> Any:
+        return self._msgpack.unpackb(data, raw=False, strict_map_key=False)
+
+
+def _decoder_for(codec_id: int) -> Callable[[bytes], Any]:
+    if codec_id == _CODEC_JSON:
+        return json.loads
+    if codec_id == _CODEC_MSGPACK:
+        import msgpack
+        return lambda data: msgpack.unpackb(data, raw=False, strict_map_key=False)
+    raise ValueError(f"Unknown cache codec id: {codec_id}")
+
+
+CODECS: Dict[str, type] = {
+    "json": JsonCodec,
+    "msgpack": MsgpackCodec,
+}
+
+
+def get_codec(name: str = "msgpack", compress_threshold: Optional[int] = 4096,
+              compression: str = "zstd") -> CacheCodec:
+    """
+    יצירת codec לפי שם; msgpack חוזר ל-JSON אם הספרייה לא מותקנת
+    """
+    if name not in CODECS:
+        raise ValueError(f"Unsupported cache codec: {name}")
+    try:
+        return CODECS[name](compress_threshold, compression)
+    except ImportError:
+        logger.warning("msgpack not installed, using JSON cache codec. Install with: pip install msgpack")
+        return JsonCodec(compress_threshold, compression)
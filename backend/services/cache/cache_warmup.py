@@ -0,0 +1,320 @@
+"""
+Cache Warmup
+חימום cache חזוי לפי היסטוריית גישה לשיחות
+
+AccessTracker שומר לכל session מונה גישות דועך (תדירות + עדכניות) ומתמיד אותו
+ב-SQLite, כך שהדירוג שורד הפעלה מחדש. CacheWarmupScheduler טוען ברקע את
+ה-sessions בעלי הניקוד הגבוה - ה-session, חלון ההודעות המפוענח וחלון ה-context -
+בעלייה ואחרי תקופות שקט, בתקציב CPU ו-IO מוגבל.
+"""
+
+import time
+import heapq
+import sqlite3
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class AccessTracker:
+    """
+    מוני גישה דועכים ל-sessions
+
+    כל גישה מוסיפה 1 לניקוד, והניקוד נחצה כל half_life_seconds, כך ש-session
+    שנפתח הרבה לאחרונה מדורג מעל session שנפתח הרבה לפני חודש.
+    """
+
+    def __init__(self, db_path: str, half_life_seconds: float = 3 * 24 * 3600, max_sessions: int = 5000):
+        self.db_path = db_path
+        self.half_life_seconds = half_life_seconds
+        self.max_sessions = max_sessions
+        self._lock = threading.Lock()
+        # session_id -> [score, last_access (wall clock, נשמר ב-DB)]
+        self._scores: Dict[str, List[float]] = {}
+        self._dirty: set = set()
+        self._forgotten: set = set()
+
+        self._init_db()
+        self._load()
+
+    def _init_db(self) -> None:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            CREATE TABLE IF NOT EXISTS chat_session_access (
+                session_id TEXT PRIMARY KEY,
+                score REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+            """
+        )
+        conn.commit()
+        conn.close()
+
+    def _load(self) -> None:
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.execute("SELECT session_id, score, last_access FROM chat_session_access")
+        rows = cursor.fetchall()
+        conn.close()
+        now = time.time()
+        ranked = heapq.nlargest(self.max_sessions, rows, key=lambda row: self._decayed(row[1], row[2], now))
+        self._scores = {session_id: [score, last_access] for session_id, score, last_access in ranked}
+
+    def _decayed(self, score: float, last_access: float, now: float) -> float:
+        return score * 0.5 ** (max(0.0, now - last_access) / self.half_life_seconds)
+
+    def record(self, session_id: str, now: Optional[float] = None) -> float:
+        """רישום גישה ל-session; מחזיר את הניקוד החדש"""
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._scores.get(session_id)
+            score = 1.0 if entry is None else self._decayed(entry[0], entry[1], now) + 1.0
+            self._scores[session_id] = [score, now]
+            self._dirty.add(session_id)
+            self._forgotten.discard(session_id)
+            if len(self._scores) > self.max_sessions * 1.1:
+                self._prune(now)
+            return score
+
+    def forget(self, session_id: str) -> None:
+        """הסרת session (למשל אחרי מחיקה)"""
+        with self._lock:
+            self._scores.pop(session_id, None)
+            self._dirty.discard(session_id)
+            self._forgotten.add(session_id)
+
+    def top(self, limit: int, now: Optional[float] = None) -> List[str]:
+        """ה-sessions בעלי הניקוד הגבוה ביותר כרגע"""
+        now = time.time() if now is None else now
+        with self._lock:
+            ranked = heapq.nlargest(
+                limit, self._scores.items(), key=lambda item: self._decayed(item[1][0], item[1][1], now)
+            )
+        return [session_id for session_id, _ in ranked]
+
+    def _prune(self, now: float) -> None:
+        keep = heapq.nlargest(
+            self.max_sessions, self._scores.items(), key=lambda item: self._decayed(item[1][0], item[1][1], now)
+        )
+        kept = dict(keep)
+        self._forgotten.update(session_id for session_id in self._scores if session_id not in kept)
+        self._dirty.intersection_update(kept)
+        self._scores = {session_id: list(entry) for session_id, entry in kept.items()}
+
+    def flush(self) -> int:
+        """שמירת השינויים ל-DB בטרנזקציה אחת"""
+        with self._lock:
+            rows = [(session_id, *self._scores[session_id]) for session_id in self._dirty]
+            forgotten = [(session_id,) for session_id in self._forgotten]
+            self._dirty.clear()
+            self._forgotten.clear()
+        if not rows and not forgotten:
+            return 0
+
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "INSERT OR REPLACE INTO chat_session_access (session_id, score, last_access) VALUES (?, ?, ?)",
+                rows,
+            )
+            cursor.executemany("DELETE FROM chat_session_access WHERE session_id = ?", forgotten)
+            conn.commit()
+        finally:
+            conn.close()
+        return len(rows)
+
+
+class CacheWarmupScheduler:
+    """
+    טעינה מוקדמת ברקע של ה-sessions שצפויים להיפתח
+
+    Args:
+        top_sessions: כמה sessions לחמם בכל ריצה
+        message_limit: limit שמועבר ל-get_session_messages; None (ברירת המחדל, כמו ב-API)
+            מחמם את ההיסטוריה המלאה שה-endpoints קוראים
+        cpu_budget: חלק מזמן ה-CPU שהחימום רשאי לצרוך (0-1); בין sessions ה-thread ממתין
+        max_messages_per_run: תקציב IO - מספר הודעות מקסימלי לקריאה בריצה אחת;
+            session שלא נכנס במה שנשאר מהתקציב מדולג ולא נשמר חלקית
+        idle_seconds: אחרי כמה זמן ללא גישה נחשבת המערכת שקטה ומחממים שוב
+    """
+
+    def __init__(self, session_service, history_service, tracker: AccessTracker,
+                 top_sessions: int = 20, message_limit: Optional[int] = None,
+                 cpu_budget: float = 0.2, max_messages_per_run: int = 5000,
+                 idle_seconds: float = 300, check_interval: float = 30, startup_delay: float = 2.0):
+        if not 0 < cpu_budget <= 1:
+            raise ValueError("cpu_budget must be in (0, 1]")
+        self.session_service = session_service
+        self.history_service = history_service
+        self.tracker = tracker
+        self.top_sessions = top_sessions
+        self.message_limit = message_limit
+        self.cpu_budget = cpu_budget
+        self.max_messages_per_run = max_messages_per_run
+        self.idle_seconds = idle_seconds
+        self.check_interval = check_interval
+        self.startup_delay = startup_delay
+
+        self._stop = threading.Event()
+        self._run_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._last_activity = time.monotonic()
+        self._last_warmup: Optional[float] = None
+        self.last_run: Dict[str, Any] = {}
+
+    def record_access(self, session_id: str) -> None:
+        """רישום פתיחה / שימוש ב-session"""
+        self.tracker.record(session_id)
+        self._last_activity = time.monotonic()
+
+    def forget(self, session_id: str) -> None:
+        self.tracker.forget(session_id)
+
+    def predict(self) -> List[str]:
+        """
+        ה-sessions שצפויים להיפתח: ניקוד גישה דועך, ומשלימים מה-sessions
+        שעודכנו לאחרונה כשאין מספיק היסטוריה (למשל בהתקנה חדשה)
+        """
+        candidates = self.tracker.top(self.top_sessions)
+        if len(candidates) < self.top_sessions:
+            try:
+                for session in self.session_service.list_user_sessions(limit=self.top_sessions):
+                    if session.id not in candidates:
+                        candidates.append(session.id)
+                    if len(candidates) >= self.top_sessions:
+                        break
+            except Exception as e:
+                logger.warning(f"Failed to list recent sessions for warmup: {e}")
+        return candidates
+
+    def run_once(self) -> int:
+        """
+        חימום אחד בתקציב; מחזיר את מספר ה-sessions שנטענו
+        """
+        from backend.services.cache import chat_cache_service
+
+        if not self._run_lock.acquire(blocking=False):
+            return 0
+        try:
+            started = time.monotonic()
+            candidates = self.predict()
+            chat_cache = chat_cache_service.chat_cache
+            # אותו מפתח ש-get_session_messages קורא; MGET אחד מסנן sessions שכבר ב-cache
+            key_limit = self.message_limit if self.message_limit is not None else chat_cache.FULL_HISTORY
+            cached = chat_cache.get_many_session_messages(candidates, key_limit)
+
+            warmed, messages_read, over_budget, stopped_by = 0, 0, 0, None
+            for session_id in candidates:
+                if self._stop.is_set():
+                    stopped_by = "stopped"
+                    break
+                if session_id in cached:
+                    continue
+                remaining = self.max_messages_per_run - messages_read
+                if remaining <= 0:
+                    stopped_by = "io_budget"
+                    break
+
+                cpu_start = time.thread_time()
+                cost = self._read_cost(session_id)
+                if cost is None:
+                    continue
+                if cost > remaining:
+                    # רשימה חלקית לא הייתה נקראת - sessions קטנים יותר עדיין יכולים להיכנס
+                    over_budget += 1
+                    stopped_by = "io_budget"
+                    continue
+                loaded = self._warm_session(session_id)
+                if loaded is None:
+                    continue
+                warmed += 1
+                messages_read += loaded
+
+                # Duty cycle: לכל שנייה של CPU ממתינים (1 - b) / b שניות
+                spent = time.thread_time() - cpu_start
+                if self.cpu_budget < 1 and spent > 0:
+                    self._stop.wait(spent * (1 - self.cpu_budget) / self.cpu_budget)
+
+            self._last_warmup = time.monotonic()
+            self.last_run = {
+                "candidates": len(candidates),
+                "already_cached": len(cached),
+                "warmed": warmed,
+                "messages_read": messages_read,
+                "over_budget": over_budget,
+                "stopped_by": stopped_by,
+                "duration_ms": int((self._last_warmup - started) * 1000),
+            }
+            logger.info(f"Cache warmup: {self.last_run}")
+            return warmed
+        finally:
+            self._run_lock.release()
+
+    def _read_cost(self, session_id: str) -> Optional[int]:
+        """מספר ההודעות שחימום ה-session יקרא; None אם ה-session לא קיים או נכשל"""
+        try:
+            if self.session_service.get_session(session_id) is None:
+                self.tracker.forget(session_id)
+                return None
+            count = self.history_service.get_message_count(session_id)
+        except Exception as e:
+            logger.warning(f"Failed to size up session {session_id} for warmup: {e}")
+            return None
+        return count if self.message_limit is None else min(count, self.message_limit)
+
+    def _warm_session(self, session_id: str) -> Optional[int]:
+        """טעינת session אחד ל-cache; None אם נכשל"""
+        try:
+            messages = self.history_service.get_session_messages(session_id, limit=self.message_limit)
+            self.history_service.get_recent_context(session_id)
+            return len(messages)
+        except Exception as e:
+            logger.warning(f"Failed to warm up session {session_id}: {e}")
+            return None
+
+    # --- Background loop ---
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-warmup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        try:
+            self.tracker.flush()
+        except Exception as e:
+            logger.warning(f"Failed to persist session access history: {e}")
+
+    def _run(self) -> None:
+        if self._stop.wait(self.startup_delay):
+            return
+        self._safe_run_once()
+
+        while not self._stop.wait(self.check_interval):
+            try:
+                self.tracker.flush()
+            except Exception as e:
+                logger.warning(f"Failed to persist session access history: {e}")
+
+            idle_for = time.monotonic() - self._last_activity
+            # חימום אחד לכל תקופת שקט: רק אם הייתה פעילות מאז החימום הקודם
+            if idle_for >= self.idle_seconds and (
+                self._last_warmup is None or self._last_warmup < self._last_activity
+            ):
+                self._safe_run_once()
+
+    def _safe_run_once(self) -> None:
+        try:
+            self.run_once()
+        except Exception as e:
+            logger.error(f"Cache warmup failed: {e}")
@@ -4,19 +4,27 @@ Chat Cache Service
 """
 
 import os
+import sys
 import json
+import math
 import time
+import uuid
+import random
+import asyncio
 import hashlib
 import threading
 import logging
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Union, Callable, TypeVar, Generic
-from dataclasses import dataclass, field
+from typing import Any, Awaitable, Dict, List, Optional, Tuple, Union, Callable, TypeVar, Generic
+from dataclasses import dataclass, field, asdict
+from concurrent.futures import ThreadPoolExecutor
 from enum import Enum
 from functools import wraps
 import weakref
 from collections import OrderedDict
 
+from backend.services.cache.cache_codecs import CacheCodec, get_codec
+
 logger = logging.getLogger(__name__)
 
 # Type definitions
@@ -41,24 +49,32 @@ class CacheEntry:
     """רשומת cache בודדת"""
     key: str
     value: Any
-    created_at: datetime
-    last_accessed: datetime
+    created_at: Optional[datetime] = None
+    last_accessed: Optional[datetime] = None
     access_count: int = 0
     ttl_seconds: Optional[int] = None
     size_bytes: int = 0
     metadata: Dict[str, Any] = field(default_factory=dict)
+    # שעון מונוטוני - לא מושפע משינויי שעון המערכת וזול יותר מ-datetime
+    created_monotonic: float = field(default_factory=time.monotonic)
+    expires_at: Optional[float] = None
+    
+    def __post_init__(self):
+        if self.expires_at is None and self.ttl_seconds is not None:
+            # רשומה שנוצרה עם created_at מהעבר - המרת הגיל לשעון המונוטוני פעם אחת
+            if self.created_at is not None:
+                self.created_monotonic -= max(0.0, (datetime.utcnow() - self.created_at).total_seconds())
+            self.expires_at = self.created_monotonic + self.ttl_seconds
     
     @property
     def is_expired(self) -> bool:
         """בדיקה אם הרשומה פגה"""
-        if self.ttl_seconds is None:
-            return False
-        return (datetime.utcnow() - self.created_at).total_seconds() > self.ttl_seconds
+        return self.expires_at is not None and time.monotonic() > self.expires_at
     
     @property
     def age_seconds(self) -> float:
         """גיל הרשומה בשניות"""
-        return (datetime.utcnow() - self.created_at).total_seconds()
+        return time.monotonic() - self.created_monotonic
     
     def touch(self):
         """עדכון זמן גישה אחרון"""
@@ -80,71 +96,115 @@ class CacheStats:
         total = self.hits + self.misses
         self.hit_rate = (self.hits / total * 100) if total > 0 else 0.0
 
+_SCALAR_TYPES = frozenset((str, bytes, int, float, bool, type(None)))
+_SEQUENCE_TYPES = frozenset((list, tuple, set, frozenset))
+
+
+def estimate_size(value: Any, _depth: int = 0) -> int:
+    """
+    הערכת גודל ערך בבתים בעלות קבועה
+    
+    ערכים פשוטים נמדדים ישירות; באוספים נדגמים עד 8 פריטים (עד עומק 3)
+    והממוצע מוכפל במספר הפריטים, במקום סריאליזציה של כל הערך.
+    """
+    value_type = type(value)
+    size = sys.getsizeof(value)
+    if value_type in _SCALAR_TYPES or _depth >= 3:
+        return size
+    
+    if value_type is dict:
+        count = len(value)
+        if count == 0:
+            return size
+        sample = 0
+        for index, (k, v) in enumerate(value.items()):
+            sample += estimate_size(k, _depth + 1) + estimate_size(v, _depth + 1)
+            if index == 7:
+                break
+        return size + sample * count // min(count, 8)
+    
+    if value_type in _SEQUENCE_TYPES:
+        count = len(value)
+        if count == 0:
+            return size
+        sample = 0
+        for index, item in enumerate(value):
+            sample += estimate_size(item, _depth + 1)
+            if index == 7:
+                break
+        return size + sample * count // min(count, 8)
+    
+    return size
+
+
 class LRUCache(Generic[T]):
     """
     LRU Cache implementation מותאם לביצועים
+    
+    מוגבל גם במספר רשומות (max_size) וגם בתקציב זיכרון בבתים (max_bytes).
     """
     
-    def __init__(self, max_size: int = 1000, ttl_seconds: Optional[int] = None):
+    def __init__(self, max_size: int = 1000, ttl_seconds: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
         self.max_size = max_size
+        self.max_bytes = max_bytes
         self.ttl_seconds = ttl_seconds
         self._cache: OrderedDict[str, CacheEntry] = OrderedDict()
-        self._lock = threading.RLock()
+        self._lock = threading.Lock()
         self._stats = CacheStats()
     
     def get(self, key: str) -> Optional[T]:
         """קבלת ערך מה-cache"""
         with self._lock:
-            if key not in self._cache:
+            entry = self._cache.get(key)
+            if entry is None:
                 self._stats.misses += 1
-                self._stats.update_hit_rate()
                 return None
             
-            entry = self._cache[key]
-            
             # בדיקת תפוגה
-            if entry.is_expired:
+            if entry.expires_at is not None and time.monotonic() > entry.expires_at:
                 del self._cache[key]
                 self._stats.misses += 1
                 self._stats.evictions += 1
                 self._stats.entry_count -= 1
                 self._stats.total_size_bytes -= entry.size_bytes
-                self._stats.update_hit_rate()
                 return None
             
-            # עדכון LRU - העברה לסוף
-            entry.touch()
+            # עדכון LRU - העברה לסוף (הסדר עצמו משמש כזמן הגישה האחרון)
+            entry.access_count += 1
             self._cache.move_to_end(key)
             
             self._stats.hits += 1
-            self._stats.update_hit_rate()
             return entry.value
     
-    def set(self, key: str, value: T, ttl_seconds: Optional[int] = None) -> None:
-        """הגדרת ערך ב-cache"""
+    def set(self, key: str, value: T, ttl_seconds: Optional[int] = None,
+            size_hint: Optional[int] = None) -> None:
+        """
+        הגדרת ערך ב-cache
+        
+        Args:
+            size_hint: גודל ידוע מראש בבתים (למשל אורך ה-payload), חוסך את ההערכה
+        """
+        # חישוב גודל מחוץ למנעול
+        size_bytes = size_hint if size_hint is not None else estimate_size(value)
+        
+        # יצירת entry חדש
+        entry = CacheEntry(
+            key=key,
+            value=value,
+            ttl_seconds=ttl_seconds or self.ttl_seconds,
+            size_bytes=size_bytes
+        )
+        
         with self._lock:
-            # חישוב גודל
-            size_bytes = self._calculate_size(value)
-            
-            # יצירת entry חדש
-            entry = CacheEntry(
-                key=key,
-                value=value,
-                created_at=datetime.utcnow(),
-                last_accessed=datetime.utcnow(),
-                ttl_seconds=ttl_seconds or self.ttl_seconds,
-                size_bytes=size_bytes
-            )
-            
             # אם המפתח כבר קיים, עדכון
-            if key in self._cache:
-                old_entry = self._cache[key]
+            old_entry = self._cache.pop(key, None)
+            if old_entry is not None:
                 self._stats.total_size_bytes -= old_entry.size_bytes
             else:
                 self._stats.entry_count += 1
             
             self._cache[key] = entry
-            self._cache.move_to_end(key)
             self._stats.total_size_bytes += size_bytes
             
             # בדיקת גבול גודל ופינוי אם נדרש
@@ -153,12 +213,12 @@ class LRUCache(Generic[T]):
     def delete(self, key: str) -> bool:
         """מחיקת ערך מה-cache"""
         with self._lock:
-            if key in self._cache:
-                entry = self._cache.pop(key)
-                self._stats.entry_count -= 1
-                self._stats.total_size_bytes -= entry.size_bytes
-                return True
-            return False
+            entry = self._cache.pop(key, None)
+            if entry is None:
+                return False
+            self._stats.entry_count -= 1
+            self._stats.total_size_bytes -= entry.size_bytes
+            return True
     
     def clear(self) -> None:
         """ניקוי כל ה-cache"""
@@ -166,9 +226,17 @@ class LRUCache(Generic[T]):
             self._cache.clear()
             self._stats = CacheStats()
     
+    def keys(self) -> List[str]:
+        """תמונת מצב של המפתחות הקיימים"""
+        with self._lock:
+            return list(self._cache.keys())
+    
     def _evict_if_needed(self) -> None:
-        """פינוי entries אם נדרש"""
-        while len(self._cache) > self.max_size:
+        """פינוי entries אם נדרש (נקרא כשהמנעול מוחזק)"""
+        while self._cache and (
+            len(self._cache) > self.max_size
+            or (self.max_bytes is not None and self._stats.total_size_bytes > self.max_bytes)
+        ):
             # הסרת הישן ביותר (LRU)
             oldest_key, oldest_entry = self._cache.popitem(last=False)
             self._stats.evictions += 1
@@ -178,30 +246,22 @@ class LRUCache(Generic[T]):
     
     def _calculate_size(self, value: Any) -> int:
         """חישוב גודל ערך בבתים (הערכה)"""
-        try:
-            if isinstance(value, str):
-                return len(value.encode('utf-8'))
-            elif isinstance(value, (int, float)):
-                return 8
-            elif isinstance(value, (list, dict)):
-                return len(json.dumps(value, ensure_ascii=False).encode('utf-8'))
-            else:
-                return len(str(value).encode('utf-8'))
-        except:
-            return 100  # הערכה ברירת מחדל
+        return estimate_size(value)
     
     def get_stats(self) -> CacheStats:
         """קבלת סטטיסטיקות cache"""
         with self._lock:
+            self._stats.update_hit_rate()
             return self._stats
     
     def cleanup_expired(self) -> int:
         """ניקוי entries שפגו"""
         with self._lock:
-            expired_keys = []
-            for key, entry in self._cache.items():
-                if entry.is_expired:
-                    expired_keys.append(key)
+            now = time.monotonic()
+            expired_keys = [
+                key for key, entry in self._cache.items()
+                if entry.expires_at is not None and now > entry.expires_at
+            ]
             
             for key in expired_keys:
                 entry = self._cache.pop(key)
@@ -211,13 +271,98 @@ class LRUCache(Generic[T]):
             
             return len(expired_keys)
 
+
+class ShardedLRUCache(Generic[T]):
+    """
+    LRU Cache מחולק ל-shards עם מנעול נפרד לכל shard
+    
+    כל מפתח משויך ל-shard קבוע, כך ש-threads שניגשים למפתחות שונים
+    לא ממתינים זה לזה. מגבלות הרשומות והבתים מחולקות שווה בין ה-shards,
+    ולכן סדר ה-LRU נשמר בתוך shard ולא גלובלית.
+    """
+    
+    # מספר רשומות מינימלי ל-shard - cache קטן נשאר shard יחיד עם LRU מדויק
+    MIN_ENTRIES_PER_SHARD = 64
+    
+    def __init__(self, max_size: int = 1000, ttl_seconds: Optional[int] = None,
+                 max_bytes: Optional[int] = None, shards: int = 16):
+        shards = max(1, min(shards, max_size // self.MIN_ENTRIES_PER_SHARD))
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._shards: List[LRUCache[T]] = [
+            LRUCache(
+                max_size=-(-max_size // shards),
+                ttl_seconds=ttl_seconds,
+                max_bytes=-(-max_bytes // shards) if max_bytes is not None else None,
+            )
+            for _ in range(shards)
+        ]
+    
+    @property
+    def shard_count(self) -> int:
+        return len(self._shards)
+    
+    def _shard(self, key: str) -> LRUCache[T]:
+        if len(self._shards) == 1:
+            return self._shards[0]
+        return self._shards[hash(key) % len(self._shards)]
+    
+    def get(self, key: str) -> Optional[T]:
+        """קבלת ערך מה-cache"""
+        return self._shard(key).get(key)
+    
+    def set(self, key: str, value: T, ttl_seconds: Optional[int] = None,
+            size_hint: Optional[int] = None) -> None:
+        """הגדרת ערך ב-cache"""
+        self._shard(key).set(key, value, ttl_seconds, size_hint)
+    
+    def delete(self, key: str) -> bool:
+        """מחיקת ערך מה-cache"""
+        return self._shard(key).delete(key)
+    
+    def clear(self) -> None:
+        """ניקוי כל ה-cache"""
+        for shard in self._shards:
+            shard.clear()
+    
+    def keys(self) -> List[str]:
+        """תמונת מצב של המפתחות בכל ה-shards"""
+        keys: List[str] = []
+        for shard in self._shards:
+            keys.extend(shard.keys())
+        return keys
+    
+    def get_stats(self) -> CacheStats:
+        """סטטיסטיקות מצטברות של כל ה-shards"""
+        total = CacheStats()
+        for shard in self._shards:
+            stats = shard.get_stats()
+            total.hits += stats.hits
+            total.misses += stats.misses
+            total.evictions += stats.evictions
+            total.total_size_bytes += stats.total_size_bytes
+            total.entry_count += stats.entry_count
+        total.update_hit_rate()
+        return total
+    
+    def cleanup_expired(self) -> int:
+        """ניקוי entries שפגו בכל ה-shards"""
+        return sum(shard.cleanup_expired() for shard in self._shards)
+
 class RedisCache:
     """
     Redis Cache implementation (אופציונלי)
+    
+    ערכים נשמרים בקידוד בינארי (msgpack כברירת מחדל, עם דחיסה מעל סף גודל).
+    ה-client של redis-py בטוח לשימוש מכמה threads דרך ה-connection pool שלו,
+    לכן אין נעילה סביב קריאות רשת - רק סביב עדכון הסטטיסטיקות.
     """
     
     def __init__(self, host: str = 'localhost', port: int = 6379, db: int = 0, 
-                 password: Optional[str] = None, prefix: str = 'chat_cache:'):
+                 password: Optional[str] = None, prefix: str = 'chat_cache:',
+                 codec: Union[str, CacheCodec] = 'msgpack', compress_threshold: Optional[int] = 4096,
+                 max_connections: int = 50, client: Any = None):
         self.prefix = prefix
         self._redis = None
         self._connection_params = {
@@ -225,20 +370,24 @@ class RedisCache:
             'port': port,
             'db': db,
             'password': password,
-            'decode_responses': True
+            'max_connections': max_connections,
         }
+        self.codec = codec if isinstance(codec, CacheCodec) else get_codec(codec, compress_threshold)
         self._stats = CacheStats()
-        self._lock = threading.RLock()
+        self._stats_lock = threading.Lock()
         
-        # ניסיון חיבור
-        self._connect()
+        # ניסיון חיבור (או שימוש ב-client קיים, למשל fakeredis בבדיקות)
+        self._connect(client)
     
-    def _connect(self) -> bool:
+    def _connect(self, client: Any = None) -> bool:
         """חיבור ל-Redis"""
         try:
-            import redis
-            self._redis = redis.Redis(**self._connection_params)
-            self._redis.ping()  # בדיקת חיבור
+            if client is None:
+                import redis
+                pool = redis.ConnectionPool(**self._connection_params)
+                client = redis.Redis(connection_pool=pool)
+            client.ping()  # בדיקת חיבור
+            self._redis = client
             logger.info("Connected to Redis successfully")
             return True
         except ImportError:
@@ -252,94 +401,220 @@ class RedisCache:
         """בדיקה אם Redis זמין"""
         return self._redis is not None
     
+    def _record(self, hits: int = 0, misses: int = 0, entries: int = 0, size_bytes: int = 0):
+        with self._stats_lock:
+            self._stats.hits += hits
+            self._stats.misses += misses
+            self._stats.entry_count += entries
+            self._stats.total_size_bytes += size_bytes
+            self._stats.update_hit_rate()
+    
     def get(self, key: str) -> Optional[Any]:
         """קבלת ערך מ-Redis"""
         if not self.is_available():
             return None
         
         try:
-            with self._lock:
-                full_key = f"{self.prefix}{key}"
-                data = self._redis.get(full_key)
-                
-                if data is None:
-                    self._stats.misses += 1
-                    self._stats.update_hit_rate()
-                    return None
-                
-                # פענוח JSON
-                value = json.loads(data)
-                self._stats.hits += 1
-                self._stats.update_hit_rate()
-                return value
+            data = self._redis.get(f"{self.prefix}{key}")
+            
+            if data is None:
+                self._record(misses=1)
+                return None
+            
+            value = self.codec.decode(data)
+            self._record(hits=1)
+            return value
                 
         except Exception as e:
             logger.error(f"Redis get error for key {key}: {e}")
-            self._stats.misses += 1
-            self._stats.update_hit_rate()
+            self._record(misses=1)
             return None
     
+    def mget(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        קבלת מספר ערכים ב-round trip אחד (MGET)
+        
+        Returns:
+            Dict[str, Any]: רק המפתחות שנמצאו
+        """
+        if not self.is_available() or not keys:
+            return {}
+        
+        try:
+            values = self._redis.mget([f"{self.prefix}{key}" for key in keys])
+        except Exception as e:
+            logger.error(f"Redis mget error: {e}")
+            self._record(misses=len(keys))
+            return {}
+        
+        found = {}
+        for key, data in zip(keys, values):
+            if data is None:
+                continue
+            try:
+                found[key] = self.codec.decode(data)
+            except Exception as e:
+                logger.error(f"Redis decode error for key {key}: {e}")
+        self._record(hits=len(found), misses=len(keys) - len(found))
+        return found
+    
     def set(self, key: str, value: Any, ttl_seconds: Optional[int] = None) -> bool:
         """הגדרת ערך ב-Redis"""
         if not self.is_available():
             return False
         
         try:
-            with self._lock:
-                full_key = f"{self.prefix}{key}"
-                data = json.dumps(value, ensure_ascii=False, default=str)
-                
-                if ttl_seconds:
-                    result = self._redis.setex(full_key, ttl_seconds, data)
-                else:
-                    result = self._redis.set(full_key, data)
-                
-                if result:
-                    self._stats.entry_count += 1
-                    self._stats.total_size_bytes += len(data.encode('utf-8'))
-                
-                return bool(result)
+            data = self.codec.encode(value)
+            result = self._redis.set(f"{self.prefix}{key}", data, ex=ttl_seconds or None)
+            
+            if result:
+                self._record(entries=1, size_bytes=len(data))
+            
+            return bool(result)
                 
         except Exception as e:
             logger.error(f"Redis set error for key {key}: {e}")
             return False
     
+    def mset(self, items: Dict[str, Any], ttl_seconds: Optional[int] = None) -> bool:
+        """הגדרת מספר ערכים ב-pipeline אחד (round trip יחיד)"""
+        if not self.is_available():
+            return False
+        if not items:
+            return True
+        
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            size_bytes = 0
+            for key, value in items.items():
+                data = self.codec.encode(value)
+                size_bytes += len(data)
+                pipe.set(f"{self.prefix}{key}", data, ex=ttl_seconds or None)
+            results = pipe.execute()
+            self._record(entries=sum(1 for r in results if r), size_bytes=size_bytes)
+            return all(results)
+        
+        except Exception as e:
+            logger.error(f"Redis mset error: {e}")
+            return False
+    
     def delete(self, key: str) -> bool:
         """מחיקת ערך מ-Redis"""
         if not self.is_available():
             return False
         
         try:
-            with self._lock:
-                full_key = f"{self.prefix}{key}"
-                result = self._redis.delete(full_key)
-                
-                if result:
-                    self._stats.entry_count -= 1
-                
-                return bool(result)
+            result = self._redis.delete(f"{self.prefix}{key}")
+            
+            if result:
+                self._record(entries=-1)
+            
+            return bool(result)
                 
         except Exception as e:
             logger.error(f"Redis delete error for key {key}: {e}")
             return False
     
+    def delete_many(self, keys: List[str]) -> int:
+        """מחיקת מספר מפתחות בפקודה אחת"""
+        if not self.is_available() or not keys:
+            return 0
+        
+        try:
+            deleted = int(self._redis.delete(*[f"{self.prefix}{key}" for key in keys]))
+            self._record(entries=-deleted)
+            return deleted
+        except Exception as e:
+            logger.error(f"Redis delete error: {e}")
+            return 0
+    
+    def incr(self, key: str, seed: Optional[int] = None) -> Optional[int]:
+        """הגדלה אטומית של מונה (INCR); מונה חסר מתחיל מ-seed אם ניתן"""
+        if not self.is_available():
+            return None
+        
+        try:
+            redis_key = f"{self.prefix}{key}"
+            if seed is None:
+                return int(self._redis.incr(redis_key))
+            pipe = self._redis.pipeline()
+            pipe.set(redis_key, seed, nx=True)
+            pipe.incr(redis_key)
+            return int(pipe.execute()[-1])
+        except Exception as e:
+            logger.error(f"Redis incr error for key {key}: {e}")
+            return None
+    
+    def get_counter(self, key: str, seed: Optional[int] = None) -> Optional[int]:
+        """קריאת מונה; מונה חסר נוצר עם seed (או 0 בלי seed); None אם Redis לא זמין"""
+        if not self.is_available():
+            return None
+        
+        try:
+            redis_key = f"{self.prefix}{key}"
+            value = self._redis.get(redis_key)
+            if value is None and seed is not None:
+                # SET NX: תהליך שיצר את המונה במקביל קובע את הערך
+                self._redis.set(redis_key, seed, nx=True)
+                value = self._redis.get(redis_key)
+            return int(value) if value is not None else 0
+        except Exception as e:
+            logger.error(f"Redis counter read error for key {key}: {e}")
+            return None
+    
+    def publish(self, channel: str, message: bytes) -> bool:
+        """פרסום הודעה בערוץ pub/sub (שם הערוץ כולל את ה-prefix)"""
+        if not self.is_available():
+            return False
+        
+        try:
+            self._redis.publish(f"{self.prefix}{channel}", message)
+            return True
+        except Exception as e:
+            logger.error(f"Redis publish error on {channel}: {e}")
+            return False
+    
+    def subscribe(self, channel: str):
+        """יצירת חיבור pub/sub מנוי לערוץ"""
+        pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(f"{self.prefix}{channel}")
+        return pubsub
+    
+    def scan_keys(self, pattern: str):
+        """מעבר על מפתחות לפי pattern עם SCAN (לא חוסם את השרת כמו KEYS)"""
+        if not self.is_available():
+            return
+        
+        prefix_length = len(self.prefix)
+        for key in self._redis.scan_iter(match=f"{self.prefix}{pattern}", count=500):
+            if isinstance(key, bytes):
+                key = key.decode('utf-8')
+            yield key[prefix_length:]
+    
+    def delete_pattern(self, pattern: str, batch_size: int = 500) -> int:
+        """מחיקת מפתחות לפי pattern - SCAN ומחיקה באצוות"""
+        deleted = 0
+        batch = []
+        for key in self.scan_keys(pattern):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                deleted += self.delete_many(batch)
+                batch = []
+        if batch:
+            deleted += self.delete_many(batch)
+        return deleted
+    
     def clear(self) -> bool:
         """ניקוי כל המפתחות עם הprefix"""
         if not self.is_available():
             return False
         
         try:
-            with self._lock:
-                pattern = f"{self.prefix}*"
-                keys = self._redis.keys(pattern)
-                
-                if keys:
-                    result = self._redis.delete(*keys)
-                    self._stats.entry_count = 0
-                    self._stats.total_size_bytes = 0
-                    return bool(result)
-                
-                return True
+            self.delete_pattern("*")
+            with self._stats_lock:
+                self._stats.entry_count = 0
+                self._stats.total_size_bytes = 0
+            return True
                 
         except Exception as e:
             logger.error(f"Redis clear error: {e}")
@@ -349,6 +624,391 @@ class RedisCache:
         """קבלת סטטיסטיקות Redis cache"""
         return self._stats
 
+class CacheGenerations:
+    """
+    מוני דורות (generations) לביטול cache ב-O(1)
+    
+    מפתחות cache מכילים את הדור הנוכחי של ה-namespace שלהם. ביטול מגדיל את
+    המונה, כך שהמפתחות הישנים פשוט לא נקראים יותר ומתפנים דרך LRU / TTL.
+    
+    כאשר Redis זמין המונים נשמרים בו (INCR) ומשותפים בין תהליכים; קריאות
+    נשמרות מקומית ל-refresh_seconds כדי לא להוסיף round trip לכל get.
+    מונה שחסר ב-Redis (פונה, נמחק ב-clear) נוצר מחדש מהזמן הנוכחי
+    במיקרו-שניות - מעל כל דור שהונפק קודם, כך שמפתח ישן לא חוזר להיות תקף.
+    
+    לכל namespace נשמר גם סימון (remote_mark) שמשתנה רק כשנראה דור שתהליך
+    אחר הגדיל, כדי ש-state מקומי (למשל חלון ההקשר) יידע מתי לבדוק את ה-DB.
+    """
+    
+    def __init__(self, redis_cache: Optional['RedisCache'] = None,
+                 max_namespaces: int = 100000, refresh_seconds: float = 1.0):
+        self.redis_cache = redis_cache
+        self.max_namespaces = max_namespaces
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        # namespace -> (generation, monotonic time of last read from Redis, remote mark)
+        self._generations: OrderedDict[str, tuple] = OrderedDict()
+        self._counter = 0
+        self._marks = 0
+        # דור ברירת מחדל ל-namespaces שלא מוכרים; עולה כשמפנים namespace מהטבלה
+        self._floor = 0
+    
+    def _shared(self) -> bool:
+        return self.redis_cache is not None and self.redis_cache.is_available()
+    
+    @staticmethod
+    def _seed() -> int:
+        return time.time_ns() // 1000
+    
+    def get(self, namespace: str) -> int:
+        """הדור הנוכחי של namespace"""
+        with self._lock:
+            cached = self._generations.get(namespace)
+            if cached is not None and (
+                not self._shared() or time.monotonic() - cached[1] < self.refresh_seconds
+            ):
+                return cached[0]
+            if not self._shared():
+                return self._floor
+        
+        generation = self.redis_cache.get_counter(f"gen:{namespace}", seed=self._seed())
+        if generation is None:
+            with self._lock:
+                cached = self._generations.get(namespace)
+                return cached[0] if cached else self._floor
+        # הדורות שהתהליך הזה הגדיל כבר נשמרו ב-bump, לכן דור חדש מ-Redis הוא של תהליך אחר
+        self._remember(namespace, generation, remote=True)
+        return generation
+    
+    def remote_mark(self, namespace: str) -> Optional[int]:
+        """
+        סימון שמשתנה כשתהליך אחר מגדיל את דור ה-namespace
+        
+        ללא Redis אין תהליכים משותפים והסימון קבוע (0). None - ה-namespace לא
+        במעקב (למשל פונה מהטבלה), ולכן אי אפשר לדעת אם השתנה.
+        """
+        if not self._shared():
+            return 0
+        self.get(namespace)
+        with self._lock:
+            cached = self._generations.get(namespace)
+            return cached[2] if cached is not None else None
+    
+    def bump(self, namespace: str) -> int:
+        """ביטול כל המפתחות של namespace - הגדלת הדור"""
+        generation = self.redis_cache.incr(f"gen:{namespace}", seed=self._seed()) if self._shared() else None
+        if generation is None:
+            with self._lock:
+                self._counter += 1
+                generation = self._counter
+        self._remember(namespace, generation)
+        return generation
+    
+    def observe(self, namespace: str, generation: int) -> None:
+        """עדכון דור שהתקבל מתהליך אחר (לא חוזר אחורה)"""
+        with self._lock:
+            cached = self._generations.get(namespace)
+            if cached is not None and cached[0] >= generation:
+                return
+        self._remember(namespace, generation, remote=True)
+    
+    def _remember(self, namespace: str, generation: int, remote: bool = False) -> None:
+        with self._lock:
+            cached = self._generations.get(namespace)
+            if cached is None or (remote and generation > cached[0]):
+                # namespace חדש בטבלה מקבל סימון חדש: אולי השתנה בזמן שלא היה במעקב
+                self._marks += 1
+                mark = self._marks
+            else:
+                mark = cached[2]
+            self._generations[namespace] = (generation, time.monotonic(), mark)
+            self._generations.move_to_end(namespace)
+            while len(self._generations) > self.max_namespaces:
+                self._generations.popitem(last=False)
+                if not self._shared():
+                    # namespace שנשכח מקבל דור חדש מכל דור שהונפק - אף מפתח ישן לא יחזור
+                    self._counter += 1
+                    self._floor = self._counter
+    
+    def clear(self) -> None:
+        with self._lock:
+            self._generations.clear()
+            self._counter += 1
+            self._floor = self._counter
+
+
+@dataclass
+class SingleFlightStats:
+    """סטטיסטיקות coalescing של טעינות"""
+    loads: int = 0
+    coalesced: int = 0
+    stale_served: int = 0
+    early_refreshes: int = 0
+    refresh_errors: int = 0
+
+
+class _Flight:
+    """טעינה אחת שנמצאת בביצוע"""
+    __slots__ = ("event", "result", "error", "waiters")
+    
+    def __init__(self):
+        self.event = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        # ממתינים async: (event loop, future)
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+
+def _resolve_future(future: asyncio.Future, result: Any, error: Optional[BaseException]):
+    if future.done():
+        return
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(result)
+
+
+class SingleFlight:
+    """
+    איחוד טעינות מקבילות לאותו מפתח (single-flight)
+    
+    הקורא הראשון מריץ את ה-loader; קוראים נוספים - sync או async - ממתינים
+    לתוצאה שלו במקום להריץ שוב את השאילתה והפענוח.
+    
+    הערה: קורא sync שממתין בתוך ה-event loop שמריץ את הטעינה ה-async ייתקע,
+    לכן בקוד async יש להשתמש ב-do_async.
+    """
+    
+    def __init__(self, refresh_workers: int = 4):
+        self._lock = threading.Lock()
+        self._flights: Dict[str, _Flight] = {}
+        self._refresh_workers = refresh_workers
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._background_tasks: set = set()
+        self.stats = SingleFlightStats()
+    
+    def _join(self, key: str) -> Tuple[_Flight, bool]:
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.stats.coalesced += 1
+                return flight, False
+            flight = _Flight()
+            self._flights[key] = flight
+            self.stats.loads += 1
+            return flight, True
+    
+    def _finish(self, key: str, flight: _Flight, result: Any = None, error: Optional[BaseException] = None):
+        flight.result = result
+        flight.error = error
+        with self._lock:
+            self._flights.pop(key, None)
+            waiters, flight.waiters = flight.waiters, []
+            flight.event.set()
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve_future, future, result, error)
+    
+    def in_flight(self, key: str) -> bool:
+        with self._lock:
+            return key in self._flights
+    
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        """הרצת fn פעם אחת לכל המבקשים המקבילים של key"""
+        flight, leader = self._join(key)
+        if not leader:
+            flight.event.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+        
+        try:
+            result = fn()
+        except BaseException as e:
+            self._finish(key, flight, error=e)
+            raise
+        self._finish(key, flight, result)
+        return result
+    
+    async def do_async(self, key: str, fn: Callable[[], Awaitable[T]]) -> T:
+        """גרסת async של do - ממתינים לא חוסמים את ה-event loop"""
+        flight, leader = self._join(key)
+        if not leader:
+            future = asyncio.get_running_loop().create_future()
+            with self._lock:
+                if flight.event.is_set():
+                    _resolve_future(future, flight.result, flight.error)
+                else:
+                    flight.waiters.append((asyncio.get_running_loop(), future))
+            return await future
+        
+        try:
+            result = await fn()
+        except BaseException as e:
+            self._finish(key, flight, error=e)
+            raise
+        self._finish(key, flight, result)
+        return result
+    
+    def refresh(self, key: str, fn: Callable[[], Any]) -> bool:
+        """
+        רענון ברקע (stale-while-revalidate) אם אין כבר טעינה של key
+        
+        Returns:
+            bool: True אם הרענון תוזמן
+        """
+        if self.in_flight(key):
+            return False
+        
+        def run():
+            try:
+                self.do(key, fn)
+            except Exception as e:
+                self.stats.refresh_errors += 1
+                logger.warning(f"Background cache refresh failed for {key}: {e}")
+        
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self._refresh_workers, thread_name_prefix="cache-refresh"
+                )
+        self._executor.submit(run)
+        return True
+    
+    def refresh_async(self, key: str, fn: Callable[[], Awaitable[Any]]) -> bool:
+        """רענון ברקע כ-task על ה-event loop הנוכחי"""
+        if self.in_flight(key):
+            return False
+        
+        async def run():
+            try:
+                await self.do_async(key, fn)
+            except Exception as e:
+                self.stats.refresh_errors += 1
+                logger.warning(f"Background cache refresh failed for {key}: {e}")
+        
+        task = asyncio.get_running_loop().create_task(run())
+        # שמירת reference כדי שה-task לא ייאסף לפני שסיים
+        self._background_tasks.add(task)
+        task.add_done_callback(self._background_tasks.discard)
+        return True
+    
+    def get_stats(self) -> SingleFlightStats:
+        with self._lock:
+            return SingleFlightStats(**asdict(self.stats))
+
+
+class CacheInvalidationBus:
+    """
+    ביטול cache בין תהליכים ב-Redis pub/sub (near-cache)
+    
+    כל תהליך מחזיק L1 (LRU בזיכרון) מעל Redis. כתיבות מפורסמות בערוץ
+    invalidate - מפתחות שהשתנו, דורות חדשים, patterns ו-clear - וכל שאר
+    התהליכים מוחקים את ה-L1 שלהם בהתאם, כך שאפשר להחזיק TTL ארוך ב-L1.
+    
+    אם החיבור לערוץ נפל ייתכן שהודעות אבדו, לכן ב-resubscribe ה-L1 מתרוקן.
+    
+    ב-REDIS (ללא L1) ה-bus מפיץ רק דורות, כדי שדור שתהליך אחר הגדיל ייראה
+    מיד ולא אחרי refresh. כל עוד אין מנוי, הדורות מתרעננים מ-Redis בקצב הרגיל.
+    """
+    
+    CHANNEL = "invalidate"
+    
+    def __init__(self, cache_service: 'ChatCacheService', generation_refresh_seconds: float = 30.0,
+                 poll_timeout: float = 1.0, reconnect_delay: float = 1.0):
+        self.cache_service = cache_service
+        self.redis_cache = cache_service.redis_cache
+        self.origin = uuid.uuid4().hex
+        self.generation_refresh_seconds = generation_refresh_seconds
+        self._fallback_refresh_seconds = cache_service.generations.refresh_seconds
+        self.poll_timeout = poll_timeout
+        self.reconnect_delay = reconnect_delay
+        self.received = 0
+        self.published = 0
+        self._stop = threading.Event()
+        self._subscribed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    def start(self):
+        """התחלת thread המנוי"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._listen, name="cache-invalidation", daemon=True)
+        self._thread.start()
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.poll_timeout + 1)
+            self._thread = None
+    
+    @property
+    def subscribed(self) -> bool:
+        return self._subscribed.is_set()
+    
+    def wait_until_subscribed(self, timeout: float = 5.0) -> bool:
+        return self._subscribed.wait(timeout)
+    
+    def publish(self, op: str, **fields: Any) -> bool:
+        """פרסום שינוי לשאר התהליכים"""
+        message = json.dumps({"origin": self.origin, "op": op, **fields}, ensure_ascii=False)
+        published = self.redis_cache.publish(self.CHANNEL, message.encode('utf-8'))
+        if published:
+            self.published += 1
+        return published
+    
+    def _listen(self):
+        while not self._stop.is_set():
+            pubsub = None
+            try:
+                pubsub = self.redis_cache.subscribe(self.CHANNEL)
+                # הודעות שנשלחו בזמן שלא היינו מנויים אבדו
+                self.cache_service._drop_local()
+                # הודעות דורות מגיעות מיד, ה-refresh התקופתי הוא רק רשת ביטחון
+                self.cache_service.generations.refresh_seconds = self.generation_refresh_seconds
+                self._subscribed.set()
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=self.poll_timeout)
+                    if message and message.get("type") == "message":
+                        self._apply(message["data"])
+            except Exception as e:
+                self._subscribed.clear()
+                self.cache_service.generations.refresh_seconds = self._fallback_refresh_seconds
+                logger.warning(f"Cache invalidation channel error: {e}")
+                self._stop.wait(self.reconnect_delay)
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+    
+    def _apply(self, data: Union[bytes, str]):
+        try:
+            event = json.loads(data)
+        except (TypeError, ValueError):
+            logger.warning("Ignoring malformed cache invalidation message")
+            return
+        if event.get("origin") == self.origin:
+            return
+        
+        self.received += 1
+        op = event.get("op")
+        if op == "keys":
+            self.cache_service._drop_local(keys=event.get("keys", []))
+        elif op == "generation":
+            self.cache_service.generations.observe(event["namespace"], int(event["generation"]))
+        elif op == "pattern":
+            self.cache_service._drop_local(pattern=event.get("pattern"))
+        elif op == "clear":
+            self.cache_service._drop_local()
+        else:
+            logger.warning(f"Unknown cache invalidation op: {op}")
+
+
+# סימון לערכים שנשמרו דרך get_or_load - כוללים זמן תפוגה לוגי ועלות טעינה
+_LOADED_MARKER = "__cache_loaded__"
+
+
 class ChatCacheService:
     """
     שירות cache מתקדם למערכת השיחות
@@ -358,14 +1018,22 @@ class ChatCacheService:
                  backend: CacheBackend = CacheBackend.MEMORY,
                  max_memory_size: int = 1000,
                  default_ttl: int = 3600,  # שעה
-                 redis_config: Optional[Dict[str, Any]] = None):
+                 redis_config: Optional[Dict[str, Any]] = None,
+                 max_memory_bytes: Optional[int] = 64 * 1024 * 1024,
+                 memory_shards: int = 16,
+                 pubsub_invalidation: bool = True):
         
         self.backend = backend
         self.default_ttl = default_ttl
         self._lock = threading.RLock()
         
         # אתחול cache backends
-        self.memory_cache = LRUCache(max_size=max_memory_size, ttl_seconds=default_ttl)
+        self.memory_cache = ShardedLRUCache(
+            max_size=max_memory_size,
+            ttl_seconds=default_ttl,
+            max_bytes=max_memory_bytes,
+            shards=memory_shards,
+        )
         
         self.redis_cache = None
         if backend in [CacheBackend.REDIS, CacheBackend.HYBRID]:
@@ -376,6 +1044,23 @@ class ChatCacheService:
                 logger.warning("Redis not available, falling back to memory cache")
                 self.backend = CacheBackend.MEMORY
         
+        # מוני דורות לביטול O(1) של namespaces
+        self.generations = CacheGenerations(
+            self.redis_cache if self.backend in [CacheBackend.REDIS, CacheBackend.HYBRID] else None
+        )
+        
+        # איחוד טעינות מקבילות (cache stampede)
+        self.single_flight = SingleFlight()
+        
+        # מונה ביטולים מקומיים - ערך שנקרא מ-Redis לא נשמר ב-L1 אם הגיע ביטול בינתיים
+        self._l1_epoch = 0
+        
+        # ביטול L1 ודורות בין תהליכים (ב-REDIS רק דורות - אין L1)
+        self.invalidation_bus: Optional[CacheInvalidationBus] = None
+        if self.backend in [CacheBackend.REDIS, CacheBackend.HYBRID] and pubsub_invalidation:
+            self.invalidation_bus = CacheInvalidationBus(self)
+            self.invalidation_bus.start()
+        
         # Cache invalidation callbacks
         self._invalidation_callbacks: Dict[str, List[Callable]] = {}
         
@@ -387,6 +1072,13 @@ class ChatCacheService:
     
     def get(self, key: str, default: Optional[T] = None) -> Optional[T]:
         """קבלת ערך מה-cache"""
+        value = self._get_raw(key, default)
+        if isinstance(value, dict) and value.get(_LOADED_MARKER):
+            return value["value"]
+        return value
+    
+    def _get_raw(self, key: str, default: Optional[T] = None) -> Optional[T]:
+        """קבלת הערך כפי שנשמר (כולל מעטפת get_or_load)"""
         try:
             if self.backend == CacheBackend.MEMORY:
                 return self.memory_cache.get(key) or default
@@ -401,10 +1093,12 @@ class ChatCacheService:
                     return value
                 
                 # אם לא נמצא, נסה Redis
+                epoch = self._l1_epoch
                 value = self.redis_cache.get(key)
                 if value is not None:
-                    # שמור ב-memory cache לפעם הבאה
-                    self.memory_cache.set(key, value)
+                    # שמור ב-memory cache לפעם הבאה, אלא אם הגיע ביטול בזמן הקריאה
+                    if epoch == self._l1_epoch:
+                        self.memory_cache.set(key, value)
                     return value
                 
                 return default
@@ -413,24 +1107,88 @@ class ChatCacheService:
             logger.error(f"Cache get error for key {key}: {e}")
             return default
     
-    def set(self, key: str, value: T, ttl_seconds: Optional[int] = None) -> bool:
-        """הגדרת ערך ב-cache"""
+    def set(self, key: str, value: T, ttl_seconds: Optional[int] = None,
+            size_hint: Optional[int] = None, publish: bool = True) -> bool:
+        """
+        הגדרת ערך ב-cache
+        
+        publish=False למילוי cache שלא משנה נתונים (טעינה מהמקור, מפתח עם דור) -
+        תהליכים אחרים מחזיקים את אותו ערך ואין סיבה למחוק אותו מה-L1 שלהם.
+        """
         try:
             ttl = ttl_seconds or self.default_ttl
             success = True
             
             if self.backend in [CacheBackend.MEMORY, CacheBackend.HYBRID]:
-                self.memory_cache.set(key, value, ttl)
+                self.memory_cache.set(key, value, ttl, size_hint)
             
             if self.backend in [CacheBackend.REDIS, CacheBackend.HYBRID]:
                 success = self.redis_cache.set(key, value, ttl)
             
+            if publish:
+                self._publish("keys", keys=[key])
             return success
             
         except Exception as e:
             logger.error(f"Cache set error for key {key}: {e}")
             return False
     
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        קבלת מספר ערכים - memory קודם, והחסרים ב-MGET אחד מ-Redis
+        
+        Returns:
+            Dict[str, Any]: רק המפתחות שנמצאו
+        """
+        found: Dict[str, Any] = {}
+        try:
+            missing = keys
+            if self.backend in [CacheBackend.MEMORY, CacheBackend.HYBRID]:
+                missing = []
+                for key in keys:
+                    value = self.memory_cache.get(key)
+                    if value is not None:
+                        found[key] = value
+                    else:
+                        missing.append(key)
+            
+            if missing and self.backend in [CacheBackend.REDIS, CacheBackend.HYBRID]:
+                epoch = self._l1_epoch
+                remote = self.redis_cache.mget(missing)
+                if self.backend == CacheBackend.HYBRID and epoch == self._l1_epoch:
+                    for key, value in remote.items():
+                        self.memory_cache.set(key, value)
+                found.update(remote)
+        except Exception as e:
+            logger.error(f"Cache get_many error: {e}")
+        
+        return {
+            key: value["value"] if isinstance(value, dict) and value.get(_LOADED_MARKER) else value
+            for key, value in found.items()
+        }
+    
+    def set_many(self, items: Dict[str, Any], ttl_seconds: Optional[int] = None,
+                 publish: bool = True) -> bool:
+        """הגדרת מספר ערכים - ב-Redis ב-pipeline אחד (publish כמו ב-set)"""
+        try:
+            ttl = ttl_seconds or self.default_ttl
+            success = True
+            
+            if self.backend in [CacheBackend.MEMORY, CacheBackend.HYBRID]:
+                for key, value in items.items():
+                    self.memory_cache.set(key, value, ttl)
+            
+            if self.backend in [CacheBackend.REDIS, CacheBackend.HYBRID]:
+                success = self.redis_cache.mset(items, ttl)
+            
+            if items and publish:
+                self._publish("keys", keys=list(items))
+            return success
+            
+        except Exception as e:
+            logger.error(f"Cache set_many error: {e}")
+            return False
+    
     def delete(self, key: str) -> bool:
         """מחיקת ערך מה-cache"""
         try:
@@ -442,6 +1200,8 @@ class ChatCacheService:
             if self.backend in [CacheBackend.REDIS, CacheBackend.HYBRID]:
                 success = self.redis_cache.delete(key)
             
+            self._publish("keys", keys=[key])
+            
             # הפעלת callbacks של invalidation
             self._trigger_invalidation_callbacks(key)
             
@@ -462,21 +1222,155 @@ class ChatCacheService:
             if self.backend in [CacheBackend.REDIS, CacheBackend.HYBRID]:
                 success = self.redis_cache.clear()
             
+            self.generations.clear()
+            self._publish("clear")
+            
             return success
             
         except Exception as e:
             logger.error(f"Cache clear error: {e}")
             return False
     
+    def _lookup(self, key: str, early_expiration_beta: float) -> Tuple[Any, str]:
+        """
+        קריאת ערך ומצבו: fresh / early / stale / miss
+        
+        early - תפוגה מוקדמת הסתברותית (XFetch): ההסתברות לרענן עולה ככל
+        שמתקרבים לתפוגה ובהתאם לזמן הטעינה, כך שקורא אחד מרענן לפני כולם.
+        """
+        raw = self._get_raw(key)
+        if raw is None:
+            return None, "miss"
+        if not (isinstance(raw, dict) and raw.get(_LOADED_MARKER)):
+            # ערך שנשמר ב-set רגיל
+            return raw, "fresh"
+        
+        now = time.time()
+        if now >= raw["expires"]:
+            return raw["value"], "stale"
+        if early_expiration_beta > 0 and raw["delta"] > 0:
+            jitter = -raw["delta"] * early_expiration_beta * math.log(1.0 - random.random())
+            if now + jitter >= raw["expires"]:
+                return raw["value"], "early"
+        return raw["value"], "fresh"
+    
+    def _store_loaded(self, key: str, value: Any, ttl: int, stale_ttl: int, delta: float):
+        if value is None:
+            return
+        self.set(key, {
+            _LOADED_MARKER: True,
+            "value": value,
+            "expires": time.time() + ttl,
+            "delta": delta,
+        }, ttl + stale_ttl, publish=False)
+    
+    def get_or_load(self, key: str, loader: Callable[[], T], ttl_seconds: Optional[int] = None,
+                    stale_ttl_seconds: int = 0, early_expiration_beta: float = 1.0) -> Optional[T]:
+        """
+        קבלת ערך מה-cache או טעינה שלו עם single-flight
+        
+        Args:
+            loader: פונקציה שמחזירה את הערך (None לא נשמר)
+            stale_ttl_seconds: כמה זמן אחרי התפוגה מותר להחזיר ערך ישן
+                בזמן שהוא מתרענן ברקע
+            early_expiration_beta: עוצמת התפוגה המוקדמת (0 מבטל)
+        """
+        ttl = ttl_seconds or self.default_ttl
+        value, state = self._lookup(key, early_expiration_beta)
+        if state == "fresh":
+            return value
+        
+        def load():
+            start = time.perf_counter()
+            result = loader()
+            self._store_loaded(key, result, ttl, stale_ttl_seconds, time.perf_counter() - start)
+            return result
+        
+        if state == "early" or (state == "stale" and stale_ttl_seconds > 0):
+            if self.single_flight.refresh(key, load):
+                if state == "early":
+                    self.single_flight.stats.early_refreshes += 1
+                else:
+                    self.single_flight.stats.stale_served += 1
+            return value
+        
+        def load_if_missing():
+            # ייתכן שטעינה אחרת הסתיימה בין ה-lookup לבין ההצטרפות
+            current, current_state = self._lookup(key, 0)
+            if current_state == "fresh":
+                return current
+            return load()
+        
+        return self.single_flight.do(key, load_if_missing)
+    
+    async def aget_or_load(self, key: str, loader: Callable[[], Awaitable[T]], ttl_seconds: Optional[int] = None,
+                           stale_ttl_seconds: int = 0, early_expiration_beta: float = 1.0) -> Optional[T]:
+        """גרסת async של get_or_load - loader הוא coroutine function"""
+        ttl = ttl_seconds or self.default_ttl
+        value, state = self._lookup(key, early_expiration_beta)
+        if state == "fresh":
+            return value
+        
+        async def load():
+            start = time.perf_counter()
+            result = await loader()
+            self._store_loaded(key, result, ttl, stale_ttl_seconds, time.perf_counter() - start)
+            return result
+        
+        if state == "early" or (state == "stale" and stale_ttl_seconds > 0):
+            if self.single_flight.refresh_async(key, load):
+                if state == "early":
+                    self.single_flight.stats.early_refreshes += 1
+                else:
+                    self.single_flight.stats.stale_served += 1
+            return value
+        
+        async def load_if_missing():
+            current, current_state = self._lookup(key, 0)
+            if current_state == "fresh":
+                return current
+            return await load()
+        
+        return await self.single_flight.do_async(key, load_if_missing)
+    
+    def get_generation(self, namespace: str) -> int:
+        """הדור הנוכחי של namespace, לשילוב במפתחות"""
+        return self.generations.get(namespace)
+    
+    def get_remote_mark(self, namespace: str) -> Optional[int]:
+        """סימון שמשתנה כשתהליך אחר ביטל את ה-namespace (ראו CacheGenerations.remote_mark)"""
+        return self.generations.remote_mark(namespace)
+    
+    def invalidate_namespace(self, namespace: str) -> int:
+        """
+        ביטול כל המפתחות של namespace ב-O(1)
+        
+        Returns:
+            int: הדור החדש
+        """
+        try:
+            generation = self.generations.bump(namespace)
+            self._publish("generation", namespace=namespace, generation=generation)
+            self._trigger_invalidation_callbacks(namespace)
+            return generation
+        except Exception as e:
+            logger.error(f"Namespace invalidation error for {namespace}: {e}")
+            return 0
+    
     def invalidate_pattern(self, pattern: str) -> int:
-        """ביטול cache לפי pattern"""
+        """
+        ביטול cache לפי pattern
+        
+        סורק את כל המפתחות - לביטול של session / משתמש / סוג נתונים יש
+        להשתמש ב-invalidate_namespace.
+        """
         try:
             invalidated = 0
             
             if self.backend in [CacheBackend.MEMORY, CacheBackend.HYBRID]:
                 # Memory cache - iterate through keys
                 keys_to_delete = []
-                for key in self.memory_cache._cache.keys():
+                for key in self.memory_cache.keys():
                     if self._match_pattern(key, pattern):
                         keys_to_delete.append(key)
                 
@@ -484,17 +1378,12 @@ class ChatCacheService:
                     if self.memory_cache.delete(key):
                         invalidated += 1
             
+            self._publish("pattern", pattern=pattern)
+            
             if self.backend in [CacheBackend.REDIS, CacheBackend.HYBRID] and self.redis_cache.is_available():
-                # Redis - use keys pattern matching
+                # Redis - incremental SCAN instead of blocking KEYS, batched deletes
                 try:
-                    import redis
-                    full_pattern = f"{self.redis_cache.prefix}{pattern}"
-                    keys = self.redis_cache._redis.keys(full_pattern)
-                    
-                    for key in keys:
-                        clean_key = key.replace(self.redis_cache.prefix, '')
-                        if self.redis_cache.delete(clean_key):
-                            invalidated += 1
+                    invalidated += self.redis_cache.delete_pattern(pattern)
                             
                 except Exception as e:
                     logger.error(f"Redis pattern invalidation error: {e}")
@@ -505,6 +1394,36 @@ class ChatCacheService:
             logger.error(f"Pattern invalidation error for pattern {pattern}: {e}")
             return 0
     
+    def _publish(self, op: str, **fields: Any):
+        """פרסום שינוי לתהליכים אחרים (אם ה-bus פעיל)"""
+        if self.invalidation_bus is None:
+            return
+        if self.backend == CacheBackend.REDIS and op != "generation":
+            return
+        self.invalidation_bus.publish(op, **fields)
+    
+    def _drop_local(self, keys: Optional[List[str]] = None, pattern: Optional[str] = None):
+        """
+        מחיקה מה-L1 בלבד, בעקבות שינוי בתהליך אחר
+        
+        ללא keys ו-pattern - ריקון כל ה-L1.
+        """
+        self._l1_epoch += 1
+        if keys is not None:
+            for key in keys:
+                self.memory_cache.delete(key)
+        elif pattern is not None:
+            for key in self.memory_cache.keys():
+                if self._match_pattern(key, pattern):
+                    self.memory_cache.delete(key)
+        else:
+            self.memory_cache.clear()
+    
+    def close(self):
+        """עצירת threads רקע של השירות"""
+        if self.invalidation_bus is not None:
+            self.invalidation_bus.stop()
+    
     def _match_pattern(self, key: str, pattern: str) -> bool:
         """בדיקה אם מפתח תואם לpattern"""
         import fnmatch
@@ -557,13 +1476,16 @@ class ChatCacheService:
         self._cleanup_thread.start()
 
 # Decorator לcaching פונקציות
-def cached(ttl_seconds: int = 3600, key_prefix: str = "func"):
+def cached(ttl_seconds: int = 3600, key_prefix: str = "func",
+           stale_ttl_seconds: int = 0, early_expiration_beta: float = 1.0):
     """
     Decorator לcaching תוצאות פונקציות
+    
+    קריאות מקבילות עם אותו מפתח מאוחדות לטעינה אחת (sync ו-async).
+    stale_ttl_seconds מאפשר החזרת ערך ישן בזמן רענון ברקע.
     """
     def decorator(func: Callable) -> Callable:
-        @wraps(func)
-        def wrapper(*args, **kwargs):
+        def make_key(args, kwargs) -> str:
             # יצירת מפתח cache
             key_parts = [key_prefix, func.__name__]
             
@@ -581,20 +1503,24 @@ def cached(ttl_seconds: int = 3600, key_prefix: str = "func"):
                 else:
                     key_parts.append(f"{k}:{hashlib.md5(str(v).encode()).hexdigest()[:8]}")
             
-            cache_key = ":".join(key_parts)
-            
-            # ניסיון קבלה מ-cache
-            cached_result = cache_service.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            # חישוב התוצאה
-            result = func(*args, **kwargs)
-            
-            # שמירה ב-cache
-            cache_service.set(cache_key, result, ttl_seconds)
+            return ":".join(key_parts)
+        
+        if asyncio.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                return await cache_service.aget_or_load(
+                    make_key(args, kwargs), lambda: func(*args, **kwargs), ttl_seconds,
+                    stale_ttl_seconds, early_expiration_beta
+                )
             
-            return result
+            return async_wrapper
+        
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache_service.get_or_load(
+                make_key(args, kwargs), lambda: func(*args, **kwargs), ttl_seconds,
+                stale_ttl_seconds, early_expiration_beta
+            )
         
         return wrapper
     return decorator
@@ -605,58 +1531,137 @@ class ChatCacheManager:
     מנהל cache ספציפי למערכת השיחות
     """
     
+    FAMILIES = ("session", "messages", "user_sessions", "search", "stats")
+    # משפחות שמפתחותיהן כוללים דור לכל session / משתמש
+    SCOPED_FAMILIES = ("messages", "user_sessions")
+    # limit במפתח של רשימת הודעות מלאה (limit=None)
+    FULL_HISTORY = "all"
+    
     def __init__(self, cache_service: ChatCacheService):
         self.cache = cache_service
     
+    def _key(self, family: str, scope: Optional[str], *parts: Any) -> str:
+        """
+        בניית מפתח הכולל את דור המשפחה ואת דור ה-scope (session / משתמש)
+        
+        ביטול של scope או של משפחה שלמה מגדיל מונה בלבד - מפתחות ישנים לא
+        נקראים יותר ומתפנים דרך LRU / TTL.
+        """
+        key = f"{family}:g{self.cache.get_generation(family)}"
+        if scope is not None:
+            key += f":{scope}:g{self.cache.get_generation(f'{family}:{scope}')}"
+        for part in parts:
+            key += f":{part}"
+        return key
+    
+    def invalidate_family(self, family: str) -> int:
+        """ביטול כל המפתחות של סוג נתונים (session / messages / search ...)"""
+        return self.cache.invalidate_namespace(family)
+    
+    def namespace_for_pattern(self, pattern: str) -> Optional[str]:
+        """
+        המרת pattern בסגנון "messages:*" / "messages:<session_id>:*" ל-namespace
+        
+        Returns:
+            Optional[str]: ה-namespace, או None אם ה-pattern לא ממופה לדור
+        """
+        parts = pattern.split(":")
+        if parts[-1] != "*" or parts[0] not in self.FAMILIES:
+            return None
+        if any(ch in part for part in parts[:-1] for ch in "*?["):
+            return None
+        if len(parts) == 2:
+            return parts[0]
+        if len(parts) == 3 and parts[0] in self.SCOPED_FAMILIES:
+            return f"{parts[0]}:{parts[1]}"
+        return None
+    
     # Session caching
     def get_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """קבלת session מ-cache"""
-        return self.cache.get(f"session:{session_id}")
+        return self.cache.get(self._key("session", None, session_id))
     
     def set_session(self, session_id: str, session_data: Dict[str, Any], ttl: int = 1800):
         """שמירת session ב-cache (30 דקות)"""
-        return self.cache.set(f"session:{session_id}", session_data, ttl)
+        return self.cache.set(self._key("session", None, session_id), session_data, ttl)
+    
+    def set_sessions(self, sessions: Dict[str, Dict[str, Any]], ttl: int = 1800):
+        """שמירת מספר sessions בפעולה אחת"""
+        return self.cache.set_many(
+            {self._key("session", None, session_id): data for session_id, data in sessions.items()}, ttl
+        )
     
     def invalidate_session(self, session_id: str):
         """ביטול cache של session"""
-        return self.cache.delete(f"session:{session_id}")
+        return self.cache.delete(self._key("session", None, session_id))
     
     # Messages caching
     def get_session_messages(self, session_id: str, limit: int = 50) -> Optional[List[Dict[str, Any]]]:
         """קבלת הודעות session מ-cache"""
-        return self.cache.get(f"messages:{session_id}:{limit}")
+        return self.cache.get(self._key("messages", session_id, limit))
     
     def set_session_messages(self, session_id: str, messages: List[Dict[str, Any]], limit: int = 50):
         """שמירת הודעות session ב-cache"""
-        return self.cache.set(f"messages:{session_id}:{limit}", messages, 600)  # 10 דקות
+        # כל כתיבה מגדילה את דור ה-session, לכן מילוי לא צריך לבטל עותקים בתהליכים אחרים
+        return self.cache.set(self._key("messages", session_id, limit), messages, 600, publish=False)  # 10 דקות
+    
+    def get_many_session_messages(self, session_ids: List[str], limit: int = 50) -> Dict[str, List[Dict[str, Any]]]:
+        """קבלת הודעות של מספר sessions ב-round trip אחד"""
+        keys = {self._key("messages", session_id, limit): session_id for session_id in session_ids}
+        return {keys[key]: value for key, value in self.cache.get_many(list(keys)).items()}
+    
+    def set_many_session_messages(self, messages_by_session: Dict[str, List[Dict[str, Any]]], limit: int = 50):
+        """שמירת הודעות של מספר sessions בפעולה אחת"""
+        return self.cache.set_many(
+            {self._key("messages", session_id, limit): messages
+             for session_id, messages in messages_by_session.items()},
+            600, publish=False
+        )
     
     def invalidate_session_messages(self, session_id: str):
         """ביטול cache של הודעות session"""
-        return self.cache.invalidate_pattern(f"messages:{session_id}:*")
+        return self.cache.invalidate_namespace(f"messages:{session_id}")
+    
+    def session_messages_remote_mark(self, session_id: str) -> Optional[int]:
+        """סימון שמשתנה כשתהליך אחר שינה את הודעות ה-session"""
+        return self.cache.get_remote_mark(f"messages:{session_id}")
+    
+    def load_session_messages(self, session_id: str, limit: int,
+                              loader: Callable[[], Optional[List[Dict[str, Any]]]]) -> Optional[List[Dict[str, Any]]]:
+        """קבלת הודעות session מ-cache או טעינה אחת משותפת לכל הקוראים המקבילים"""
+        # כל כתיבה מגדילה את דור ה-session, לכן ערך "ישן" באותו דור עדיין נכון
+        return self.cache.get_or_load(self._key("messages", session_id, limit), loader, 600,
+                                      stale_ttl_seconds=300)
     
     # User sessions caching
     def get_user_sessions(self, user_id: str, limit: int = 20) -> Optional[List[Dict[str, Any]]]:
         """קבלת sessions של משתמש מ-cache"""
-        return self.cache.get(f"user_sessions:{user_id}:{limit}")
+        return self.cache.get(self._key("user_sessions", user_id, limit))
     
     def set_user_sessions(self, user_id: str, sessions: List[Dict[str, Any]], limit: int = 20):
         """שמירת sessions של משתמש ב-cache"""
-        return self.cache.set(f"user_sessions:{user_id}:{limit}", sessions, 900)  # 15 דקות
+        return self.cache.set(self._key("user_sessions", user_id, limit), sessions, 900, publish=False)  # 15 דקות
+    
+    def load_user_sessions(self, user_id: str, limit: int,
+                           loader: Callable[[], Optional[List[Dict[str, Any]]]]) -> Optional[List[Dict[str, Any]]]:
+        """קבלת sessions של משתמש מ-cache או טעינה אחת משותפת לכל הקוראים המקבילים"""
+        return self.cache.get_or_load(self._key("user_sessions", user_id, limit), loader, 900,
+                                      stale_ttl_seconds=300)
     
     def invalidate_user_sessions(self, user_id: str):
         """ביטול cache של sessions משתמש"""
-        return self.cache.invalidate_pattern(f"user_sessions:{user_id}:*")
+        return self.cache.invalidate_namespace(f"user_sessions:{user_id}")
     
     # Search results caching
     def get_search_results(self, query: str, filters: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
         """קבלת תוצאות חיפוש מ-cache"""
         search_key = self._generate_search_key(query, filters)
-        return self.cache.get(f"search:{search_key}")
+        return self.cache.get(self._key("search", None, search_key))
     
     def set_search_results(self, query: str, filters: Dict[str, Any], results: List[Dict[str, Any]]):
         """שמירת תוצאות חיפוש ב-cache"""
         search_key = self._generate_search_key(query, filters)
-        return self.cache.set(f"search:{search_key}", results, 300)  # 5 דקות
+        return self.cache.set(self._key("search", None, search_key), results, 300)  # 5 דקות
     
     def _generate_search_key(self, query: str, filters: Dict[str, Any]) -> str:
         """יצירת מפתח לחיפוש"""
@@ -667,12 +1672,146 @@ class ChatCacheManager:
     # Statistics caching
     def get_stats(self, stat_type: str, period: str = "daily") -> Optional[Dict[str, Any]]:
         """קבלת סטטיסטיקות מ-cache"""
-        return self.cache.get(f"stats:{stat_type}:{period}")
+        return self.cache.get(self._key("stats", None, stat_type, period))
     
     def set_stats(self, stat_type: str, stats_data: Dict[str, Any], period: str = "daily"):
         """שמירת סטטיסטיקות ב-cache"""
         ttl = 3600 if period == "hourly" else 86400  # שעה או יום
-        return self.cache.set(f"stats:{stat_type}:{period}", stats_data, ttl)
+        return self.cache.set(self._key("stats", None, stat_type, period), stats_data, ttl)
+
+
+@dataclass
+class LLMResponseCacheStats:
+    """סטטיסטיקות cache תשובות LLM"""
+    hits: int = 0
+    misses: int = 0
+    stores: int = 0
+    bypassed: int = 0
+    uncacheable: int = 0
+    oversized: int = 0
+    evictions: int = 0
+    tokens_saved: int = 0
+    cost_saved: float = 0.0
+    hit_rate: float = 0.0
+
+
+class LLMResponseCache:
+    """
+    cache לתשובות LLM דטרמיניסטיות
+
+    המפתח הוא (model_id, הודעות מנורמלות, פרמטרים). תשובה נשמרת רק כאשר
+    temperature == 0 או כשהקורא ביקש זאת במפורש (cache=True); cache=False
+    עוקף את ה-cache לבקשה בודדת. הערכים נשמרים ב-ChatCacheService עם TTL,
+    תשובות ארוכות מ-max_response_chars לא נשמרות, ומספר הרשומות שתהליך זה
+    כתב מוגבל ל-max_entries (הוותיקה נמחקת ראשונה).
+    """
+
+    NAMESPACE = "llm_responses"
+
+    def __init__(self, cache_service: ChatCacheService, ttl_seconds: int = 3600,
+                 max_entries: int = 1000, max_response_chars: int = 32 * 1024):
+        self.cache = cache_service
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_response_chars = max_response_chars
+        self.stats = LLMResponseCacheStats()
+        self._keys: 'OrderedDict[str, None]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_messages(messages: List[Dict[str, Any]]) -> List[Tuple[str, str]]:
+        """
+        תפקיד ותוכן בלבד: רווחים בקצוות ו-CRLF מנורמלים, רווחים פנימיים נשמרים
+
+        רווחים פנימיים משנים משמעות (קוד, טקסט מעוצב), ולכן הם חלק מהמפתח
+        """
+        return [
+            (
+                str(message.get("role", "")).strip().lower(),
+                str(message.get("content", "")).replace("\r\n", "\n").replace("\r", "\n").strip(),
+            )
+            for message in messages
+        ]
+
+    def should_cache(self, parameters: Dict[str, Any], cache: Optional[bool] = None) -> bool:
+        """
+        האם להשתמש ב-cache לבקשה
+
+        Args:
+            parameters: פרמטרי היצירה (LLMParameters.to_dict())
+            cache: None - רק ב-temperature == 0, True - תמיד, False - עקיפה
+        """
+        if cache is False:
+            with self._lock:
+                self.stats.bypassed += 1
+            return False
+        if cache is True or float(parameters.get("temperature", 1.0)) == 0.0:
+            return True
+        with self._lock:
+            self.stats.uncacheable += 1
+        return False
+
+    def key_for(self, model_id: str, messages: List[Dict[str, Any]], parameters: Dict[str, Any]) -> str:
+        """מפתח cache הכולל את דור ה-namespace, כך ש-invalidate() הוא O(1)"""
+        payload = json.dumps(
+            [model_id, self.normalize_messages(messages), parameters],
+            sort_keys=True, ensure_ascii=False, default=str
+        )
+        digest = hashlib.sha256(payload.encode()).hexdigest()
+        return f"{self.NAMESPACE}:g{self.cache.get_generation(self.NAMESPACE)}:{digest}"
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """קבלת תשובה שמורה (content, tokens_used, cost, model_used, metadata, cached_at)"""
+        response = self.cache.get(key)
+        with self._lock:
+            if response is None:
+                self.stats.misses += 1
+            else:
+                self.stats.hits += 1
+                self.stats.tokens_saved += int(response.get("tokens_used") or 0)
+                self.stats.cost_saved += float(response.get("cost") or 0.0)
+                if key in self._keys:
+                    self._keys.move_to_end(key)
+            total = self.stats.hits + self.stats.misses
+            self.stats.hit_rate = self.stats.hits / total * 100 if total else 0.0
+        return response
+
+    def store(self, key: str, response: Dict[str, Any]) -> bool:
+        """שמירת תשובה מוצלחת; תשובות ארוכות מדי לא נשמרות"""
+        if len(response.get("content") or "") > self.max_response_chars:
+            with self._lock:
+                self.stats.oversized += 1
+            return False
+
+        entry = dict(response, cached_at=time.time())
+        # המפתח נגזר מהבקשה - אותה תשובה תקפה בכל תהליך
+        if not self.cache.set(key, entry, self.ttl_seconds, publish=False):
+            return False
+
+        with self._lock:
+            self.stats.stores += 1
+            self._keys[key] = None
+            self._keys.move_to_end(key)
+            evicted = []
+            while len(self._keys) > self.max_entries:
+                evicted.append(self._keys.popitem(last=False)[0])
+                self.stats.evictions += 1
+        for old_key in evicted:
+            self.cache.delete(old_key)
+        return True
+
+    def invalidate(self) -> int:
+        """ביטול כל התשובות השמורות (למשל אחרי החלפת משקלי מודל)"""
+        with self._lock:
+            self._keys.clear()
+        return self.cache.invalidate_namespace(self.NAMESPACE)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = asdict(self.stats)
+            stats["entries"] = len(self._keys)
+        stats["cost_saved"] = round(stats["cost_saved"], 6)
+        return stats
 
 # Global cache service instance
 cache_service = ChatCacheService(
@@ -684,10 +1823,13 @@ cache_service = ChatCacheService(
 # Global chat cache manager
 chat_cache = ChatCacheManager(cache_service)
 
+# Global LLM response cache
+llm_response_cache = LLMResponseCache(cache_service)
+
 # Initialize Redis if available
 def init_redis_cache(host: str = 'localhost', port: int = 6379, password: Optional[str] = None):
     """אתחול Redis cache"""
-    global cache_service, chat_cache
+    global cache_service, chat_cache, llm_response_cache
     
     redis_config = {
         'host': host,
@@ -701,17 +1843,26 @@ def init_redis_cache(host: str = 'localhost', port: int = 6379, password: Option
     )
     
     chat_cache = ChatCacheManager(cache_service)
+    llm_response_cache = LLMResponseCache(cache_service)
     logger.info("Redis cache initialized")
 
 # Utility functions
 def get_cache_info() -> Dict[str, Any]:
     """קבלת מידע על מצב ה-cache"""
     stats = cache_service.get_stats()
+    bus = cache_service.invalidation_bus
     
     info = {
         'backend': cache_service.backend.value,
         'stats': stats,
-        'redis_available': cache_service.redis_cache.is_available() if cache_service.redis_cache else False
+        'redis_available': cache_service.redis_cache.is_available() if cache_service.redis_cache else False,
+        'single_flight': asdict(cache_service.single_flight.get_stats()),
+        'llm_responses': llm_response_cache.get_stats(),
+        'invalidation_bus': {
+            'subscribed': bus.subscribed,
+            'published': bus.published,
+            'received': bus.received,
+        } if bus is not None else None
     }
     
     return info
@@ -0,0 +1,159 @@
+"""
+בדיקות לחימום cache חזוי
+"""
+
+import os
+import time
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+
+from backend.migrations.add_chat_tables import migrate_chat_tables
+from backend.services.ai.chat_history_service import ChatHistoryService
+from backend.services.ai.session_service import SessionService
+from backend.services.cache.cache_warmup import AccessTracker, CacheWarmupScheduler
+from backend.services.cache.chat_cache_service import cache_service, chat_cache
+from backend.models.chat import Message, MessageRole
+
+
+class TestAccessTracker(unittest.TestCase):
+
+    def setUp(self):
+        """הכנה לבדיקות"""
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.db_path)
+
+    def test_decay_prefers_recent_activity(self):
+        """בדיקה ש-session פעיל לאחרונה עוקף session שהיה פעיל מזמן"""
+        tracker = AccessTracker(self.db_path, half_life_seconds=3600)
+        now = time.time()
+        for _ in range(10):
+            tracker.record("old", now=now - 10 * 3600)
+        for _ in range(3):
+            tracker.record("recent", now=now)
+
+        self.assertEqual(tracker.top(2, now=now), ["recent", "old"])
+
+    def test_history_survives_restart(self):
+        """בדיקה שהדירוג נשמר ב-DB ונטען מחדש"""
+        tracker = AccessTracker(self.db_path)
+        tracker.record("a")
+        tracker.record("b")
+        tracker.record("b")
+        tracker.record("deleted")
+        tracker.forget("deleted")
+        self.assertEqual(tracker.flush(), 2)
+
+        restarted = AccessTracker(self.db_path)
+        self.assertEqual(restarted.top(10), ["b", "a"])
+
+    def test_bounded_size(self):
+        """בדיקה שמספר ה-sessions במעקב מוגבל"""
+        tracker = AccessTracker(self.db_path, max_sessions=10)
+        for i in range(50):
+            tracker.record(f"s{i}")
+        self.assertLessEqual(len(tracker.top(100)), 11)
+        self.assertIn("s49", tracker.top(100))
+
+
+class TestCacheWarmupScheduler(unittest.TestCase):
+
+    def setUp(self):
+        """DB זמני עם sessions והודעות"""
+        fd, self.db_path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        migrate_chat_tables(self.db_path)
+        cache_service.clear()
+
+        self.session_service = SessionService(db_path=self.db_path)
+        self.history_service = ChatHistoryService(db_path=self.db_path)
+        self.session_ids = []
+        for i in range(3):
+            session = self.session_service.create_session(title=f"Chat {i}")
+            self.session_ids.append(session.id)
+            for j in range(5):
+                self.history_service.save_message(session.id, Message(
+                    id=f"{session.id}-{j}", session_id=session.id, role=MessageRole.USER,
+                    content=f"message {j}", timestamp=datetime.utcnow(),
+                ))
+        cache_service.clear()
+
+        self.scheduler = CacheWarmupScheduler(
+            self.session_service, self.history_service, AccessTracker(self.db_path),
+            top_sessions=2, cpu_budget=1.0,
+        )
+
+    def tearDown(self):
+        self.scheduler.stop()
+        cache_service.clear()
+        os.unlink(self.db_path)
+
+    def test_warms_most_accessed_sessions(self):
+        """בדיקה שה-sessions המדורגים נטענים ל-cache ופתיחה ראשונה היא hit"""
+        hot = self.session_ids[0]
+        for _ in range(5):
+            self.scheduler.record_access(hot)
+
+        self.assertEqual(self.scheduler.run_once(), 2)
+        self.assertEqual(self.scheduler.predict()[0], hot)
+        self.assertIn(hot, chat_cache.get_many_session_messages([hot], chat_cache.FULL_HISTORY))
+        self.assertIsNotNone(self.history_service.context_window.get(hot))
+
+        # ריצה נוספת לא טוענת שוב מה שכבר ב-cache
+        self.assertEqual(self.scheduler.run_once(), 0)
+        self.assertEqual(self.scheduler.last_run["already_cached"], 2)
+
+    def test_io_budget_limits_run(self):
+        """בדיקה שתקציב ההודעות עוצר את הריצה"""
+        self.scheduler.max_messages_per_run = 5
+        self.assertEqual(self.scheduler.run_once(), 1)
+        self.assertEqual(self.scheduler.last_run["stopped_by"], "io_budget")
+
+    def test_session_over_budget_is_skipped(self):
+        """בדיקה ש-session שלא נכנס בתקציב מדולג ולא נשמר חלקית"""
+        big = self.session_ids[0]
+        for j in range(5, 10):
+            self.history_service.save_message(big, Message(
+                id=f"{big}-{j}", session_id=big, role=MessageRole.USER,
+                content=f"message {j}", timestamp=datetime.utcnow(),
+            ))
+        cache_service.clear()
+        for _ in range(5):
+            self.scheduler.record_access(big)
+        self.scheduler.max_messages_per_run = 7
+
+        self.assertEqual(self.scheduler.run_once(), 1)
+        self.assertEqual(self.scheduler.last_run["messages_read"], 5)
+        self.assertEqual(self.scheduler.last_run["over_budget"], 1)
+        self.assertEqual(self.scheduler.last_run["stopped_by"], "io_budget")
+        self.assertNotIn(big, chat_cache.get_many_session_messages([big], chat_cache.FULL_HISTORY))
+        self.assertEqual(len(self.history_service.get_session_messages(big)), 10)
+
+    def test_endpoint_read_after_warmup_is_a_hit(self):
+        """בדיקה שקריאה כמו ב-API (ללא limit) אחרי חימום לא ניגשת ל-DB"""
+        self.scheduler.run_once()
+        hot = self.scheduler.predict()[0]
+
+        with patch.object(self.history_service, "_fetch_session_messages") as fetch:
+            messages = self.history_service.get_session_messages(hot)
+        fetch.assert_not_called()
+        self.assertEqual(len(messages), 5)
+
+    def test_forgets_deleted_sessions(self):
+        """בדיקה ש-session שנמחק יוצא מהדירוג"""
+        self.scheduler.record_access("missing-session")
+        self.scheduler.run_once()
+        self.assertNotIn("missing-session", self.scheduler.tracker.top(10))
+
+    def test_invalid_cpu_budget(self):
+        """בדיקת ולידציה של תקציב CPU"""
+        with self.assertRaises(ValueError):
+            CacheWarmupScheduler(self.session_service, self.history_service, self.scheduler.tracker, cpu_budget=0)
+
+
+if __name__ == '__main__':
+    unittest.main()
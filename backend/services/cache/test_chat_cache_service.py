@@ -7,15 +7,23 @@ import tempfile
 import os
 import shutil
 import time
+import asyncio
 import threading
 from datetime import datetime, timedelta
-from unittest.mock import patch, MagicMock
+from unittest.mock import ANY, patch, MagicMock
 
 from backend.services.cache.chat_cache_service import (
-    ChatCacheService, LRUCache, RedisCache, ChatCacheManager,
+    ChatCacheService, LRUCache, ShardedLRUCache, RedisCache, ChatCacheManager, LLMResponseCache,
     CacheBackend, CacheStrategy, CacheEntry, CacheStats,
-    cached, cache_service, chat_cache, get_cache_info, clear_all_cache
+    CacheGenerations, SingleFlight, cached, cache_service, chat_cache, get_cache_info, clear_all_cache,
+    estimate_size
 )
+from backend.services.cache.cache_codecs import JsonCodec, get_codec
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
 
 
 class TestCacheEntry(unittest.TestCase):
@@ -218,6 +226,71 @@ class TestLRUCache(unittest.TestCase):
         self.assertEqual(short_cache.get("key3"), "value3")
 
 
+class TestShardedLRUCache(unittest.TestCase):
+    
+    def test_byte_budget_eviction(self):
+        """בדיקת פינוי לפי תקציב בתים"""
+        cache = LRUCache(max_size=100, max_bytes=1000)
+        
+        cache.set("key1", "a", size_hint=400)
+        cache.set("key2", "b", size_hint=400)
+        cache.set("key3", "c", size_hint=400)
+        
+        # key1 פונה כדי לעמוד בתקציב
+        self.assertIsNone(cache.get("key1"))
+        self.assertEqual(cache.get("key3"), "c")
+        self.assertLessEqual(cache.get_stats().total_size_bytes, 1000)
+    
+    def test_oversized_value_not_cached(self):
+        """ערך גדול מהתקציב כולו לא נשמר"""
+        cache = LRUCache(max_size=100, max_bytes=100)
+        cache.set("small", "a", size_hint=10)
+        cache.set("huge", "b", size_hint=1000)
+        
+        self.assertIsNone(cache.get("huge"))
+        self.assertEqual(cache.get_stats().total_size_bytes, 0)
+    
+    def test_small_cache_uses_single_shard(self):
+        """cache קטן נשאר shard יחיד עם LRU מדויק"""
+        self.assertEqual(ShardedLRUCache(max_size=10).shard_count, 1)
+        self.assertEqual(ShardedLRUCache(max_size=10000, shards=16).shard_count, 16)
+    
+    def test_sharded_operations_and_stats(self):
+        """בדיקת פעולות וסטטיסטיקות מצטברות בין shards"""
+        cache = ShardedLRUCache(max_size=1024, shards=8, max_bytes=10 * 1024 * 1024)
+        for i in range(200):
+            cache.set(f"key{i}", {"value": i})
+        
+        self.assertEqual(cache.get("key42"), {"value": 42})
+        self.assertTrue(cache.delete("key42"))
+        self.assertIsNone(cache.get("key42"))
+        self.assertEqual(len(cache.keys()), 199)
+        
+        stats = cache.get_stats()
+        self.assertEqual(stats.entry_count, 199)
+        self.assertEqual(stats.hits, 1)
+        self.assertEqual(stats.misses, 1)
+        
+        cache.clear()
+        self.assertEqual(cache.get_stats().entry_count, 0)
+    
+    def test_estimate_size_is_sampled(self):
+        """הערכת גודל גדלה עם התוכן בלי לסרלז את כולו"""
+        small = [{"content": "x" * 10}] * 10
+        large = [{"content": "x" * 10}] * 10000
+        
+        self.assertGreater(estimate_size(large), estimate_size(small) * 100)
+        self.assertGreater(estimate_size("x" * 1000), 1000)
+    
+    def test_monotonic_expiry(self):
+        """תפוגה לפי שעון מונוטוני"""
+        entry = CacheEntry(key="k", value="v", ttl_seconds=60)
+        self.assertFalse(entry.is_expired)
+        
+        entry.expires_at = time.monotonic() - 1
+        self.assertTrue(entry.is_expired)
+
+
 class TestRedisCache(unittest.TestCase):
     
     def setUp(self):
@@ -278,6 +351,182 @@ class TestRedisCache(unittest.TestCase):
         self.assertIsNone(result)
 
 
+class TestCacheCodecs(unittest.TestCase):
+    
+    def test_round_trip(self):
+        """בדיקת קידוד ופענוח בכל ה-codecs"""
+        value = {"id": "msg1", "content": "שלום " * 10, "tokens": 12, "meta": None, "tags": ["a", "b"]}
+        for codec in (JsonCodec(), get_codec("msgpack")):
+            self.assertEqual(codec.decode(codec.encode(value)), value)
+    
+    def test_compression_above_threshold(self):
+        """בדיקה שרק ערכים גדולים נדחסים"""
+        codec = get_codec("msgpack", compress_threshold=1024)
+        small = codec.encode({"content": "x" * 100})
+        large = codec.encode({"content": "x" * 100000})
+        self.assertLess(len(large), 10000)
+        self.assertEqual(codec.decode(large), {"content": "x" * 100000})
+        self.assertEqual(codec.decode(small), {"content": "x" * 100})
+    
+    def test_reads_legacy_json_and_other_codecs(self):
+        """בדיקה שערכי JSON ישנים וערכים מ-codec אחר נקראים"""
+        codec = get_codec("msgpack")
+        self.assertEqual(codec.decode(b'{"a": 1}'), {"a": 1})
+        self.assertEqual(codec.decode(JsonCodec().encode([1, 2])), [1, 2])
+
+
+@unittest.skipUnless(fakeredis is not None, "fakeredis not installed")
+class TestRedisCachePipelines(unittest.TestCase):
+    
+    def setUp(self):
+        """הכנה לבדיקות"""
+        self.client = fakeredis.FakeRedis()
+        self.redis_cache = RedisCache(prefix="test_cache:", client=self.client)
+    
+    def test_binary_round_trip(self):
+        """בדיקת שמירה וקריאה בקידוד בינארי"""
+        self.assertTrue(self.redis_cache.set("k", {"data": [1, 2, 3]}, ttl_seconds=60))
+        self.assertEqual(self.redis_cache.get("k"), {"data": [1, 2, 3]})
+        self.assertLessEqual(self.client.ttl("test_cache:k"), 60)
+        self.assertIsNone(self.redis_cache.get("missing"))
+    
+    def test_mget_mset_single_round_trip(self):
+        """בדיקה ש-mset/mget מבצעים round trip אחד"""
+        items = {f"messages:s{i}": [{"id": i}] for i in range(20)}
+        with patch.object(self.client, 'set', wraps=self.client.set) as single_set:
+            self.assertTrue(self.redis_cache.mset(items, ttl_seconds=60))
+            single_set.assert_not_called()
+        
+        with patch.object(self.client, 'get', wraps=self.client.get) as single_get:
+            found = self.redis_cache.mget(list(items) + ["messages:missing"])
+            single_get.assert_not_called()
+        
+        self.assertEqual(found, items)
+        stats = self.redis_cache.get_stats()
+        self.assertEqual(stats.hits, 20)
+        self.assertEqual(stats.misses, 1)
+    
+    def test_scan_based_clear_and_pattern_delete(self):
+        """בדיקת מחיקה לפי pattern ו-clear מבוססי SCAN"""
+        self.client.set("other:key", b"1")
+        self.redis_cache.mset({f"a:{i}": i for i in range(1200)})
+        self.redis_cache.set("b:1", 1)
+        
+        self.assertEqual(self.redis_cache.delete_pattern("a:*"), 1200)
+        self.assertEqual(self.redis_cache.get("b:1"), 1)
+        
+        self.assertTrue(self.redis_cache.clear())
+        self.assertIsNone(self.redis_cache.get("b:1"))
+        self.assertEqual(self.client.get("other:key"), b"1")
+    
+    def test_hybrid_get_many(self):
+        """בדיקת get_many ב-HYBRID: memory קודם ואז MGET"""
+        service = ChatCacheService(backend=CacheBackend.MEMORY)
+        service.backend = CacheBackend.HYBRID
+        service.redis_cache = self.redis_cache
+        manager = ChatCacheManager(service)
+        
+        manager.set_many_session_messages({"s1": [{"id": 1}], "s2": [{"id": 2}]})
+        service.memory_cache.clear()
+        
+        found = manager.get_many_session_messages(["s1", "s2", "s3"])
+        self.assertEqual(found, {"s1": [{"id": 1}], "s2": [{"id": 2}]})
+        # נשמר ב-memory לקריאה הבאה
+        self.assertEqual(len(service.memory_cache.keys()), 2)
+
+
+@unittest.skipUnless(fakeredis is not None, "fakeredis not installed")
+class TestHybridInvalidationBus(unittest.TestCase):
+    
+    def setUp(self):
+        """שני "תהליכים" עם L1 נפרד מעל אותו Redis"""
+        server = fakeredis.FakeServer()
+        self.worker_a = ChatCacheService(backend=CacheBackend.HYBRID,
+                                         redis_config={'client': fakeredis.FakeRedis(server=server)})
+        self.worker_b = ChatCacheService(backend=CacheBackend.HYBRID,
+                                         redis_config={'client': fakeredis.FakeRedis(server=server)})
+        self.assertTrue(self.worker_a.invalidation_bus.wait_until_subscribed())
+        self.assertTrue(self.worker_b.invalidation_bus.wait_until_subscribed())
+    
+    def tearDown(self):
+        self.worker_a.close()
+        self.worker_b.close()
+    
+    def _eventually(self, predicate, timeout: float = 2.0) -> bool:
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if predicate():
+                return True
+            time.sleep(0.01)
+        return predicate()
+    
+    def test_write_invalidates_other_l1(self):
+        """בדיקה שכתיבה בתהליך אחד מוחקת את ה-L1 בתהליך השני"""
+        self.worker_a.set("session:s1", {"title": "old"})
+        self.assertEqual(self.worker_b.get("session:s1"), {"title": "old"})  # נשמר ב-L1 של b
+        
+        self.worker_a.set("session:s1", {"title": "new"})
+        self.assertTrue(self._eventually(lambda: self.worker_b.get("session:s1") == {"title": "new"}))
+        
+        self.worker_a.delete("session:s1")
+        self.assertTrue(self._eventually(lambda: self.worker_b.get("session:s1") is None))
+    
+    def test_generation_bump_reaches_other_process(self):
+        """בדיקה שביטול namespace מתפרסם מיד ולא אחרי refresh"""
+        manager_a = ChatCacheManager(self.worker_a)
+        manager_b = ChatCacheManager(self.worker_b)
+        manager_a.set_session_messages("s1", [{"id": 1}])
+        self.assertEqual(manager_b.get_session_messages("s1"), [{"id": 1}])
+        
+        manager_a.invalidate_session_messages("s1")
+        self.assertTrue(self._eventually(lambda: manager_b.get_session_messages("s1") is None))
+        self.assertGreaterEqual(self.worker_b.generations.refresh_seconds, 30)
+    
+    def test_cache_fills_are_not_published(self):
+        """בדיקה שמילוי cache לא מוחק את העותקים ב-L1 של תהליכים אחרים"""
+        manager = ChatCacheManager(self.worker_a)
+        with patch.object(self.worker_a.invalidation_bus, 'publish') as publish:
+            self.worker_a.get_or_load("stats:loaded", lambda: {"n": 1}, 60)
+            manager.set_session_messages("s1", [{"id": 1}])
+            publish.assert_not_called()
+            
+            self.worker_a.set("session:s1", {"title": "new"})
+            publish.assert_called_once_with("keys", keys=["session:s1"])
+    
+    def test_own_messages_are_ignored(self):
+        """בדיקה שתהליך לא מבטל את ה-L1 של עצמו"""
+        self.worker_a.set("k", "v")
+        time.sleep(0.1)
+        self.assertEqual(self.worker_a.invalidation_bus.received, 0)
+        self.assertIn("k", self.worker_a.memory_cache.keys())
+    
+    def test_redis_mode_sees_generation_bump_before_refresh(self):
+        """בדיקה שב-REDIS ללא L1 דור שתהליך אחר הגדיל נראה מיד ולא אחרי refresh"""
+        server = fakeredis.FakeServer()
+        worker_a = ChatCacheService(backend=CacheBackend.REDIS,
+                                    redis_config={'client': fakeredis.FakeRedis(server=server)})
+        worker_b = ChatCacheService(backend=CacheBackend.REDIS,
+                                    redis_config={'client': fakeredis.FakeRedis(server=server)})
+        try:
+            self.assertTrue(worker_a.invalidation_bus.wait_until_subscribed())
+            self.assertTrue(worker_b.invalidation_bus.wait_until_subscribed())
+            manager_a = ChatCacheManager(worker_a)
+            manager_b = ChatCacheManager(worker_b)
+            manager_a.set_session_messages("s1", [{"id": 1}])
+            self.assertEqual(manager_b.get_session_messages("s1"), [{"id": 1}])
+            
+            with patch.object(worker_a.invalidation_bus, 'publish', wraps=worker_a.invalidation_bus.publish) as publish:
+                worker_a.set("session:s1", {"title": "new"})
+                publish.assert_not_called()  # אין L1 לבטל
+                manager_a.invalidate_session_messages("s1")
+            
+            self.assertGreaterEqual(worker_b.generations.refresh_seconds, 30)
+            self.assertTrue(self._eventually(lambda: manager_b.get_session_messages("s1") is None, timeout=0.5))
+        finally:
+            worker_a.close()
+            worker_b.close()
+
+
 class TestChatCacheService(unittest.TestCase):
     
     def setUp(self):
@@ -472,6 +721,187 @@ class TestChatCacheManager(unittest.TestCase):
         # קבלה
         cached_stats = self.cache_manager.get_stats("general", "daily")
         self.assertEqual(cached_stats, stats_data)
+    
+    def test_generation_invalidation_is_scoped(self):
+        """בדיקה שביטול session מגדיל את הדור שלו בלבד"""
+        self.cache_manager.set_session_messages("s1", [{"id": "a"}], 50)
+        self.cache_manager.set_session_messages("s1", [{"id": "a"}], 10)
+        self.cache_manager.set_session_messages("s2", [{"id": "b"}], 50)
+        
+        with patch.object(self.cache_manager.cache, 'invalidate_pattern') as scan:
+            self.cache_manager.invalidate_session_messages("s1")
+            scan.assert_not_called()
+        
+        self.assertIsNone(self.cache_manager.get_session_messages("s1", 50))
+        self.assertIsNone(self.cache_manager.get_session_messages("s1", 10))
+        self.assertEqual(self.cache_manager.get_session_messages("s2", 50), [{"id": "b"}])
+        
+        # ערך חדש נשמר תחת הדור החדש
+        self.cache_manager.set_session_messages("s1", [{"id": "c"}], 50)
+        self.assertEqual(self.cache_manager.get_session_messages("s1", 50), [{"id": "c"}])
+    
+    def test_family_invalidation(self):
+        """בדיקת ביטול כל המשפחה"""
+        self.cache_manager.set_user_sessions("u1", [{"id": "s1"}])
+        self.cache_manager.set_session("s1", {"id": "s1"})
+        
+        self.cache_manager.invalidate_family("user_sessions")
+        
+        self.assertIsNone(self.cache_manager.get_user_sessions("u1"))
+        self.assertEqual(self.cache_manager.get_session("s1"), {"id": "s1"})
+    
+    def test_namespace_for_pattern(self):
+        """בדיקת מיפוי patterns ל-namespaces"""
+        self.assertEqual(self.cache_manager.namespace_for_pattern("messages:*"), "messages")
+        self.assertEqual(self.cache_manager.namespace_for_pattern("messages:s1:*"), "messages:s1")
+        self.assertEqual(self.cache_manager.namespace_for_pattern("user_sessions:u1:*"), "user_sessions:u1")
+        self.assertIsNone(self.cache_manager.namespace_for_pattern("session:s1:*"))
+        self.assertIsNone(self.cache_manager.namespace_for_pattern("messages:s*:*"))
+        self.assertIsNone(self.cache_manager.namespace_for_pattern("user:123:*"))
+
+
+class TestLLMResponseCache(unittest.TestCase):
+
+    MESSAGES = [{"role": "user", "content": "normalize  the\taudio "}]
+    RESPONSE = {"content": "ok", "tokens_used": 12, "cost": 0.003, "model_used": "m", "metadata": {}}
+
+    def setUp(self):
+        """הכנה לבדיקות"""
+        self.responses = LLMResponseCache(ChatCacheService(backend=CacheBackend.MEMORY), max_entries=2)
+
+    def test_only_deterministic_or_opted_in_calls_are_cached(self):
+        """temperature 0 נשמר אוטומטית, אחרת רק בבקשה מפורשת"""
+        self.assertTrue(self.responses.should_cache({"temperature": 0.0}))
+        self.assertFalse(self.responses.should_cache({"temperature": 0.7}))
+        self.assertTrue(self.responses.should_cache({"temperature": 0.7}, cache=True))
+        self.assertFalse(self.responses.should_cache({"temperature": 0.0}, cache=False))
+
+        stats = self.responses.get_stats()
+        self.assertEqual(stats["uncacheable"], 1)
+        self.assertEqual(stats["bypassed"], 1)
+
+    def test_key_normalizes_messages(self):
+        """רווחים בקצוות, סופי שורות ואותיות תפקיד לא משנים את המפתח; מודל ופרמטרים כן"""
+        params = {"temperature": 0.0, "max_tokens": 100}
+        key = self.responses.key_for("m", self.MESSAGES, params)
+
+        same = [{"role": "User", "content": "  normalize  the\taudio\r\n", "id": "x"}]
+        self.assertEqual(self.responses.key_for("m", same, params), key)
+        self.assertNotEqual(self.responses.key_for("other", self.MESSAGES, params), key)
+        self.assertNotEqual(self.responses.key_for("m", self.MESSAGES, dict(params, max_tokens=50)), key)
+
+    def test_internal_whitespace_is_part_of_the_key(self):
+        """פרומפטים שנבדלים רק ברווחים פנימיים מקבלים מפתחות שונים"""
+        params = {"temperature": 0.0}
+        code = [{"role": "user", "content": "def f():\n    return 1\nprint(f())"}]
+        flattened = [{"role": "user", "content": "def f(): return 1 print(f())"}]
+        self.assertNotEqual(self.responses.key_for("m", code, params), self.responses.key_for("m", flattened, params))
+
+        windows = [{"role": "user", "content": "def f():\r\n    return 1\r\nprint(f())"}]
+        self.assertEqual(self.responses.key_for("m", windows, params), self.responses.key_for("m", code, params))
+
+    def test_hits_report_tokens_and_cost_saved(self):
+        """פגיעות נספרות יחד עם הטוקנים והעלות שנחסכו"""
+        key = self.responses.key_for("m", self.MESSAGES, {"temperature": 0.0})
+        self.assertIsNone(self.responses.get(key))
+        self.assertTrue(self.responses.store(key, self.RESPONSE))
+
+        for _ in range(2):
+            self.assertEqual(self.responses.get(key)["content"], "ok")
+
+        stats = self.responses.get_stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["stores"]), (2, 1, 1))
+        self.assertEqual(stats["tokens_saved"], 24)
+        self.assertAlmostEqual(stats["cost_saved"], 0.006)
+
+    def test_size_caps(self):
+        """תשובות ארוכות לא נשמרות ומספר הרשומות מוגבל"""
+        self.responses.max_response_chars = 10
+        self.assertFalse(self.responses.store("long", dict(self.RESPONSE, content="x" * 11)))
+        self.assertIsNone(self.responses.get("long"))
+
+        for key in ("a", "b", "c"):
+            self.assertTrue(self.responses.store(key, self.RESPONSE))
+        self.assertIsNone(self.responses.get("a"))
+        self.assertIsNotNone(self.responses.get("c"))
+        stats = self.responses.get_stats()
+        self.assertEqual((stats["oversized"], stats["evictions"], stats["entries"]), (1, 1, 2))
+
+    def test_invalidate(self):
+        """ביטול מחליף דור - מפתחות ישנים לא נקראים יותר"""
+        key = self.responses.key_for("m", self.MESSAGES, {"temperature": 0.0})
+        self.responses.store(key, self.RESPONSE)
+        self.responses.invalidate()
+
+        new_key = self.responses.key_for("m", self.MESSAGES, {"temperature": 0.0})
+        self.assertNotEqual(new_key, key)
+        self.assertIsNone(self.responses.get(new_key))
+
+
+class TestCacheGenerations(unittest.TestCase):
+    
+    def test_bump_is_monotonic(self):
+        """בדיקה שהדור תמיד עולה"""
+        generations = CacheGenerations()
+        self.assertEqual(generations.get("messages:s1"), 0)
+        first = generations.bump("messages:s1")
+        second = generations.bump("messages:s1")
+        self.assertGreater(second, first)
+        self.assertEqual(generations.get("messages:s1"), second)
+        self.assertEqual(generations.get("messages:s2"), 0)
+    
+    def test_forgotten_namespace_never_reuses_generation(self):
+        """בדיקה ש-namespace שפונה מהטבלה לא חוזר לדור ישן"""
+        generations = CacheGenerations(max_namespaces=2)
+        stale = generations.bump("messages:s1")
+        generations.bump("messages:s2")
+        generations.bump("messages:s3")  # מפנה את s1
+        
+        self.assertNotEqual(generations.get("messages:s1"), stale)
+        self.assertNotEqual(generations.get("messages:s1"), 0)
+    
+    def test_uses_redis_counters_when_available(self):
+        """בדיקה שהמונים נשמרים ב-Redis כשהוא זמין"""
+        redis_cache = MagicMock()
+        redis_cache.is_available.return_value = True
+        redis_cache.incr.return_value = 7
+        redis_cache.get_counter.return_value = 9
+        generations = CacheGenerations(redis_cache, refresh_seconds=0)
+        
+        self.assertEqual(generations.bump("messages:s1"), 7)
+        redis_cache.incr.assert_called_with("gen:messages:s1", seed=ANY)
+        self.assertEqual(generations.get("messages:s1"), 9)
+    
+    @unittest.skipUnless(fakeredis is not None, "fakeredis not installed")
+    def test_lost_redis_counter_never_reuses_generation(self):
+        """בדיקה שמונה שנמחק מ-Redis (clear / eviction) לא מתחיל שוב מ-0"""
+        client = fakeredis.FakeRedis()
+        redis_cache = RedisCache(prefix="test_cache:", client=client)
+        generations = CacheGenerations(redis_cache, refresh_seconds=0)
+        
+        first = generations.get("messages:s1")
+        stale = generations.bump("messages:s1")
+        self.assertEqual(stale, first + 1)
+        
+        redis_cache.clear()
+        self.assertGreater(generations.get("messages:s1"), stale)
+        client.delete("test_cache:gen:messages:s1")
+        self.assertGreater(generations.bump("messages:s1"), stale)
+    
+    @unittest.skipUnless(fakeredis is not None, "fakeredis not installed")
+    def test_remote_mark_changes_only_for_other_workers(self):
+        """בדיקה שהסימון משתנה רק כשתהליך אחר מגדיל את הדור"""
+        client = fakeredis.FakeRedis()
+        local = CacheGenerations(RedisCache(prefix="test_cache:", client=client), refresh_seconds=0)
+        other = CacheGenerations(RedisCache(prefix="test_cache:", client=client), refresh_seconds=0)
+        
+        mark = local.remote_mark("messages:s1")
+        local.bump("messages:s1")
+        self.assertEqual(local.remote_mark("messages:s1"), mark)
+        
+        other.bump("messages:s1")
+        self.assertNotEqual(local.remote_mark("messages:s1"), mark)
+        self.assertEqual(CacheGenerations().remote_mark("messages:s1"), 0)
 
 
 class TestCachedDecorator(unittest.TestCase):
@@ -525,6 +955,128 @@ class TestCachedDecorator(unittest.TestCase):
         self.assertEqual(result2, 16)
         self.assertEqual(result3, 17)
         self.assertEqual(call_count, 2)  # רק 2 חישובים
+    
+    def test_async_function_caching(self):
+        """בדיקת caching של פונקציות async עם איחוד קריאות מקבילות"""
+        call_count = 0
+        
+        @cached(ttl_seconds=3600, key_prefix="test_async")
+        async def load(x):
+            nonlocal call_count
+            call_count += 1
+            await asyncio.sleep(0.05)
+            return x * 2
+        
+        async def run():
+            return await asyncio.gather(*(load(21) for _ in range(10)))
+        
+        self.assertEqual(asyncio.run(run()), [42] * 10)
+        self.assertEqual(call_count, 1)
+        self.assertEqual(asyncio.run(load(21)), 42)
+        self.assertEqual(call_count, 1)
+
+
+class TestSingleFlight(unittest.TestCase):
+    
+    def setUp(self):
+        """הכנה לבדיקות"""
+        self.cache_service = ChatCacheService(backend=CacheBackend.MEMORY)
+    
+    def test_concurrent_misses_load_once(self):
+        """בדיקה שקוראים מקבילים ממתינים לטעינה אחת"""
+        calls = []
+        barrier = threading.Barrier(8)
+        results = []
+        
+        def loader():
+            calls.append(1)
+            time.sleep(0.1)
+            return {"value": 1}
+        
+        def worker():
+            barrier.wait()
+            results.append(self.cache_service.get_or_load("hot", loader, 60))
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, [{"value": 1}] * 8)
+        stats = self.cache_service.single_flight.get_stats()
+        self.assertEqual(stats.loads, 1)
+        self.assertEqual(stats.coalesced, 7)
+    
+    def test_loader_error_reaches_all_waiters(self):
+        """בדיקה ששגיאת טעינה מועברת לכל הממתינים ולא נשמרת"""
+        flight = SingleFlight()
+        errors = []
+        started = threading.Event()
+        
+        def loader():
+            started.set()
+            time.sleep(0.1)
+            raise RuntimeError("db down")
+        
+        def follower():
+            started.wait()
+            try:
+                flight.do("k", lambda: "unused")
+            except RuntimeError as e:
+                errors.append(e)
+        
+        thread = threading.Thread(target=follower)
+        thread.start()
+        with self.assertRaises(RuntimeError):
+            flight.do("k", loader)
+        thread.join()
+        
+        self.assertEqual(len(errors), 1)
+        self.assertFalse(flight.in_flight("k"))
+    
+    def test_stale_while_revalidate(self):
+        """בדיקה שערך שפג מוחזר מיד ומתרענן ברקע"""
+        versions = iter(["v1", "v2"])
+        refreshed = threading.Event()
+        
+        def loader():
+            value = next(versions)
+            if value == "v2":
+                refreshed.set()
+            return value
+        
+        self.assertEqual(self.cache_service.get_or_load("k", loader, 1, stale_ttl_seconds=60,
+                                                        early_expiration_beta=0), "v1")
+        time.sleep(1.1)
+        
+        self.assertEqual(self.cache_service.get_or_load("k", loader, 1, stale_ttl_seconds=60,
+                                                        early_expiration_beta=0), "v1")
+        self.assertTrue(refreshed.wait(2))
+        time.sleep(0.05)
+        self.assertEqual(self.cache_service.get("k"), "v2")
+        self.assertEqual(self.cache_service.single_flight.get_stats().stale_served, 1)
+    
+    def test_probabilistic_early_expiration(self):
+        """בדיקה שטעינה איטית מתרעננת לפני התפוגה"""
+        calls = []
+        
+        def loader():
+            calls.append(1)
+            return len(calls)
+        
+        self.cache_service.get_or_load("k", loader, 60)
+        # זמן טעינה גדול מה-TTL; הגרלה קבועה כדי שהרענון המוקדם יהיה ודאי
+        self.cache_service._store_loaded("k", 1, 60, 0, delta=1000.0)
+        with patch('backend.services.cache.chat_cache_service.random.random', return_value=0.5):
+            self.assertEqual(self.cache_service.get_or_load("k", loader, 60), 1)
+        
+        deadline = time.time() + 2
+        while len(calls) < 2 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(len(calls), 2)
+        self.assertGreaterEqual(self.cache_service.single_flight.get_stats().early_refreshes, 1)
 
 
 class TestUtilityFunctions(unittest.TestCase):
@@ -595,6 +1147,33 @@ class TestConcurrency(unittest.TestCase):
         # בדיקת תוצאות
         self.assertEqual(len(errors), 0, f"Errors occurred: {errors}")
         self.assertEqual(len(results), 50)  # 5 workers * 10 operations
+    
+    def test_sharded_concurrent_access(self):
+        """בדיקת עקביות ה-shards תחת עומס מרובה threads"""
+        cache = ShardedLRUCache(max_size=4096, shards=8)
+        errors = []
+        
+        def worker(worker_id):
+            try:
+                for i in range(500):
+                    key = f"worker_{worker_id}_key_{i % 50}"
+                    cache.set(key, i)
+                    if cache.get(key) is None:
+                        errors.append(key)
+                    if i % 7 == 0:
+                        cache.delete(key)
+            except Exception as e:
+                errors.append(str(e))
+        
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, [])
+        stats = cache.get_stats()
+        self.assertEqual(stats.entry_count, len(cache.keys()))
 
 
 if __name__ == '__main__':
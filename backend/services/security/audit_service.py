@@ -1,18 +1,32 @@
 """
 Audit Logging Service
 מספק מערכת מתקדמת לרישום ומעקב אחר כל פעולות המשתמש ואירועי אבטחה
+
+log_event לא כותב ל-DB בנתיב הבקשה: האירוע נכנס לתור חסום, ו-thread רקע
+מנקז אותו ב-batches - INSERT אחד (executemany) ו-upsert אחד של המונים היומיים
+לכל flush. קריאות (get_events, get_statistics וכו') מבצעות flush לפני השאילתה,
+כך שאירוע שנרשם תמיד נראה בקריאה שאחריו.
+
+כל אירוע מקבל מספר רצף (seq) ו-chain_hash = sha256(chain_hash קודם + checksum),
+כך ששינוי, מחיקה או הכנסה של אירוע באמצע הלוג שוברים את השרשרת. verify_integrity
+מאמת רק את מה שנוסף מאז ה-checkpoint האחרון, בבלוקים של טווחי seq במקביל.
 """
 
 import os
+import time
+import heapq
+import atexit
 import json
 import sqlite3
 import logging
 import hashlib
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, List, Union
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Union
 from enum import Enum
-from dataclasses import dataclass, field, asdict
+from dataclasses import dataclass, field, fields
 import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 from contextlib import contextmanager
 import ipaddress
 
@@ -91,7 +105,9 @@ class AuditEvent:
     
     def to_dict(self) -> Dict[str, Any]:
         """המרה למילון"""
-        data = asdict(self)
+        # בלי asdict - ה-deepcopy הרקורסיבי שלו היה רוב העלות של חישוב checksum
+        data = {f.name: getattr(self, f.name) for f in fields(self)}
+        data['details'] = dict(self.details)
         data['timestamp'] = self.timestamp.isoformat()
         data['event_type'] = self.event_type.value
         data['severity'] = self.severity.value
@@ -107,47 +123,82 @@ class AuditEvent:
         return cls(**data)
 
 
+# מדיניות כשהתור מלא
+OVERFLOW_POLICIES = ("block", "drop_low", "sync")
+
+# chain_hash של "האירוע שלפני הראשון"
+GENESIS_HASH = "0" * 64
+
+
+def _chain_hash(prev_hash: str, checksum: str) -> str:
+    """חוליה בשרשרת: מחייבת את האירוע לכל מה שלפניו"""
+    return hashlib.sha256(f"{prev_hash}{checksum}".encode()).hexdigest()
+
+
 class AuditService:
     """
     שירות audit מתקדם לרישום ומעקב אחר פעולות משתמש ואירועי אבטחה
+
+    Args:
+        async_writes: כתיבה ברקע דרך תור; False כותב כל אירוע מיד (ההתנהגות הקודמת)
+        queue_size: מספר אירועים מקסימלי שממתינים לכתיבה
+        flush_interval: כמה זמן (שניות) לחכות לאירועים נוספים לפני flush
+        max_batch: מספר אירועים מקסימלי בטרנזקציה אחת
+        overflow_policy: מה קורה כשהתור מלא -
+            "block": המתנה עד enqueue_timeout לפינוי מקום, ואחריה כתיבה ישירה (אירוע לא הולך לאיבוד)
+            "drop_low": אירועים בחומרה LOW נזרקים (ונספרים), השאר כמו "block"
+            "sync": כתיבה ישירה מיד
     """
     
-    def __init__(self, db_path: str = "data/audit_logs.db", max_log_size_mb: int = 100):
+    # סדר העמודות בכל מחיצה (ו-SELECT * על audit_events)
+    _EVENT_COLUMNS = (
+        'id, timestamp, event_type, severity, user_id, session_id, ip_address, user_agent, action, '
+        'resource, details, success, error_message, duration_ms, checksum, seq, chain_hash'
+    )
+    # שדות שנכנסים לאינדקס FTS
+    _SEARCH_COLUMNS = ('action', 'resource', 'error_message', 'details')
+    
+    def __init__(self, db_path: str = "data/audit_logs.db", max_log_size_mb: int = 100,
+                 async_writes: bool = True, queue_size: int = 10000, flush_interval: float = 0.05,
+                 max_batch: int = 500, overflow_policy: str = "block", enqueue_timeout: float = 1.0):
+        if overflow_policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unsupported audit overflow policy: {overflow_policy}")
         self.db_path = db_path
         self.max_log_size_mb = max_log_size_mb
         self.max_log_entries = 100000  # מקסימום רשומות לפני ניקוי
         self.retention_days = 365  # שמירת לוגים לשנה
         self._lock = threading.Lock()
         self._init_database()
+
+        self.async_writes = async_writes
+        self.queue_size = queue_size
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.overflow_policy = overflow_policy
+        self.enqueue_timeout = enqueue_timeout
+
+        self._queue_lock = threading.Lock()
+        self._not_full = threading.Condition(self._queue_lock)
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._pending: List[AuditEvent] = []
+        self._writer_stats = {'written': 0, 'batches': 0, 'dropped': 0, 'sync_writes': 0, 'failed_flushes': 0}
+
+        self._thread: Optional[threading.Thread] = None
+        if async_writes:
+            self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
     
     def _init_database(self):
         """אתחול מסד נתונים ללוגי audit"""
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+        self._fts_enabled = self._fts_available()
         
         with self._get_connection() as conn:
             cursor = conn.cursor()
             
-            # טבלת אירועי audit
-            cursor.execute('''
-            CREATE TABLE IF NOT EXISTS audit_events (
-                id TEXT PRIMARY KEY,
-                timestamp TEXT NOT NULL,
-                event_type TEXT NOT NULL,
-                severity TEXT NOT NULL,
-                user_id TEXT,
-                session_id TEXT,
-                ip_address TEXT,
-                user_agent TEXT,
-                action TEXT NOT NULL,
-                resource TEXT,
-                details TEXT DEFAULT '{}',
-                success BOOLEAN NOT NULL DEFAULT TRUE,
-                error_message TEXT,
-                duration_ms INTEGER,
-                checksum TEXT NOT NULL
-            )
-            ''')
-            
             # טבלת סטטיסטיקות audit
             cursor.execute('''
             CREATE TABLE IF NOT EXISTS audit_statistics (
@@ -161,16 +212,232 @@ class AuditService:
             )
             ''')
             
-            # אינדקסים לביצועים
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_timestamp ON audit_events (timestamp)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_event_type ON audit_events (event_type)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_user_id ON audit_events (user_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_session_id ON audit_events (session_id)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_severity ON audit_events (severity)')
-            cursor.execute('CREATE INDEX IF NOT EXISTS idx_audit_success ON audit_events (success)')
+            # נקודות עיגון: 'verified' - עד איפה השרשרת אומתה, 'pruned' - האירוע האחרון שנמחק בניקוי
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS audit_chain_state (
+                name TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL,
+                chain_hash TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            ''')
             
+            # רישום המחיצות החודשיות (audit_events_YYYY_MM)
+            cursor.execute('''
+            CREATE TABLE IF NOT EXISTS audit_partitions (
+                name TEXT PRIMARY KEY,
+                month TEXT NOT NULL UNIQUE,
+                created_at TEXT NOT NULL
+            )
+            ''')
+            
+            cursor.execute("SELECT type FROM sqlite_master WHERE name = 'audit_events'")
+            existing = cursor.fetchone()
+            if existing and existing[0] == 'table':
+                self._migrate_single_table(cursor)
+            
+            self._refresh_view(cursor)
             conn.commit()
     
+    @staticmethod
+    def _fts_available() -> bool:
+        """FTS5 עם tokenizer trigram (חיפוש תת-מחרוזת כמו LIKE) - SQLite 3.34+"""
+        try:
+            conn = sqlite3.connect(':memory:')
+            try:
+                conn.execute("CREATE VIRTUAL TABLE probe USING fts5(x, tokenize='trigram')")
+            finally:
+                conn.close()
+            return True
+        except sqlite3.OperationalError:
+            logger.warning("SQLite FTS5 trigram tokenizer not available, audit search will use LIKE")
+            return False
+    
+    # --- מחיצות חודשיות ---
+    @staticmethod
+    def _partition_name(month: str) -> str:
+        """שם המחיצה לחודש ('YYYY-MM')"""
+        return f"audit_events_{month.replace('-', '_')}"
+    
+    def _create_partition(self, cursor, month: str) -> str:
+        """יצירת מחיצה לחודש (כולל אינדקסים ואינדקס FTS) אם אינה קיימת"""
+        name = self._partition_name(month)
+        # seq הוא ה-rowid - חיפוש לפי seq הוא חיפוש ב-rowid, ו-FTS נשאר מסונכרן גם אחרי VACUUM
+        cursor.execute(f'''
+        CREATE TABLE IF NOT EXISTS {name} (
+            id TEXT NOT NULL UNIQUE,
+            timestamp TEXT NOT NULL,
+            event_type TEXT NOT NULL,
+            severity TEXT NOT NULL,
+            user_id TEXT,
+            session_id TEXT,
+            ip_address TEXT,
+            user_agent TEXT,
+            action TEXT NOT NULL,
+            resource TEXT,
+            details TEXT DEFAULT '{{}}',
+            success BOOLEAN NOT NULL DEFAULT TRUE,
+            error_message TEXT,
+            duration_ms INTEGER,
+            checksum TEXT NOT NULL,
+            seq INTEGER PRIMARY KEY,
+            chain_hash TEXT NOT NULL
+        )
+        ''')
+        
+        # אינדקסים לביצועים
+        for column in ('timestamp', 'event_type', 'user_id', 'session_id', 'severity', 'success'):
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_{column} ON {name} ({column})')
+        
+        if self._fts_enabled:
+            # external content - הטקסט נשמר פעם אחת, בטבלת המחיצה
+            fields = ', '.join(self._SEARCH_COLUMNS)
+            new_values = ', '.join(f'new.{column}' for column in self._SEARCH_COLUMNS)
+            old_values = ', '.join(f'old.{column}' for column in self._SEARCH_COLUMNS)
+            cursor.execute(f'''
+            CREATE VIRTUAL TABLE IF NOT EXISTS {name}_fts USING fts5(
+                {fields}, content='{name}', content_rowid='seq', tokenize='trigram'
+            )
+            ''')
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name}_fts_insert AFTER INSERT ON {name} BEGIN
+                INSERT INTO {name}_fts (rowid, {fields}) VALUES (new.seq, {new_values});
+            END
+            ''')
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name}_fts_delete AFTER DELETE ON {name} BEGIN
+                INSERT INTO {name}_fts ({name}_fts, rowid, {fields}) VALUES ('delete', old.seq, {old_values});
+            END
+            ''')
+            cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {name}_fts_update AFTER UPDATE ON {name} BEGIN
+                INSERT INTO {name}_fts ({name}_fts, rowid, {fields}) VALUES ('delete', old.seq, {old_values});
+                INSERT INTO {name}_fts (rowid, {fields}) VALUES (new.seq, {new_values});
+            END
+            ''')
+        
+        cursor.execute(
+            'INSERT OR IGNORE INTO audit_partitions (name, month, created_at) VALUES (?, ?, ?)',
+            (name, month, datetime.utcnow().isoformat())
+        )
+        return name
+    
+    def _drop_partition(self, cursor, name: str) -> int:
+        """מחיקת מחיצה שלמה; מחזיר את מספר האירועים שהיו בה"""
+        cursor.execute(f'SELECT COUNT(*) FROM {name}')
+        count = cursor.fetchone()[0]
+        cursor.execute(f'DROP TABLE IF EXISTS {name}_fts')
+        cursor.execute(f'DROP TABLE IF EXISTS {name}')
+        cursor.execute('DELETE FROM audit_partitions WHERE name = ?', (name,))
+        return count
+    
+    def _partitions(self, cursor, start_date: Optional[datetime] = None,
+                    end_date: Optional[datetime] = None) -> List[str]:
+        """המחיצות שחופפות לטווח הזמן, מהחדשה לישנה"""
+        query = 'SELECT name FROM audit_partitions WHERE 1=1'
+        params = []
+        if start_date:
+            query += ' AND month >= ?'
+            params.append(start_date.strftime('%Y-%m'))
+        if end_date:
+            query += ' AND month <= ?'
+            params.append(end_date.strftime('%Y-%m'))
+        cursor.execute(query + ' ORDER BY month DESC', params)
+        return [row[0] for row in cursor.fetchall()]
+    
+    def _events_source(self, cursor, start_date: Optional[datetime] = None,
+                       end_date: Optional[datetime] = None) -> str:
+        """
+        מקור אירועים לשאילתה: UNION ALL רק של המחיצות בטווח הזמן
+        
+        SQLite דוחף את ה-WHERE / ORDER BY לכל מחיצה (ועל האינדקסים שלה), כך שמחיצות
+        מחוץ לטווח לא נקראות בכלל.
+        """
+        partitions = self._partitions(cursor, start_date, end_date)
+        if not partitions:
+            return '(SELECT * FROM audit_events WHERE 0)'
+        return '(' + ' UNION ALL '.join(f'SELECT {self._EVENT_COLUMNS} FROM {name}' for name in partitions) + ')'
+    
+    def _refresh_view(self, cursor):
+        """
+        audit_events הוא view על כל המחיצות (לשאילתות ידניות ולשרשרת);
+        נוצר מחדש רק כשרשימת המחיצות משתנה
+        """
+        cursor.execute('SELECT month FROM audit_partitions ORDER BY month')
+        months = [row[0] for row in cursor.fetchall()]
+        if not months:
+            month = datetime.utcnow().strftime('%Y-%m')
+            self._create_partition(cursor, month)
+            months = [month]
+        
+        sql = 'CREATE VIEW audit_events AS ' + ' UNION ALL '.join(
+            f'SELECT {self._EVENT_COLUMNS} FROM {self._partition_name(month)}' for month in months
+        )
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'view' AND name = 'audit_events'")
+        current = cursor.fetchone()
+        if current and current[0] == sql:
+            return
+        cursor.execute('DROP VIEW IF EXISTS audit_events')
+        cursor.execute(sql)
+    
+    def _migrate_single_table(self, cursor):
+        """העברת טבלת audit_events הישנה (טבלה אחת) למחיצות חודשיות"""
+        # שרשרת hash - עמודות שנוספו ללוגים קיימים
+        columns = {row[1] for row in cursor.execute('PRAGMA table_info(audit_events)')}
+        if 'seq' not in columns:
+            cursor.execute('ALTER TABLE audit_events ADD COLUMN seq INTEGER')
+        if 'chain_hash' not in columns:
+            cursor.execute('ALTER TABLE audit_events ADD COLUMN chain_hash TEXT')
+        self._backfill_chain(cursor)
+        
+        cursor.execute('SELECT DISTINCT substr(timestamp, 1, 7) FROM audit_events')
+        months = [row[0] for row in cursor.fetchall()]
+        for month in months:
+            name = self._create_partition(cursor, month)
+            cursor.execute(
+                f'INSERT INTO {name} ({self._EVENT_COLUMNS}) '
+                f'SELECT {self._EVENT_COLUMNS} FROM audit_events WHERE substr(timestamp, 1, 7) = ?',
+                (month,)
+            )
+        cursor.execute('DROP TABLE audit_events')
+        logger.info(f"Moved audit events into {len(months)} monthly partitions")
+    
+    def _backfill_chain(self, cursor):
+        """שרשור אירועים שנכתבו לפני שהייתה שרשרת (לפי סדר הזמן)"""
+        cursor.execute('SELECT rowid, checksum FROM audit_events WHERE seq IS NULL ORDER BY timestamp, rowid')
+        legacy = cursor.fetchall()
+        if not legacy:
+            return
+        
+        seq, prev_hash = self._chain_head(cursor)
+        updates = []
+        for rowid, checksum in legacy:
+            seq += 1
+            prev_hash = _chain_hash(prev_hash, checksum)
+            updates.append((seq, prev_hash, rowid))
+        cursor.executemany('UPDATE audit_events SET seq = ?, chain_hash = ? WHERE rowid = ?', updates)
+        logger.info(f"Added {len(updates)} existing audit events to the hash chain")
+    
+    def _chain_head(self, cursor) -> tuple:
+        """(seq, chain_hash) של האירוע האחרון בשרשרת"""
+        cursor.execute('SELECT seq, chain_hash FROM audit_events WHERE seq IS NOT NULL ORDER BY seq DESC LIMIT 1')
+        row = cursor.fetchone()
+        if row:
+            return row[0], row[1]
+        pruned = self._chain_state(cursor, 'pruned')
+        return pruned if pruned else (0, GENESIS_HASH)
+    
+    def _chain_state(self, cursor, name: str) -> Optional[tuple]:
+        cursor.execute('SELECT seq, chain_hash FROM audit_chain_state WHERE name = ?', (name,))
+        row = cursor.fetchone()
+        return (row[0], row[1]) if row else None
+    
+    def _set_chain_state(self, cursor, name: str, seq: int, chain_hash: str):
+        cursor.execute(
+            'INSERT OR REPLACE INTO audit_chain_state (name, seq, chain_hash, updated_at) VALUES (?, ?, ?, ?)',
+            (name, seq, chain_hash, datetime.utcnow().isoformat())
+        )
+    
     @contextmanager
     def _get_connection(self):
         """קבלת חיבור למסד נתונים עם thread safety"""
@@ -214,7 +481,8 @@ class AuditService:
                 user_id=user_id,
                 session_id=session_id,
                 resource=resource,
-                details=details or {},
+                # עותק - האירוע נכתב ברקע אחרי שהקורא כבר ממשיך
+                details=dict(details) if details else {},
                 severity=severity,
                 success=success,
                 error_message=error_message,
@@ -223,36 +491,12 @@ class AuditService:
                 user_agent=user_agent
             )
             
-            # יצירת ID וchecksum
             event.id = self._generate_event_id(event)
-            checksum = self._calculate_checksum(event)
             
-            # שמירה במסד נתונים
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
-                cursor.execute('''
-                INSERT INTO audit_events VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
-                ''', (
-                    event.id,
-                    event.timestamp.isoformat(),
-                    event.event_type.value,
-                    event.severity.value,
-                    event.user_id,
-                    event.session_id,
-                    event.ip_address,
-                    event.user_agent,
-                    event.action,
-                    event.resource,
-                    json.dumps(event.details, ensure_ascii=False),
-                    event.success,
-                    event.error_message,
-                    event.duration_ms,
-                    checksum
-                ))
-                conn.commit()
-            
-            # עדכון סטטיסטיקות
-            self._update_statistics(event)
+            if self.async_writes and not self._stopped.is_set():
+                self._enqueue(event)
+            else:
+                self._write_now(event)
             
             logger.debug(f"Audit event logged: {event.id} - {event.action}")
             return event.id
@@ -263,53 +507,211 @@ class AuditService:
             logger.warning(f"Audit event failed to log: {action} by {user_id}")
             raise
     
-    def _update_statistics(self, event: AuditEvent):
-        """עדכון סטטיסטיקות יומיות"""
-        try:
-            date_str = event.timestamp.date().isoformat()
-            
-            with self._get_connection() as conn:
-                cursor = conn.cursor()
+    # --- תור הכתיבה ---
+    def _enqueue(self, event: AuditEvent):
+        """הכנסת אירוע לתור לפי מדיניות ה-backpressure"""
+        with self._queue_lock:
+            if len(self._pending) >= self.queue_size:
+                self._wakeup.set()
+                if self.overflow_policy == "drop_low" and event.severity == AuditSeverity.LOW:
+                    self._writer_stats['dropped'] += 1
+                    logger.warning(f"Audit queue full, dropped low severity event: {event.action}")
+                    return
+                if self.overflow_policy != "sync":
+                    self._not_full.wait_for(lambda: len(self._pending) < self.queue_size,
+                                            timeout=self.enqueue_timeout)
+            if len(self._pending) < self.queue_size:
+                self._pending.append(event)
+                queued = True
+            else:
+                queued = False
+        
+        if queued:
+            self._wakeup.set()
+        else:
+            # התור עדיין מלא - כתיבה ישירה עדיפה על איבוד אירוע audit
+            self._write_now(event)
+    
+    def _write_now(self, event: AuditEvent):
+        """כתיבה סינכרונית של אירוע בודד (ללא תור)"""
+        with self._flush_lock:
+            self._write_batch([event])
+        if self.async_writes:
+            with self._queue_lock:
+                self._writer_stats['sync_writes'] += 1
+    
+    @property
+    def pending_count(self) -> int:
+        with self._queue_lock:
+            return len(self._pending)
+    
+    def flush(self) -> int:
+        """כתיבת כל האירועים שבתור; מחזיר את מספר האירועים שנכתבו"""
+        written = 0
+        with self._flush_lock:
+            while True:
+                with self._queue_lock:
+                    batch = self._pending[:self.max_batch]
+                    del self._pending[:self.max_batch]
+                    self._not_full.notify_all()
+                if not batch:
+                    return written
                 
-                # בדיקה אם קיימת רשומה לתאריך
-                cursor.execute('SELECT * FROM audit_statistics WHERE date = ?', (date_str,))
-                existing = cursor.fetchone()
-                
-                if existing:
-                    # עדכון רשומה קיימת
-                    updates = {
-                        'total_events': existing[1] + 1,
-                        'security_events': existing[2] + (1 if self._is_security_event(event) else 0),
-                        'error_events': existing[3] + (1 if not event.success else 0),
-                        'user_actions': existing[4] + (1 if self._is_user_action(event) else 0),
-                        'api_requests': existing[5] + (1 if self._is_api_request(event) else 0),
-                        'last_updated': datetime.utcnow().isoformat()
-                    }
-                    
-                    cursor.execute('''
-                    UPDATE audit_statistics 
-                    SET total_events = ?, security_events = ?, error_events = ?, 
-                        user_actions = ?, api_requests = ?, last_updated = ?
-                    WHERE date = ?
-                    ''', (*updates.values(), date_str))
-                else:
-                    # יצירת רשומה חדשה
-                    cursor.execute('''
-                    INSERT INTO audit_statistics VALUES (?,?,?,?,?,?,?)
-                    ''', (
-                        date_str,
-                        1,  # total_events
-                        1 if self._is_security_event(event) else 0,
-                        1 if not event.success else 0,
-                        1 if self._is_user_action(event) else 0,
-                        1 if self._is_api_request(event) else 0,
-                        datetime.utcnow().isoformat()
-                    ))
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logger.error(f"Audit flush failed, will retry: {e}")
+                    with self._queue_lock:
+                        # האירועים חוזרים לראש התור גם אם הוא מעל המגבלה
+                        self._pending = batch + self._pending
+                        self._writer_stats['failed_flushes'] += 1
+                    return written
+                written += len(batch)
+    
+    def _write_batch(self, events: List[AuditEvent]):
+        """כתיבת batch של אירועים ועדכון המונים היומיים בטרנזקציה אחת"""
+        checksums = [self._calculate_checksum(event) for event in events]
+        
+        with self._get_connection() as conn:
+            cursor = conn.cursor()
+            # IMMEDIATE - ראש השרשרת לא ישתנה על ידי תהליך אחר עד ה-commit
+            cursor.execute('BEGIN IMMEDIATE')
+            try:
+                # כל אירוע נכתב למחיצה של החודש שלו
+                cursor.execute('SELECT month, name FROM audit_partitions')
+                partitions = dict(cursor.fetchall())
+                by_partition = defaultdict(list)
+                for event, checksum in zip(events, checksums):
+                    month = event.timestamp.strftime('%Y-%m')
+                    if month not in partitions:
+                        partitions[month] = self._create_partition(cursor, month)
+                        self._refresh_view(cursor)
+                    by_partition[partitions[month]].append((event, checksum))
                 
-                conn.commit()
+                # ID כפול (ב-DB או בתוך ה-batch) לא נכתב, כדי לא לאבד את שאר האירועים
+                seen = set()
+                for name, entries in by_partition.items():
+                    placeholders = ','.join('?' for _ in entries)
+                    cursor.execute(f'SELECT id FROM {name} WHERE id IN ({placeholders})',
+                                   [event.id for event, _ in entries])
+                    seen.update(row[0] for row in cursor.fetchall())
                 
-        except Exception as e:
-            logger.error(f"Failed to update audit statistics: {e}")
+                # seq לפי סדר ה-batch, גם כשהאירועים מתפזרים על כמה מחיצות
+                seq, prev_hash = self._chain_head(cursor)
+                rows, written = defaultdict(list), []
+                for event, checksum in zip(events, checksums):
+                    if event.id in seen:
+                        logger.error(f"Duplicate audit event id {event.id}, event dropped: {event.action}")
+                        continue
+                    seen.add(event.id)
+                    seq += 1
+                    prev_hash = _chain_hash(prev_hash, checksum)
+                    rows[partitions[event.timestamp.strftime('%Y-%m')]].append(
+                        self._event_row(event, checksum, seq, prev_hash)
+                    )
+                    written.append(event)
+                
+                for name, partition_rows in rows.items():
+                    cursor.executemany(
+                        f'INSERT INTO {name} ({self._EVENT_COLUMNS}) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)',
+                        partition_rows
+                    )
+                self._update_statistics(cursor, written)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        
+        with self._queue_lock:
+            self._writer_stats['written'] += len(written)
+            self._writer_stats['batches'] += 1
+    
+    def _event_row(self, event: AuditEvent, checksum: str, seq: int, chain_hash: str) -> tuple:
+        """שורת מחיצה לאירוע (לפי _EVENT_COLUMNS)"""
+        return (
+            event.id,
+            event.timestamp.isoformat(),
+            event.event_type.value,
+            event.severity.value,
+            event.user_id,
+            event.session_id,
+            event.ip_address,
+            event.user_agent,
+            event.action,
+            event.resource,
+            json.dumps(event.details, ensure_ascii=False),
+            event.success,
+            event.error_message,
+            event.duration_ms,
+            checksum,
+            seq,
+            chain_hash
+        )
+    
+    def _update_statistics(self, cursor, events: List[AuditEvent]):
+        """עדכון סטטיסטיקות יומיות - upsert אחד לכל תאריך ב-batch"""
+        counters = defaultdict(lambda: [0, 0, 0, 0, 0])
+        for event in events:
+            day = counters[event.timestamp.date().isoformat()]
+            day[0] += 1
+            day[1] += 1 if self._is_security_event(event) else 0
+            day[2] += 1 if not event.success else 0
+            day[3] += 1 if self._is_user_action(event) else 0
+            day[4] += 1 if self._is_api_request(event) else 0
+        
+        if not counters:
+            return
+        now = datetime.utcnow().isoformat()
+        cursor.executemany('''
+        INSERT INTO audit_statistics VALUES (?,?,?,?,?,?,?)
+        ON CONFLICT(date) DO UPDATE SET
+            total_events = total_events + excluded.total_events,
+            security_events = security_events + excluded.security_events,
+            error_events = error_events + excluded.error_events,
+            user_actions = user_actions + excluded.user_actions,
+            api_requests = api_requests + excluded.api_requests,
+            last_updated = excluded.last_updated
+        ''', [(date_str, *values, now) for date_str, values in counters.items()])
+    
+    def get_writer_stats(self) -> Dict[str, Any]:
+        """מצב תור הכתיבה"""
+        with self._queue_lock:
+            return {
+                **self._writer_stats,
+                'pending': len(self._pending),
+                'queue_size': self.queue_size,
+                'overflow_policy': self.overflow_policy,
+                'async_writes': self.async_writes,
+            }
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait()
+            # המתנה קצרה כדי שאירועים נוספים יצטרפו ל-batch
+            if self.pending_count < self.max_batch:
+                self._stopped.wait(self.flush_interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Audit writer error: {e}")
+    
+    def close(self):
+        """עצירת ה-thread וכתיבת כל מה שנשאר בתור"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.flush()
+        with self._queue_lock:
+            if self._pending:
+                logger.error(f"{len(self._pending)} audit events could not be written on shutdown")
+        try:
+            atexit.unregister(self.close)
+        except Exception:
+            pass
     
     def _is_security_event(self, event: AuditEvent) -> bool:
         """בדיקה אם האירוע הוא אירוע אבטחה"""
@@ -355,42 +757,17 @@ class AuditService:
                    offset: int = 0) -> List[AuditEvent]:
         """קבלת אירועי audit לפי קריטריונים"""
         
+        self.flush()
+        
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # בניית שאילתה
-                query = "SELECT * FROM audit_events WHERE 1=1"
-                params = []
-                
-                if start_date:
-                    query += " AND timestamp >= ?"
-                    params.append(start_date.isoformat())
-                
-                if end_date:
-                    query += " AND timestamp <= ?"
-                    params.append(end_date.isoformat())
-                
-                if event_types:
-                    placeholders = ','.join(['?' for _ in event_types])
-                    query += f" AND event_type IN ({placeholders})"
-                    params.extend([et.value for et in event_types])
-                
-                if user_id:
-                    query += " AND user_id = ?"
-                    params.append(user_id)
-                
-                if session_id:
-                    query += " AND session_id = ?"
-                    params.append(session_id)
-                
-                if severity:
-                    query += " AND severity = ?"
-                    params.append(severity.value)
-                
-                if success_only is not None:
-                    query += " AND success = ?"
-                    params.append(success_only)
+                # בניית שאילתה - רק מחיצות בטווח הזמן
+                conditions, params = self._event_filters(
+                    start_date, end_date, event_types, user_id, session_id, severity, success_only
+                )
+                query = f"SELECT * FROM {self._events_source(cursor, start_date, end_date)} WHERE 1=1{conditions}"
                 
                 query += " ORDER BY timestamp DESC LIMIT ? OFFSET ?"
                 params.extend([limit, offset])
@@ -425,17 +802,64 @@ class AuditService:
             logger.error(f"Failed to get audit events: {e}")
             return []
     
+    def _event_filters(self,
+                       start_date: Optional[datetime] = None,
+                       end_date: Optional[datetime] = None,
+                       event_types: Optional[List[AuditEventType]] = None,
+                       user_id: Optional[str] = None,
+                       session_id: Optional[str] = None,
+                       severity: Optional[AuditSeverity] = None,
+                       success_only: Optional[bool] = None) -> tuple:
+        """תנאי WHERE (מתחילים ב-AND) ופרמטרים לסינון אירועים"""
+        query = ""
+        params = []
+        
+        if start_date:
+            query += " AND timestamp >= ?"
+            params.append(start_date.isoformat())
+        
+        if end_date:
+            query += " AND timestamp <= ?"
+            params.append(end_date.isoformat())
+        
+        if event_types:
+            placeholders = ','.join(['?' for _ in event_types])
+            query += f" AND event_type IN ({placeholders})"
+            params.extend([et.value for et in event_types])
+        
+        if user_id:
+            query += " AND user_id = ?"
+            params.append(user_id)
+        
+        if session_id:
+            query += " AND session_id = ?"
+            params.append(session_id)
+        
+        if severity:
+            query += " AND severity = ?"
+            params.append(severity.value)
+        
+        if success_only is not None:
+            query += " AND success = ?"
+            params.append(success_only)
+        
+        return query, params
+    
     def get_statistics(self, 
                       start_date: Optional[datetime] = None,
                       end_date: Optional[datetime] = None) -> Dict[str, Any]:
         """קבלת סטטיסטיקות audit"""
         
+        self.flush()
+        
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 
+                source = self._events_source(cursor, start_date, end_date)
+                
                 # סטטיסטיקות כלליות
-                query = "SELECT COUNT(*) FROM audit_events"
+                query = f"SELECT COUNT(*) FROM {source}"
                 params = []
                 
                 if start_date or end_date:
@@ -451,7 +875,7 @@ class AuditService:
                 total_events = cursor.fetchone()[0]
                 
                 # סטטיסטיקות לפי סוג אירוע
-                query = "SELECT event_type, COUNT(*) FROM audit_events"
+                query = f"SELECT event_type, COUNT(*) FROM {source}"
                 if start_date or end_date:
                     query += " WHERE 1=1"
                     if start_date:
@@ -464,7 +888,7 @@ class AuditService:
                 event_type_stats = dict(cursor.fetchall())
                 
                 # סטטיסטיקות לפי חומרה
-                query = "SELECT severity, COUNT(*) FROM audit_events"
+                query = f"SELECT severity, COUNT(*) FROM {source}"
                 if start_date or end_date:
                     query += " WHERE 1=1"
                     if start_date:
@@ -477,7 +901,7 @@ class AuditService:
                 severity_stats = dict(cursor.fetchall())
                 
                 # סטטיסטיקות שגיאות
-                query = "SELECT COUNT(*) FROM audit_events WHERE success = FALSE"
+                query = f"SELECT COUNT(*) FROM {source} WHERE success = FALSE"
                 if start_date or end_date:
                     if start_date or end_date:
                         query += " AND 1=1"
@@ -532,120 +956,242 @@ class AuditService:
     
     def search_events(self, 
                      search_term: str,
-                     search_fields: List[str] = None) -> List[AuditEvent]:
-        """חיפוש אירועי audit"""
+                     search_fields: List[str] = None,
+                     start_date: Optional[datetime] = None,
+                     end_date: Optional[datetime] = None,
+                     limit: int = 100) -> List[AuditEvent]:
+        """
+        חיפוש אירועי audit (תת-מחרוזת, ללא תלות ברישיות)
+        
+        בשדות שב-FTS ובמונח של 3 תווים ומעלה החיפוש עובר דרך אינדקס ה-FTS של כל
+        מחיצה, מהחדשה לישנה, ועוצר כשמגיעים ל-limit; אחרת LIKE על המחיצות בטווח.
+        """
         
         if not search_fields:
-            search_fields = ['action', 'resource', 'error_message', 'details']
+            search_fields = list(self._SEARCH_COLUMNS)
+        
+        known_columns = {column.strip() for column in self._EVENT_COLUMNS.split(',')}
+        fields = [field for field in search_fields if field in known_columns]
+        if len(fields) != len(search_fields):
+            logger.warning(f"Ignoring unknown audit search fields: {set(search_fields) - known_columns}")
+        if not fields:
+            return []
+        
+        self.flush()
         
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # בניית שאילתת חיפוש
-                conditions = []
-                params = []
-                
-                for field in search_fields:
-                    if field == 'details':
-                        conditions.append(f"{field} LIKE ?")
-                        params.append(f"%{search_term}%")
-                    else:
-                        conditions.append(f"{field} LIKE ?")
-                        params.append(f"%{search_term}%")
-                
-                query = f"SELECT * FROM audit_events WHERE {' OR '.join(conditions)} ORDER BY timestamp DESC LIMIT 100"
-                
-                cursor.execute(query, params)
-                rows = cursor.fetchall()
+                # טווח זמן - נבדק גם בתוך המחיצה (החודש הקיצוני חלקי)
+                time_filter = ""
+                time_params = []
+                if start_date:
+                    time_filter += " AND timestamp >= ?"
+                    time_params.append(start_date.isoformat())
+                if end_date:
+                    time_filter += " AND timestamp <= ?"
+                    time_params.append(end_date.isoformat())
                 
-                # המרה לאובייקטי AuditEvent
-                events = []
-                for row in rows:
-                    event_data = {
-                        'id': row[0],
-                        'timestamp': row[1],
-                        'event_type': row[2],
-                        'severity': row[3],
-                        'user_id': row[4],
-                        'session_id': row[5],
-                        'ip_address': row[6],
-                        'user_agent': row[7],
-                        'action': row[8],
-                        'resource': row[9],
-                        'details': json.loads(row[10]) if row[10] else {},
-                        'success': bool(row[11]),
-                        'error_message': row[12],
-                        'duration_ms': row[13]
-                    }
-                    events.append(AuditEvent.from_dict(event_data))
+                rows = []
+                if self._fts_enabled and len(search_term) >= 3 and set(fields) <= set(self._SEARCH_COLUMNS):
+                    # ביטוי FTS: חיפוש הביטוי כמו שהוא, רק בעמודות המבוקשות
+                    match = '{' + ' '.join(fields) + '} : "' + search_term.replace('"', '""') + '"'
+                    for name in self._partitions(cursor, start_date, end_date):
+                        cursor.execute(
+                            f"SELECT * FROM {name} WHERE seq IN (SELECT rowid FROM {name}_fts WHERE {name}_fts MATCH ?)"
+                            f"{time_filter} ORDER BY timestamp DESC LIMIT ?",
+                            [match, *time_params, limit - len(rows)]
+                        )
+                        rows.extend(cursor.fetchall())
+                        if len(rows) >= limit:
+                            break
+                else:
+                    conditions = ' OR '.join(f"{field} LIKE ?" for field in fields)
+                    query = (f"SELECT * FROM {self._events_source(cursor, start_date, end_date)} "
+                             f"WHERE ({conditions}){time_filter} ORDER BY timestamp DESC LIMIT ?")
+                    cursor.execute(query, [f"%{search_term}%"] * len(fields) + time_params + [limit])
+                    rows = cursor.fetchall()
                 
-                return events
+                return [self._row_to_event(row) for row in rows]
                 
         except Exception as e:
             logger.error(f"Failed to search audit events: {e}")
             return []
     
-    def verify_integrity(self) -> Dict[str, Any]:
-        """אימות שלמות לוגי audit"""
+    def verify_integrity(self, full: bool = False, chunk_size: int = 1000,
+                         block_size: int = 50000, workers: Optional[int] = None) -> Dict[str, Any]:
+        """
+        אימות שלמות לוגי audit
+        
+        ברירת המחדל מאמתת רק אירועים שנוספו מאז ה-checkpoint האחרון; full=True
+        מאמת את כל השרשרת. טווח ה-seq מחולק לבלוקים בני block_size שמאומתים
+        במקביל, וכל בלוק נקרא מה-DB ב-chunks של chunk_size שורות.
+        """
+        
+        self.flush()
+        started = time.monotonic()
         
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
-                
-                # בדיקת כל הרשומות
-                cursor.execute("SELECT * FROM audit_events")
-                rows = cursor.fetchall()
-                
-                total_events = len(rows)
-                corrupted_events = 0
-                corrupted_ids = []
-                
-                for row in rows:
-                    try:
-                        # יצירת אירוע מהנתונים
-                        event_data = {
-                            'id': row[0],
-                            'timestamp': row[1],
-                            'event_type': row[2],
-                            'severity': row[3],
-                            'user_id': row[4],
-                            'session_id': row[5],
-                            'ip_address': row[6],
-                            'user_agent': row[7],
-                            'action': row[8],
-                            'resource': row[9],
-                            'details': json.loads(row[10]) if row[10] else {},
-                            'success': bool(row[11]),
-                            'error_message': row[12],
-                            'duration_ms': row[13]
-                        }
-                        
-                        event = AuditEvent.from_dict(event_data)
-                        stored_checksum = row[14]
-                        calculated_checksum = self._calculate_checksum(event)
-                        
-                        if stored_checksum != calculated_checksum:
-                            corrupted_events += 1
-                            corrupted_ids.append(row[0])
-                            
-                    except Exception as e:
-                        corrupted_events += 1
-                        corrupted_ids.append(row[0])
-                        logger.warning(f"Corrupted audit event {row[0]}: {e}")
-                
-                return {
-                    'total_events': total_events,
-                    'corrupted_events': corrupted_events,
-                    'integrity_percentage': (total_events - corrupted_events) / total_events * 100 if total_events > 0 else 100,
-                    'corrupted_event_ids': corrupted_ids[:10],  # רק 10 הראשונים
-                    'integrity_ok': corrupted_events == 0
-                }
+                head_seq = self._chain_head(cursor)[0]
+                checkpoint = self._chain_state(cursor, 'verified')
+                pruned = self._chain_state(cursor, 'pruned')
+                checkpoint_row = None
+                if checkpoint:
+                    cursor.execute('SELECT chain_hash FROM audit_events WHERE seq = ?', (checkpoint[0],))
+                    checkpoint_row = cursor.fetchone()
+            
+            problems = []
+            # ה-checkpoint לא אמור להשתנות - שכתוב השרשרת שעובר דרכו יתגלה כאן
+            if checkpoint_row and checkpoint_row[0] != checkpoint[1]:
+                problems.append({'seq': checkpoint[0], 'event_id': None, 'reason': 'checkpoint_mismatch'})
+            
+            # עוגן: האירוע האחרון שידוע כתקין (checkpoint, ניקוי, או תחילת הלוג)
+            anchors = [(0, GENESIS_HASH)]
+            if pruned:
+                anchors.append(pruned)
+            if checkpoint and not full:
+                anchors.append(checkpoint)
+            anchor_seq, anchor_hash = max(anchors, key=lambda anchor: anchor[0])
+            incremental = bool(checkpoint) and not full and anchor_seq == checkpoint[0]
+            start_seq = anchor_seq + 1
+            
+            blocks = [
+                (block_start, min(block_start + block_size - 1, head_seq))
+                for block_start in range(start_seq, head_seq + 1, block_size)
+            ]
+            if len(blocks) > 1:
+                workers = workers or min(4, os.cpu_count() or 1)
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audit-verify") as executor:
+                    results = list(executor.map(
+                        lambda block: self._verify_block(block[0], block[1], anchor_hash if block[0] == start_seq else None,
+                                                         chunk_size),
+                        blocks
+                    ))
+            else:
+                results = [self._verify_block(start, end, anchor_hash, chunk_size) for start, end in blocks]
+            
+            total_events = sum(result[0] for result in results)
+            for result in results:
+                problems.extend(result[1])
+            
+            # ה-checkpoint מתקדם רק אחרי אימות נקי
+            if not problems and results:
+                with self._get_connection() as conn:
+                    cursor = conn.cursor()
+                    self._set_chain_state(cursor, 'verified', head_seq, results[-1][2])
+                    conn.commit()
+            
+            corrupted_ids = [problem['event_id'] for problem in problems if problem['event_id']]
+            return {
+                'total_events': total_events,
+                'corrupted_events': len(problems),
+                'integrity_percentage': max(0, total_events - len(problems)) / total_events * 100 if total_events > 0 else 100,
+                'corrupted_event_ids': corrupted_ids[:10],  # רק 10 הראשונים
+                'chain_errors': problems[:10],
+                'integrity_ok': not problems,
+                'incremental': incremental,
+                'verified_from_seq': start_seq,
+                'verified_through_seq': head_seq,
+                'duration_ms': int((time.monotonic() - started) * 1000)
+            }
                 
         except Exception as e:
             logger.error(f"Failed to verify audit integrity: {e}")
             return {'integrity_ok': False, 'error': str(e)}
     
+    def _verify_block(self, start_seq: int, end_seq: int, prev_hash: Optional[str],
+                      chunk_size: int) -> tuple:
+        """
+        אימות טווח seq אחד: checksum של כל אירוע והחוליה לאירוע שלפניו
+        
+        Returns:
+            (מספר אירועים, רשימת בעיות, chain_hash של האירוע האחרון בטווח)
+        """
+        problems = []
+        count = 0
+        # חיבור נפרד ללא הנעילה הגלובלית - בלוקים נקראים במקביל
+        conn = sqlite3.connect(self.db_path)
+        try:
+            cursor = conn.cursor()
+            if prev_hash is None:
+                cursor.execute('SELECT chain_hash FROM audit_events WHERE seq = ?', (start_seq - 1,))
+                row = cursor.fetchone()
+                # אירוע קודם חסר מדווח על ידי הבלוק הקודם
+                prev_hash = row[0] if row else None
+            
+            # cursor לכל מחיצה (לפי rowid = seq) ומיזוג - בלי למיין את כל הבלוק בזיכרון
+            cursor.execute('SELECT name FROM audit_partitions')
+            streams = []
+            for (name,) in cursor.fetchall():
+                partition_cursor = conn.cursor()
+                partition_cursor.execute(
+                    f'SELECT {self._EVENT_COLUMNS} FROM {name} WHERE seq BETWEEN ? AND ? ORDER BY seq',
+                    (start_seq, end_seq)
+                )
+                streams.append(self._iter_rows(partition_cursor, chunk_size))
+            
+            expected_seq = start_seq
+            for row in heapq.merge(*streams, key=lambda row: row[15]):
+                count += 1
+                seq, stored_checksum, stored_chain = row[15], row[14], row[16]
+                if seq != expected_seq:
+                    problems.append({'seq': expected_seq, 'event_id': None, 'reason': 'missing_events',
+                                     'missing_through': seq - 1})
+                    prev_hash = None
+                expected_seq = seq + 1
+                
+                reason = None
+                try:
+                    if self._calculate_checksum(self._row_to_event(row)) != stored_checksum:
+                        reason = 'checksum_mismatch'
+                except Exception as e:
+                    reason = 'unreadable'
+                    logger.warning(f"Corrupted audit event {row[0]}: {e}")
+                if reason is None and prev_hash is not None and _chain_hash(prev_hash, stored_checksum) != stored_chain:
+                    reason = 'chain_broken'
+                if reason:
+                    problems.append({'seq': seq, 'event_id': row[0], 'reason': reason})
+                # ממשיכים מהערך השמור, כך ששינוי אחד לא מסמן את כל מה שאחריו
+                prev_hash = stored_chain
+            
+            if expected_seq <= end_seq:
+                problems.append({'seq': expected_seq, 'event_id': None, 'reason': 'missing_events',
+                                 'missing_through': end_seq})
+            return count, problems, prev_hash
+        finally:
+            conn.close()
+    
+    @staticmethod
+    def _iter_rows(cursor, chunk_size: int):
+        """קריאת שורות מ-cursor ב-chunks"""
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                return
+            yield from rows
+    
+    def _row_to_event(self, row) -> AuditEvent:
+        """AuditEvent משורת audit_events (14 העמודות הראשונות)"""
+        return AuditEvent.from_dict({
+            'id': row[0],
+            'timestamp': row[1],
+            'event_type': row[2],
+            'severity': row[3],
+            'user_id': row[4],
+            'session_id': row[5],
+            'ip_address': row[6],
+            'user_agent': row[7],
+            'action': row[8],
+            'resource': row[9],
+            'details': json.loads(row[10]) if row[10] else {},
+            'success': bool(row[11]),
+            'error_message': row[12],
+            'duration_ms': row[13]
+        })
+    
     def cleanup_old_logs(self, retention_days: int = None) -> Dict[str, int]:
         """ניקוי לוגים ישנים"""
         
@@ -653,17 +1199,47 @@ class AuditService:
             retention_days = self.retention_days
         
         cutoff_date = datetime.utcnow() - timedelta(days=retention_days)
+        self.flush()
         
         try:
             with self._get_connection() as conn:
                 cursor = conn.cursor()
                 
-                # מחיקת אירועים ישנים
+                # מחיצות שכולן לפני ה-cutoff נמחקות שלמות; בשאר נמחק רק prefix לפי seq,
+                # כך שנשאר רצף רציף של השרשרת
+                cutoff_month = cutoff_date.strftime('%Y-%m')
+                cursor.execute('SELECT month, name FROM audit_partitions ORDER BY month')
+                partitions = cursor.fetchall()
+                expired = [name for month, name in partitions if month < cutoff_month]
+                retained = [name for month, name in partitions if month >= cutoff_month]
+                
+                boundary = None
+                for name in retained:
+                    cursor.execute(f"SELECT MIN(seq) FROM {name} WHERE timestamp >= ?", (cutoff_date.isoformat(),))
+                    first = cursor.fetchone()[0]
+                    if first is not None and (boundary is None or first < boundary):
+                        boundary = first
+                if boundary is None:
+                    boundary = self._chain_head(cursor)[0] + 1
+                
                 cursor.execute(
-                    "DELETE FROM audit_events WHERE timestamp < ?",
-                    (cutoff_date.isoformat(),)
+                    "SELECT seq, chain_hash FROM audit_events WHERE seq < ? ORDER BY seq DESC LIMIT 1",
+                    (boundary,)
                 )
-                deleted_events = cursor.rowcount
+                last_deleted = cursor.fetchone()
+                
+                deleted_events = 0
+                for name in expired:
+                    deleted_events += self._drop_partition(cursor, name)
+                for name in retained:
+                    cursor.execute(f"DELETE FROM {name} WHERE seq < ?", (boundary,))
+                    deleted_events += cursor.rowcount
+                if expired:
+                    self._refresh_view(cursor)
+                
+                if last_deleted:
+                    # האירוע הראשון שנשאר ממשיך להיות מאומת מול האירוע האחרון שנמחק
+                    self._set_chain_state(cursor, 'pruned', last_deleted[0], last_deleted[1])
                 
                 # מחיקת סטטיסטיקות ישנות
                 cursor.execute(
@@ -712,66 +1288,138 @@ class AuditService:
             logger.error(f"Failed to rotate audit logs: {e}")
             return False
     
+    EXPORT_FORMATS = ("json", "ndjson", "csv")
+    CSV_HEADERS = [
+        'ID', 'Timestamp', 'Event Type', 'Severity', 'User ID', 'Session ID',
+        'IP Address', 'User Agent', 'Action', 'Resource', 'Success', 
+        'Error Message', 'Duration (ms)', 'Details'
+    ]
+    
     def export_logs(self, 
                    start_date: Optional[datetime] = None,
                    end_date: Optional[datetime] = None,
                    format: str = "json") -> str:
-        """ייצוא לוגי audit"""
+        """ייצוא לוגי audit כמחרוזת אחת (לייצוא גדול - stream_export)"""
         
         try:
-            events = self.get_events(
-                start_date=start_date,
-                end_date=end_date,
-                limit=10000  # מגבלה גבוהה לייצוא
-            )
-            
-            if format == "json":
-                return json.dumps([event.to_dict() for event in events], ensure_ascii=False, indent=2)
-            elif format == "csv":
-                return self._export_to_csv(events)
-            else:
-                raise ValueError(f"Unsupported export format: {format}")
-                
+            return ''.join(self.stream_export(start_date=start_date, end_date=end_date, format=format))
         except Exception as e:
             logger.error(f"Failed to export audit logs: {e}")
             raise
     
-    def _export_to_csv(self, events: List[AuditEvent]) -> str:
-        """ייצוא לפורמט CSV"""
-        import csv
-        import io
+    def stream_export(self,
+                      start_date: Optional[datetime] = None,
+                      end_date: Optional[datetime] = None,
+                      event_types: Optional[List[AuditEventType]] = None,
+                      user_id: Optional[str] = None,
+                      severity: Optional[AuditSeverity] = None,
+                      format: str = "ndjson") -> Iterator[str]:
+        """
+        ייצוא לוגי audit כ-iterator של מקטעי טקסט
         
-        output = io.StringIO()
-        writer = csv.writer(output)
+        האירועים נקראים ב-batches, כך שהזיכרון לא גדל עם גודל הייצוא וההורדה
+        מתחילה מיד.
+        """
+        if format not in self.EXPORT_FORMATS:
+            raise ValueError(f"Unsupported export format: {format}")
+        events = self.iter_events(start_date=start_date, end_date=end_date, event_types=event_types,
+                                  user_id=user_id, severity=severity)
+        return self._stream_export(events, format)
+    
+    def iter_events(self,
+                    start_date: Optional[datetime] = None,
+                    end_date: Optional[datetime] = None,
+                    event_types: Optional[List[AuditEventType]] = None,
+                    user_id: Optional[str] = None,
+                    session_id: Optional[str] = None,
+                    severity: Optional[AuditSeverity] = None,
+                    success_only: Optional[bool] = None,
+                    batch_size: int = 1000) -> Iterator[AuditEvent]:
+        """
+        כל האירועים שמתאימים לסינון, מהחדש לישן
         
-        # כותרות
-        headers = [
-            'ID', 'Timestamp', 'Event Type', 'Severity', 'User ID', 'Session ID',
-            'IP Address', 'User Agent', 'Action', 'Resource', 'Success', 
-            'Error Message', 'Duration (ms)', 'Details'
-        ]
-        writer.writerow(headers)
+        כל מחיצה בטווח נקראת ב-keyset batches לפי (timestamp, seq). החיבור נסגר
+        בין batch ל-batch, כך שצרכן איטי לא מחזיק נעילת קריאה שחוסמת את כותב ה-audit.
+        """
+        self.flush()
+        conditions, params = self._event_filters(
+            start_date, end_date, event_types, user_id, session_id, severity, success_only
+        )
+        with self._get_connection() as conn:
+            partitions = self._partitions(conn.cursor(), start_date, end_date)
         
-        # נתונים
-        for event in events:
-            writer.writerow([
-                event.id,
-                event.timestamp.isoformat(),
-                event.event_type.value,
-                event.severity.value,
-                event.user_id or '',
-                event.session_id or '',
-                event.ip_address or '',
-                event.user_agent or '',
-                event.action,
-                event.resource or '',
-                'Yes' if event.success else 'No',
-                event.error_message or '',
-                event.duration_ms or '',
-                json.dumps(event.details, ensure_ascii=False) if event.details else ''
-            ])
-        
-        return output.getvalue()
+        for name in partitions:
+            after = None
+            while True:
+                query = f"SELECT * FROM {name} WHERE 1=1{conditions}"
+                batch_params = list(params)
+                if after is not None:
+                    query += " AND (timestamp, seq) < (?, ?)"
+                    batch_params.extend(after)
+                query += " ORDER BY timestamp DESC, seq DESC LIMIT ?"
+                batch_params.append(batch_size)
+                
+                conn = sqlite3.connect(self.db_path)
+                try:
+                    rows = conn.execute(query, batch_params).fetchall()
+                except sqlite3.OperationalError as e:
+                    # המחיצה נמחקה בניקוי בזמן הייצוא
+                    logger.warning(f"Audit partition {name} disappeared during export: {e}")
+                    rows = []
+                finally:
+                    conn.close()
+                
+                for row in rows:
+                    yield self._row_to_event(row)
+                if len(rows) < batch_size:
+                    break
+                after = (rows[-1][1], rows[-1][15])
+    
+    def _stream_export(self, events: Iterable[AuditEvent], format: str) -> Iterator[str]:
+        if format == "ndjson":
+            for event in events:
+                yield json.dumps(event.to_dict(), ensure_ascii=False) + "\n"
+        elif format == "json":
+            # אותו מסמך כמו json.dumps(list, indent=2), אירוע אחד בכל פעם
+            first = True
+            for event in events:
+                item = json.dumps(event.to_dict(), ensure_ascii=False, indent=2).replace("\n", "\n  ")
+                yield ("[\n  " if first else ",\n  ") + item
+                first = False
+            yield "[]" if first else "\n]"
+        elif format == "csv":
+            import csv
+            import io
+            
+            output = io.StringIO()
+            writer = csv.writer(output)
+            writer.writerow(self.CSV_HEADERS)
+            for event in events:
+                writer.writerow(self._csv_row(event))
+                # מרוקנים את ה-buffer אחרי כל שורה
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate(0)
+            yield output.getvalue()
+    
+    def _csv_row(self, event: AuditEvent) -> List[Any]:
+        """שורת CSV לאירוע"""
+        return [
+            event.id,
+            event.timestamp.isoformat(),
+            event.event_type.value,
+            event.severity.value,
+            event.user_id or '',
+            event.session_id or '',
+            event.ip_address or '',
+            event.user_agent or '',
+            event.action,
+            event.resource or '',
+            'Yes' if event.success else 'No',
+            event.error_message or '',
+            event.duration_ms or '',
+            json.dumps(event.details, ensure_ascii=False) if event.details else ''
+        ]
 
 
 # יצירת instance גלובלי
@@ -9,7 +9,7 @@ import base64
 import hashlib
 import secrets
 from datetime import datetime, timedelta
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, List, Tuple
 from cryptography.fernet import Fernet
 from cryptography.hazmat.primitives import hashes
 from cryptography.hazmat.primitives.kdf.pbkdf2 import PBKDF2HMAC
@@ -244,6 +244,55 @@ class EncryptionService:
             logger.error(f"Failed to decrypt message {message_id}: {str(e)}")
             raise
     
+    def decrypt_messages(self, items: List[Tuple[str, str]]) -> Dict[str, str]:
+        """
+        פענוח אצווה של הודעות עם שאילתת מטאדטה אחת
+        
+        Args:
+            items: רשימת זוגות (תוכן מוצפן, מזהה הודעה)
+            
+        Returns:
+            מילון מזהה הודעה -> תוכן מפוענח, רק עבור הודעות שפוענחו בהצלחה
+        """
+        if not items:
+            return {}
+        
+        message_ids = [message_id for _, message_id in items]
+        metadata: Dict[str, Tuple[str, str]] = {}
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        # חלוקה לקבוצות כדי לא לחרוג ממגבלת הפרמטרים של SQLite
+        for start in range(0, len(message_ids), 500):
+            chunk = message_ids[start:start + 500]
+            placeholders = ",".join("?" * len(chunk))
+            cursor.execute(
+                f"SELECT message_id, key_id, checksum FROM encrypted_messages_metadata WHERE message_id IN ({placeholders})",
+                chunk,
+            )
+            for message_id, key_id, checksum in cursor.fetchall():
+                metadata[message_id] = (key_id, checksum)
+        conn.close()
+        
+        decrypted: Dict[str, str] = {}
+        for encrypted_content, message_id in items:
+            if message_id not in metadata:
+                continue
+            key_id, checksum = metadata[message_id]
+            try:
+                key_info = self._get_key(key_id)
+                if not key_info:
+                    continue
+                encrypted_data = base64.b64decode(encrypted_content.encode('utf-8'))
+                content = key_info['fernet'].decrypt(encrypted_data).decode('utf-8')
+                if hashlib.sha256(content.encode('utf-8')).hexdigest() != checksum:
+                    logger.error(f"Checksum mismatch for message {message_id}")
+                    continue
+                decrypted[message_id] = content
+            except Exception as e:
+                logger.debug(f"Failed to decrypt message {message_id}: {e}")
+        
+        return decrypted
+    
     def _save_encryption_metadata(self, message_id: str, key_id: str, checksum: str):
         """שמירת מטאדטה של הצפנה"""
         conn = sqlite3.connect(self.db_path)
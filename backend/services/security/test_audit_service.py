@@ -26,6 +26,7 @@ class TestAuditService(unittest.TestCase):
         
     def tearDown(self):
         """ניקוי אחרי בדיקות"""
+        self.service.close()
         shutil.rmtree(self.temp_dir)
     
     def test_audit_event_creation(self):
@@ -287,13 +288,16 @@ class TestAuditService(unittest.TestCase):
             user_id="user2"
         )
         
-        # שינוי תאריך האירוע הישן במסד הנתונים
+        # שינוי תאריך האירוע הישן במסד הנתונים (אחרי שהתור נכתב)
+        self.service.flush()
         import sqlite3
         conn = sqlite3.connect(self.service.db_path)
         cursor = conn.cursor()
         old_date = (datetime.utcnow() - timedelta(days=400)).isoformat()
+        # audit_events הוא view - העדכון נעשה במחיצה של החודש
+        partition = self.service._partition_name(datetime.utcnow().strftime('%Y-%m'))
         cursor.execute(
-            "UPDATE audit_events SET timestamp = ? WHERE id = ?",
+            f"UPDATE {partition} SET timestamp = ? WHERE id = ?",
             (old_date, old_event_id)
         )
         conn.commit()
@@ -402,6 +406,421 @@ class TestAuditService(unittest.TestCase):
         self.assertEqual(len(events), 10)
 
 
+class TestAuditWriter(unittest.TestCase):
+    """בדיקות לכותב ה-audit ברקע"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "test_writer.db")
+        self.services = []
+    
+    def tearDown(self):
+        for service in self.services:
+            service.close()
+        shutil.rmtree(self.temp_dir)
+    
+    def _service(self, **kwargs):
+        service = AuditService(db_path=self.db_path, **kwargs)
+        self.services.append(service)
+        return service
+    
+    def _count(self, table="audit_events"):
+        import sqlite3
+        conn = sqlite3.connect(self.db_path)
+        count = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        conn.close()
+        return count
+    
+    def test_events_are_batched(self):
+        """בדיקה שאירועים נכתבים ב-batch אחד עם מונים יומיים מצטברים"""
+        service = self._service(flush_interval=60)
+        for i in range(20):
+            service.log_event(AuditEventType.API_REQUEST, f"GET /api/{i}", success=i % 5 != 0)
+        
+        # עדיין בתור - לא נכתב בנתיב הבקשה
+        self.assertEqual(self._count(), 0)
+        self.assertEqual(service.pending_count, 20)
+        
+        self.assertEqual(service.flush(), 20)
+        self.assertEqual(self._count(), 20)
+        writer = service.get_writer_stats()
+        self.assertEqual(writer['batches'], 1)
+        self.assertEqual(writer['pending'], 0)
+        
+        daily = service.get_statistics()['daily_statistics']
+        self.assertEqual(len(daily), 1)
+        self.assertEqual(daily[0]['total_events'], 20)
+        self.assertEqual(daily[0]['api_requests'], 20)
+        self.assertEqual(daily[0]['error_events'], 4)
+    
+    def test_background_thread_flushes(self):
+        """בדיקה שה-thread ברקע כותב ללא קריאה ל-flush"""
+        import time
+        service = self._service(flush_interval=0.01)
+        service.log_event(AuditEventType.USER_ACTION, "background")
+        
+        deadline = time.time() + 5
+        while self._count() == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self._count(), 1)
+    
+    def test_close_flushes_pending_events(self):
+        """בדיקה ש-close כותב את כל מה שבתור"""
+        service = self._service(flush_interval=60)
+        for i in range(5):
+            service.log_event(AuditEventType.USER_ACTION, f"action_{i}")
+        service.close()
+        self.assertEqual(self._count(), 5)
+        
+        # אחרי close כותבים ישירות
+        service.log_event(AuditEventType.USER_ACTION, "after_close")
+        self.assertEqual(self._count(), 6)
+    
+    def test_drop_low_policy(self):
+        """בדיקה שבתור מלא אירועי LOW נזרקים ואירועים חמורים נכתבים"""
+        service = self._service(flush_interval=60, queue_size=2, overflow_policy="drop_low",
+                                enqueue_timeout=0.01)
+        # flush_interval ארוך - ה-thread לא מנקז את התור בזמן הבדיקה
+        service.log_event(AuditEventType.USER_ACTION, "a1")
+        service.log_event(AuditEventType.USER_ACTION, "a2")
+        service.log_event(AuditEventType.USER_ACTION, "dropped")
+        service.log_event(AuditEventType.DATA_CLEARED, "critical", severity=AuditSeverity.CRITICAL)
+        
+        self.assertEqual(service.get_writer_stats()['dropped'], 1)
+        self.assertEqual(service.get_writer_stats()['sync_writes'], 1)
+        actions = {event.action for event in service.get_events()}
+        self.assertEqual(actions, {"a1", "a2", "critical"})
+    
+    def test_sync_policy_writes_inline_when_full(self):
+        """בדיקה שמדיניות sync כותבת ישירות כשהתור מלא"""
+        service = self._service(flush_interval=60, queue_size=1, overflow_policy="sync")
+        service.log_event(AuditEventType.USER_ACTION, "queued")
+        service.log_event(AuditEventType.USER_ACTION, "inline")
+        
+        self.assertEqual(self._count(), 1)
+        self.assertEqual(service.pending_count, 1)
+        self.assertEqual(len(service.get_events()), 2)
+    
+    def test_invalid_overflow_policy(self):
+        """בדיקת ולידציה של מדיניות התור"""
+        with self.assertRaises(ValueError):
+            AuditService(db_path=self.db_path, overflow_policy="ignore")
+
+
+class TestAuditHashChain(unittest.TestCase):
+    """בדיקות לשרשרת ה-hash ולאימות המצטבר"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "test_chain.db")
+        self.service = AuditService(db_path=self.db_path)
+        self.partition = self.service._partition_name(datetime.utcnow().strftime('%Y-%m'))
+    
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.temp_dir)
+    
+    def _log(self, count, prefix="action"):
+        for i in range(count):
+            self.service.log_event(AuditEventType.USER_ACTION, f"{prefix}_{i}", user_id=f"user_{i}")
+        self.service.flush()
+    
+    def _execute(self, sql, params=()):
+        """שינוי ישיר במחיצה של החודש הנוכחי"""
+        import sqlite3
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(sql.replace("audit_events", self.partition), params)
+        conn.commit()
+        conn.close()
+    
+    def test_events_are_chained(self):
+        """בדיקה שכל אירוע מקבל seq רציף ו-chain_hash שמחויב לקודם"""
+        import sqlite3
+        from backend.services.security.audit_service import GENESIS_HASH, _chain_hash
+        self._log(5)
+        
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute("SELECT seq, checksum, chain_hash FROM audit_events ORDER BY seq").fetchall()
+        conn.close()
+        self.assertEqual([row[0] for row in rows], [1, 2, 3, 4, 5])
+        prev = GENESIS_HASH
+        for _, checksum, chain in rows:
+            self.assertEqual(chain, _chain_hash(prev, checksum))
+            prev = chain
+    
+    def test_incremental_verification(self):
+        """בדיקה שאימות שני בודק רק אירועים חדשים"""
+        self._log(5)
+        first = self.service.verify_integrity()
+        self.assertTrue(first['integrity_ok'])
+        self.assertFalse(first['incremental'])
+        self.assertEqual(first['total_events'], 5)
+        
+        self._log(3, prefix="new")
+        second = self.service.verify_integrity()
+        self.assertTrue(second['integrity_ok'])
+        self.assertTrue(second['incremental'])
+        self.assertEqual(second['total_events'], 3)
+        self.assertEqual((second['verified_from_seq'], second['verified_through_seq']), (6, 8))
+        
+        # אין אירועים חדשים - אין מה לאמת
+        self.assertEqual(self.service.verify_integrity()['total_events'], 0)
+        self.assertEqual(self.service.verify_integrity(full=True)['total_events'], 8)
+    
+    def test_detects_tampering_in_parallel_blocks(self):
+        """בדיקה ששינוי, זיוף checksum ומחיקה מתגלים בבלוקים שמאומתים במקביל"""
+        self._log(20)
+        self._execute("UPDATE audit_events SET action = 'edited' WHERE seq = 4")
+        # שינוי עם checksum מחושב מחדש - נתפס רק בשרשרת
+        forged = self.service.get_events(limit=1, offset=20 - 11)[0]
+        forged.action = 'forged'
+        self._execute("UPDATE audit_events SET action = 'forged', checksum = ? WHERE seq = 11",
+                      (self.service._calculate_checksum(forged),))
+        self._execute("DELETE FROM audit_events WHERE seq = 17")
+        
+        result = self.service.verify_integrity(block_size=3, chunk_size=2, workers=4)
+        
+        self.assertFalse(result['integrity_ok'])
+        self.assertEqual(result['total_events'], 19)
+        reasons = {error['seq']: error['reason'] for error in result['chain_errors']}
+        self.assertEqual(reasons[4], 'checksum_mismatch')
+        self.assertEqual(reasons[11], 'chain_broken')
+        self.assertEqual(reasons[17], 'missing_events')
+        
+        # אימות שנכשל לא מקדם את ה-checkpoint
+        self.assertFalse(self.service.verify_integrity()['incremental'])
+    
+    def test_rewritten_chain_detected_by_checkpoint(self):
+        """בדיקה ששכתוב אירוע שכבר אומת נתפס מול ה-checkpoint"""
+        from backend.services.security.audit_service import _chain_hash
+        self._log(3)
+        self.assertTrue(self.service.verify_integrity()['integrity_ok'])
+        
+        # שכתוב אירוע אחרון כולל checksum ו-chain_hash "תקינים"
+        import sqlite3
+        conn = sqlite3.connect(self.db_path)
+        prev = conn.execute("SELECT chain_hash FROM audit_events WHERE seq = 2").fetchone()[0]
+        conn.close()
+        self._execute("UPDATE audit_events SET checksum = 'x', chain_hash = ? WHERE seq = 3",
+                      (_chain_hash(prev, 'x'),))
+        
+        result = self.service.verify_integrity()
+        self.assertFalse(result['integrity_ok'])
+        self.assertEqual(result['chain_errors'][0]['reason'], 'checkpoint_mismatch')
+    
+    def test_cleanup_keeps_chain_verifiable(self):
+        """בדיקה שניקוי לוגים ישנים לא שובר את אימות השרשרת"""
+        self._log(4)
+        old_date = (datetime.utcnow() - timedelta(days=400)).isoformat()
+        self._execute("UPDATE audit_events SET timestamp = ? WHERE seq <= 2", (old_date,))
+        
+        self.assertEqual(self.service.cleanup_old_logs(retention_days=365)['deleted_events'], 2)
+        self._log(2, prefix="after_cleanup")
+        
+        result = self.service.verify_integrity(full=True)
+        # האירועים ששונה להם התאריך לא קיימים יותר
+        self.assertTrue(result['integrity_ok'])
+        self.assertEqual(result['total_events'], 4)
+        self.assertEqual(result['verified_from_seq'], 3)
+    
+    def test_existing_log_is_backfilled(self):
+        """בדיקה שלוג שנוצר לפני השרשרת מקבל seq ו-chain_hash"""
+        import sqlite3
+        legacy_path = os.path.join(self.temp_dir, "legacy.db")
+        legacy = AuditService(db_path=os.path.join(self.temp_dir, "source.db"), async_writes=False)
+        for i in range(3):
+            legacy.log_event(AuditEventType.USER_ACTION, f"legacy_{i}")
+        
+        # העתקה לסכמה הישנה (ללא seq / chain_hash)
+        source = sqlite3.connect(legacy.db_path)
+        rows = source.execute("SELECT id, timestamp, event_type, severity, user_id, session_id, ip_address, "
+                              "user_agent, action, resource, details, success, error_message, duration_ms, "
+                              "checksum FROM audit_events").fetchall()
+        source.close()
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("""CREATE TABLE audit_events (id TEXT PRIMARY KEY, timestamp TEXT NOT NULL,
+            event_type TEXT NOT NULL, severity TEXT NOT NULL, user_id TEXT, session_id TEXT,
+            ip_address TEXT, user_agent TEXT, action TEXT NOT NULL, resource TEXT, details TEXT DEFAULT '{}',
+            success BOOLEAN NOT NULL DEFAULT TRUE, error_message TEXT, duration_ms INTEGER,
+            checksum TEXT NOT NULL)""")
+        conn.executemany("INSERT INTO audit_events VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)", rows)
+        conn.commit()
+        conn.close()
+        
+        migrated = AuditService(db_path=legacy_path, async_writes=False)
+        migrated.log_event(AuditEventType.USER_ACTION, "after_migration")
+        result = migrated.verify_integrity()
+        self.assertTrue(result['integrity_ok'])
+        self.assertEqual(result['total_events'], 4)
+        
+        # הטבלה הישנה הפכה למחיצות + view
+        conn = sqlite3.connect(legacy_path)
+        kind = conn.execute("SELECT type FROM sqlite_master WHERE name = 'audit_events'").fetchone()[0]
+        conn.close()
+        self.assertEqual(kind, 'view')
+        self.assertEqual(len(migrated.search_events("legacy")), 3)
+
+
+class TestAuditPartitions(unittest.TestCase):
+    """בדיקות למחיצות החודשיות ולחיפוש FTS"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "test_partitions.db")
+        self.service = AuditService(db_path=self.db_path, async_writes=False)
+        self.now = datetime.utcnow()
+        self.last_year = self.now - timedelta(days=400)
+    
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.temp_dir)
+    
+    def _write(self, timestamp, action, **kwargs):
+        """כתיבת אירוע עם זמן נתון"""
+        event = AuditEvent(timestamp=timestamp, event_type=AuditEventType.USER_ACTION, action=action, **kwargs)
+        event.id = self.service._generate_event_id(event)
+        self.service._write_batch([event])
+    
+    def _tables(self):
+        import sqlite3
+        conn = sqlite3.connect(self.db_path)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        conn.close()
+        return tables
+    
+    def test_events_go_to_monthly_partitions(self):
+        """בדיקה שכל אירוע נכתב למחיצת החודש שלו ושאילתות בטווח נוגעות רק בה"""
+        self._write(self.last_year, "old_login")
+        self._write(self.now, "new_login")
+        
+        old_partition = self.service._partition_name(self.last_year.strftime('%Y-%m'))
+        new_partition = self.service._partition_name(self.now.strftime('%Y-%m'))
+        self.assertTrue({old_partition, new_partition} <= self._tables())
+        
+        with self.service._get_connection() as conn:
+            source = self.service._events_source(conn.cursor(), start_date=self.now - timedelta(days=1))
+        self.assertIn(new_partition, source)
+        self.assertNotIn(old_partition, source)
+        
+        recent = self.service.get_events(start_date=self.now - timedelta(days=1))
+        self.assertEqual([event.action for event in recent], ["new_login"])
+        self.assertEqual(len(self.service.get_events()), 2)
+    
+    def test_fts_search(self):
+        """בדיקת חיפוש תת-מחרוזת דרך FTS, לפי שדות וטווח זמן"""
+        if not self.service._fts_enabled:
+            self.skipTest("FTS5 trigram tokenizer not available")
+        self._write(self.last_year, "login_attempt", resource="chat_session_1")
+        self._write(self.now, "Login_Attempt", details={"reason": "password expired"})
+        self._write(self.now, "logout", error_message="Session EXPIRED")
+        
+        self.assertEqual(len(self.service.search_events("ogin_att")), 2)
+        self.assertEqual(len(self.service.search_events("expired")), 2)
+        self.assertEqual(len(self.service.search_events("expired", search_fields=["error_message"])), 1)
+        self.assertEqual(len(self.service.search_events("login", start_date=self.now - timedelta(days=1))), 1)
+        self.assertEqual(len(self.service.search_events("log", limit=2)), 2)
+        
+        # עדכון ומחיקה נשקפים באינדקס
+        partition = self.service._partition_name(self.now.strftime('%Y-%m'))
+        import sqlite3
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f"UPDATE {partition} SET action = 'renamed' WHERE action = 'logout'")
+        conn.commit()
+        conn.close()
+        self.assertEqual(len(self.service.search_events("logout")), 0)
+        self.assertEqual(len(self.service.search_events("renamed")), 1)
+    
+    def test_short_terms_and_other_fields_use_like(self):
+        """בדיקה שמונחים קצרים ושדות מחוץ ל-FTS עדיין נמצאים"""
+        self._write(self.now, "ab", user_id="user-42")
+        self.assertEqual(len(self.service.search_events("ab")), 1)
+        self.assertEqual(len(self.service.search_events("er-4", search_fields=["user_id"])), 1)
+        self.assertEqual(self.service.search_events("x", search_fields=["no_such_column"]), [])
+    
+    def test_retention_drops_whole_partitions(self):
+        """בדיקה שניקוי מוחק מחיצות ישנות שלמות והשרשרת נשארת תקינה"""
+        for i in range(3):
+            self._write(self.last_year + timedelta(seconds=i), f"old_{i}")
+        self._write(self.now, "current")
+        old_partition = self.service._partition_name(self.last_year.strftime('%Y-%m'))
+        
+        result = self.service.cleanup_old_logs(retention_days=365)
+        
+        self.assertEqual(result['deleted_events'], 3)
+        self.assertNotIn(old_partition, self._tables())
+        self.assertNotIn(f"{old_partition}_fts", self._tables())
+        self.assertEqual([event.action for event in self.service.get_events()], ["current"])
+        self.assertTrue(self.service.verify_integrity(full=True)['integrity_ok'])
+
+
+class TestAuditStreamingExport(unittest.TestCase):
+    """בדיקות לייצוא בזרימה"""
+    
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, "test_export.db")
+        self.service = AuditService(db_path=self.db_path, async_writes=False)
+        self.now = datetime.utcnow()
+        events = []
+        for i in range(25):
+            event = AuditEvent(
+                timestamp=self.now - timedelta(days=20 * i),
+                event_type=AuditEventType.API_REQUEST if i % 2 else AuditEventType.USER_ACTION,
+                action=f"action_{i}",
+                user_id="alice" if i % 5 == 0 else "bob",
+                details={"n": i, "text": "שלום, \"world\""}
+            )
+            event.id = self.service._generate_event_id(event)
+            events.append(event)
+        self.service._write_batch(events)
+    
+    def tearDown(self):
+        self.service.close()
+        shutil.rmtree(self.temp_dir)
+    
+    def test_iter_events_crosses_partitions_newest_first(self):
+        """בדיקה שה-keyset batches עוברים על כל המחיצות בסדר יורד"""
+        events = list(self.service.iter_events(batch_size=3))
+        self.assertEqual([event.action for event in events], [f"action_{i}" for i in range(25)])
+    
+    def test_filters_pushed_into_query(self):
+        """בדיקת סינון לפי טווח זמן, סוג ומשתמש"""
+        recent = list(self.service.iter_events(start_date=self.now - timedelta(days=90), batch_size=2))
+        self.assertEqual(len(recent), 5)
+        
+        alice_api = list(self.service.iter_events(event_types=[AuditEventType.API_REQUEST], user_id="alice"))
+        self.assertEqual([event.action for event in alice_api], ["action_5", "action_15"])
+    
+    def test_ndjson_and_json_formats(self):
+        """בדיקה ש-NDJSON ו-JSON שמיוצאים בזרימה תקינים"""
+        lines = "".join(self.service.stream_export(format="ndjson")).splitlines()
+        self.assertEqual(len(lines), 25)
+        self.assertEqual(json.loads(lines[3])['details']['text'], 'שלום, "world"')
+        
+        document = json.loads("".join(self.service.stream_export(format="json")))
+        self.assertEqual(len(document), 25)
+        self.assertEqual(json.loads("".join(self.service.stream_export(format="json", user_id="nobody"))), [])
+    
+    def test_csv_format_streams_rows(self):
+        """בדיקה שכל שורת CSV נשלחת בנפרד ונקראת חזרה נכון"""
+        import csv
+        import io
+        chunks = list(self.service.stream_export(format="csv"))
+        self.assertGreaterEqual(len(chunks), 25)
+        rows = list(csv.reader(io.StringIO("".join(chunks))))
+        self.assertEqual(rows[0], AuditService.CSV_HEADERS)
+        self.assertEqual(len(rows), 26)
+        self.assertEqual(json.loads(rows[1][-1])['n'], 0)
+    
+    def test_export_is_lazy(self):
+        """בדיקה שהייצוא מתחיל לפני שכל האירועים נקראו"""
+        stream = self.service.stream_export(format="ndjson")
+        first = next(stream)
+        self.assertIn("action_0", first)
+        with self.assertRaises(ValueError):
+            self.service.stream_export(format="xml")
+
+
 class TestAuditServiceHelpers(unittest.TestCase):
     """בדיקות לפונקציות העזר"""
     
@@ -417,6 +836,7 @@ class TestAuditServiceHelpers(unittest.TestCase):
     def tearDown(self):
         # החזרת השירות המקורי
         import backend.services.security.audit_service as audit_module
+        audit_module.audit_service.close()
         audit_module.audit_service = self.original_service
         shutil.rmtree(self.temp_dir)
     
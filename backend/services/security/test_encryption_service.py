@@ -38,6 +38,20 @@ class TestEncryptionService(unittest.TestCase):
         decrypted = self.service.decrypt_message(encrypted, message_id)
         self.assertEqual(decrypted, original_content)
     
+    def test_batch_decryption(self):
+        """בדיקת פענוח אצווה"""
+        items = []
+        for i in range(5):
+            message_id = f"batch_msg_{i}"
+            items.append((self.service.encrypt_message(f"תוכן {i}", message_id), message_id))
+        items.append(("not-encrypted", "unknown_msg"))
+        
+        decrypted = self.service.decrypt_messages(items)
+        
+        self.assertEqual(len(decrypted), 5)
+        self.assertEqual(decrypted["batch_msg_3"], "תוכן 3")
+        self.assertNotIn("unknown_msg", decrypted)
+    
     def test_encryption_with_special_characters(self):
         """בדיקת הצפנה עם תווים מיוחדים"""
         message_id = "test_msg_002"
@@ -0,0 +1,71 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from backend.api import main as api_main
+from backend.services.security import audit_service
+from backend.services.utils.stream_compression import compress_chunks
+
+
+class StubSessions:
+    def iter_sessions(self):
+        for session_id in ("s1", "s2"):
+            yield SimpleNamespace(id=session_id, to_dict=lambda session_id=session_id: {"id": session_id})
+
+
+class StubHistory:
+    def get_encryption_status(self):
+        return {"enabled": True}
+
+    def get_session_statistics(self, session_id):
+        return {}
+
+    def iter_session_messages(self, session_id):
+        for index in range(2):
+            yield SimpleNamespace(to_dict=lambda index=index: {"id": f"{session_id}-{index}"})
+
+
+@pytest.fixture
+def audited(monkeypatch):
+    events = []
+    monkeypatch.setattr(api_main, "session_service", StubSessions())
+    monkeypatch.setattr(api_main, "chat_history_service", StubHistory())
+    monkeypatch.setattr(audit_service, "log_security_event", lambda **kwargs: events.append(kwargs))
+    return events
+
+
+def test_complete_export_is_audited(audited):
+    body = "".join(api_main._stream_data_export("json"))
+
+    assert len(json.loads(body)["sessions"]) == 2
+    (event,) = audited
+    assert event["action"] == "data_exported"
+    assert event["details"]["completed"]
+    assert event["details"]["exported_messages"] == 4
+    assert event["details"]["data_size_bytes"] == len(body.encode("utf-8"))
+
+
+def test_interrupted_export_is_audited(audited):
+    stream = api_main._stream_data_export("ndjson")
+    sent = [next(stream) for _ in range(3)]
+    # A client disconnect closes the generator
+    stream.close()
+
+    (event,) = audited
+    assert not event["details"]["completed"]
+    assert event["details"]["exported_sessions"] == 0
+    assert event["details"]["exported_messages"] == 1
+    assert event["details"]["data_size_bytes"] == len("".join(sent).encode("utf-8"))
+
+
+def test_interrupted_compressed_export_is_audited(audited):
+    export = api_main._stream_data_export("ndjson")
+    stream = compress_chunks(export, "gzip", min_flush_bytes=1)
+    next(stream)
+    # Closing the compressed stream must close the export generator under it,
+    # even while something else still holds a reference to it
+    stream.close()
+
+    (event,) = audited
+    assert not event["details"]["completed"]
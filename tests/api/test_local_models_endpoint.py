@@ -0,0 +1,61 @@
+import pytest
+import torch
+from fastapi.testclient import TestClient
+
+from backend.api import main as api_main
+from backend.services.ai.llm_service import LLMService
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    service = LLMService(db_path=str(tmp_path / "llm_data.db"))
+    monkeypatch.setattr(api_main, "llm_service", service)
+    yield service
+    service.close_local_models()
+
+
+def test_local_models_status(llm):
+    client = TestClient(api_main.app)
+
+    resp = client.get("/api/llm/local-models")
+    assert resp.status_code == 200
+    assert resp.json()["models"] == []
+
+    provider = llm._get_provider_instance("Local Gemma")
+    provider.models.register("tiny", torch.nn.Linear(256, 4, bias=False))
+
+    data = client.get("/api/llm/local-models").json()
+    (model,) = data["models"]
+    assert model["model_id"] == "tiny"
+    assert model["state"] == "loaded"
+    assert model["resident_bytes"] == 256 * 4 * 4
+    assert model["load_seconds"] is not None
+    assert model["scheduler"] is None
+    assert "memory_budget_bytes" in data
+
+
+def test_set_local_model_backend(llm):
+    client = TestClient(api_main.app)
+
+    resp = client.post("/api/llm/local-models/google-gemma-2-2b-it/backend", data={"backend": "int8"})
+    assert resp.status_code == 200
+    assert resp.json()["backend"] == "int8"
+    assert llm.get_model("google-gemma-2-2b-it").parameters["backend"] == "int8"
+    assert llm._get_provider_instance("Local Gemma").backend_for("google-gemma-2-2b-it") == "int8"
+    # Restored when the service starts again
+    restarted = LLMService(db_path=llm.db_path)
+    assert restarted._get_provider_instance("Local Gemma").backend_for("google-gemma-2-2b-it") == "int8"
+
+    resp = client.post("/api/llm/local-models/google-gemma-2-2b-it/backend", data={"backend": "onnx"})
+    assert resp.status_code == 400
+    resp = client.post("/api/llm/local-models/openai-gpt-4/backend", data={"backend": "int8"})
+    assert resp.status_code == 400
+
+
+def test_set_backend_without_local_provider(llm, monkeypatch):
+    monkeypatch.setattr(llm, "_get_provider_instance", lambda name: None)
+    client = TestClient(api_main.app)
+
+    resp = client.post("/api/llm/local-models/google-gemma-2-2b-it/backend", data={"backend": "int8"})
+    assert resp.status_code == 400
+    assert "not available" in resp.json()["detail"]
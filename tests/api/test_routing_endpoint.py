@@ -0,0 +1,31 @@
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.api import main as api_main
+from backend.services.ai.llm_service import LLMService
+
+
+@pytest.fixture
+def llm(tmp_path, monkeypatch):
+    service = LLMService(db_path=str(tmp_path / "llm_data.db"))
+    monkeypatch.setattr(api_main, "llm_service", service)
+    return service
+
+
+def test_routing_settings_round_trip(llm):
+    client = TestClient(api_main.app)
+
+    data = client.get("/api/llm/routing").json()
+    assert data["settings"] == {"fallback_models": [], "hedge": False}
+    assert data["router"]["hedges"] == 0
+
+    resp = client.post("/api/llm/routing", json={"fallback_models": ["anthropic-claude-3-opus"], "hedge": True})
+    assert resp.status_code == 200
+    assert resp.json()["settings"] == {"fallback_models": ["anthropic-claude-3-opus"], "hedge": True}
+    assert llm.router.hedge
+    # Persisted for the next start
+    assert LLMService(db_path=llm.db_path).router.hedge
+
+    resp = client.post("/api/llm/routing", json={"fallback_models": ["no-such-model"]})
+    assert resp.status_code == 400
+    assert client.get("/api/llm/routing").json()["settings"]["fallback_models"] == ["anthropic-claude-3-opus"]
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Cache Hot-Path Benchmark
+מדידת עלות get ב-cache תחת עומס מרובה threads
+
+Compares the single-lock LRUCache against ShardedLRUCache with the same
+capacity. Each thread reads a mix of hot keys and misses.
+
+Usage:
+    python tests/performance/cache_benchmark.py --threads 8 --ops 200000
+"""
+
+import sys
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict
+
+# Add project root to path
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.services.cache.chat_cache_service import LRUCache, ShardedLRUCache
+
+
+def benchmark_get(cache, threads: int = 8, ops_per_thread: int = 50000, keys: int = 1000,
+                  hit_ratio: float = 0.9) -> Dict[str, float]:
+    """Run concurrent gets against ``cache`` and return throughput figures"""
+    for i in range(keys):
+        cache.set(f"messages:session-{i}:50", [{"role": "user", "content": "x" * 200}] * 10)
+
+    rng = random.Random(42)
+    hot = [f"messages:session-{rng.randrange(keys)}:50" for _ in range(4096)]
+    cold = [f"messages:missing-{i}:50" for i in range(4096)]
+    workload = [hot[i] if rng.random() < hit_ratio else cold[i] for i in range(4096)]
+
+    barrier = threading.Barrier(threads + 1)
+
+    def worker():
+        get = cache.get
+        barrier.wait()
+        for i in range(ops_per_thread):
+            get(workload[i & 4095])
+
+    workers = [threading.Thread(target=worker) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    total_ops = threads * ops_per_thread
+    return {
+        "threads": threads,
+        "total_ops": total_ops,
+        "elapsed_s": elapsed,
+        "ops_per_second": total_ops / elapsed,
+        "ns_per_get": elapsed / total_ops * 1e9,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark cache get() under multi-threaded load")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=100000, help="gets per thread")
+    parser.add_argument("--keys", type=int, default=1000)
+    args = parser.parse_args()
+
+    caches = {
+        "LRUCache (single lock)": LRUCache(max_size=args.keys * 2, ttl_seconds=3600),
+        "ShardedLRUCache": ShardedLRUCache(max_size=args.keys * 2, ttl_seconds=3600,
+                                           max_bytes=256 * 1024 * 1024),
+    }
+
+    print(f"🔍 get() benchmark: {args.threads} threads x {args.ops} ops, {args.keys} keys")
+    for name, cache in caches.items():
+        result = benchmark_get(cache, threads=args.threads, ops_per_thread=args.ops, keys=args.keys)
+        print(f"  {name:<24} {result['ops_per_second']:>12,.0f} ops/s  {result['ns_per_get']:>8.0f} ns/get")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Local Model Backend Benchmark
+השוואת מהירות וזיכרון בין ה-backends של המודלים המקומיים
+
+Runs the supported small models with every backend in LOCAL_BACKENDS
+(float ``torch`` and dynamic ``int8``) on LocalInferenceScheduler and
+reports decode throughput, load time and process RSS. Every
+model/backend pair runs in a fresh process so RSS isn't skewed by the
+models measured before it. Greedy decoding, CPU.
+
+The models are downloaded from the Hub. With ``--random-weights`` they are
+built from their configs instead, which needs no download and has the same
+compute and memory per token.
+
+Usage:
+    python tests/performance/local_backend_benchmark.py
+    python tests/performance/local_backend_benchmark.py --random-weights --requests 4 --new-tokens 64
+"""
+
+import sys
+import time
+import random
+import argparse
+import multiprocessing
+from pathlib import Path
+from typing import Dict, List
+
+# Add project root to path
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+MODELS = ["distilgpt2", "gpt2", "microsoft/DialoGPT-small"]
+# GPT-2 shapes of the models above, for --random-weights
+MODEL_LAYERS = {"distilgpt2": 6, "gpt2": 12, "microsoft/DialoGPT-small": 12}
+
+
+def _rss_mb() -> float:
+    import psutil
+    return psutil.Process().memory_info().rss / 1024 ** 2
+
+
+def _load(name: str, random_weights: bool):
+    import torch
+    from transformers import AutoModelForCausalLM, GPT2Config, GPT2LMHeadModel
+
+    if random_weights:
+        torch.manual_seed(0)
+        return GPT2LMHeadModel(GPT2Config(n_layer=MODEL_LAYERS[name], n_embd=768, n_head=12)).eval()
+    return AutoModelForCausalLM.from_pretrained(name, torch_dtype=torch.float32).eval()
+
+
+def run_case(name: str, backend: str, args: argparse.Namespace) -> Dict[str, float]:
+    """Load one model with one backend and time concurrent greedy generations"""
+    import torch
+    from backend.services.ai.providers.local_backends import apply_backend
+    from backend.services.ai.providers.local_model_manager import model_memory_bytes
+    from backend.services.ai.providers.local_scheduler import LocalInferenceScheduler
+
+    if args.torch_threads:
+        torch.set_num_threads(args.torch_threads)
+    rss_start = _rss_mb()
+    start = time.perf_counter()
+    model = apply_backend(_load(name, args.random_weights), backend)
+    load_s = time.perf_counter() - start
+    rss_loaded = _rss_mb()
+
+    rng = random.Random(42)
+    prompts: List[List[int]] = [
+        [rng.randrange(model.config.vocab_size) for _ in range(rng.randint(args.min_prompt, args.max_prompt))]
+        for _ in range(args.requests)
+    ]
+    scheduler = LocalInferenceScheduler(model)
+    # Count every token like min_new_tokens does for generate()
+    scheduler.eos_token_ids = set()
+    try:
+        # Warm up kernels and allocator
+        scheduler.generate(prompts[0], 2)
+        start = time.perf_counter()
+        requests = [scheduler.submit(prompt, max_new_tokens=args.new_tokens, temperature=0) for prompt in prompts]
+        for request in requests:
+            request.done.wait()
+        elapsed = time.perf_counter() - start
+    finally:
+        scheduler.stop()
+
+    return {
+        "load_s": load_s,
+        "weights_mb": model_memory_bytes(model) / 1024 ** 2,
+        "rss_model_mb": rss_loaded - rss_start,
+        "rss_peak_mb": _rss_mb(),
+        "tokens_per_second": args.requests * args.new_tokens / elapsed,
+    }
+
+
+def _child(queue, name: str, backend: str, args: argparse.Namespace):
+    try:
+        queue.put(run_case(name, backend, args))
+    except Exception as e:
+        queue.put({"error": str(e)})
+
+
+def main():
+    from backend.services.ai.providers.local_backends import LOCAL_BACKENDS
+
+    parser = argparse.ArgumentParser(description="Compare throughput and memory of the local model backends")
+    parser.add_argument("--models", nargs="+", default=MODELS)
+    parser.add_argument("--backends", nargs="+", default=list(LOCAL_BACKENDS))
+    parser.add_argument("--random-weights", action="store_true", help="models built from their configs, no download")
+    parser.add_argument("--requests", type=int, default=4, help="concurrent requests batched together")
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--min-prompt", type=int, default=16)
+    parser.add_argument("--max-prompt", type=int, default=64)
+    parser.add_argument("--torch-threads", type=int, default=0, help="0 keeps the torch default")
+    args = parser.parse_args()
+
+    print(f"🔍 {args.requests} requests x {args.new_tokens} new tokens, "
+          f"prompts {args.min_prompt}-{args.max_prompt} tokens")
+    print(f"  {'model':<26} {'backend':<8} {'tok/s':>8} {'load':>7} {'weights':>9} {'RSS model':>10} {'RSS peak':>9}")
+    context = multiprocessing.get_context("spawn")
+    for name in args.models:
+        baseline = None
+        for backend in args.backends:
+            queue = context.Queue()
+            process = context.Process(target=_child, args=(queue, name, backend, args))
+            process.start()
+            result = queue.get()
+            process.join()
+            if "error" in result:
+                print(f"  {name:<26} {backend:<8} ❌ {result['error']}")
+                continue
+            baseline = baseline or result
+            speedup = result["tokens_per_second"] / baseline["tokens_per_second"]
+            print(f"  {name:<26} {backend:<8} {result['tokens_per_second']:>8.1f} {result['load_s']:>6.1f}s "
+                  f"{result['weights_mb']:>7.0f}MB {result['rss_model_mb']:>8.0f}MB {result['rss_peak_mb']:>7.0f}MB"
+                  f"  ({speedup:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
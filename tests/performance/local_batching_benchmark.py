@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Local Inference Batching Benchmark
+מדידת תפוקת מודל מקומי תחת בקשות מקבילות
+
+Compares the old behaviour, where every concurrent request runs its own
+``model.generate()`` at batch size 1, with LocalInferenceScheduler
+batching the same requests on one worker. Greedy decoding, CPU.
+
+``--model distilgpt2`` (default) downloads the model from the Hub. With
+``--random-weights`` a distilgpt2-shaped model is built from its config
+instead, which needs no download and has the same compute per token.
+
+``--turns N`` additionally replays an N-turn conversation and compares
+the latency of the last turn with and without the prefix KV cache.
+
+Usage:
+    python tests/performance/local_batching_benchmark.py --requests 16 --new-tokens 32
+    python tests/performance/local_batching_benchmark.py --random-weights --turns 8
+"""
+
+import sys
+import time
+import random
+import argparse
+import threading
+from pathlib import Path
+from typing import Dict, List
+
+import torch
+from transformers import AutoModelForCausalLM, GPT2Config, GPT2LMHeadModel
+
+# Add project root to path
+project_root = Path(__file__).parent.parent.parent
+sys.path.insert(0, str(project_root))
+
+from backend.services.ai.providers.local_prefix_cache import PrefixKVCache
+from backend.services.ai.providers.local_scheduler import LocalInferenceScheduler
+
+
+def load_model(name: str, random_weights: bool):
+    if random_weights:
+        torch.manual_seed(0)
+        # distilgpt2: 6 layers, 768 hidden, 12 heads, GPT-2 vocabulary
+        config = GPT2Config(n_layer=6, n_embd=768, n_head=12)
+        return GPT2LMHeadModel(config).eval()
+    return AutoModelForCausalLM.from_pretrained(name).eval()
+
+
+def make_prompts(count: int, min_len: int, max_len: int, vocab_size: int) -> List[List[int]]:
+    rng = random.Random(42)
+    return [[rng.randrange(vocab_size) for _ in range(rng.randint(min_len, max_len))] for _ in range(count)]
+
+
+def run_concurrent(fn, prompts: List[List[int]]) -> float:
+    """Start one thread per prompt at the same time and return the wall time"""
+    barrier = threading.Barrier(len(prompts) + 1)
+
+    def worker(prompt):
+        barrier.wait()
+        fn(prompt)
+
+    threads = [threading.Thread(target=worker, args=(p,)) for p in prompts]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start
+
+
+def benchmark_independent(model, prompts: List[List[int]], new_tokens: int) -> Dict[str, float]:
+    """Every request calls generate() on its own, as LocalGemmaProvider used to"""
+    def generate(prompt):
+        with torch.inference_mode():
+            model.generate(
+                torch.tensor([prompt]),
+                attention_mask=torch.ones(1, len(prompt), dtype=torch.long),
+                max_new_tokens=new_tokens,
+                min_new_tokens=new_tokens,
+                do_sample=False,
+                pad_token_id=model.config.eos_token_id,
+            )
+
+    elapsed = run_concurrent(generate, prompts)
+    return {"elapsed_s": elapsed, "tokens_per_second": len(prompts) * new_tokens / elapsed}
+
+
+def benchmark_scheduler(model, prompts: List[List[int]], new_tokens: int, max_batch_size: int) -> Dict[str, float]:
+    scheduler = LocalInferenceScheduler(model, max_batch_size=max_batch_size)
+    # Count every token like min_new_tokens does for generate()
+    scheduler.eos_token_ids = set()
+    try:
+        elapsed = run_concurrent(lambda prompt: scheduler.generate(prompt, new_tokens), prompts)
+        stats = scheduler.stats()
+    finally:
+        scheduler.stop()
+    return {
+        "elapsed_s": elapsed,
+        "tokens_per_second": stats["tokens_generated"] / elapsed,
+        "avg_batch_size": stats["avg_batch_size"],
+    }
+
+
+def benchmark_conversation(model, turns: int, turn_tokens: int, new_tokens: int, prefix_cache: bool) -> Dict[str, float]:
+    """Replay a growing conversation and time each turn"""
+    rng = random.Random(7)
+    scheduler = LocalInferenceScheduler(model, prefix_cache=PrefixKVCache() if prefix_cache else None)
+    scheduler.eos_token_ids = set()
+    history: List[int] = []
+    latencies = []
+    try:
+        for _ in range(turns):
+            history += [rng.randrange(model.config.vocab_size) for _ in range(turn_tokens)]
+            start = time.perf_counter()
+            history += scheduler.generate(history, new_tokens)
+            latencies.append(time.perf_counter() - start)
+    finally:
+        scheduler.stop()
+    return {"history_tokens": len(history), "last_turn_s": latencies[-1], "total_s": sum(latencies)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched local inference against per-request generate()")
+    parser.add_argument("--model", default="distilgpt2")
+    parser.add_argument("--random-weights", action="store_true", help="distilgpt2-shaped model without download")
+    parser.add_argument("--requests", type=int, default=16)
+    parser.add_argument("--new-tokens", type=int, default=32)
+    parser.add_argument("--min-prompt", type=int, default=16)
+    parser.add_argument("--max-prompt", type=int, default=64)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--turns", type=int, default=0, help="also benchmark prefix reuse over this many turns")
+    parser.add_argument("--turn-tokens", type=int, default=64, help="user tokens added per turn")
+    parser.add_argument("--torch-threads", type=int, default=0, help="0 keeps the torch default")
+    args = parser.parse_args()
+
+    if args.torch_threads:
+        torch.set_num_threads(args.torch_threads)
+    model = load_model(args.model, args.random_weights)
+    prompts = make_prompts(args.requests, args.min_prompt, args.max_prompt, model.config.vocab_size)
+
+    print(f"🔍 {args.requests} concurrent requests, {args.new_tokens} new tokens each, "
+          f"prompts {args.min_prompt}-{args.max_prompt} tokens, {torch.get_num_threads()} torch threads")
+    # Warm up kernels and allocator
+    benchmark_scheduler(model, prompts[:2], 2, args.batch_size)
+
+    independent = benchmark_independent(model, prompts, args.new_tokens)
+    batched = benchmark_scheduler(model, prompts, args.new_tokens, args.batch_size)
+
+    print(f"  {'generate() per request':<28} {independent['tokens_per_second']:>8.1f} tok/s  {independent['elapsed_s']:>7.2f}s")
+    print(f"  {'LocalInferenceScheduler':<28} {batched['tokens_per_second']:>8.1f} tok/s  {batched['elapsed_s']:>7.2f}s"
+          f"  (avg batch {batched['avg_batch_size']:.1f})")
+    print(f"  speedup: {independent['elapsed_s'] / batched['elapsed_s']:.2f}x")
+
+    if args.turns:
+        print(f"🔍 {args.turns}-turn conversation, {args.turn_tokens} user tokens + {args.new_tokens} reply tokens per turn")
+        for name, cached in (("full prefill", False), ("prefix KV cache", True)):
+            result = benchmark_conversation(model, args.turns, args.turn_tokens, args.new_tokens, cached)
+            print(f"  {name:<28} last turn {result['last_turn_s']:>6.2f}s  total {result['total_s']:>7.2f}s"
+                  f"  ({result['history_tokens']} tokens)")
+
+
+if __name__ == "__main__":
+    main()
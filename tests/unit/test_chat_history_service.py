@@ -5,7 +5,7 @@ import pytest
 import tempfile
 import os
 import json
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from backend.services.ai.chat_history_service import ChatHistoryService
 from backend.models.chat import Message
@@ -267,11 +267,50 @@ class TestChatHistoryService:
         assert "Chat Session Export" in text_export
         assert "USER: Hello, world!" in text_export
     
+    def test_stream_export_session_ndjson(self, history_service):
+        """Test streaming NDJSON export reads all batches in order"""
+        base = datetime(2024, 1, 1)
+        for i in range(5):
+            history_service.save_message("test-session-1", Message(
+                id=f"msg-{i}", session_id="test-session-1", role="user",
+                content=f"Message {i}", timestamp=base + timedelta(seconds=i)
+            ))
+        
+        messages = list(history_service.iter_session_messages("test-session-1", batch_size=2))
+        assert [m.content for m in messages] == [f"Message {i}" for i in range(5)]
+        
+        lines = "".join(history_service.stream_export_session("test-session-1", format="ndjson")).splitlines()
+        assert [json.loads(line)["content"] for line in lines] == [f"Message {i}" for i in range(5)]
+    
     def test_export_session_invalid_format(self, history_service):
         """Test exporting with invalid format"""
         with pytest.raises(ValueError, match="Unsupported export format"):
             history_service.export_session("test-session-1", format="invalid")
     
+    def test_get_data_statistics_uses_summary(self, history_service, temp_db):
+        """Test global statistics with and without the summary table"""
+        from backend.migrations.add_chat_statistics_summary import migrate_chat_statistics_summary
+        
+        history_service.save_message("test-session-1", Message(
+            id="msg-0", session_id="test-session-1", role="user",
+            content="Hello", timestamp=datetime(2024, 1, 1)
+        ))
+        fallback = history_service.get_data_statistics()
+        assert fallback["total_messages"] == 1
+        assert fallback["oldest_message"] == "2024-01-01T00:00:00"
+        
+        assert migrate_chat_statistics_summary(temp_db)
+        history_service.save_message("test-session-1", Message(
+            id="msg-1", session_id="test-session-1", role="assistant",
+            content="Hi", timestamp=datetime(2024, 1, 2)
+        ))
+        stats = history_service.get_data_statistics()
+        assert stats["total_messages"] == 2
+        assert stats["newest_message"] == "2024-01-02T00:00:00"
+        assert stats["storage_bytes"] > fallback["storage_bytes"]
+        
+        assert history_service.get_data_statistics(exact_storage=True)["storage_bytes"] > 0
+    
     def test_get_message_count(self, history_service):
         """Test getting message count for session"""
         # Initially should be 0
@@ -373,4 +412,118 @@ class TestChatHistoryService:
         assert stats["message_counts"]["assistant"] == 1
         assert stats["token_usage"]["total"] == 15
         assert stats["token_usage"]["average"] == 5.0
-        assert stats["response_times"]["average"] == 1.0
\ No newline at end of file
+        assert stats["response_times"]["average"] == 1.0
+
+    def test_get_recent_messages_returns_latest(self, history_service):
+        """Test that recent messages are the newest ones, oldest first"""
+        base = datetime(2024, 1, 1)
+        for i in range(12):
+            message = Message(
+                id=f"msg-{i}",
+                session_id="test-session-1",
+                role="user",
+                content=f"Message {i}",
+                timestamp=base + timedelta(seconds=i)
+            )
+            history_service.save_message("test-session-1", message)
+        
+        recent = history_service.get_recent_messages("test-session-1", limit=3)
+        
+        assert [m.content for m in recent] == ["Message 9", "Message 10", "Message 11"]
+    
+    def test_get_recent_messages_keyset_pages(self, history_service):
+        """Test paging back through history with a (timestamp, id) cursor"""
+        base = datetime(2024, 1, 1)
+        for i in range(5):
+            history_service.save_message("test-session-1", Message(
+                id=f"msg-{i}", session_id="test-session-1", role="user",
+                content=f"Message {i}", timestamp=base
+            ))
+        
+        pages = []
+        cursor = None
+        while True:
+            page = history_service.get_recent_messages("test-session-1", limit=2, before=cursor)
+            if not page:
+                break
+            pages.append([m.id for m in page])
+            cursor = (page[0].timestamp.isoformat(), page[0].id)
+        
+        # Identical timestamps are ordered by id, with no gaps or repeats
+        assert pages == [["msg-3", "msg-4"], ["msg-1", "msg-2"], ["msg-0"]]
+    
+    def test_recent_context_tracks_new_messages(self, history_service):
+        """Test that the context window is seeded once and then updated in place"""
+        base = datetime(2024, 1, 1)
+        for i in range(3):
+            history_service.save_message("test-session-1", Message(
+                id=f"msg-{i}", session_id="test-session-1", role="user",
+                content=f"Message {i}", timestamp=base + timedelta(seconds=i)
+            ))
+        
+        context = history_service.get_recent_context("test-session-1")
+        assert [c["content"] for c in context] == ["Message 0", "Message 1", "Message 2"]
+        
+        history_service.save_message("test-session-1", Message(
+            id="msg-3", session_id="test-session-1", role="assistant",
+            content="Message 3", timestamp=base + timedelta(seconds=3)
+        ))
+        
+        context = history_service.get_recent_context("test-session-1")
+        assert context[-1] == {"role": "assistant", "content": "Message 3"}
+        assert len(context) == 4
+    
+    def test_recent_context_does_not_read_the_database_per_turn(self, history_service, monkeypatch):
+        """Test that a loaded window is served without flushing or querying the database"""
+        base = datetime(2024, 1, 1)
+        history_service.save_message("test-session-1", Message(
+            id="msg-0", session_id="test-session-1", role="user",
+            content="Message 0", timestamp=base
+        ))
+        history_service.get_recent_context("test-session-1")
+        
+        def fail(*args, **kwargs):
+            raise AssertionError("database read on the hot path")
+        monkeypatch.setattr(history_service, "get_recent_messages", fail)
+        monkeypatch.setattr(history_service, "_flush_pending", fail)
+        
+        context = history_service.get_recent_context("test-session-1")
+        assert [c["content"] for c in context] == ["Message 0"]
+    
+    def test_recent_context_sees_turns_from_other_workers(self, history_service, temp_db, monkeypatch):
+        """Test that a window is reloaded once the cache generations show another worker's write"""
+        from backend.services.cache.chat_cache_service import chat_cache
+        
+        marks = {"test-session-1": 1}
+        monkeypatch.setattr(chat_cache, "session_messages_remote_mark", lambda session_id: marks[session_id])
+        other_worker = ChatHistoryService(db_path=temp_db)
+        base = datetime(2024, 1, 1)
+        history_service.save_message("test-session-1", Message(
+            id="msg-0", session_id="test-session-1", role="user",
+            content="Message 0", timestamp=base
+        ))
+        assert len(history_service.get_recent_context("test-session-1")) == 1
+        
+        other_worker.save_message("test-session-1", Message(
+            id="msg-1", session_id="test-session-1", role="assistant",
+            content="Message 1", timestamp=base + timedelta(seconds=1)
+        ))
+        # The other worker's invalidation reaches this one through the shared generation
+        marks["test-session-1"] = 2
+        
+        context = history_service.get_recent_context("test-session-1")
+        assert [c["content"] for c in context] == ["Message 0", "Message 1"]
+    
+    def test_recent_context_respects_token_budget(self, history_service):
+        """Test that old turns are dropped once the token budget is exceeded"""
+        history_service.context_window.max_tokens = 10
+        base = datetime(2024, 1, 1)
+        for i in range(5):
+            history_service.save_message("test-session-1", Message(
+                id=f"msg-{i}", session_id="test-session-1", role="user",
+                content=f"{i}" * 16, timestamp=base + timedelta(seconds=i)  # ~4 tokens each
+            ))
+        
+        context = history_service.get_recent_context("test-session-1")
+        
+        assert [c["content"][0] for c in context] == ["3", "4"]
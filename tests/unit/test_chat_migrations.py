@@ -0,0 +1,134 @@
+"""
+Unit tests for chat database migrations
+"""
+import os
+import sqlite3
+import tempfile
+
+import pytest
+
+from backend.migrations.add_chat_tables import migrate_chat_tables
+from backend.migrations.add_chat_keyset_indexes import (
+    migrate_chat_keyset_indexes,
+    rollback_chat_keyset_indexes,
+)
+from backend.migrations.add_chat_statistics_summary import (
+    migrate_chat_statistics_summary,
+    rollback_chat_statistics_summary,
+)
+
+
+def _indexes(path: str) -> set:
+    conn = sqlite3.connect(path)
+    rows = conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'").fetchall()
+    conn.close()
+    return {row[0] for row in rows}
+
+
+class TestChatKeysetIndexesMigration:
+    """Test the keyset pagination index migration"""
+
+    @pytest.fixture
+    def temp_db(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        assert migrate_chat_tables(path)
+        yield path
+        os.unlink(path)
+
+    def test_migration_replaces_prefix_indexes(self, temp_db):
+        assert migrate_chat_keyset_indexes(temp_db)
+        # Running twice is a no-op
+        assert migrate_chat_keyset_indexes(temp_db)
+
+        indexes = _indexes(temp_db)
+        assert "idx_chat_messages_session_keyset" in indexes
+        assert "idx_chat_sessions_user_keyset" in indexes
+        assert "idx_chat_messages_session_id" not in indexes
+
+        conn = sqlite3.connect(temp_db)
+        plan = conn.execute(
+            "EXPLAIN QUERY PLAN SELECT * FROM chat_messages WHERE session_id = ? AND (timestamp, id) < (?, ?) "
+            "ORDER BY timestamp DESC, id DESC LIMIT 50",
+            ("s", "2024-01-01", "m"),
+        ).fetchall()
+        conn.close()
+        details = " ".join(row[-1] for row in plan)
+        assert "idx_chat_messages_session_keyset" in details
+        assert "TEMP B-TREE" not in details
+
+    def test_rollback_restores_original_indexes(self, temp_db):
+        assert migrate_chat_keyset_indexes(temp_db)
+        assert rollback_chat_keyset_indexes(temp_db)
+
+        indexes = _indexes(temp_db)
+        assert "idx_chat_messages_session_keyset" not in indexes
+        assert "idx_chat_messages_session_id" in indexes
+
+
+class TestChatStatisticsSummaryMigration:
+    """Test the trigger-maintained chat statistics summary"""
+
+    @pytest.fixture
+    def temp_db(self):
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        assert migrate_chat_tables(path)
+        yield path
+        os.unlink(path)
+
+    def _summary(self, path: str):
+        conn = sqlite3.connect(path)
+        row = conn.execute(
+            "SELECT session_count, message_count, storage_bytes, oldest_message, newest_message FROM chat_data_summary"
+        ).fetchone()
+        conn.close()
+        return row
+
+    def _insert_message(self, conn, msg_id: str, timestamp: str, content: str = "hello"):
+        conn.execute(
+            "INSERT INTO chat_messages VALUES (?, 's1', 'user', ?, ?, NULL, NULL, NULL, '{}')",
+            (msg_id, content, timestamp),
+        )
+
+    def test_backfill_and_triggers_track_changes(self, temp_db):
+        conn = sqlite3.connect(temp_db)
+        conn.execute("INSERT INTO chat_sessions VALUES ('s1', 't', 'm', NULL, 'x', 'x', 0, 0, '{}')")
+        self._insert_message(conn, "m1", "2024-01-01T00:00:00")
+        conn.commit()
+        conn.close()
+
+        assert migrate_chat_statistics_summary(temp_db)
+        sessions, messages, size, oldest, newest = self._summary(temp_db)
+        assert (sessions, messages, oldest, newest) == (1, 1, "2024-01-01T00:00:00", "2024-01-01T00:00:00")
+        assert size > 0
+
+        conn = sqlite3.connect(temp_db)
+        self._insert_message(conn, "m2", "2024-02-01T00:00:00", content="x" * 100)
+        self._insert_message(conn, "m3", "2023-12-01T00:00:00")
+        conn.execute("DELETE FROM chat_messages WHERE id = 'm3'")
+        conn.commit()
+        conn.close()
+
+        _, messages, grown, oldest, newest = self._summary(temp_db)
+        assert messages == 2
+        assert grown > size + 100
+        assert (oldest, newest) == ("2024-01-01T00:00:00", "2024-02-01T00:00:00")
+
+        # Deleting everything brings the summary back to empty
+        conn = sqlite3.connect(temp_db)
+        conn.execute("DELETE FROM chat_messages")
+        conn.execute("DELETE FROM chat_sessions")
+        conn.commit()
+        conn.close()
+        assert self._summary(temp_db) == (0, 0, 0, None, None)
+
+    def test_rollback_removes_summary(self, temp_db):
+        assert migrate_chat_statistics_summary(temp_db)
+        assert rollback_chat_statistics_summary(temp_db)
+
+        conn = sqlite3.connect(temp_db)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master")}
+        conn.close()
+        assert "chat_data_summary" not in tables
+        assert "trg_chat_summary_message_insert" not in tables
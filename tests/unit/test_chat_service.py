@@ -49,6 +49,7 @@ class TestChatService:
         """Mock history service"""
         mock = Mock(spec=ChatHistoryService)
         mock.get_session_messages.return_value = []
+        mock.get_recent_context.return_value = []
         mock.save_message.return_value = "test-message-id"
         return mock
     
@@ -102,28 +103,15 @@ class TestChatService:
     
     def test_build_context(self, chat_service, mock_history_service):
         """Test building conversation context"""
-        # Mock message history
-        mock_messages = [
-            Message(
-                id="msg1",
-                session_id="test-session",
-                role="user",
-                content="Hello",
-                timestamp=datetime.utcnow()
-            ),
-            Message(
-                id="msg2",
-                session_id="test-session",
-                role="assistant",
-                content="Hi there!",
-                timestamp=datetime.utcnow()
-            )
+        mock_history_service.get_recent_context.return_value = [
+            {"role": "user", "content": "Hello"},
+            {"role": "assistant", "content": "Hi there!"},
         ]
-        mock_history_service.get_session_messages.return_value = mock_messages
         
-        context = chat_service._build_context("test-session", limit=5)
+        context = chat_service._build_context("test-session")
         
-        mock_history_service.get_session_messages.assert_called_once_with("test-session", limit=5)
+        mock_history_service.get_recent_context.assert_called_once_with("test-session")
+        mock_history_service.get_session_messages.assert_not_called()
         
         assert len(context) == 2
         assert context[0]["role"] == "user"
@@ -0,0 +1,113 @@
+import sqlite3
+
+import pytest
+
+from backend.models.commands import LLMParameters
+from backend.services.ai import llm_service as llm_service_module
+from backend.services.ai.llm_service import LLMService
+from backend.services.ai.providers.base_provider import ProviderResponse
+
+
+class EchoProvider:
+    def chat_completion(self, messages, model_id, params):
+        return ProviderResponse(content="ok", tokens_used=1, cost=0.0, response_time=0.0, model_used=model_id)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "llm_data.db")
+
+
+@pytest.fixture
+def connections(monkeypatch):
+    """Counts the sqlite connections LLMService opens"""
+    opened = []
+    connect = sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        opened.append(args)
+        return connect(*args, **kwargs)
+
+    monkeypatch.setattr(llm_service_module.sqlite3, "connect", counting_connect)
+    return opened
+
+
+def test_chat_requests_do_not_read_the_database(db_path, connections, monkeypatch):
+    service = LLMService(db_path=db_path)
+    assert service.set_active_model("openai-gpt-4")
+    monkeypatch.setattr(service, "_get_provider_instance", lambda name: EchoProvider())
+    connections.clear()
+
+    for _ in range(5):
+        assert service.generate_chat_response([{"role": "user", "content": "hi"}]).content == "ok"
+    assert service.get_active_model().id == "openai-gpt-4"
+    assert service.get_provider("OpenAI").rate_limit == 3500
+    assert connections == []
+
+
+def test_writes_go_through_to_memory_and_database(db_path):
+    service = LLMService(db_path=db_path)
+    assert service.set_parameters(LLMParameters(temperature=0.2, max_tokens=64))
+    assert service.set_active_model("anthropic-claude-3-opus")
+    model = service.get_model("openai-gpt-4")
+    model.description = "edited"
+    service.save_model(model)
+    assert not service.set_active_model("no-such-model")
+
+    for reader in (service, LLMService(db_path=db_path)):
+        assert reader.get_parameters().temperature == 0.2
+        assert reader.get_active_model().id == "anthropic-claude-3-opus"
+        assert reader.get_model("openai-gpt-4").description == "edited"
+        assert not reader.get_model("openai-gpt-4").is_active
+
+
+def test_returned_objects_are_copies(db_path):
+    service = LLMService(db_path=db_path)
+    service.set_parameters(LLMParameters())
+    service.get_model("openai-gpt-4").parameters["backend"] = "int8"
+    service.get_parameters().stop_sequences.append("END")
+    service.get_provider("OpenAI").metadata["max_concurrency"] = 1
+
+    assert "backend" not in service.get_model("openai-gpt-4").parameters
+    assert service.get_parameters().stop_sequences == []
+    assert "max_concurrency" not in service.get_provider("OpenAI").metadata
+
+
+def test_changes_from_another_worker_are_picked_up(db_path, monkeypatch):
+    first = LLMService(db_path=db_path)
+    second = LLMService(db_path=db_path)
+    assert first.set_active_model("openai-gpt-4")
+    second.get_active_model()
+
+    monkeypatch.setattr(llm_service_module, "REGISTRY_CHECK_SECONDS", 0.0)
+    assert first.set_active_model("anthropic-claude-3-opus")
+    assert second.get_active_model().id == "anthropic-claude-3-opus"
+
+    # A write that skipped the other worker's version reloads instead of patching
+    first.set_parameters(LLMParameters(temperature=0.3))
+    monkeypatch.setattr(llm_service_module, "REGISTRY_CHECK_SECONDS", 3600.0)
+    second.set_routing_settings(hedge=True)
+    assert second.get_parameters().temperature == 0.3
+    assert second.get_routing_settings()["hedge"]
+
+
+def test_unreadable_database_keeps_the_loaded_registry(db_path, monkeypatch):
+    service = LLMService(db_path=db_path)
+    assert service.set_active_model("openai-gpt-4")
+    LLMService(db_path=db_path).set_active_model("anthropic-claude-3-opus")
+    monkeypatch.setattr(llm_service_module, "REGISTRY_CHECK_SECONDS", 0.0)
+
+    def locked(cursor):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(LLMService, "_read_registry_version", staticmethod(locked))
+    assert service.get_active_model().id == "openai-gpt-4"
+    assert service.get_model("anthropic-claude-3-opus") is not None
+
+    # Nothing to fall back on: the error reaches the caller
+    service._registry = None
+    with pytest.raises(sqlite3.OperationalError):
+        service.get_active_model()
+
+    monkeypatch.undo()
+    assert service.get_active_model().id == "anthropic-claude-3-opus"
@@ -0,0 +1,84 @@
+import pytest
+
+from backend.services.ai.llm_service import LLMService
+from backend.services.ai.providers.base_provider import ProviderResponse
+from backend.services.cache.chat_cache_service import CacheBackend, ChatCacheService, LLMResponseCache
+
+MESSAGES = [{"role": "user", "content": "trim the first 5 seconds"}]
+
+
+class CountingProvider:
+    """Answers every call and records the parameters it was called with"""
+
+    def __init__(self, success=True):
+        self.calls = []
+        self.success = success
+
+    def chat_completion(self, messages, model_id, params):
+        self.calls.append(params)
+        return ProviderResponse(
+            content=f"reply {len(self.calls)}",
+            tokens_used=40,
+            cost=0.002,
+            response_time=0.5,
+            model_used=model_id,
+            success=self.success,
+        )
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    service = LLMService(db_path=str(tmp_path / "llm_data.db"))
+    assert service.set_active_model("openai-gpt-4")
+    service.response_cache = LLMResponseCache(ChatCacheService(backend=CacheBackend.MEMORY))
+    provider = CountingProvider()
+    monkeypatch.setattr(service, "_get_provider_instance", lambda name: provider)
+    service.provider = provider
+    return service
+
+
+def test_deterministic_calls_are_served_from_cache(service):
+    first = service.generate_chat_response(MESSAGES, temperature=0.0)
+    second = service.generate_chat_response(MESSAGES, temperature=0.0)
+
+    assert len(service.provider.calls) == 1
+    assert service.provider.calls[0].temperature == 0.0
+    assert second.content == first.content
+    assert second.metadata["cached"] and second.metadata["cost_saved"] == 0.002
+    assert second.cost == 0.0
+    # The override applies to one request only
+    assert service.get_parameters().temperature == 0.7
+
+    stats = service.response_cache.get_stats()
+    assert stats["hits"] == 1 and stats["tokens_saved"] == 40
+
+
+def test_sampled_calls_need_an_explicit_opt_in(service):
+    service.generate_chat_response(MESSAGES)
+    service.generate_chat_response(MESSAGES)
+    assert len(service.provider.calls) == 2
+
+    service.generate_chat_response(MESSAGES, cache=True)
+    assert service.generate_chat_response(MESSAGES, cache=True).metadata.get("cached")
+    assert len(service.provider.calls) == 3
+
+
+def test_bypass_and_failures_skip_the_cache(service):
+    service.generate_chat_response(MESSAGES, temperature=0.0)
+    service.generate_chat_response(MESSAGES, temperature=0.0, cache=False)
+    assert len(service.provider.calls) == 2
+
+    service.provider.success = False
+    other = [{"role": "user", "content": "fade out"}]
+    service.generate_chat_response(other, temperature=0.0)
+    service.provider.success = True
+    assert service.generate_chat_response(other, temperature=0.0).content == "reply 4"
+
+
+@pytest.mark.asyncio
+async def test_async_calls_share_the_cache(service):
+    first = await service.agenerate_chat_response(MESSAGES, temperature=0.0)
+    assert service.generate_chat_response(MESSAGES, temperature=0.0).content == first.content
+    second = await service.agenerate_chat_response(MESSAGES, temperature=0.0)
+    assert second.metadata["cached"]
+    assert len(service.provider.calls) == 1
@@ -1,3 +1,5 @@
+import threading
+
 import pytest
 
 from backend.services.ai.llm_service import LLMService
@@ -10,15 +12,36 @@ async def test_stream_chat_response_uses_provider(monkeypatch):
 
     provider = GoogleProvider(api_key="test")
 
-    def fake_stream(messages, model_id, params, timeout=60):
+    async def fake_stream(messages, model_id, params, timeout=60):
         yield "foo"
         yield "bar"
 
     monkeypatch.setattr(service, "_get_provider_instance", lambda name: provider)
-    provider.stream_chat_completion = fake_stream
+    provider.astream_chat_completion = fake_stream
 
     chunks = []
     async for chunk in service.stream_chat_response([{"role": "user", "content": "hi"}]):
         chunks.append(chunk)
 
     assert chunks == ["foo", "bar"]
+
+
+@pytest.mark.asyncio
+async def test_blocking_stream_runs_off_the_event_loop(monkeypatch, tmp_path):
+    service = LLMService(db_path=str(tmp_path / "llm_data.db"))
+    assert service.set_active_model("google-gemini-pro")
+    loop_thread = threading.get_ident()
+    threads = []
+
+    class SyncOnlyProvider:
+        def stream_chat_completion(self, messages, model_id, params, timeout=60):
+            for chunk in ("foo", "bar"):
+                threads.append(threading.get_ident())
+                yield chunk
+
+    monkeypatch.setattr(service, "_get_provider_instance", lambda name: SyncOnlyProvider())
+
+    chunks = [chunk async for chunk in service.stream_chat_response([{"role": "user", "content": "hi"}])]
+
+    assert chunks == ["foo", "bar"]
+    assert loop_thread not in threads
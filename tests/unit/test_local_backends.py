@@ -0,0 +1,61 @@
+"""
+Unit tests for the int8 inference backend of local models
+"""
+import pytest
+import torch
+from transformers import GPT2Config, GPT2LMHeadModel
+from transformers.pytorch_utils import Conv1D
+
+from backend.services.ai.providers.local_backends import (
+    BACKEND_ENV, apply_backend, default_backend, quantize_int8, resolve_backend,
+)
+from backend.services.ai.providers.local_model_manager import model_memory_bytes
+from backend.services.ai.providers.local_scheduler import LocalInferenceScheduler
+
+
+def _model():
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=64, n_positions=64, n_embd=64, n_layer=2, n_head=4)
+    return GPT2LMHeadModel(config).eval()
+
+
+def test_quantized_model_matches_float_logits():
+    model = _model()
+    input_ids = torch.randint(0, 64, (2, 12))
+    with torch.inference_mode():
+        expected = model(input_ids).logits
+    float_bytes = model_memory_bytes(model)
+
+    quantized = quantize_int8(model)
+    assert not any(isinstance(m, Conv1D) for m in quantized.modules())
+    assert isinstance(quantized.transformer.h[0].mlp.c_fc, torch.ao.nn.quantized.dynamic.Linear)
+    with torch.inference_mode():
+        actual = quantized(input_ids).logits
+    similarity = torch.nn.functional.cosine_similarity(actual.flatten(), expected.flatten(), dim=0)
+    assert similarity > 0.99
+    assert model_memory_bytes(quantized) < float_bytes / 2
+
+
+def test_quantized_model_runs_on_the_scheduler():
+    scheduler = LocalInferenceScheduler(quantize_int8(_model()))
+    scheduler.eos_token_ids = set()
+    try:
+        assert len(scheduler.generate(list(range(10)), 8)) == 8
+    finally:
+        scheduler.stop()
+
+
+def test_torch_backend_leaves_the_model_unchanged():
+    model = _model()
+    assert apply_backend(model, "torch") is model
+    assert isinstance(model.transformer.h[0].mlp.c_fc, Conv1D)
+
+
+def test_backend_names(monkeypatch):
+    monkeypatch.delenv(BACKEND_ENV, raising=False)
+    assert default_backend() == "torch"
+    assert resolve_backend(" INT8 ") == "int8"
+    monkeypatch.setenv(BACKEND_ENV, "int8")
+    assert resolve_backend(None) == "int8"
+    with pytest.raises(ValueError):
+        resolve_backend("onnx")
@@ -0,0 +1,171 @@
+"""
+Unit tests for LocalGemmaProvider token streaming, on a tiny randomly initialised GPT-2
+"""
+import threading
+
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers, decoders
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast, pipeline
+
+from backend.models.commands import LLMParameters
+from backend.services.ai.providers import local_gemma_provider
+from backend.services.ai.providers.base_provider import StreamUsage
+from backend.services.ai.providers.local_backends import BACKEND_ENV
+from backend.services.ai.providers.local_gemma_provider import LocalGemmaProvider
+
+MODEL_ID = "tiny-gpt2"
+MESSAGES = [{"role": "user", "content": "hello there"}]
+WORDS = ["<eos>", "<unk>", "User", ":", "Assistant", "hello", "there", "general", "kenobi", "how", "are", "you"]
+
+
+def _tiny_pipeline():
+    torch.manual_seed(0)
+    backend = Tokenizer(models.WordLevel({w: i for i, w in enumerate(WORDS)}, unk_token="<unk>"))
+    backend.pre_tokenizer = pre_tokenizers.Sequence([pre_tokenizers.WhitespaceSplit(), pre_tokenizers.Punctuation()])
+    backend.decoder = decoders.WordPiece(prefix="##")
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, eos_token="<eos>", unk_token="<unk>")
+    config = GPT2Config(vocab_size=len(WORDS), n_positions=128, n_embd=16, n_layer=1, n_head=2,
+                        bos_token_id=0, eos_token_id=0)
+    model = GPT2LMHeadModel(config).eval()
+    # Never emit <eos>, so every run generates exactly max_tokens
+    with torch.no_grad():
+        model.lm_head.weight[0].fill_(0)
+        model.transformer.wte.weight[0].fill_(0)
+    return pipeline("text-generation", model=model, tokenizer=tokenizer, device="cpu")
+
+
+@pytest.fixture(scope="module")
+def tiny_pipe():
+    return _tiny_pipeline()
+
+
+@pytest.fixture
+def provider(tiny_pipe):
+    provider = LocalGemmaProvider()
+    provider.models.register(MODEL_ID, tiny_pipe)
+    yield provider
+    # Unloads the models and stops their scheduler threads
+    provider.models.stop()
+
+
+def _prompt_tokens(provider, tiny_pipe):
+    prompt = provider._build_prompt(MESSAGES, tiny_pipe.tokenizer)
+    return len(tiny_pipe.tokenizer(prompt)["input_ids"])
+
+
+def test_stream_yields_tokens_and_counts_from_generation(provider, tiny_pipe):
+    usage = StreamUsage()
+    params = LLMParameters(temperature=0, max_tokens=6)
+    seen = []
+
+    for chunk in provider.stream_chat_completion(MESSAGES, MODEL_ID, params, usage=usage):
+        seen.append((chunk, usage.completion_tokens))
+
+    assert len(seen) > 1
+    # Counts grow while the reply is still being decoded
+    assert seen[0][1] < 6
+    assert usage.prompt_tokens == _prompt_tokens(provider, tiny_pipe)
+    assert usage.completion_tokens == 6
+    assert not usage.estimated
+
+
+def test_chat_completion_reports_generation_counts(provider, tiny_pipe):
+    params = LLMParameters(temperature=0, max_tokens=5)
+    response = provider.chat_completion(MESSAGES, MODEL_ID, params)
+
+    assert response.success, response.error_message
+    assert response.content
+    assert response.metadata["completion_tokens"] == 5
+    assert response.tokens_used == _prompt_tokens(provider, tiny_pipe) + 5
+    # Greedy decoding streams the same text
+    assert response.content == "".join(provider.stream_chat_completion(MESSAGES, MODEL_ID, params)).strip()
+
+
+@pytest.mark.asyncio
+async def test_async_stream_runs_off_loop_and_stops_on_close(provider, tiny_pipe):
+    loop_thread = threading.get_ident()
+    forward_threads = []
+    model = tiny_pipe.model
+    original = model.forward
+
+    def tracking_forward(*args, **kwargs):
+        forward_threads.append(threading.get_ident())
+        return original(*args, **kwargs)
+
+    model.forward = tracking_forward
+    usage = StreamUsage()
+    try:
+        stream = provider.astream_chat_completion(MESSAGES, MODEL_ID, LLMParameters(temperature=0, max_tokens=100), usage=usage)
+        assert await stream.__anext__()
+        # What happens when the client disconnects mid-reply
+        await stream.aclose()
+    finally:
+        del model.forward
+
+    assert forward_threads and loop_thread not in forward_threads
+    assert usage.completion_tokens < 100
+    assert provider._get_scheduler(MODEL_ID, tiny_pipe).stats()["running"] == 0
+
+
+def test_missing_model_raises(provider, monkeypatch):
+    def fail(model_id):
+        raise OSError(f"{model_id} is not downloaded")
+
+    monkeypatch.setattr(provider, "_create_pipeline", fail)
+    response = provider.chat_completion(MESSAGES, "not-loaded", LLMParameters())
+
+    assert not response.success
+    assert "not-loaded" in response.error_message
+
+
+def test_next_turn_reuses_cached_history(provider, tiny_pipe):
+    params = LLMParameters(temperature=0, max_tokens=4)
+    messages = [{"role": "user", "content": "hello there general kenobi how are you " * 3}]
+    reply = provider.chat_completion(messages, MODEL_ID, params)
+    assert reply.success, reply.error_message
+
+    messages += [{"role": "assistant", "content": reply.content}, {"role": "user", "content": "how are you"}]
+    second = provider.chat_completion(messages, MODEL_ID, params)
+    assert second.success, second.error_message
+
+    stats = provider._get_scheduler(MODEL_ID, tiny_pipe).stats()["prefix_cache"]
+    assert stats["hits"] == 1
+    # The whole first turn, prompt and reply, came from the cache
+    assert stats["tokens_reused"] >= reply.tokens_used - 1
+
+
+def test_switching_backend_reloads_the_model(monkeypatch):
+    monkeypatch.delenv(BACKEND_ENV, raising=False)
+    # Every load builds a fresh tiny model instead of downloading one
+    monkeypatch.setattr(local_gemma_provider, "pipeline", lambda *args, **kwargs: _tiny_pipeline())
+    provider = LocalGemmaProvider()
+    params = LLMParameters(temperature=0, max_tokens=4)
+
+    def status():
+        return provider.model_status()["models"][0]
+
+    try:
+        assert provider.chat_completion(MESSAGES, MODEL_ID, params).success
+        assert status()["backend"] == "torch"
+        float_bytes = status()["resident_bytes"]
+
+        # A generation in progress keeps the weights it runs on
+        stream = provider.stream_chat_completion(MESSAGES, MODEL_ID, LLMParameters(temperature=0, max_tokens=50))
+        next(stream)
+        assert provider.set_model_backend(MODEL_ID, "int8")
+        assert status()["state"] == "loaded"
+        stream.close()
+
+        # The next one reloads the model quantized
+        response = provider.chat_completion(MESSAGES, MODEL_ID, params)
+        assert response.success, response.error_message
+        model = status()
+        assert model["backend"] == "int8"
+        assert model["load_count"] == 2
+        assert model["resident_bytes"] < float_bytes
+        lm_head = provider.models.loaded()[MODEL_ID].model.lm_head
+        assert isinstance(lm_head, torch.ao.nn.quantized.dynamic.Linear)
+        assert not provider.set_model_backend(MODEL_ID, "int8")
+    finally:
+        provider.models.stop()
@@ -0,0 +1,162 @@
+"""
+Unit tests for the local model lifecycle manager
+"""
+import threading
+import time
+
+import torch
+
+from backend.services.ai.providers.local_model_manager import (
+    PRELOAD_ENV, LocalModelManager, model_memory_bytes, startup_preload_enabled
+)
+
+MB = 1024 * 1024
+
+
+class Loader:
+    """Builds a model of ``sizes[model_id]`` MiB of float32 weights and records calls"""
+
+    def __init__(self, sizes, delay=0.0, fail=()):
+        self.sizes = sizes
+        self.delay = delay
+        self.fail = set(fail)
+        self.calls = []
+
+    def __call__(self, model_id):
+        self.calls.append(model_id)
+        time.sleep(self.delay)
+        if model_id in self.fail:
+            raise OSError(f"{model_id} is not downloaded")
+        return torch.nn.Linear(self.sizes[model_id] * MB // 4, 1, bias=False)
+
+
+def _manager(loader, budget_mb=None, **kwargs):
+    unloaded = []
+    manager = LocalModelManager(
+        loader,
+        memory_budget_bytes=budget_mb * MB if budget_mb else None,
+        on_unload=lambda model_id, pipeline: unloaded.append(model_id),
+        **kwargs,
+    )
+    return manager, unloaded
+
+
+def _states(manager):
+    return {m["model_id"]: m["state"] for m in manager.status()["models"]}
+
+
+def test_concurrent_gets_share_one_load():
+    loader = Loader({"a": 1}, delay=0.2)
+    manager, _ = _manager(loader)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(manager.get("a"))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loader.calls == ["a"]
+    assert len({id(r) for r in results}) == 1
+    model = manager.status()["models"][0]
+    assert model["resident_bytes"] == 1 * MB == model_memory_bytes(results[0])
+    assert model["load_seconds"] >= 0.2
+
+
+def test_preload_loads_in_background():
+    loader = Loader({"a": 1}, delay=0.2)
+    manager, _ = _manager(loader)
+    thread = manager.preload("a")
+
+    assert _states(manager)["a"] == "loading"
+    thread.join()
+    assert _states(manager)["a"] == "loaded"
+    assert manager.status()["models"][0]["pinned"]
+    # The first chat finds it warm
+    manager.get("a")
+    assert loader.calls == ["a"]
+
+
+def test_lru_idle_model_is_evicted_over_budget():
+    manager, unloaded = _manager(Loader({"a": 2, "b": 2, "c": 2}), budget_mb=5)
+    manager.get("a")
+    manager.get("b")
+    manager.get("a")
+    manager.get("c")
+
+    assert unloaded == ["b"]
+    assert _states(manager) == {"a": "loaded", "b": "unloaded", "c": "loaded"}
+    status = manager.status()
+    assert status["resident_bytes"] == 4 * MB
+    assert status["stats"]["evictions"] == 1
+
+
+def test_models_in_use_and_pinned_models_are_kept():
+    manager, unloaded = _manager(Loader({"pinned": 2, "idle": 2, "busy": 2, "new": 2}), budget_mb=5)
+    manager.preload("pinned").join()
+    manager.get("idle")
+    with manager.use("busy"):
+        # Over budget: unpinned idle models go first
+        assert unloaded == ["idle"]
+        # Then the pinned one; the model that is generating never
+        manager.get("new")
+        assert unloaded == ["idle", "pinned"]
+        assert not manager.unload("busy")
+
+    assert _states(manager) == {"pinned": "unloaded", "idle": "unloaded", "busy": "loaded", "new": "loaded"}
+
+
+def test_reload_evicts_up_front_with_previous_size():
+    manager, unloaded = _manager(Loader({"a": 3, "b": 3}), budget_mb=4)
+    manager.get("a")
+    manager.get("b")
+    assert unloaded == ["a"]
+
+    # "a" is known to need 3 MiB, so "b" is evicted before "a" loads again
+    manager.get("a")
+    assert unloaded == ["a", "b"]
+    assert manager.status()["resident_bytes"] == 3 * MB
+
+
+def test_idle_models_are_unloaded_after_timeout():
+    manager, unloaded = _manager(Loader({"active": 1, "old": 1, "busy": 1}), idle_unload_seconds=60)
+    manager.preload("active").join()
+    manager.get("old")
+    with manager.use("busy"):
+        assert manager.unload_idle(now=time.time() + 120) == ["old"]
+
+    assert unloaded == ["old"]
+    assert _states(manager) == {"active": "loaded", "old": "unloaded", "busy": "loaded"}
+    manager.stop()
+    assert set(unloaded) == {"old", "active", "busy"}
+
+
+def test_failed_load_is_reported_and_retried():
+    loader = Loader({"a": 1}, fail={"a"})
+    manager, _ = _manager(loader)
+
+    assert manager.get("a") is None
+    model = manager.status()["models"][0]
+    assert model["state"] == "failed"
+    assert "not downloaded" in model["error"]
+
+    loader.fail.clear()
+    assert manager.get("a") is not None
+    assert loader.calls == ["a", "a"]
+
+
+def test_pinning_moves_to_the_new_active_model():
+    manager, _ = _manager(Loader({"a": 1, "b": 1}))
+    manager.preload("a").join()
+    manager.preload("b").join()
+
+    pinned = {m["model_id"]: m["pinned"] for m in manager.status()["models"]}
+    assert pinned == {"a": False, "b": True}
+
+
+def test_startup_preload_is_opt_in(monkeypatch):
+    monkeypatch.delenv(PRELOAD_ENV, raising=False)
+    assert not startup_preload_enabled()
+    monkeypatch.setenv(PRELOAD_ENV, "1")
+    assert startup_preload_enabled()
+    monkeypatch.setenv(PRELOAD_ENV, "0")
+    assert not startup_preload_enabled()
@@ -0,0 +1,94 @@
+"""
+Unit tests for the prefix KV cache of local chat sessions
+"""
+import torch
+
+from backend.services.ai.providers.local_prefix_cache import PrefixKVCache, PREFIX_BLOCK_TOKENS
+
+
+def _layers(length, layers=2, heads=2, dim=4, fill=0.0):
+    return [(torch.full((1, heads, length, dim), fill), torch.full((1, heads, length, dim), fill))
+            for _ in range(layers)]
+
+
+def _nbytes(length, layers=2, heads=2, dim=4):
+    return layers * 2 * heads * length * dim * 4
+
+
+SYSTEM = list(range(1000, 1000 + PREFIX_BLOCK_TOKENS + 4))
+
+
+def test_lookup_returns_longest_common_prefix():
+    cache = PrefixKVCache()
+    turn = SYSTEM + [1, 2, 3, 4, 5]
+    cache.store(turn, _layers(len(turn)))
+
+    # The next turn repeats the history and diverges at its last token
+    length, layers = cache.lookup(turn[:-1] + [9, 10, 11])
+    assert length == len(turn) - 1
+    assert all(k.shape[2] == length and v.shape[2] == length for k, v in layers)
+    assert cache.stats()["tokens_reused"] == length
+
+
+def test_lookup_leaves_a_token_to_prefill():
+    cache = PrefixKVCache()
+    cache.store(SYSTEM, _layers(len(SYSTEM)))
+
+    length, _ = cache.lookup(SYSTEM)
+    assert length == len(SYSTEM) - 1
+
+
+def test_short_or_unrelated_prompts_miss():
+    cache = PrefixKVCache()
+    cache.store(SYSTEM, _layers(len(SYSTEM)))
+
+    assert cache.lookup(SYSTEM[:PREFIX_BLOCK_TOKENS]) == (0, None)
+    assert cache.lookup([7] * 40) == (0, None)
+    assert cache.stats()["misses"] == 1
+
+
+def test_next_turn_replaces_previous_entry():
+    cache = PrefixKVCache()
+    first = SYSTEM + [1, 2, 3]
+    second = first + [4, 5, 6]
+    cache.store(first, _layers(len(first)))
+    cache.store(second, _layers(len(second)))
+
+    stats = cache.stats()
+    assert stats["entries"] == 1
+    assert stats["bytes"] == _nbytes(len(second))
+
+
+def test_sessions_sharing_a_system_prompt_are_kept_apart():
+    cache = PrefixKVCache()
+    alice = SYSTEM + [1] * 40
+    bob = SYSTEM + [2] * 40
+    cache.store(alice, _layers(len(alice), fill=1.0))
+    cache.store(bob, _layers(len(bob), fill=2.0))
+
+    assert cache.stats()["entries"] == 2
+    length, layers = cache.lookup(bob + [3])
+    assert length == len(bob)
+    assert layers[0][0][0, 0, 0, 0].item() == 2.0
+
+
+def test_lru_eviction_under_byte_budget():
+    cache = PrefixKVCache(max_bytes=_nbytes(100))
+    sessions = [[s] * 40 for s in range(3)]
+    for tokens in sessions[:2]:
+        cache.store(tokens, _layers(len(tokens)))
+    # Touch the first session so the second is the least recently used
+    assert cache.lookup(sessions[0] + [9])[0] == 40
+    cache.store(sessions[2], _layers(len(sessions[2])))
+
+    stats = cache.stats()
+    assert stats["evictions"] == 1
+    assert stats["bytes"] <= cache.max_bytes
+    assert cache.lookup(sessions[1] + [9]) == (0, None)
+    assert cache.lookup(sessions[0] + [9])[0] == 40
+
+
+def test_entry_over_budget_is_not_stored():
+    cache = PrefixKVCache(max_bytes=_nbytes(10))
+    assert not cache.store(SYSTEM, _layers(len(SYSTEM)))
+    assert cache.stats()["entries"] == 0
@@ -0,0 +1,275 @@
+"""
+Unit tests for MessageWriteBuffer
+"""
+import glob
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+import psutil
+import pytest
+
+from backend.models.chat import Message
+from backend.services.ai.chat_history_service import ChatHistoryService
+from backend.services.ai.message_write_buffer import MessageWriteBuffer
+from backend.services.ai.session_service import SessionService
+
+
+def _create_tables(path: str) -> None:
+    conn = sqlite3.connect(path)
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE chat_sessions (
+        id TEXT PRIMARY KEY,
+        title TEXT NOT NULL,
+        model_id TEXT NOT NULL,
+        user_id TEXT,
+        created_at TEXT NOT NULL,
+        updated_at TEXT NOT NULL,
+        message_count INTEGER DEFAULT 0,
+        is_archived BOOLEAN DEFAULT FALSE,
+        metadata TEXT DEFAULT '{}'
+    )
+    ''')
+    cursor.execute('''
+    CREATE TABLE chat_messages (
+        id TEXT PRIMARY KEY,
+        session_id TEXT NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        model_id TEXT,
+        tokens_used INTEGER,
+        response_time REAL,
+        metadata TEXT DEFAULT '{}'
+    )
+    ''')
+    now = datetime.utcnow().isoformat()
+    cursor.execute(
+        "INSERT INTO chat_sessions VALUES (?,?,?,?,?,?,?,?,?)",
+        ("s1", "Test", "m", None, now, now, 0, 0, "{}"),
+    )
+    conn.commit()
+    conn.close()
+
+
+def _message_count(path: str, session_id: str = "s1") -> int:
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT message_count FROM chat_sessions WHERE id = ?", (session_id,)).fetchone()[0]
+    conn.close()
+    return count
+
+
+def _row_count(path: str) -> int:
+    conn = sqlite3.connect(path)
+    count = conn.execute("SELECT COUNT(*) FROM chat_messages").fetchone()[0]
+    conn.close()
+    return count
+
+
+def _journal_rows(path: str) -> dict:
+    conn = sqlite3.connect(path)
+    rows = dict(conn.execute("SELECT journal_id, last_seq FROM chat_write_journals").fetchall())
+    conn.close()
+    return rows
+
+
+def _dead_journal_id() -> str:
+    """Journal id of a process that isn't running"""
+    pid = 4_000_000
+    while psutil.pid_exists(pid):
+        pid += 1
+    return f"{pid}-1-dead"
+
+
+class TestMessageWriteBuffer:
+    """Test write-behind batching and journal recovery"""
+
+    @pytest.fixture
+    def temp_db(self):
+        tmpdir = tempfile.mkdtemp()
+        path = os.path.join(tmpdir, "chat.db")
+        _create_tables(path)
+        yield path
+        for name in os.listdir(tmpdir):
+            os.unlink(os.path.join(tmpdir, name))
+        os.rmdir(tmpdir)
+
+    @pytest.fixture
+    def buffer(self, temp_db):
+        # Long interval so tests control when flushes happen
+        buf = MessageWriteBuffer(temp_db, flush_interval=60)
+        yield buf
+        buf.close()
+
+    def _message(self, msg_id: str, role: str = "user") -> Message:
+        return Message(id=msg_id, session_id="s1", role=role, content=f"content {msg_id}", timestamp=datetime.utcnow())
+
+    def test_flush_commits_messages_and_counters_together(self, buffer, temp_db):
+        buffer.enqueue_message("s1", self._message("m1"), "stored-1")
+        buffer.enqueue_message("s1", self._message("m2", "assistant"), "stored-2")
+        buffer.enqueue_increment("s1", 2)
+
+        assert _row_count(temp_db) == 0
+        assert buffer.flush() == 3
+        assert _row_count(temp_db) == 2
+        assert _message_count(temp_db) == 2
+        assert buffer.pending_count == 0
+
+    def test_services_read_their_own_writes(self, buffer, temp_db):
+        history = ChatHistoryService(db_path=temp_db, write_buffer=buffer)
+        sessions = SessionService(db_path=temp_db, write_buffer=buffer)
+
+        history.save_message("s1", self._message("m1"))
+        sessions.increment_message_count("s1", 1)
+
+        assert history.get_message_by_id("m1").content == "content m1"
+        assert sessions.get_session_stats("s1")["message_count"] == 1
+        assert _message_count(temp_db) == 1
+
+    def test_cached_reads_see_queued_writes(self, buffer, temp_db):
+        history = ChatHistoryService(db_path=temp_db, write_buffer=buffer)
+        history.save_message("s1", self._message("m1"))
+        assert [m.id for m in history.get_session_messages("s1")] == ["m1"]
+        # Served from the cache now
+        assert [m.id for m in history.get_session_messages("s1")] == ["m1"]
+
+        history.save_message("s1", self._message("m2", "assistant"))
+
+        assert [m.id for m in history.get_session_messages("s1")] == ["m1", "m2"]
+        # The reloaded list was cached under the current generation
+        assert [m.id for m in history.get_session_messages("s1")] == ["m1", "m2"]
+
+    def test_close_flushes_pending_writes(self, temp_db):
+        buf = MessageWriteBuffer(temp_db, flush_interval=60)
+        buf.enqueue_message("s1", self._message("m1"), "stored")
+        buf.close()
+
+        assert _row_count(temp_db) == 1
+        assert not os.path.exists(buf.journal_path)
+
+    def test_recovery_replays_unapplied_journal_entries(self, temp_db):
+        journal = f"{temp_db}.journal.{_dead_journal_id()}.log"
+        now = datetime.utcnow().isoformat()
+        entries = [
+            {"seq": 1, "op": "message", "row": ["m1", "s1", "user", "x", now, None, None, None, "{}"]},
+            {"seq": 2, "op": "increment", "session_id": "s1", "count": 1, "updated_at": now},
+        ]
+        with open(journal, "w", encoding="utf-8") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.write('{"seq": 3, "op": "mess')  # torn write from the crash
+
+        buf = MessageWriteBuffer(temp_db, flush_interval=60)
+        buf.close()
+
+        assert _row_count(temp_db) == 1
+        assert _message_count(temp_db) == 1
+        assert not os.path.exists(journal)
+
+    def test_recovery_skips_entries_already_committed(self, temp_db):
+        journal_id = _dead_journal_id()
+        conn = sqlite3.connect(temp_db)
+        conn.execute("CREATE TABLE chat_write_journals (journal_id TEXT PRIMARY KEY, last_seq INTEGER NOT NULL)")
+        conn.execute("INSERT INTO chat_write_journals VALUES (?, 1)", (journal_id,))
+        conn.commit()
+        conn.close()
+
+        # Simulate a crash between commit and journal cleanup
+        now = datetime.utcnow().isoformat()
+        with open(f"{temp_db}.journal.{journal_id}.1.flushing", "w", encoding="utf-8") as f:
+            for seq in (1, 2):
+                entry = {"seq": seq, "op": "increment", "session_id": "s1", "count": 1, "updated_at": now}
+                f.write(json.dumps(entry) + "\n")
+
+        MessageWriteBuffer(temp_db, flush_interval=60).close()
+
+        assert _message_count(temp_db) == 1
+        assert _journal_rows(temp_db) == {}
+
+    def test_journals_of_live_workers_are_left_alone(self, temp_db):
+        now = datetime.utcnow().isoformat()
+        entry = json.dumps({"seq": 1, "op": "increment", "session_id": "s1", "count": 1, "updated_at": now}) + "\n"
+        pid = os.getpid()
+        live = f"{temp_db}.journal.{pid}-{int(psutil.Process(pid).create_time() * 1000)}-aaaa.log"
+        # Same pid, different start time: a previous process whose pid was reused
+        recycled = f"{temp_db}.journal.{pid}-1-bbbb.log"
+        for path in (live, recycled):
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(entry)
+
+        MessageWriteBuffer(temp_db, flush_interval=60).close()
+
+        assert os.path.exists(live)
+        assert not os.path.exists(recycled)
+        assert _message_count(temp_db) == 1
+
+    def test_workers_number_their_journals_independently(self, temp_db):
+        first = MessageWriteBuffer(temp_db, flush_interval=60)
+        second = MessageWriteBuffer(temp_db, flush_interval=60)
+        for _ in range(3):
+            first.enqueue_increment("s1", 1)
+        second.enqueue_increment("s1", 1)
+
+        # The worker with fewer writes commits last
+        first.flush()
+        second.flush()
+
+        assert _message_count(temp_db) == 4
+        assert _journal_rows(temp_db) == {first.journal_id: 3, second.journal_id: 1}
+        first.close()
+        second.close()
+        assert _journal_rows(temp_db) == {}
+
+    def test_batch_that_keeps_failing_is_dead_lettered(self, temp_db):
+        buf = MessageWriteBuffer(temp_db, flush_interval=60, max_attempts=2)
+        buf.enqueue_message("s1", self._message("m1"), "stored")
+        buf._append({"op": "message", "row": ["bad"]})
+        buf.enqueue_increment("s1", 1)
+
+        assert buf.flush() == 0
+        assert buf.pending_count == 3
+        assert buf.flush() == 2
+
+        assert buf.pending_count == 0
+        assert buf.dead_lettered == 1
+        assert _row_count(temp_db) == 1
+        assert _message_count(temp_db) == 1
+        with open(f"{temp_db}.journal.{buf.journal_id}.dead", encoding="utf-8") as f:
+            assert [json.loads(line)["row"] for line in f] == [["bad"]]
+        buf.close()
+        assert glob.glob(f"{temp_db}.journal.*.flushing") == []
+
+    def test_failed_flush_is_retried_without_new_writes(self, temp_db):
+        buf = MessageWriteBuffer(temp_db, flush_interval=0.001, retry_interval=0.01)
+        apply = buf._apply
+        calls = []
+
+        def flaky_apply(journal_id, batch):
+            calls.append(len(batch))
+            if len(calls) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            return apply(journal_id, batch)
+
+        buf._apply = flaky_apply
+        buf.enqueue_increment("s1", 1)
+
+        deadline = time.time() + 5
+        while buf.pending_count and time.time() < deadline:
+            time.sleep(0.01)
+        assert len(calls) == 2
+        assert _message_count(temp_db) == 1
+        buf.close()
+
+    def test_fsync_per_write_is_opt_in(self, temp_db, monkeypatch):
+        synced = []
+        monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd))
+        for durable in (False, True):
+            buf = MessageWriteBuffer(temp_db, flush_interval=60, durable=durable)
+            buf.enqueue_increment("s1", 1)
+            buf.enqueue_increment("s1", 1)
+            assert len(synced) == (2 if durable else 0)
+            buf.close()
@@ -0,0 +1,215 @@
+"""
+Unit tests for the async provider transport against a local mock server
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from backend.models.commands import LLMParameters
+from backend.services.ai.providers.http_client import aclose_async_client
+from backend.services.ai.providers.openai_provider import OpenAIProvider
+from backend.services.ai.providers.anthropic_provider import AnthropicProvider
+from backend.services.ai.providers.google_provider import GoogleProvider
+from backend.services.ai.providers.cohere_provider import CohereProvider
+from backend.services.ai.providers.huggingface_provider import HuggingFaceProvider
+
+STREAM_CHUNKS = ["Hel", "lo", "!"]
+CHUNK_DELAY = 0.05
+
+RESPONSES = {
+    "/v1/chat/completions": {
+        "choices": [{"message": {"role": "assistant", "content": "openai reply"}, "finish_reason": "stop"}],
+        "usage": {"total_tokens": 12},
+    },
+    "/v1/messages": {
+        "content": [{"type": "text", "text": "anthropic reply"}],
+        "usage": {"input_tokens": 5, "output_tokens": 7},
+        "stop_reason": "end_turn",
+    },
+    "/v1/chat": {
+        "text": "cohere reply",
+        "meta": {"billed_units": {"input_tokens": 4, "output_tokens": 6}},
+    },
+    "/v1/models/gemini-pro:generateContent": {
+        "candidates": [{"content": {"parts": [{"text": "gemini reply"}]}, "finishReason": "STOP"}],
+        "usageMetadata": {"promptTokenCount": 3, "candidatesTokenCount": 4},
+    },
+    "/v1/models/microsoft/DialoGPT-medium": [{"generated_text": "hf reply"}],
+}
+
+
+class MockProviderHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.server.requests.append((self.path, self.client_address, dict(self.headers), json.loads(body)))
+
+        if self.path == "/v1/models/gemini-pro:streamGenerateContent?alt=sse":
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for text in STREAM_CHUNKS:
+                time.sleep(CHUNK_DELAY)
+                event = {"candidates": [{"content": {"parts": [{"text": text}]}}]}
+                self._write_chunk(f"data: {json.dumps(event)}\r\n\r\n".encode())
+            self._write_chunk(b"")
+            return
+
+        if self.path == "/v1/rate-limited/chat/completions":
+            self._send_json(429, {"error": {"message": "slow down"}})
+            return
+
+        payload = RESPONSES.get(self.path)
+        if payload is None:
+            self._send_json(500, {"error": {"message": f"unexpected path {self.path}"}})
+        else:
+            self._send_json(200, payload)
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+class MockProviderServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Accept a burst of concurrent connections
+    request_queue_size = 512
+
+
+@pytest.fixture(scope="module")
+def mock_server():
+    server = MockProviderServer(("127.0.0.1", 0), MockProviderHandler)
+    server.requests = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def base_url(mock_server):
+    mock_server.requests.clear()
+    return f"http://127.0.0.1:{mock_server.server_address[1]}/v1"
+
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("provider_cls,api_key,model_id,expected", [
+    (OpenAIProvider, "sk-test-key-0123456789", "gpt-3.5-turbo", "openai reply"),
+    (AnthropicProvider, "sk-ant-test", "claude-3-haiku-20240307", "anthropic reply"),
+    (CohereProvider, "cohere-test", "command", "cohere reply"),
+    (GoogleProvider, "google-test", "gemini-pro", "gemini reply"),
+    (HuggingFaceProvider, "hf_test", "microsoft/DialoGPT-medium", "hf reply"),
+])
+async def test_achat_completion(base_url, provider_cls, api_key, model_id, expected):
+    provider = provider_cls(api_key, base_url)
+    try:
+        response = await provider.achat_completion(MESSAGES, model_id, LLMParameters())
+    finally:
+        await aclose_async_client()
+
+    assert response.success, response.error_message
+    assert response.content == expected
+    assert response.tokens_used > 0
+    # Same parsing as the blocking path
+    sync_response = provider.chat_completion(MESSAGES, model_id, LLMParameters())
+    assert sync_response.content == expected
+    assert sync_response.tokens_used == response.tokens_used
+
+
+@pytest.mark.asyncio
+async def test_async_requests_share_keepalive_connection(mock_server, base_url):
+    openai = OpenAIProvider("sk-test-key-0123456789", base_url)
+    anthropic = AnthropicProvider("sk-ant-test", base_url)
+    try:
+        for _ in range(3):
+            await openai.achat_completion(MESSAGES, "gpt-3.5-turbo", LLMParameters())
+            await anthropic.achat_completion(MESSAGES, "claude-3-haiku-20240307", LLMParameters())
+    finally:
+        await aclose_async_client()
+
+    # One pooled connection, per-provider auth headers on each request
+    assert len({client for _, client, _, _ in mock_server.requests}) == 1
+    headers = {path: h for path, _, h, _ in mock_server.requests}
+    assert headers["/v1/chat/completions"]["Authorization"] == "Bearer sk-test-key-0123456789"
+    assert headers["/v1/messages"]["x-api-key"] == "sk-ant-test"
+    assert "Authorization" not in headers["/v1/messages"]
+
+
+@pytest.mark.asyncio
+async def test_rate_limit_maps_to_failed_response(base_url):
+    provider = OpenAIProvider("sk-test-key-0123456789", f"{base_url}/rate-limited")
+    try:
+        response = await provider.achat_completion(MESSAGES, "gpt-3.5-turbo", LLMParameters())
+    finally:
+        await aclose_async_client()
+
+    assert not response.success
+    assert response.error_message == "Rate limit exceeded"
+
+
+@pytest.mark.asyncio
+async def test_concurrent_streams_share_one_event_loop(base_url):
+    provider = GoogleProvider("google-test", base_url)
+    streams = 200
+    gaps = []
+    done = asyncio.Event()
+
+    async def ticker():
+        last = time.perf_counter()
+        while not done.is_set():
+            await asyncio.sleep(0.01)
+            now = time.perf_counter()
+            gaps.append(now - last)
+            last = now
+
+    async def consume():
+        return [chunk async for chunk in provider.astream_chat_completion(MESSAGES, "gemini-pro", LLMParameters())]
+
+    ticker_task = asyncio.create_task(ticker())
+    start = time.perf_counter()
+    try:
+        results = await asyncio.gather(*(consume() for _ in range(streams)))
+    finally:
+        done.set()
+        await ticker_task
+        await aclose_async_client()
+    elapsed = time.perf_counter() - start
+
+    assert all(chunks == STREAM_CHUNKS for chunks in results)
+    # Sequential streaming would take streams * len(STREAM_CHUNKS) * CHUNK_DELAY = 30s
+    assert elapsed < streams * len(STREAM_CHUNKS) * CHUNK_DELAY / 4
+    # The loop kept running other tasks while the streams were open
+    assert max(gaps) < 1.0
+
+
+@pytest.mark.asyncio
+async def test_stream_parser_matches_blocking_stream(base_url):
+    provider = GoogleProvider("google-test", base_url)
+    try:
+        chunks = [chunk async for chunk in provider.astream_chat_completion(MESSAGES, "gemini-pro", LLMParameters())]
+    finally:
+        await aclose_async_client()
+
+    assert chunks == STREAM_CHUNKS
+    assert list(provider.stream_chat_completion(MESSAGES, "gemini-pro", LLMParameters())) == STREAM_CHUNKS
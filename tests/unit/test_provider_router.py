@@ -0,0 +1,342 @@
+"""
+Unit tests for ProviderRouter, against local stub providers
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from backend.models.commands import LLMParameters
+from backend.services.ai.llm_service import LLMService
+from backend.services.ai.provider_router import ProviderLimits, ProviderRouter, RouteTarget, TokenBucket
+from backend.services.ai.providers.base_provider import (
+    AuthenticationError, ProviderError, ProviderResponse, RateLimitError, StreamUsage,
+)
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+PARAMS = LLMParameters()
+
+
+class StubProvider:
+    """Plays back a script of outcomes ("ok", "rate_limit", "auth", "timeout" or "raise"), then answers ok"""
+
+    def __init__(self, name, script=(), delay=0.0):
+        self.name = name
+        self.script = list(script)
+        self.delay = delay
+        self.calls = 0
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def _outcome(self):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+            return self.script.pop(0) if self.script else "ok"
+
+    def _response(self, outcome, model_id):
+        with self._lock:
+            self.active -= 1
+        errors = {"rate_limit": RateLimitError("Rate limit exceeded"),
+                  "auth": AuthenticationError("Invalid API key or authentication failed"),
+                  "timeout": ProviderError("Request timeout after 30 seconds")}
+        if outcome == "raise":
+            raise RuntimeError("provider crashed")
+        if outcome in errors:
+            error = errors[outcome]
+            return ProviderResponse(content="", tokens_used=0, cost=0.0, response_time=0.0, model_used=model_id,
+                                    success=False, error_message=str(error),
+                                    metadata={"error_type": type(error).__name__})
+        return ProviderResponse(content=f"{self.name} says hi", tokens_used=3, cost=0.0, response_time=self.delay,
+                                model_used=model_id)
+
+    def chat_completion(self, messages, model_id, params):
+        outcome = self._outcome()
+        time.sleep(self.delay)
+        return self._response(outcome, model_id)
+
+
+class AsyncStubProvider(StubProvider):
+    async def achat_completion(self, messages, model_id, params):
+        outcome = self._outcome()
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            with self._lock:
+                self.active -= 1
+            raise
+        return self._response(outcome, model_id)
+
+
+def _target(provider):
+    return RouteTarget(provider.name, f"{provider.name}-model", provider)
+
+
+def _router(**kwargs):
+    kwargs.setdefault("backoff_base", 0.001)
+    return ProviderRouter(**kwargs)
+
+
+def test_concurrency_is_limited_per_provider():
+    router = _router()
+    router.configure("slow", ProviderLimits(max_concurrency=2))
+    provider = StubProvider("slow", delay=0.05)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(router.complete([_target(provider)], MESSAGES, PARAMS)))
+               for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert provider.max_active == 2
+    assert all(r.success for r in results) and len(results) == 6
+    assert router.stats()["providers"]["slow"]["in_flight"] == 0
+
+
+def test_token_bucket_refills_and_pauses():
+    now = [0.0]
+    bucket = TokenBucket(60, clock=lambda: now[0])
+    for _ in range(60):
+        assert bucket.reserve() == 0
+    assert bucket.reserve() == pytest.approx(1.0)
+
+    now[0] += 1.0
+    assert bucket.reserve() == 0
+    bucket.pause(5)
+    now[0] += 2.0
+    assert bucket.reserve() == pytest.approx(3.0)
+
+
+def test_rate_limited_provider_fails_over_at_once():
+    router = _router()
+    primary = StubProvider("primary", ["rate_limit"])
+    fallback = StubProvider("fallback")
+
+    response = router.complete([_target(primary), _target(fallback)], MESSAGES, PARAMS)
+
+    assert response.success and response.content == "fallback says hi"
+    assert response.metadata["route"] == {"provider": "fallback", "model_id": "fallback-model", "attempts": 1,
+                                          "failover": True, "hedged": False}
+    assert primary.calls == 1
+    stats = router.stats()
+    assert stats["failovers"] == 1
+    assert stats["providers"]["primary"]["rate_limited"] == 1
+
+
+def test_transient_failures_are_retried_with_backoff():
+    router = _router(max_attempts=3)
+    provider = StubProvider("flaky", ["rate_limit", "timeout"])
+
+    response = router.complete([_target(provider)], MESSAGES, PARAMS)
+
+    assert response.success
+    assert provider.calls == 3
+    assert response.metadata["route"]["attempts"] == 3
+    assert router.stats()["retries"] == 2
+
+
+def test_permanent_failures_are_not_retried():
+    router = _router()
+    primary = StubProvider("primary", ["auth"])
+    fallback = StubProvider("fallback", ["auth"])
+
+    response = router.complete([_target(primary), _target(fallback)], MESSAGES, PARAMS)
+
+    assert not response.success
+    assert "authentication" in response.error_message
+    assert (primary.calls, fallback.calls) == (1, 1)
+
+
+def test_failing_provider_cools_down_behind_healthy_ones():
+    router = _router(failure_threshold=2, max_attempts=1)
+    primary = StubProvider("primary", ["raise", "raise"])
+    fallback = StubProvider("fallback")
+    targets = [_target(primary), _target(fallback)]
+
+    for _ in range(2):
+        assert router.complete(targets, MESSAGES, PARAMS).metadata["route"]["provider"] == "fallback"
+    assert primary.calls == 2
+
+    # In cooldown: the fallback is asked first
+    response = router.complete(targets, MESSAGES, PARAMS)
+    assert response.metadata["route"]["failover"]
+    assert primary.calls == 2
+    health = router.stats()["providers"]["primary"]
+    assert health["cooldown_remaining"] > 0
+    assert health["error_rate"] > 0 and health["score"] < router.stats()["providers"]["fallback"]["score"]
+
+
+@pytest.mark.asyncio
+async def test_slow_request_is_hedged_after_p95():
+    router = _router(hedge=True, hedge_min_samples=5)
+    primary = AsyncStubProvider("primary", delay=0.01)
+    fallback = AsyncStubProvider("fallback", delay=0.01)
+    targets = [_target(primary), _target(fallback)]
+    for _ in range(5):
+        await router.acomplete(targets, MESSAGES, PARAMS)
+    assert fallback.calls == 0
+
+    primary.delay = 2.0
+    start = time.monotonic()
+    response = await router.acomplete(targets, MESSAGES, PARAMS)
+
+    assert time.monotonic() - start < 1.0
+    assert response.content == "fallback says hi"
+    assert response.metadata["route"]["hedged"]
+    stats = router.stats()
+    assert (stats["hedges"], stats["hedge_wins"]) == (1, 1)
+    # The losing attempt was cancelled and gave its slot back
+    assert primary.active == 0
+    assert stats["providers"]["primary"]["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_async_failover_without_hedging():
+    router = _router()
+    primary = AsyncStubProvider("primary", ["raise"])
+    fallback = StubProvider("fallback")
+
+    response = await router.acomplete([_target(primary), _target(fallback)], MESSAGES, PARAMS)
+
+    assert response.content == "fallback says hi"
+    assert router.stats()["hedges"] == 0
+
+
+def test_llm_service_fails_over_to_configured_model(tmp_path, monkeypatch):
+    service = LLMService(db_path=str(tmp_path / "llm_data.db"))
+    assert service.set_active_model("openai-gpt-4")
+    with pytest.raises(ValueError):
+        service.set_routing_settings(fallback_models=["no-such-model"])
+    service.set_routing_settings(fallback_models=["anthropic-claude-3-opus"])
+
+    providers = {"OpenAI": StubProvider("openai", ["rate_limit"]), "Anthropic": StubProvider("anthropic")}
+    monkeypatch.setattr(service, "_get_provider_instance", lambda name: providers.get(name))
+
+    response = service.generate_chat_response(MESSAGES)
+    assert response.content == "anthropic says hi"
+    assert response.metadata["route"]["model_id"] == "anthropic-claude-3-opus"
+
+    status = service.get_routing_status()
+    assert status["settings"]["fallback_models"] == ["anthropic-claude-3-opus"]
+    # Limits come from the provider records
+    assert status["router"]["providers"]["OpenAI"]["requests_per_minute"] == 3500
+
+
+def test_fallbacks_are_ordered_by_health():
+    router = _router(max_attempts=1, failure_threshold=100)
+    primary = StubProvider("primary", ["raise", "raise"])
+    flaky = StubProvider("flaky", ["raise"])
+    steady = StubProvider("steady")
+    targets = [_target(primary), _target(flaky), _target(steady)]
+
+    assert router.complete(targets, MESSAGES, PARAMS).metadata["route"]["provider"] == "steady"
+    # The fallback that failed now ranks behind the one that answered
+    response = router.complete(targets, MESSAGES, PARAMS)
+    assert response.metadata["route"]["provider"] == "steady"
+    assert (primary.calls, flaky.calls, steady.calls) == (2, 1, 2)
+
+
+class StreamStub:
+    """Streams ``chunks``; raises ``error`` after ``fail_after`` chunks"""
+
+    def __init__(self, name, chunks=("a", "b"), error=None, fail_after=0):
+        self.name = name
+        self.chunks = chunks
+        self.error = error
+        self.fail_after = fail_after
+
+    async def astream(self):
+        for index, chunk in enumerate(self.chunks):
+            if self.error is not None and index == self.fail_after:
+                raise self.error
+            yield chunk
+        if self.error is not None and self.fail_after >= len(self.chunks):
+            raise self.error
+
+
+@pytest.mark.asyncio
+async def test_stream_fails_over_before_the_first_chunk():
+    router = _router()
+    primary = StreamStub("primary", error=RateLimitError("Rate limit exceeded"))
+    fallback = StreamStub("fallback", chunks=("x", "y"))
+    targets = [_target(primary), _target(fallback)]
+
+    chunks = [chunk async for chunk in router.astream(targets, lambda t: t.provider.astream())]
+
+    assert chunks == ["x", "y"]
+    stats = router.stats()
+    assert stats["failovers"] == 1
+    assert stats["providers"]["primary"]["rate_limited"] == 1
+    assert stats["providers"]["fallback"]["requests"] == 1
+    assert stats["providers"]["fallback"]["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_error_after_a_chunk_is_raised():
+    router = _router()
+    primary = StreamStub("primary", error=ProviderError("connection error"), fail_after=1)
+    fallback = StreamStub("fallback")
+    received = []
+
+    with pytest.raises(ProviderError):
+        async for chunk in router.astream([_target(primary), _target(fallback)], lambda t: t.provider.astream()):
+            received.append(chunk)
+
+    assert received == ["a"]
+    stats = router.stats()
+    assert stats["failovers"] == 0
+    assert stats["providers"]["primary"]["failures"] == 1
+    assert stats["providers"]["primary"]["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_stream_holds_a_concurrency_slot():
+    router = _router(queue_timeout=0.05)
+    router.configure("busy", ProviderLimits(max_concurrency=1))
+    provider = StreamStub("busy")
+    open_stream = lambda t: t.provider.astream()
+
+    first = router.astream([_target(provider)], open_stream)
+    assert await first.__anext__() == "a"
+    with pytest.raises(ProviderError, match="at capacity"):
+        [chunk async for chunk in router.astream([_target(provider)], open_stream)]
+
+    # A client disconnect gives the slot back
+    await first.aclose()
+    assert router.stats()["providers"]["busy"]["in_flight"] == 0
+    assert [chunk async for chunk in router.astream([_target(provider)], open_stream)] == ["a", "b"]
+
+
+@pytest.mark.asyncio
+async def test_llm_service_stream_fails_over_to_configured_model(tmp_path, monkeypatch):
+    service = LLMService(db_path=str(tmp_path / "llm_data.db"))
+    assert service.set_active_model("openai-gpt-4")
+    service.set_routing_settings(fallback_models=["anthropic-claude-3-opus"])
+
+    class Streaming:
+        def __init__(self, chunks, error=None):
+            self.chunks, self.error = chunks, error
+
+        async def astream_chat_completion(self, messages, model_id, params, timeout=60, usage=None):
+            if usage is not None:
+                usage.add_text("counted by a failed attempt")
+            if self.error:
+                raise self.error
+            for chunk in self.chunks:
+                usage.add_text(chunk)
+                yield chunk
+
+    providers = {"OpenAI": Streaming((), ProviderError("Request timeout after 30 seconds")),
+                 "Anthropic": Streaming(("he", "llo"))}
+    monkeypatch.setattr(service, "_get_provider_instance", lambda name: providers.get(name))
+    usage = StreamUsage()
+
+    chunks = [chunk async for chunk in service.stream_chat_response(MESSAGES, usage=usage)]
+
+    assert chunks == ["he", "llo"]
+    assert usage.chunks == 3
+    assert service.get_routing_status()["router"]["failovers"] == 1
@@ -0,0 +1,190 @@
+"""
+Unit tests for provider streaming parsers, replaying recorded streams from a local stub server
+"""
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+from backend.models.commands import LLMParameters
+from backend.services.ai.providers.base_provider import ProviderError, StreamUsage
+from backend.services.ai.providers.http_client import aclose_async_client
+from backend.services.ai.providers.openai_provider import OpenAIProvider
+from backend.services.ai.providers.anthropic_provider import AnthropicProvider
+from backend.services.ai.providers.google_provider import GoogleProvider
+from backend.services.ai.providers.cohere_provider import CohereProvider
+from backend.services.ai.providers.huggingface_provider import HuggingFaceProvider
+
+FIXTURES = Path(__file__).parent / "fixtures" / "provider_streams"
+EXPECTED_CHUNKS = ["Hello", " there", "!"]
+MESSAGES = [{"role": "user", "content": "Say hello"}]
+
+# path -> (fixture, content type)
+STREAMS = {
+    "/v1/chat/completions": ("openai.sse", "text/event-stream"),
+    "/v1/messages": ("anthropic.sse", "text/event-stream"),
+    "/v1/chat": ("cohere.jsonl", "application/stream+json"),
+    "/v1/models/microsoft/DialoGPT-medium": ("huggingface.sse", "text/event-stream"),
+    "/v1/models/gemini-pro:streamGenerateContent?alt=sse": ("google.sse", "text/event-stream"),
+}
+
+
+class StreamReplayHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.server.bodies.append((self.path, body))
+
+        if self.path == "/v1/slow/chat/completions":
+            self._replay_slow()
+            return
+        if self.path == "/v1/error/messages":
+            fixture = 'event: error\ndata: {"type":"error","error":{"type":"overloaded_error","message":"Overloaded"}}\n\n'
+            self._start_stream("text/event-stream")
+            self._write_chunk(fixture.encode())
+            self._write_chunk(b"")
+            return
+
+        fixture, content_type = STREAMS[self.path]
+        self._start_stream(content_type)
+        # One network write per recorded line, like a real server flushing events
+        for line in (FIXTURES / fixture).read_text().splitlines(keepends=True):
+            self._write_chunk(line.encode())
+        self._write_chunk(b"")
+
+    def _replay_slow(self):
+        """Endless OpenAI stream; records whether the client hung up"""
+        self._start_stream("text/event-stream")
+        try:
+            for i in range(200):
+                event = {"choices": [{"index": 0, "delta": {"content": f"tok{i} "}, "finish_reason": None}]}
+                self._write_chunk(f"data: {json.dumps(event)}\n\n".encode())
+                time.sleep(0.05)
+            self._write_chunk(b"")
+            self.server.slow_finished.set()
+        except (BrokenPipeError, ConnectionResetError):
+            self.server.slow_aborted.set()
+
+    def _start_stream(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+@pytest.fixture(scope="module")
+def stub_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StreamReplayHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def base_url(stub_server):
+    stub_server.bodies = []
+    stub_server.slow_finished = threading.Event()
+    stub_server.slow_aborted = threading.Event()
+    return f"http://127.0.0.1:{stub_server.server_address[1]}/v1"
+
+
+PROVIDERS = [
+    # provider, api key, model, (prompt, completion) tokens, finish reason
+    (OpenAIProvider, "sk-test-key-0123456789", "gpt-3.5-turbo", (9, 3), "stop"),
+    (AnthropicProvider, "sk-ant-test", "claude-3-haiku-20240307", (12, 4), "end_turn"),
+    (CohereProvider, "cohere-test", "command", (7, 3), "COMPLETE"),
+    (HuggingFaceProvider, "hf_test", "microsoft/DialoGPT-medium", (None, 4), "eos_token"),
+    (GoogleProvider, "google-test", "gemini-pro", (5, 3), "STOP"),
+]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("provider_cls,api_key,model_id,tokens,finish_reason", PROVIDERS)
+async def test_stream_replay(base_url, stub_server, provider_cls, api_key, model_id, tokens, finish_reason):
+    provider = provider_cls(api_key, base_url)
+    usage = StreamUsage()
+    try:
+        chunks = [chunk async for chunk in provider.astream_chat_completion(
+            MESSAGES, model_id, LLMParameters(), usage=usage)]
+    finally:
+        await aclose_async_client()
+
+    assert chunks == EXPECTED_CHUNKS
+    path, body = stub_server.bodies[-1]
+    # Google selects streaming by endpoint, the others by a body flag
+    assert body.get("stream") is True or path.endswith("?alt=sse")
+    prompt_tokens, completion_tokens = tokens
+    assert usage.completion_tokens == completion_tokens
+    assert usage.completion_reported
+    if prompt_tokens is None:
+        # Hugging Face doesn't report prompt tokens
+        assert usage.prompt_tokens > 0 and usage.estimated
+    else:
+        assert usage.prompt_tokens == prompt_tokens and not usage.estimated
+    assert usage.finish_reason == finish_reason
+    assert usage.chunks == len(EXPECTED_CHUNKS)
+    assert usage.cost > 0
+
+    # The blocking stream replays the same fixture with the same parser
+    sync_usage = StreamUsage()
+    assert list(provider.stream_chat_completion(MESSAGES, model_id, LLMParameters(), usage=sync_usage)) == EXPECTED_CHUNKS
+    assert sync_usage.to_dict() == usage.to_dict()
+
+
+@pytest.mark.asyncio
+async def test_usage_is_updated_while_streaming(base_url):
+    provider = OpenAIProvider("sk-test-key-0123456789", base_url)
+    usage = StreamUsage()
+    seen = []
+    try:
+        async for chunk in provider.astream_chat_completion(MESSAGES, "gpt-3.5-turbo", LLMParameters(), usage=usage):
+            seen.append((usage.chunks, usage.completion_tokens, usage.estimated))
+    finally:
+        await aclose_async_client()
+
+    # Estimated from the text so far until the final usage event arrives
+    assert seen[0] == (1, 1, True)
+    assert [count for count, _, _ in seen] == [1, 2, 3]
+    assert not usage.estimated and usage.total_tokens == 12
+
+
+@pytest.mark.asyncio
+async def test_closing_stream_aborts_upstream_request(base_url, stub_server):
+    provider = OpenAIProvider("sk-test-key-0123456789", f"{base_url}/slow")
+    stream = provider.astream_chat_completion(MESSAGES, "gpt-3.5-turbo", LLMParameters())
+    try:
+        assert await stream.__anext__() == "tok0 "
+        # What happens when the client disconnects mid-reply
+        await stream.aclose()
+        aborted = await asyncio.to_thread(stub_server.slow_aborted.wait, 5)
+    finally:
+        await aclose_async_client()
+
+    assert aborted
+    assert not stub_server.slow_finished.is_set()
+
+
+@pytest.mark.asyncio
+async def test_error_event_raises(base_url):
+    provider = AnthropicProvider("sk-ant-test", f"{base_url}/error")
+    try:
+        with pytest.raises(ProviderError, match="Overloaded"):
+            async for _ in provider.astream_chat_completion(MESSAGES, "claude-3-haiku-20240307", LLMParameters()):
+                pass
+    finally:
+        await aclose_async_client()
@@ -132,6 +132,22 @@ class TestSessionService:
         assert "Session 1" in session_titles
         assert "Session 2" in session_titles
     
+    def test_list_sessions_keyset_pages(self, session_service):
+        """Test paging through sessions with an (updated_at, id) cursor"""
+        created = [session_service.create_session(title=f"Session {i}", user_id="user1") for i in range(5)]
+        
+        seen = []
+        cursor = None
+        while True:
+            page = session_service.list_user_sessions(user_id="user1", limit=2, before=cursor)
+            if not page:
+                break
+            seen.extend(s.id for s in page)
+            cursor = (page[-1].updated_at.isoformat(), page[-1].id)
+        
+        assert len(seen) == 5
+        assert set(seen) == {s.id for s in created}
+    
     def test_update_session(self, session_service):
         """Test updating session"""
         session = session_service.create_session(title="Original Title")
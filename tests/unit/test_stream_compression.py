@@ -0,0 +1,25 @@
+"""
+Unit tests for streaming export compression
+"""
+import gzip
+
+import pytest
+
+from backend.services.utils.stream_compression import compress_chunks
+
+
+def test_uncompressed_chunks_are_coalesced():
+    chunks = list(compress_chunks(["a" * 10] * 10, min_flush_bytes=25))
+    assert b"".join(chunks) == b"a" * 100
+    assert len(chunks) == 4
+
+
+def test_gzip_round_trip():
+    text = ["{\"n\": %d}\n" % i for i in range(1000)]
+    data = b"".join(compress_chunks(text, "gzip"))
+    assert gzip.decompress(data).decode("utf-8") == "".join(text)
+
+
+def test_unknown_compression_rejected():
+    with pytest.raises(ValueError):
+        list(compress_chunks(["x"], "brotli"))